@@ -1,4 +1,6 @@
 import requests
+import gzip
+import time
 from datetime import timedelta, datetime, timezone
 from flask import Flask, jsonify, request
 from flask_jwt_extended import JWTManager
@@ -9,6 +11,7 @@ from flask_cors import CORS
 from commonRessources.interfaces import ApiStatusMessages, SubscriptionStatus
 from commonRessources import API_MESSAGE_DESCRIPTOR, COMPOSE_POSTGRES_DATA_CONNECTOR_URL
 from commonRessources.decorators import accessControlApiKey, accessControlJwtOrApiKey
+from commonRessources import jsonCodec
 
 app = Flask(__name__)
 # -------------------------- Environment Variables -----------------------------------------------------------------------------------------------------------------------------------
@@ -17,10 +20,56 @@ headers = {
     'x-api-key': apiKey
 }
 app.config["JWT_SECRET_KEY"] = f"{getenv('JWT_SECRET_KEY')}"
+SUBSCRIPTION_CACHE_TTL = 30     # seconds the result of a subscription check is reused by the batch route
 
 # --------------------------- Initializations -----------------------------------------------------------------------------------------------------------------------------------------
 jwt = JWTManager(app)  # Initializes JWT manager for authentication
 CORS(app)  # Enables Cross-Origin Resource Sharing for API access across different origins
+subscriptionCache = {}  # subscriptionID -> (time of the check, error message or None if data may be written)
+
+
+def checkSubscription(subscriptionID):
+    """
+    Checks if data may be written for a subscription. The result is cached for SUBSCRIPTION_CACHE_TTL seconds,
+    so that a batch doesn't cause one request to the PostgreSQL data connector per point.
+
+    :param subscriptionID: ID of the subscription
+    :return: (error message or None if data may be written, True if the check failed and should be retried later)
+    """
+    cachedAt, error = subscriptionCache.get(subscriptionID, (0, None))
+    if time.monotonic() - cachedAt < SUBSCRIPTION_CACHE_TTL:
+        return error, False
+    try:
+        response = requests.get(f"{COMPOSE_POSTGRES_DATA_CONNECTOR_URL}/subscription/{subscriptionID}", headers=headers)
+        if response.status_code == 404:
+            error = f"Subscription with ID {subscriptionID} does not exist"
+        else:
+            response.raise_for_status()
+            error = f"Subscription with ID {subscriptionID} is not active" if response.json().get("status") == SubscriptionStatus.INACTIVE.value else None
+    except requests.RequestException as e:
+        return f"Error fetching subscription data: {e}", True     # not cached, the next batch tries again
+    subscriptionCache[subscriptionID] = (time.monotonic(), error)
+    return error, False
+
+
+def queryLastValue(bucketName, subscriptionID, before):
+    """
+    Queries the last value which was written for a subscription before a point in time.
+
+    :param bucketName: The InfluxDB bucket of the API of the subscription
+    :param subscriptionID: ID of the subscription
+    :param before: The value has to be written before this time
+    :return: The last value, None if there is none
+    """
+    query = f'''
+    from(bucket: "{bucketName}")
+        |> range(start: 0, stop: {before.isoformat()})
+        |> filter(fn: (r) => r["subscriptionID"] == "{subscriptionID}" and r["_field"] == "value")
+        |> last()
+    '''
+    tables = influxQueryApi.query(org=influxdbOrg, query=query)
+    values = [record.get_value() for table in tables for record in table.records]
+    return values[-1] if values else None
 
 
 # -------------------------- InfluxDB Routes ------------------------------------------------------------------------------------------------------------------------------------------
@@ -38,19 +87,26 @@ def influxWriteData(apiId):
     {
         "subscriptionID": <str>,  # ID of the subscription
         "value": <float>,         # Value to be stored in InfluxDB
-        "fetchTimestamp": <str>   # Timestamp when the data was fetched by the worker
+        "fetchTimestamp": <str>,  # Timestamp when the data was fetched by the worker
+        "unchanged": <bool>       # Optional, instead of value: heartbeat point of a payload which didn't change since the last one
     }
 
     1. Fetches the subscription data using the subscriptionID.
     2. Verifies if the subscription is valid and active.
     3. Writes data into an InfluxDB bucket.
     """
-    data = request.json
+    try:
+        data = jsonCodec.loads(request.get_data())
+    except ValueError as e:
+        return jsonify({API_MESSAGE_DESCRIPTOR: f"{ApiStatusMessages.ERROR}Invalid JSON in the request: {e}"}), 400
+    if not isinstance(data, dict):
+        return jsonify({API_MESSAGE_DESCRIPTOR: f"{ApiStatusMessages.ERROR}Missing JSON in the request"}), 400
     subscriptionID = data.get("subscriptionID")
     value = data.get("value")
     fetchTimestamp = data.get("fetchTimestamp")
+    unchanged = data.get("unchanged") is True
 
-    if not subscriptionID or not value or not fetchTimestamp:
+    if not subscriptionID or not (value or unchanged) or not fetchTimestamp:
         return jsonify({API_MESSAGE_DESCRIPTOR: f"{ApiStatusMessages.ERROR}Missing required fields in the request"}), 400
 
     # Check if the given subscriptionId exists
@@ -70,8 +126,11 @@ def influxWriteData(apiId):
     point = Point(apiId) \
         .tag("subscriptionID", subscriptionID) \
         .field("fetchTimestamp", fetchTimestamp) \
-        .field("value", value) \
         .time(now)
+    if unchanged:
+        point.field("unchanged", True)
+    else:
+        point.field("value", value)
 
     bucketName = f"{apiId}_bucket"
 
@@ -81,6 +140,99 @@ def influxWriteData(apiId):
     except Exception as e:
         return jsonify({API_MESSAGE_DESCRIPTOR: f"{ApiStatusMessages.ERROR}Failed to write data to InfluxDB bucket {bucketName}"}), 500
 
+@app.route('/influxWriteBatch', methods=['POST'])
+@accessControlApiKey
+def influxWriteBatch():
+    """
+    This route writes a batch of points of several APIs into their InfluxDB buckets.
+    The body may be gzip compressed (Content-Encoding: gzip). Every point is checked on its own,
+    so one bad point doesn't fail the whole batch. Failed points which may be written later
+    (e.g. because InfluxDB is down) are marked with "retry": true, the worker spools them.
+
+    :return: A JSON response with one result per point, status 200 if all points were written, otherwise 207.
+
+    Request JSON data structure:
+    {
+        "points": [
+            {
+                "apiID": <int>,             # ID of the API, identifies the InfluxDB bucket
+                "subscriptionID": <str>,    # ID of the subscription
+                "value": <str>,             # Value to be stored in InfluxDB
+                "unchanged": <bool>,        # Optional, instead of value: heartbeat point of a payload which didn't change since the last one
+                "aggregate": <str>,         # Optional, JSON summary {field: {min, max, mean, last, count}} of a pre-aggregated window, value is then optional
+                "window": <int>,            # Optional, length of the pre-aggregated window in seconds
+                "fetchTimestamp": <str>,    # Timestamp when the data was fetched by the worker
+                "time": <str>               # Optional ISO 8601 time of the point, e.g. for replayed points, default now
+            }, ...
+        ]
+    }
+
+    Response JSON data structure:
+    {
+        "response": <str>,
+        "results": [{"status": "SUCCESS" | "ERROR", "message": <str>, "retry": <bool>}, ...]     # in the order of the points
+    }
+    """
+    try:
+        body = request.get_data()
+        if request.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        points = jsonCodec.loads(body).get("points")
+    except (OSError, ValueError, AttributeError) as e:
+        return jsonify({API_MESSAGE_DESCRIPTOR: f"{ApiStatusMessages.ERROR}Invalid batch: {e}"}), 400
+    if not isinstance(points, list):
+        return jsonify({API_MESSAGE_DESCRIPTOR: f"{ApiStatusMessages.ERROR}Missing points in the request"}), 400
+
+    results = [None] * len(points)
+    pointsPerBucket = {}        # bucketName -> list of (index, Point)
+    now = datetime.now(timezone.utc)
+
+    for index, data in enumerate(points):
+        apiId = data.get("apiID") if isinstance(data, dict) else None
+        subscriptionID = data.get("subscriptionID") if apiId else None
+        value = data.get("value") if apiId else None
+        fetchTimestamp = data.get("fetchTimestamp") if apiId else None
+        unchanged = data.get("unchanged") is True if apiId else False
+        aggregate = data.get("aggregate") if apiId else None
+        if not apiId or not subscriptionID or not (value or unchanged or aggregate) or not fetchTimestamp:
+            results[index] = {"status": "ERROR", "message": "Missing required fields in the point", "retry": False}
+            continue
+        try:
+            pointTime = datetime.fromisoformat(data["time"]) if data.get("time") else now
+        except (TypeError, ValueError):
+            results[index] = {"status": "ERROR", "message": f"Invalid time {data.get('time')}", "retry": False}
+            continue
+        error, retry = checkSubscription(subscriptionID)
+        if error:
+            results[index] = {"status": "ERROR", "message": error, "retry": retry}
+            continue
+        point = Point(str(apiId)) \
+            .tag("subscriptionID", subscriptionID) \
+            .field("fetchTimestamp", fetchTimestamp) \
+            .time(pointTime)
+        if aggregate:
+            point.field("aggregate", aggregate)
+            point.field("window", int(data.get("window") or 0))
+        if unchanged:
+            point.field("unchanged", True)
+        elif value:
+            point.field("value", value)
+        pointsPerBucket.setdefault(f"{apiId}_bucket", []).append((index, point))
+
+    for bucketName, bucketPoints in pointsPerBucket.items():
+        try:
+            influxWriteApi.write(bucket=bucketName, org=influxdbOrg, record=[point for _, point in bucketPoints])
+            result = {"status": "SUCCESS", "message": f"Data written to InfluxDB bucket {bucketName}", "retry": False}
+        except Exception as e:
+            result = {"status": "ERROR", "message": f"Failed to write data to InfluxDB bucket {bucketName}: {e}", "retry": True}
+        for index, _ in bucketPoints:
+            results[index] = result
+
+    failedPoints = sum(1 for result in results if result["status"] == "ERROR")
+    if failedPoints:
+        return jsonify({API_MESSAGE_DESCRIPTOR: f"{ApiStatusMessages.WARNING}{failedPoints} of {len(points)} points couldn't be written", "results": results}), 207
+    return jsonify({API_MESSAGE_DESCRIPTOR: f"{ApiStatusMessages.SUCCESS}{len(points)} points written", "results": results}), 200
+
 @app.route('/influxGetData/<int:subscriptionID>/<int:queryTimespan>', methods=['GET'])
 @accessControlJwtOrApiKey
 def influxGetData(subscriptionID, queryTimespan):
@@ -93,6 +245,8 @@ def influxGetData(subscriptionID, queryTimespan):
 
     1. Fetches the subscription data using the subscriptionID.
     2. Retrieves data from the associated InfluxDB bucket for the specified time period.
+    3. Fills the heartbeat points of unchanged payloads with the last value, so that every record has a value.
+       Pre-aggregated points without a raw sample keep only their aggregate.
     """
     # Fetch subscription data to get availableAPIID
     try:
@@ -119,7 +273,19 @@ def influxGetData(subscriptionID, queryTimespan):
 
     try:
         tables = influxQueryApi.query(org=influxdbOrg, query=query)
-        result = [record.values for table in tables for record in table.records]
+        records = sorted((record.values for table in tables for record in table.records), key=lambda values: values["_time"])
+        lastValue = None
+        if records and records[0].get("unchanged"):     # the payload didn't change since before the timespan
+            lastValue = queryLastValue(bucketName, subscriptionID, start)
+        result = []
+        for values in records:
+            if values.get("unchanged"):
+                if lastValue is None:
+                    continue
+                values["value"] = lastValue
+            if values.get("value") is not None:
+                lastValue = values["value"]
+            result.append(values)
     except Exception as e:
         return jsonify({API_MESSAGE_DESCRIPTOR: f"{ApiStatusMessages.ERROR}Error querying InfluxDB: {e}"}), 500
 
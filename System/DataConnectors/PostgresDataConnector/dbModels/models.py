@@ -1,6 +1,6 @@
-from sqlalchemy import ARRAY, DateTime, Column, Integer, String, ForeignKey, Enum, Boolean
+from sqlalchemy import ARRAY, JSON, DateTime, Column, Integer, String, ForeignKey, Enum, Boolean
 from sqlalchemy.orm import declarative_base
-from commonRessources.interfaces import UserRole, SubscriptionType, SubscriptionStatus
+from commonRessources.interfaces import UserRole, SubscriptionType, SubscriptionStatus, UnchangedPayload
 
 Base = declarative_base()
 
@@ -41,6 +41,12 @@ class Subscription(Base):
     jobName = Column(String(64), nullable=True)
     command = Column(String(512), nullable=True)
     container = Column(String(64), nullable=True)
+    adaptive = Column(Boolean, nullable=False, default=False)     # if the worker stretches the interval while the payload doesn't change
+    effectiveInterval = Column(Integer, nullable=True)            # interval the worker currently fetches with in adaptive mode
+    aggregationWindow = Column(Integer, nullable=True)            # seconds per pre-aggregated summary point, None writes every fetch
+    aggregationRawSample = Column(Boolean, nullable=False, default=False)     # if the last raw payload of every window is written as well
+    parameters = Column(JSON, nullable=True)                      # values of the placeholders of the URL template of the API, e.g. {"symbol": "IBM"}
+    idempotencyKey = Column(String(64), nullable=True, unique=True)     # key of the request which created it, a retried request gets this subscription instead of a new one
 
     def toDict(self):
         """
@@ -56,7 +62,12 @@ class Subscription(Base):
             'status': self.status.name,
             'jobName': self.jobName,
             'command': self.command,
-            'container': self.container
+            'container': self.container,
+            'adaptive': bool(self.adaptive),
+            'effectiveInterval': self.effectiveInterval or self.interval,
+            'aggregationWindow': self.aggregationWindow,
+            'aggregationRawSample': bool(self.aggregationRawSample),
+            'parameters': self.parameters or {}
         }
 
 class AvailableApi(Base):
@@ -69,6 +80,11 @@ class AvailableApi(Base):
     description = Column(String(200), nullable=False)
     subscriptionType = Column(Enum(SubscriptionType), nullable=False)
     relevantFields = Column(ARRAY(String), nullable=False)
+    authParameter = Column(String(50), nullable=True)       # query parameter which carries the API token, e.g. token
+    timeout = Column(Integer, nullable=True)                # timeout budget of one fetch in seconds, the worker default is used if not set
+    maxBodySize = Column(Integer, nullable=True)            # maximum size of the body of one fetch in bytes, the worker default is used if not set
+    batch = Column(JSON, nullable=True)                     # batch form of the URL for several subscriptions in one request (see Scheduler/fetchPlans.compileBatch)
+    unchangedPayload = Column(Enum(UnchangedPayload), nullable=True)    # what is written if the API returns the same payload again, the worker default is used if not set
 
     def toDict(self):
         """
@@ -83,5 +99,10 @@ class AvailableApi(Base):
             'apiTokenRequired': self.apiTokenRequired,
             'description': self.description,
             'subscriptionType': self.subscriptionType.name,
-            'relevantFields': self.relevantFields
+            'relevantFields': self.relevantFields,
+            'authParameter': self.authParameter,
+            'timeout': self.timeout,
+            'maxBodySize': self.maxBodySize,
+            'batch': self.batch,
+            'unchangedPayload': self.unchangedPayload.name if self.unchangedPayload else None
         }
\ No newline at end of file
@@ -76,7 +76,8 @@ def initializePostgres():
                 apiTokenRequired=True,
                 description="This Api returns the current Apple stock price via Finnhub",
                 subscriptionType=SubscriptionType.FREE,
-                relevantFields=["c", "d", "dp", "h", "l", "o", "pc", "t"]
+                relevantFields=["c", "d", "dp", "h", "l", "o", "pc", "t"],
+                authParameter="token"
             )
             availableApi2 = AvailableApi(
                 availableApiID=2,
@@ -85,7 +86,8 @@ def initializePostgres():
                 apiTokenRequired=True,
                 description="This Api returns the current IBM stock price via Finnhub",
                 subscriptionType=SubscriptionType.FREE,
-                relevantFields=["c", "d", "dp", "h", "l", "o", "pc", "t"]
+                relevantFields=["c", "d", "dp", "h", "l", "o", "pc", "t"],
+                authParameter="token"
             )
             availableApi3 = AvailableApi(
                 availableApiID=3,
@@ -103,13 +105,31 @@ def initializePostgres():
                 apiTokenRequired=True,
                 description="This Api returns the current IBM stock price via AlphaVantage",
                 subscriptionType=SubscriptionType.FREE,
-                relevantFields=["01. symbol", "02. open", "03. high", "04. low", "05. price", "06. volume", "07. latest trading day", "08. previous close", "09. change", "10. change percent"]
+                relevantFields=["01. symbol", "02. open", "03. high", "04. low", "05. price", "06. volume", "07. latest trading day", "08. previous close", "09. change", "10. change percent"],
+                authParameter="apikey"
+            )
+            availableApi5 = AvailableApi(
+                availableApiID=5,
+                url="https://api.open-meteo.com/v1/forecast?latitude={latitude}&longitude={longitude}&current=temperature_2m,relative_humidity_2m,dew_point_2m,apparent_temperature,precipitation_probability,precipitation,rain,cloud_cover,wind_speed_10m",
+                name="Weather Open-Meteo",
+                apiTokenRequired=False,
+                description="This Api returns the current relevant weather data for the latitude and longitude of the subscription",
+                subscriptionType=SubscriptionType.FREE,
+                relevantFields=["temperature_2m", "relative_humidity_2m", "dew_point_2m", "apparent_temperature", "precipitation_probability", "precipitation", "rain", "cloud_cover", "wind_speed_10m"],
+                batch={     # Open-Meteo accepts comma separated coordinates and answers with a list in the same order
+                    "url": "https://api.open-meteo.com/v1/forecast?latitude={latitude}&longitude={longitude}&current=temperature_2m,relative_humidity_2m,dew_point_2m,apparent_temperature,precipitation_probability,precipitation,rain,cloud_cover,wind_speed_10m",
+                    "parameters": ["latitude", "longitude"],
+                    "separator": ",",
+                    "maxSize": 50,
+                    "split": "INDEX"
+                }
             )
 
             session.add(availableApi1)
             session.add(availableApi2)
             session.add(availableApi3)
             session.add(availableApi4)
+            session.add(availableApi5)
             session.commit()
             print("APIs created and added to the database.")
         print("Database initialized.")
@@ -79,3 +79,23 @@ class AvailableApiRepository:
             return False
         finally:
             session.close()
+
+    def updateAvailableApi(self, paramAvailableApiID, paramFields):
+        try:
+            session = scoped_session(self.session_factory)
+            availableApi = session.query(AvailableApi).filter(AvailableApi.availableApiID == paramAvailableApiID).first()
+            if availableApi is None:
+                print(f"AvailableApiRepository: No availableApi found with ID {paramAvailableApiID}")
+                return False
+
+            for fieldName, fieldValue in paramFields.items():
+                setattr(availableApi, fieldName, fieldValue)
+
+            session.commit()
+            return True
+        except SQLAlchemyError as e:
+            print(f"AvailableApiRepository: An error occurred while updating the availableApi with ID {paramAvailableApiID}: {e}")
+            session.rollback()
+            return False
+        finally:
+            session.close()
@@ -33,6 +33,18 @@ class SubscriptionRepository:
         finally:
             session.close()
     
+    def getSubscriptionsByIDs(self, paramSubscriptionIDs):
+        try:
+            session = scoped_session(self.session_factory)
+            subscriptions = session.query(Subscription).filter(Subscription.subscriptionID.in_(paramSubscriptionIDs)).all()
+            return subscriptions
+        except SQLAlchemyError as e:
+            print(f"SubscriptionRepository: An error occurred while fetching {len(paramSubscriptionIDs)} subscriptions by ID: {e}")
+            session.rollback()
+            return None
+        finally:
+            session.close()
+
     def getSubscriptionsByStatus(self, paramSubscriptionStatus):
         try:
             session = scoped_session(self.session_factory)
@@ -57,9 +69,47 @@ class SubscriptionRepository:
         finally:
             session.close()
 
-    def createSubscription(self, paramUserID, paramavalableApiID, paramInterval, paramSubscriptionStatus, paramJobName):
+    def setSubscriptionsStatuses(self, paramUpdates):
+        """
+        Updates several subscriptions in one transaction. Only the fields given in an update are changed.
+        An update with expectedStatuses is only applied if the subscription currently has one of them.
+
+        :param paramUpdates: list of dictionaries with subscriptionID, optional status (SubscriptionStatus), jobName, command, container, effectiveInterval and expectedStatuses (list of SubscriptionStatus)
+        :return: list with one result per update ("UPDATED", "SKIPPED" or "NOT_FOUND"), None if the transaction failed
+        """
         try:
             session = scoped_session(self.session_factory)
+            subscriptionIDs = [update['subscriptionID'] for update in paramUpdates]
+            subscriptions = {subscription.subscriptionID: subscription for subscription in session.query(Subscription).filter(Subscription.subscriptionID.in_(subscriptionIDs)).all()}
+            results = []
+            for update in paramUpdates:
+                subscription = subscriptions.get(update['subscriptionID'])
+                if subscription is None:
+                    results.append("NOT_FOUND")
+                    continue
+                if update.get('expectedStatuses') and subscription.status not in update['expectedStatuses']:
+                    results.append("SKIPPED")
+                    continue
+                for field in ('status', 'jobName', 'command', 'container', 'effectiveInterval'):
+                    if field in update:
+                        setattr(subscription, field, update[field])
+                results.append("UPDATED")
+            session.commit()
+            return results
+        except SQLAlchemyError as e:
+            print(f"SubscriptionRepository: An error occurred while updating {len(paramUpdates)} subscriptions: {e}")
+            session.rollback()
+            return None
+        finally:
+            session.close()
+
+    def createSubscription(self, paramUserID, paramavalableApiID, paramInterval, paramSubscriptionStatus, paramJobName, paramAdaptive=False, paramAggregationWindow=None, paramAggregationRawSample=False, paramParameters=None, paramIdempotencyKey=None):
+        try:
+            session = scoped_session(self.session_factory)
+            if paramIdempotencyKey is not None:
+                existingSubscription = session.query(Subscription).filter(Subscription.idempotencyKey == paramIdempotencyKey).first()
+                if existingSubscription is not None:        # the request was retried, the subscription was created by the first attempt
+                    return True, existingSubscription.subscriptionID
             randomID = getRandomID()
             while session.query(Subscription).filter(Subscription.subscriptionID == randomID).first() is not None:
                 randomID = getRandomID()
@@ -69,7 +119,12 @@ class SubscriptionRepository:
                                             availableApiID=paramavalableApiID,
                                             interval=paramInterval, 
                                             status=paramSubscriptionStatus,
-                                            jobName=paramJobName)
+                                            jobName=paramJobName,
+                                            adaptive=paramAdaptive,
+                                            aggregationWindow=paramAggregationWindow,
+                                            aggregationRawSample=paramAggregationRawSample,
+                                            parameters=paramParameters,
+                                            idempotencyKey=paramIdempotencyKey)
             session.add(newSubscription)
             session.commit()
             return True, newSubscription.subscriptionID
@@ -80,6 +135,50 @@ class SubscriptionRepository:
         finally:
             session.close()
 
+    def createSubscriptions(self, paramSubscriptions):
+        """
+        Creates several subscriptions in one transaction.
+
+        :param paramSubscriptions: list of dictionaries with userID, availableApiID, interval, status, jobName, adaptive, aggregationWindow, aggregationRawSample, parameters and idempotencyKey
+        :return: list with the IDs of the created subscriptions in the order of paramSubscriptions, None if the transaction failed.
+                 A subscription whose idempotencyKey exists already isn't created again, its ID is returned instead
+        """
+        try:
+            session = scoped_session(self.session_factory)
+            idempotencyKeys = [newSubscription.get('idempotencyKey') for newSubscription in paramSubscriptions if newSubscription.get('idempotencyKey') is not None]
+            existingIDs = dict(session.query(Subscription.idempotencyKey, Subscription.subscriptionID).filter(Subscription.idempotencyKey.in_(idempotencyKeys)).all()) if idempotencyKeys else {}
+            missingSubscriptions = [newSubscription for newSubscription in paramSubscriptions if newSubscription.get('idempotencyKey') not in existingIDs]
+
+            subscriptionIDs = set()
+            while len(subscriptionIDs) < len(missingSubscriptions):       # one query per round instead of one per subscription
+                randomIDs = {getRandomID() for _ in range(len(missingSubscriptions) - len(subscriptionIDs))} - subscriptionIDs
+                takenIDs = {subscriptionID for (subscriptionID,) in session.query(Subscription.subscriptionID).filter(Subscription.subscriptionID.in_(randomIDs)).all()}
+                subscriptionIDs |= randomIDs - takenIDs
+            subscriptionIDs = list(subscriptionIDs)
+
+            for subscriptionID, newSubscription in zip(subscriptionIDs, missingSubscriptions):
+                session.add(Subscription(subscriptionID=subscriptionID,
+                                         userID=newSubscription['userID'],
+                                         availableApiID=newSubscription['availableApiID'],
+                                         interval=newSubscription['interval'],
+                                         status=newSubscription['status'],
+                                         jobName=newSubscription.get('jobName'),
+                                         adaptive=newSubscription.get('adaptive', False),
+                                         aggregationWindow=newSubscription.get('aggregationWindow'),
+                                         aggregationRawSample=newSubscription.get('aggregationRawSample', False),
+                                         parameters=newSubscription.get('parameters'),
+                                         idempotencyKey=newSubscription.get('idempotencyKey')))
+            session.commit()
+            createdIDs = iter(subscriptionIDs)
+            return [existingIDs[newSubscription['idempotencyKey']] if newSubscription.get('idempotencyKey') in existingIDs else next(createdIDs)
+                    for newSubscription in paramSubscriptions]
+        except SQLAlchemyError as e:
+            print(f"SubscriptionRepository: An error occurred while creating {len(paramSubscriptions)} subscriptions: {e}")
+            session.rollback()
+            return None
+        finally:
+            session.close()
+
     def setSubsriptionStatus(self, paramSubscriptionID, paramSubscriptionStatus, paramJobName, paramCommand, paramContainer):
         try:
             session = scoped_session(self.session_factory)
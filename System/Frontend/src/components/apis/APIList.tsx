@@ -5,6 +5,9 @@ import { subscribe } from '../../services/subscription/subscriptionService';
 import { useAuth } from '../../contexts/AuthContext';
 import StatusMessage from '../util/StatusMessage';
 
+// names of the {placeholders} in the URL template of an API, e.g. ['latitude', 'longitude']
+const templateParameters = (url: string): string[] => Array.from(url.matchAll(/\{(\w+)\}/g), match => match[1]);
+
 const ApiList: React.FC = () => {
   const { userID, getAndCheckToken } = useAuth();
   const { apiData, loading, error } = useAPI();
@@ -13,6 +16,7 @@ const ApiList: React.FC = () => {
   const [interval, setInterval] = useState<string>('60');
   const [customInterval, setCustomInterval] = useState<string>('');
   const [inputError, setInputError] = useState<string>('');
+  const [parameters, setParameters] = useState<Record<string, string>>({});
 
   const [statusMessage, setStatusMessage] = useState<string | null>(null);
   const [statusType, setStatusType] = useState<'success' | 'failure'>('success');
@@ -29,6 +33,7 @@ const ApiList: React.FC = () => {
     setInterval('60');
     setCustomInterval('');
     setInputError('');
+    setParameters({});
   };
 
   // Subscribe api and check if a valid interval is selected and give user feedback if subscription is successfull/unsuccessful
@@ -56,9 +61,15 @@ const ApiList: React.FC = () => {
       }
     }
 
+    const missingParameters = templateParameters(selectedApi?.url ?? '').filter(name => !parameters[name]?.trim());
+    if (missingParameters.length > 0) {
+      setInputError(`Please enter a value for ${missingParameters.join(', ')}.`);
+      return;
+    }
+
     if (selectedApi?.availableApiID !== undefined) {
       try {
-        await subscribe(getAndCheckToken(), userID, selectedApi.availableApiID, intervalNumber);
+        await subscribe(getAndCheckToken(), userID, selectedApi.availableApiID, intervalNumber, parameters);
         setStatusMessage('Subscription successful!');
         setStatusType('success');
       } catch (error) {
@@ -181,6 +192,25 @@ const ApiList: React.FC = () => {
                 </Form.Control.Feedback>
               </Form.Group>
             )}
+
+            {templateParameters(selectedApi?.url ?? '').map(name => (
+              <Form.Group controlId={`parameter-${name}`} className="mt-3" key={name}>
+                <Form.Label>{name}</Form.Label>
+                <Form.Control
+                  type="text"
+                  placeholder={`Enter ${name}`}
+                  value={parameters[name] ?? ''}
+                  onChange={(e) => {
+                    setParameters({ ...parameters, [name]: e.target.value });
+                    setInputError('');
+                  }}
+                  isInvalid={!!inputError && !parameters[name]?.trim()}
+                />
+                <Form.Control.Feedback type="invalid">
+                  {inputError}
+                </Form.Control.Feedback>
+              </Form.Group>
+            ))}
           </Form>
         </Modal.Body>
         <Modal.Footer>
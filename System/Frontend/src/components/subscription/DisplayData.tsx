@@ -15,6 +15,8 @@ interface DataPoint {
   subscriptionID: number;
   table: number;
   value: string;
+  aggregate?: string;   // pre-aggregated points: JSON of {path: {min, max, mean, last, count}} of the window
+  window?: number;
 }
 
 const DisplayData: React.FC = () => {
@@ -108,6 +110,20 @@ const DisplayData: React.FC = () => {
   // Convert the fetched API data in order to show them in the right format
   const parsedData = data.map(point => {
     try {
+      // Pre-aggregated points without a raw sample: show the mean of every field and its range within the window
+      if (!point.value && point.aggregate) {
+        const aggregate: Record<string, { min: number; max: number; mean: number; last: number; count: number }> = JSON.parse(point.aggregate);
+        const valueFromAggregate = Object.keys(aggregate).reduce<Record<string, string>>((acc, path) => {
+          const stats = aggregate[path];
+          acc[path.split('/').pop() as string] = `${Math.round(stats.mean * 100) / 100} (${stats.min} - ${stats.max})`;
+          return acc;
+        }, {});
+        return {
+          ...point,
+          value: valueFromAggregate
+        };
+      }
+
       const parsedValue = JSON.parse(point.value);
 
       // Check if 'current' exists and handle accordingly
@@ -29,8 +29,43 @@ export const fetchSubscriptions = async (token: string, userID: string) => {
   }
 };
 
+export interface Operation {
+  operationID: string;
+  type: 'subscribe' | 'resubscribe' | 'unsubscribe';
+  status: 'PENDING' | 'RUNNING' | 'RETRYING' | 'SUCCEEDED' | 'FAILED';
+  step: string | null;
+  attempts: number;
+  message: string | null;
+  code: number | null;
+  result: Record<string, unknown> | null;
+}
+
+const OPERATION_POLL_INTERVAL = 1000;   // milliseconds between two polls of operationStatus
+const OPERATION_POLL_TIMEOUT = 120000;
+
+// Poll operationStatus until the operation the scheduler accepted (202) succeeded or failed
+const waitForOperation = async (token: string, response: Response): Promise<Operation> => {
+  const { operationID } = await response.json();
+  const deadline = Date.now() + OPERATION_POLL_TIMEOUT;
+  while (Date.now() < deadline) {
+    const statusResponse = await fetch(`${SCHEDULER_API_BASE_URL}operationStatus/${operationID}`, {
+      method: 'GET',
+      headers: {
+        'Authorization': `Bearer ${token}`,
+        'Content-Type': 'application/json',
+      },
+    });
+    if (!statusResponse.ok) throw new Error(`Operation ${operationID} could not be loaded`);
+    const operation = await statusResponse.json() as Operation;
+    if (operation.status === 'SUCCEEDED') return operation;
+    if (operation.status === 'FAILED') throw new Error(`Operation ${operationID} failed: ${operation.message}`);
+    await new Promise((resolve) => setTimeout(resolve, OPERATION_POLL_INTERVAL));
+  }
+  throw new Error(`Operation ${operationID} did not finish in time`);
+};
+
 // Fetch subscribeApi endpoint
-export const subscribe = async (token: string, userID: string, apiID: number, interval: number): Promise<string> => {
+export const subscribe = async (token: string, userID: string, apiID: number, interval: number, parameters: Record<string, string> = {}): Promise<string> => {
   try {
     const response = await fetch(`${SCHEDULER_API_BASE_URL}subscribeApi`, {
       method: 'POST',
@@ -41,7 +76,8 @@ export const subscribe = async (token: string, userID: string, apiID: number, in
       body: JSON.stringify({
         userID: userID,
         apiID: apiID,
-        interval: interval
+        interval: interval,
+        parameters: parameters
       }),
     });
 
@@ -49,6 +85,7 @@ export const subscribe = async (token: string, userID: string, apiID: number, in
       const errorMessage = await response.text(); 
       throw new Error(`Subscription failed: ${errorMessage}`); 
     }
+    await waitForOperation(token, response);
     return 'Subscription successful!'; 
   } catch {
     throw new Error('Subscribing failed due to an error. Please try again later.'); 
@@ -70,6 +107,7 @@ export const resubscribe = async (token: string, subscriptionID: number): Promis
       const errorMessage = await response.text(); 
       throw new Error(`Subscription failed: ${errorMessage}`); 
     }
+    await waitForOperation(token, response);
     return 'Activate subscription successful!'; 
   } catch {
     throw new Error('Resubscribing failed due to an error. Please try again later.'); 
@@ -88,7 +126,7 @@ export const unsubscribe = async (token: string, subscriptionID: number) => {
       },
     });
     if (!response.ok) throw new Error('Failed to remove subscription');
-    return response.json();
+    return waitForOperation(token, response);
   } catch {
     throw new Error('Unsubscribing failed due to an error. Please try again later.'); 
   }
@@ -1,14 +1,15 @@
-from flask import Flask, jsonify, request
-import requests
+from flask import Flask, Response, jsonify, request
 from os import getenv
 from flask_cors import CORS
 import configparser
-from commonRessources.interfaces import ApiStatusMessages, SubscriptionStatus
-from commonRessources import API_MESSAGE_DESCRIPTOR, COMPOSE_POSTGRES_DATA_CONNECTOR_URL, SCHEDULER_WORKER_HEARTBEAT_INTERVAL, REDIS_HOST, REDIS_PORT
+from commonRessources.interfaces import ApiStatusMessages
+from commonRessources import API_MESSAGE_DESCRIPTOR, SCHEDULER_WORKER_HEARTBEAT_INTERVAL, REDIS_HOST, REDIS_PORT, SCHEDULER_JOBS_FILE, WORKER_REGISTRATION_TIMEOUT, WORKER_DISPATCH_MODE, WORKER_COST_UPDATE_INTERVAL, SCHEDULER_OPERATION_EXECUTORS, SCHEDULER_BULK_MAX_SIZE
 from commonRessources.logger import setLoggerLevel
-from commonRessources.decorators import accessControlApiKey, accessControlJwt
+from commonRessources.decorators import accessControlApiKey, accessControlJwt, accessControlJwtOrApiKey
+from commonRessources.workerRegistry import deregisterWorker, loadRegisteredWorkers
+from commonRessources.fetchStream import FETCH_STREAM_KEY, FETCH_STREAM_GROUP
 from flask_jwt_extended import JWTManager
-import jobCounter, scale, manageJobs, lockConfigFile
+import jobCounter, scale, manageJobs, lockConfigFile, workerJobs, jobStore, fetchPlans, fetchLatencies, scheduleAccuracy, workerLoad, streamDispatch, costModel, operations, subscriptionOperations
 import time
 from datetime import datetime, timezone
 import threading
@@ -16,19 +17,26 @@ import redis
 
 
 # ------------------------------ Environment Variables --------------------------------------------------------------------------------------------------------------------------------
-apiKey = getenv('INTERNAL_API_KEY')
-headers = {
-    'x-api-key': apiKey
-}
-
 app = Flask(__name__)
 app.config["JWT_SECRET_KEY"] = f"{getenv('JWT_SECRET_KEY')}"
 
-CONFIG_FILE = '/app/opheliaConfig/config.ini'
+CONFIG_FILE = SCHEDULER_JOBS_FILE     # Rendered from the job store (see jobStore.py)
 
 # --------------------------- Initializations -----------------------------------------------------------------------------------------------------------------------------------------
 redisClient = redis.StrictRedis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
 redisClient.delete('heartbeats')    # heartbeat entries are deleted because after a restart, the workers should run again
+startupTimestamp = datetime.now(timezone.utc).isoformat()
+for registeredWorkerID in loadRegisteredWorkers(redisClient):      # registered workers count as seen now, so that workers which are gone get marked as not working and removed
+    redisClient.hset('heartbeats', registeredWorkerID, startupTimestamp)
+with scale.lockJobStore() as leases:
+    importedJobs = jobStore.importJobsFile(leases)    # the job store is empty on the first start or after Redis lost its data
+if workerJobs.migrateOfeliaJobs() or importedJobs:     # jobs were added to the job store, count them again
+    jobCounter.initializeActiveJobCounter()
+    jobCounter.initializeHistoricalJobCounter()
+    scale.initializeWorkerCounter()
+    with scale.lockJobStore() as leases:
+        scale.updateJobCosts(leases)          # the jobs file doesn't contain the costs of the jobs
+workerJobs.publishWorkerJobs(allWorkers=True)      # make sure the workers know the jobs of the job store, e.g. after a restart of Redis
 
 jwt = JWTManager(app)
 CORS(app)
@@ -36,179 +44,317 @@ CORS(app)
 logger = setLoggerLevel("Scheduler")
 ENV=getenv('ENV')
 
+# --------------------------- Functions -----------------------------------------------------------------------------------------------------------------------------------------
+def validateSubscription(data):
+    """
+    Validates the JSON of a subscription (see subscribeApi).
+
+    :param data: The JSON of the subscription
+    :return: (the subscription as carried out by subscriptionOperations.subscribe, None), (None, reason) if it's invalid
+    """
+    if not isinstance(data, dict):
+        return None, "subscription must be a JSON object"
+    userID = data.get('userID')
+    apiID = data.get('apiID')
+    interval = data.get('interval')
+    aggregationWindow = data.get('aggregationWindow')
+    if not userID or not apiID:
+        return None, "Missing userID or apiID"
+    if not isinstance(interval, int) or isinstance(interval, bool) or interval < 1:
+        return None, "interval must be a positive integer"
+    if aggregationWindow is not None:
+        if not isinstance(aggregationWindow, int) or isinstance(aggregationWindow, bool) or aggregationWindow < interval:
+            return None, "aggregationWindow must be an integer of at least the interval"
+    parameters = data.get('parameters') or {}
+    if not isinstance(parameters, dict) or not all(isinstance(value, (str, int, float)) and str(value) for value in parameters.values()):
+        return None, "parameters must map the placeholders of the URL template to values"
+    return {
+        'userID': userID,
+        'apiID': apiID,
+        'interval': interval,
+        'adaptive': data.get('adaptive') is True,
+        'aggregationWindow': aggregationWindow,
+        'aggregationRawSample': data.get('aggregationRawSample') is True,
+        'parameters': parameters
+    }, None
+
+def validateSubscriptionIDs(data):
+    """
+    Validates the JSON of a bulk resubscription or unsubscription: {"subscriptionIDs": [<int>, ...]}
+
+    :return: (list of the subscriptionIDs, None), (None, reason) if it's invalid
+    """
+    subscriptionIDs = data.get('subscriptionIDs') if isinstance(data, dict) else None
+    if not isinstance(subscriptionIDs, list) or not subscriptionIDs:
+        return None, "Missing subscriptionIDs"
+    if not all(isinstance(subscriptionID, int) and not isinstance(subscriptionID, bool) for subscriptionID in subscriptionIDs):
+        return None, "subscriptionIDs must be a list of IDs"
+    if len(subscriptionIDs) > SCHEDULER_BULK_MAX_SIZE:
+        return None, f"At most {SCHEDULER_BULK_MAX_SIZE} subscriptions can be changed at once"
+    if len(set(subscriptionIDs)) != len(subscriptionIDs):
+        return None, "subscriptionIDs must not contain duplicates"
+    return subscriptionIDs, None
+
+def enqueueOperation(operationType, operationRequest):
+    """
+    Stores an operation and adds it to the stream of the executors (see operations.createOperation).
+
+    :return: JSON response with the ID of the operation and 202, or an error message and 503 if Redis couldn't be reached
+    """
+    try:
+        operationID = operations.createOperation(operationType, operationRequest)
+    except redis.RedisError as e:
+        return jsonify({API_MESSAGE_DESCRIPTOR: f"{ApiStatusMessages.ERROR}Operation couldn't be stored: {e}, try again"}), 503
+    return jsonify({API_MESSAGE_DESCRIPTOR: f"{ApiStatusMessages.SUCCESS}{operationType} accepted, poll /operationStatus/{operationID}", 'operationID': operationID}), 202
+
 # --------------------------- Scheduler API Routes -----------------------------------------------------------------------------------------------------------------------------------------
+# Subscribing, resubscribing and unsubscribing are carried out in the background (see operations.py and subscriptionOperations.py),
+# the routes answer with 202 and the ID of the operation, whose progress and outcome are returned by /operationStatus.
 @app.route('/subscribeApi', methods=['POST'])
 @accessControlJwt
 def subscribeApi():
     """
     Subscribe to an API and schedule a job to fetch data from it.
 
-    :return: JSON response with a success or error message
+    :return: JSON response with the ID of the operation or an error message
 
     Request JSON data structure:
     {
         "userID": int,          # ID of the user subscribing to the API
         "apiID": int,           # ID of the API to subscribe to
-        "interval": int         # Interval in seconds to fetch data
+        "interval": int,        # Interval in seconds to fetch data
+        "adaptive": bool,       # Optional, stretch the interval while the payload doesn't change (daemon mode only)
+        "aggregationWindow": int,       # Optional, write one min/max/mean/last/count summary per window of this many seconds (daemon mode only)
+        "aggregationRawSample": bool,   # Optional, write the last raw payload of every window as well
+        "parameters": dict      # Values of the placeholders of the URL template of the API, e.g. {"symbol": "IBM"}
     }
     """
     if not request.is_json:
         return jsonify({API_MESSAGE_DESCRIPTOR:  f"{ApiStatusMessages.ERROR}Missing JSON in the request"}), 400
-    userID = request.json.get('userID')
-    apiID = request.json.get('apiID')
-    interval = request.json.get('interval')
+    subscription, error = validateSubscription(request.json)
+    if error:
+        return jsonify({API_MESSAGE_DESCRIPTOR: f"{ApiStatusMessages.ERROR}{error}"}), 400
 
-    try:
-        availableApiResponse = requests.get(f'{COMPOSE_POSTGRES_DATA_CONNECTOR_URL}/availableApi/{apiID}', headers=headers)  # get the data of the requested API
-        availableApiResponse.raise_for_status()
+    return enqueueOperation('subscribe', subscription)
 
-        apiData = availableApiResponse.json()
-        apiName = apiData.get("name")
-        apiUrl = apiData.get("url")
-        apiTokenRequired = apiData.get("apiTokenRequired")
 
-        if not apiName or not apiUrl:
-            return jsonify({API_MESSAGE_DESCRIPTOR: f"{ApiStatusMessages.ERROR}API name or URL not found in response"}), 400
+@app.route('/resubscribeApi/<int:subscriptionID>', methods=['GET'])
+@accessControlJwt
+def resubscribeApi(subscriptionID):
+    """
+    Resubscribe to an API and schedule a job to fetch data from it.
 
-        while not lockConfigFile.acquireLock():  # If the config file is locked, wait
-            time.sleep(0.5)
+    :param subscriptionID: ID of the subscription to resubscribe to
+    :return: JSON response with the ID of the operation or an error message
+    """
+    return enqueueOperation('resubscribe', {'subscriptionID': subscriptionID})
 
-        checkContainersAlive()
 
-        containerName = scale.scaleWorkers()    # scale the jobs across the worker containers
+@app.route('/unsubscribeApi/<int:subscriptionID>', methods=['GET'])
+@accessControlJwt
+def unsubscribeApi(subscriptionID):
+    """
+    Unsubscribe from an API and delete the job fetching data from it.
+    Therefore set the PostgresSQL SubscriptionStatus to INACTIVE and delete the job from the job store.
 
-        if not containerName:
-            lockConfigFile.releaseLock()
-            return jsonify({API_MESSAGE_DESCRIPTOR: f"{ApiStatusMessages.ERROR}No worker container available"}), 400
+    :param subscriptionID: ID of the subscription to unsubscribe from
+    :return: JSON response with the ID of the operation or an error message
+    """
+    return enqueueOperation('unsubscribe', {'subscriptionID': subscriptionID})
 
-        # Create subscription in order to get the ID afterwards
-        subscriptionResponse = requests.post(f'{COMPOSE_POSTGRES_DATA_CONNECTOR_URL}/createSubscription', 
-                                             json={
-                                                 'userID': userID,
-                                                 'availableApiID': apiID,
-                                                 'interval': interval,
-                                                 'status': SubscriptionStatus.ACTIVE.value
-                                                 },
-                                             headers=headers)
-        subscriptionResponse.raise_for_status()
+@app.route('/subscribeApis', methods=['POST'])
+@accessControlJwt
+def subscribeApis():
+    """
+    Subscribe to several APIs at once, e.g. to onboard many symbols of one API. The subscriptions are created with one request,
+    their jobs are placed in one planning pass and published once (see subscriptionOperations.bulkSubscribe).
+    The result of the operation contains one result per subscription, in the order of the request.
 
+    :return: JSON response with the ID of the operation or an error message
 
-        # Collect the information needed for ofelia config file
-        subscriptionID = subscriptionResponse.json().get('subscriptionID')
-        if apiTokenRequired:
-            command = f"python /app/fetchScripts/fetchApis.py --url {apiUrl} --tokenRequired {apiTokenRequired} --subscriptionID {subscriptionID} --apiID {apiID}"
-        else:
-            command = f"python /app/fetchScripts/fetchApis.py --url {apiUrl} --tokenRequired {apiTokenRequired} --subscriptionID {subscriptionID} --apiID {apiID}"
+    Request JSON data structure:
+    {
+        "subscriptions": [
+            {...}, ...          # Each like the request of /subscribeApi
+        ]
+    }
+    """
+    if not request.is_json:
+        return jsonify({API_MESSAGE_DESCRIPTOR:  f"{ApiStatusMessages.ERROR}Missing JSON in the request"}), 400
+    dataSubscriptions = request.json.get('subscriptions')
+    if not isinstance(dataSubscriptions, list) or not dataSubscriptions:
+        return jsonify({API_MESSAGE_DESCRIPTOR: f"{ApiStatusMessages.ERROR}Missing subscriptions"}), 400
+    if len(dataSubscriptions) > SCHEDULER_BULK_MAX_SIZE:
+        return jsonify({API_MESSAGE_DESCRIPTOR: f"{ApiStatusMessages.ERROR}At most {SCHEDULER_BULK_MAX_SIZE} subscriptions can be created at once"}), 400
+
+    subscriptions = []
+    errors = []
+    for index, dataSubscription in enumerate(dataSubscriptions):
+        subscription, error = validateSubscription(dataSubscription)
+        if error:
+            errors.append({'index': index, 'message': error})
+        subscriptions.append(subscription)
+    if errors:          # nothing is subscribed if one of the subscriptions is malformed
+        return jsonify({API_MESSAGE_DESCRIPTOR: f"{ApiStatusMessages.ERROR}{len(errors)} of {len(subscriptions)} subscriptions are invalid", 'results': errors}), 400
+
+    return enqueueOperation('bulkSubscribe', {'subscriptions': subscriptions})
+
+@app.route('/resubscribeApis', methods=['POST'])
+@accessControlJwt
+def resubscribeApis():
+    """
+    Resubscribe several inactive subscriptions at once, their jobs are placed in one planning pass (see subscriptionOperations.bulkResubscribe).
 
-        jobName = f"job{jobCounter.getHistoricalJobCounter()}"
+    :return: JSON response with the ID of the operation or an error message
 
+    Request JSON data structure:
+    {
+        "subscriptionIDs": [<int>, ...]     # IDs of the subscriptions to resubscribe to
+    }
+    """
+    if not request.is_json:
+        return jsonify({API_MESSAGE_DESCRIPTOR:  f"{ApiStatusMessages.ERROR}Missing JSON in the request"}), 400
+    subscriptionIDs, error = validateSubscriptionIDs(request.json)
+    if error:
+        return jsonify({API_MESSAGE_DESCRIPTOR: f"{ApiStatusMessages.ERROR}{error}"}), 400
+    return enqueueOperation('bulkResubscribe', {'subscriptionIDs': subscriptionIDs})
 
+@app.route('/unsubscribeApis', methods=['POST'])
+@accessControlJwt
+def unsubscribeApis():
+    """
+    Unsubscribe several subscriptions at once, their jobs are deleted in one transaction (see subscriptionOperations.bulkUnsubscribe).
 
-        manageJobs.addJob(jobName, interval, command, containerName)        # add the job to ofelia
+    :return: JSON response with the ID of the operation or an error message
 
-        #set the jobName, command and container in the subscription
-        subscriptionResponse = requests.post(f'{COMPOSE_POSTGRES_DATA_CONNECTOR_URL}/setSubscriptionsStatus', 
-                                             json={
-                                                   'subscriptionID': subscriptionID,
-                                                   'subscriptionStatus': SubscriptionStatus.ACTIVE.value,
-                                                   'jobName': jobName,
-                                                   'command': command,
-                                                   'container': containerName
-                                                   },
-                                             headers=headers)
-        subscriptionResponse.raise_for_status()
+    Request JSON data structure:
+    {
+        "subscriptionIDs": [<int>, ...]     # IDs of the subscriptions to unsubscribe from
+    }
+    """
+    if not request.is_json:
+        return jsonify({API_MESSAGE_DESCRIPTOR:  f"{ApiStatusMessages.ERROR}Missing JSON in the request"}), 400
+    subscriptionIDs, error = validateSubscriptionIDs(request.json)
+    if error:
+        return jsonify({API_MESSAGE_DESCRIPTOR: f"{ApiStatusMessages.ERROR}{error}"}), 400
+    return enqueueOperation('bulkUnsubscribe', {'subscriptionIDs': subscriptionIDs})
+
+@app.route('/operationStatus/<operationID>', methods=['GET'])
+@accessControlJwtOrApiKey
+def operationStatus(operationID):
+    """
+    Returns the progress and the outcome of a subscribe, resubscribe or unsubscribe operation (see operations.loadOperation).
+    The status is PENDING, RUNNING, RETRYING, SUCCEEDED or FAILED, the code is the HTTP status code the synchronous route answered with.
+    Finished operations are kept for SCHEDULER_OPERATION_RETENTION seconds.
 
-        lockConfigFile.releaseLock()
-        return jsonify({API_MESSAGE_DESCRIPTOR: f"{ApiStatusMessages.SUCCESS}Job {jobName} scheduled and subscription for API {apiName}; API_ID: {apiID} created"}), 200
-    except requests.RequestException as e:
-        return jsonify({API_MESSAGE_DESCRIPTOR: f"{ApiStatusMessages.ERROR}{str(e)}"}), 500
+    :param operationID: ID of the operation, returned by the route which started it
+    """
+    try:
+        operation = operations.loadOperation(operationID)
+    except redis.RedisError as e:
+        return jsonify({API_MESSAGE_DESCRIPTOR: f"{ApiStatusMessages.ERROR}Operation couldn't be loaded: {e}"}), 500
+    if operation is None:
+        return jsonify({API_MESSAGE_DESCRIPTOR: f"{ApiStatusMessages.ERROR}Operation {operationID} doesn't exist or expired"}), 404
+    return jsonify(operation), 200
+
+@app.route('/invalidateFetchPlans/<int:apiID>', methods=['POST'])
+@accessControlApiKey
+def invalidateFetchPlans(apiID):
+    """
+    Compiles the fetch plans of all subscriptions of an availableApi again.
+    Called by the PostgreSQL data connector if an availableApi was changed.
 
+    :param apiID: ID of the changed availableApi
+    """
+    refreshedPlans = fetchPlans.refreshFetchPlans(apiID)
+    if refreshedPlans is None:
+        return jsonify({API_MESSAGE_DESCRIPTOR: f"{ApiStatusMessages.ERROR}Fetch plans of API_ID {apiID} couldn't be refreshed"}), 500
+    return jsonify({API_MESSAGE_DESCRIPTOR: f"{ApiStatusMessages.SUCCESS}{refreshedPlans} fetch plans of API_ID {apiID} refreshed"}), 200
 
-@app.route('/resubscribeApi/<int:subscriptionID>', methods=['GET'])
-@accessControlJwt
-def resubscribeApi(subscriptionID):
+# --------------------------- Fetch Latencies -----------------------------------------------------------------------------------------------------------------------------------------
+@app.route('/metrics', methods=['GET'])
+@accessControlApiKey
+def metrics():
     """
-    Resubscribe to an API and schedule a job to fetch data from it.
+    Exports the stage latencies of the fetches of all workers, the schedule accuracy of the fleet, the load and utilisation of the workers
+    and the duration and moved jobs of the rebalances as Prometheus metrics.
+    """
+    try:
+        exposition = (fetchLatencies.renderPrometheus(fetchLatencies.loadWorkerHistograms()) + scheduleAccuracy.renderPrometheus(*scheduleAccuracy.loadScheduleAccuracy())
+                      + workerLoad.renderPrometheus(workerLoad.loadWorkerLoads()) + costModel.renderPrometheus(scale.loadUtilisation())
+                      + scale.renderRebalancePrometheus(scale.loadRebalanceStats()))
+        return Response(exposition, mimetype='text/plain; version=0.0.4')
+    except redis.RedisError as e:
+        return jsonify({API_MESSAGE_DESCRIPTOR: f"{ApiStatusMessages.ERROR}Fetch latencies couldn't be loaded: {e}"}), 500
+
+@app.route('/fetchLatencies', methods=['GET'])
+@accessControlApiKey
+def getFetchLatencies():
+    """
+    Returns count, mean, p50, p95 and p99 in seconds of every stage of the fetches, per API and per worker.
 
-    :param subscriptionID: ID of the subscription to resubscribe to
+    Response JSON data structure:
+    {
+        "byApi": {"<apiID>": {"<stage>": {"count": int, "mean": float, "p50": float, "p95": float, "p99": float}}},
+        "byWorker": {"<workerID>": {"<stage>": {...}}}
+    }
     """
     try:
-        response = requests.get(f'{COMPOSE_POSTGRES_DATA_CONNECTOR_URL}/subscription/{subscriptionID}', headers=headers)    # get the data of the requested subscription
-        response.raise_for_status()
-        data = response.json()
-        if data.get('status') == SubscriptionStatus.INACTIVE.value:
-            while not lockConfigFile.acquireLock():  # If the config file is locked, wait
-                time.sleep(0.5)
-            jobName = f"job{jobCounter.getHistoricalJobCounter()}"
-
-            checkContainersAlive()
-
-            containerName = scale.scaleWorkers()
-
-            if not containerName:
-                lockConfigFile.releaseLock()
-                return jsonify({API_MESSAGE_DESCRIPTOR: f"{ApiStatusMessages.ERROR}No worker container available"}), 400
-
-            manageJobs.addJob(jobName, str(data.get('interval')), str(data.get('command')), containerName)
-            lockConfigFile.releaseLock()
-
-            subscriptionResponse = requests.post(f'{COMPOSE_POSTGRES_DATA_CONNECTOR_URL}/setSubscriptionsStatus', 
-                                                 json={
-                                                    'subscriptionID': subscriptionID,
-                                                    'subscriptionStatus': SubscriptionStatus.ACTIVE.value,
-                                                    'jobName': jobName,
-                                                    'container': containerName
-                                                     },
-                                                 headers=headers)
-            subscriptionResponse.raise_for_status()
-            return jsonify({API_MESSAGE_DESCRIPTOR: f"{ApiStatusMessages.SUCCESS}Job {jobName} scheduled and subscription for API_ID {data.get('availableApiID')} reactivated"}), 200
-        else:
-            return jsonify({API_MESSAGE_DESCRIPTOR: f"{ApiStatusMessages.ERROR}Api is already active"}), 400
-    except requests.RequestException as e:
-        return jsonify({API_MESSAGE_DESCRIPTOR: f"{ApiStatusMessages.ERROR}: str(e)"}), 500
+        return jsonify(fetchLatencies.summarizeLatencies(fetchLatencies.loadWorkerHistograms())), 200
+    except redis.RedisError as e:
+        return jsonify({API_MESSAGE_DESCRIPTOR: f"{ApiStatusMessages.ERROR}Fetch latencies couldn't be loaded: {e}"}), 500
 
+@app.route('/scheduleAccuracy', methods=['GET'])
+@accessControlApiKey
+def getScheduleAccuracy():
+    """
+    Returns how late the ticks started compared to their schedule (count, mean, p50, p95, p99 in seconds) and how many ticks were missed,
+    for the whole fleet and per subscription.
 
+    Response JSON data structure:
+    {
+        "fleet": {"count": int, "mean": float, "p50": float, "p95": float, "p99": float, "missedTicks": int, "missedRatio": float},
+        "bySubscription": {"<subscriptionID>": {...}}
+    }
+    """
+    try:
+        return jsonify(scheduleAccuracy.summarizeScheduleAccuracy(*scheduleAccuracy.loadScheduleAccuracy())), 200
+    except redis.RedisError as e:
+        return jsonify({API_MESSAGE_DESCRIPTOR: f"{ApiStatusMessages.ERROR}Schedule accuracy couldn't be loaded: {e}"}), 500
 
-@app.route('/unsubscribeApi/<int:subscriptionID>', methods=['GET'])
-@accessControlJwt
-def unsubscribeApi(subscriptionID):
+@app.route('/workerLoads', methods=['GET'])
+@accessControlApiKey
+def getWorkerLoads():
     """
-    Unsubscribe from an API and delete the job fetching data from it.
-    Therefore set the PostgresSQL SubscriptionStatus to INACTIVE and delete the job from ofelia.
+    Returns the smoothed load of every worker and its last load report.
 
-    :param subscriptionID: ID of the subscription to unsubscribe from
+    Response JSON data structure:
+    {
+        "<workerID>": {"score": float, "overloaded": bool, "updatedAt": str,
+                       "report": {"cpu": float, "inflight": int, "saturation": float, "errorRate": float, "latency": float, "ticks": int}}
+    }
+    """
+    try:
+        return jsonify(workerLoad.loadWorkerLoads()), 200
+    except redis.RedisError as e:
+        return jsonify({API_MESSAGE_DESCRIPTOR: f"{ApiStatusMessages.ERROR}Worker loads couldn't be loaded: {e}"}), 500
+
+@app.route('/workerUtilisation', methods=['GET'])
+@accessControlApiKey
+def getWorkerUtilisation():
+    """
+    Returns the utilisation of every worker according to the cost model (see costModel.py): the sum of the costs of its jobs,
+    i.e. the fetch slots they keep busy on average, relative to its capacity. Workers which have jobs but aren't available have no utilisation.
+
+    Response JSON data structure:
+    {
+        "<workerID>": {"capacity": int, "cost": float, "utilisation": float, "jobs": int, "available": bool}
+    }
     """
     try:
-        response = requests.get(f'{COMPOSE_POSTGRES_DATA_CONNECTOR_URL}/subscription/{subscriptionID}', headers=headers)
-        response.raise_for_status()
-        data = response.json()
-        jobName = data.get('jobName')       # jobName is needed to delete the job from ofelia config.ini
-
-        while not lockConfigFile.acquireLock():  # If the config file is locked, wait
-            time.sleep(0.5)
-
-        if(manageJobs.deleteJob(jobName)):
-            subscriptionResponse = requests.post(f'{COMPOSE_POSTGRES_DATA_CONNECTOR_URL}/setSubscriptionsStatus', json={
-                                                    'subscriptionID': subscriptionID,
-                                                    'subscriptionStatus': SubscriptionStatus.INACTIVE.value,
-                                                    'jobName': None,
-                                                    'container': None
-                                                }, headers=headers)
-            subscriptionResponse.raise_for_status()
-            lockConfigFile.releaseLock()
-            return jsonify({API_MESSAGE_DESCRIPTOR: f"{ApiStatusMessages.SUCCESS}Api unsubsribed and job {jobName} deleted"}), 200
-        else:   # if the job couldn't be deleted from ofelia set the subscription status the DB to ERROR
-            subscriptionResponse = requests.post(f'{COMPOSE_POSTGRES_DATA_CONNECTOR_URL}/setSubscriptionsStatus', json={
-                'subscriptionID': subscriptionID,
-                'subscriptionStatus': SubscriptionStatus.ERROR.value,
-                'jobName': None,
-                'container': None
-            }, headers=headers)
-            subscriptionResponse.raise_for_status()
-            lockConfigFile.releaseLock()
-            return jsonify({API_MESSAGE_DESCRIPTOR: f"{ApiStatusMessages.ERROR}Api isn't unsubscribed and job {jobName} couldn't be deleted"}), 400
-    except requests.RequestException as e:
-        return jsonify({API_MESSAGE_DESCRIPTOR: f"{ApiStatusMessages.ERROR}: {str(e)}"}), 500
+        return jsonify(scale.loadUtilisation()), 200
+    except redis.RedisError as e:
+        return jsonify({API_MESSAGE_DESCRIPTOR: f"{ApiStatusMessages.ERROR}Worker utilisation couldn't be loaded: {e}"}), 500
 
 # --------------------------- Worker Heartbeat -----------------------------------------------------------------------------------------------------------------------------------------
 @app.route('/heartbeatWorkers', methods=['POST'])
@@ -220,16 +366,32 @@ def receive_heartbeat():
     Request JSON data structure:
     {
         "workerID": str,        # ID of the worker sending the heartbeat
-        "timestamp": str        # Timestamp of the heartbeat
+        "timestamp": str,       # Timestamp of the heartbeat
+        "load": dict            # Load of the worker since its last heartbeat (optional, see Worker/heartbeat/loadReport.py)
     }
+
+    If the smoothed load of the worker is above the high watermark, a share of its jobs is moved to less loaded workers
+    at most every WORKER_LOAD_SHED_COOLDOWN seconds (pinned dispatch mode, in stream dispatch mode the workers only read as many ticks as they can run).
     """
     data = request.get_json()
     workerID = data.get('workerID')
     timestamp = data.get('timestamp')
+    load = data.get('load')
 
     if workerID and timestamp:
         redisClient.hset('heartbeats', workerID, timestamp)   # save the heartbeat (containing: workerContainerID, timestamp) in the redis database
         logger.info(f"Received heartbeat from worker {workerID} at {timestamp}")
+        if load:
+            try:
+                if workerLoad.updateWorkerLoad(workerID, load)['overloaded'] and WORKER_DISPATCH_MODE != 'stream' and workerLoad.claimShed(workerID):
+                    with scale.lockJobStore() as leases:
+                        movedJobs = scale.shedLoad(workerID, leases)
+                    if movedJobs:
+                        manageJobs.refreshWorkerJobs()
+            except redis.RedisError as e:
+                logger.error(f"Error updating the load of worker {workerID}: {e}")
+            except (lockConfigFile.LockTimeoutError, lockConfigFile.LockLostError) as e:
+                logger.error(f"Load of worker {workerID} not shed: {e}")
         return jsonify({API_MESSAGE_DESCRIPTOR: f"{ApiStatusMessages.SUCCESS}Heartbeat successfully"}), 200
     else:
         logger.error("Invalid heartbeat data")
@@ -243,6 +405,8 @@ def receive_startup_heartbeat():
 
     This is used e.g. if a worker is restarted so that the scheduler checks the heartbeats directly 
     in order to delete the worker container from the NOT_WORKING_CONTAINERS set.
+    The worker registered itself before, if jobs are still assigned to workers which aren't registered
+    (removed containers, or container names from before the workers registered themselves) they are rebalanced.
 
     JSON request data structure:
     {
@@ -254,6 +418,15 @@ def receive_startup_heartbeat():
 
     if workerID in redisClient.smembers("NOT_WORKING_CONTAINERS"):
                     redisClient.srem("NOT_WORKING_CONTAINERS", workerID)
+
+    if scale.hasUnregisteredAssignments():
+        try:
+            with scale.lockJobStore() as leases:
+                logger.info(f"Worker {workerID} registered, moving the jobs of unregistered workers")
+                scale.balanceJobsAcrossWorkers(leases)
+        except (redis.RedisError, lockConfigFile.LockTimeoutError, lockConfigFile.LockLostError) as e:
+            logger.error(f"Jobs of unregistered workers not moved: {e}")
+        manageJobs.refreshWorkerJobs()
     return jsonify({API_MESSAGE_DESCRIPTOR: f"{ApiStatusMessages.SUCCESS}Startup heartbeat successfully"}), 200
 
 
@@ -268,51 +441,76 @@ def checkHeartbeats():
         # Iterate over all workers and check if they sent a heartbeat within the expected time
         for workerID, lastHeartbeat in heartbeats.items():
             lastHeartbeat = datetime.fromisoformat(lastHeartbeat)
+            if (now - lastHeartbeat).total_seconds() > WORKER_REGISTRATION_TIMEOUT:     # The worker is gone for good (e.g. scaled down), forget it
+                logger.info(f"Removing worker {workerID} from the registry, last seen at {lastHeartbeat}")
+                deregisterWorker(redisClient, workerID)
+                workerLoad.forgetWorkerLoad(workerID)
+                if WORKER_DISPATCH_MODE == 'stream':
+                    try:
+                        redisClient.xgroup_delconsumer(FETCH_STREAM_KEY, FETCH_STREAM_GROUP, workerID)     # its pending ticks were claimed by the other workers long ago
+                    except redis.ResponseError:     # the stream or the group doesn't exist (yet)
+                        pass
+                redisClient.hdel('heartbeats', workerID)
+                redisClient.srem("NOT_WORKING_CONTAINERS", workerID)
+                continue
             # Last heartbeat has to be send within 2*SCHEDULER_WORKER_HEARTBEAT_INTERVAL so one heartbeat can be missed
             if (now - lastHeartbeat).total_seconds() > (SCHEDULER_WORKER_HEARTBEAT_INTERVAL * 2):
                 logger.error(f"Worker {workerID} missed heartbeat! Last seen at {lastHeartbeat}")
                 if workerID not in redisClient.smembers("NOT_WORKING_CONTAINERS"):      # Just rebalance the jobs the first time a container is consired as not working
                     redisClient.sadd("NOT_WORKING_CONTAINERS", workerID)
-                    while not lockConfigFile.acquireLock():  # If the config file is locked, wait
-                        time.sleep(0.5)
-                    
-                    scale.balanceJobsAcrossWorkers()
-
-                    lockConfigFile.releaseLock()
-                    manageJobs.refreshOfelia()
+                    try:
+                        with scale.lockJobStore() as leases:
+                            scale.balanceJobsAcrossWorkers(leases)
+                    except (redis.RedisError, lockConfigFile.LockTimeoutError, lockConfigFile.LockLostError) as e:
+                        logger.error(f"Jobs of worker {workerID} not moved, trying again at the next check: {e}")
+                        try:
+                            redisClient.srem("NOT_WORKING_CONTAINERS", workerID)      # otherwise the jobs would never be moved
+                        except redis.RedisError as e:
+                            logger.error(f"Error accessing Redis: {e}")
+                    manageJobs.refreshWorkerJobs()
             else:
                 # if the worker is in NOT_WORKING_CONTAINERS but is sending heartbeats again, remove it from the set
                 if workerID in redisClient.smembers("NOT_WORKING_CONTAINERS"):
                     redisClient.srem("NOT_WORKING_CONTAINERS", workerID)
                 logger.info(f"{now.time()}: Worker {workerID} is alive (last seen {lastHeartbeat})")
 
+        if WORKER_DISPATCH_MODE != 'stream' and redisClient.set('JOB_COSTS_UPDATED', now.isoformat(), nx=True, ex=WORKER_COST_UPDATE_INTERVAL):    # one replica per interval
+            updateJobCosts()
+
         time.sleep(SCHEDULER_WORKER_HEARTBEAT_INTERVAL)     # Sleep before checking again
 
-def checkContainersAlive():
+def updateJobCosts():
     """
-    Check which of the containers are still alive.
-    In comparison to the checkHeartbeats function, this function is only called when a new job is scheduled and 
-    isn't executed periodically.
-    And it doesn't checks if last heartbeat was sent in SCHEDULER_WORKER_HEARTBEAT_INTERVAL*2
-    this one checks if the last heartbeat was sent in SCHEDULER_WORKER_HEARTBEAT_INTERVAL because the chance to schedule
-    a job on a dead container gets smaller if no heartbeat could be missed like it's checked in this function
+    Computes the costs of the jobs again with the current latencies and payload sizes of their APIs.
+    Workers whose jobs exceed their budget afterwards hand over their newest jobs (see scale.balanceJobsAcrossWorkers).
     """
-    now = datetime.now(timezone.utc)
-    heartbeats = redisClient.hgetall('heartbeats')
-
-    # Iterate over all workers and check if they sent a heartbeat within the expected time
-    for workerID, lastHeartbeat in heartbeats.items():
-        lastHeartbeat = datetime.fromisoformat(lastHeartbeat)
-        # Last heartbeat has to be send within 2*SCHEDULER_WORKER_HEARTBEAT_INTERVAL so one heartbeat can be missed
-        if (now - lastHeartbeat).total_seconds() > (SCHEDULER_WORKER_HEARTBEAT_INTERVAL):
-            logger.error(f"Worker {workerID} missed heartbeat! Last seen at {lastHeartbeat}")
-            redisClient.sadd("NOT_WORKING_CONTAINERS", workerID)
+    try:
+        with scale.lockJobStore() as leases:
+            changedJobs = scale.updateJobCosts(leases)
+            if changedJobs:
+                logger.info(f"Costs of {changedJobs} jobs changed")
+                scale.balanceJobsAcrossWorkers(leases)
+    except (redis.RedisError, lockConfigFile.LockTimeoutError, lockConfigFile.LockLostError) as e:
+        logger.error(f"Error updating the job costs: {e}")
+        changedJobs = 0
+    if changedJobs:
+        manageJobs.refreshWorkerJobs()
 
 # Create a new thread for the check_heartbeats function in order to not block the main API functions
 heartbeat_thread = threading.Thread(target=checkHeartbeats)
 heartbeat_thread.daemon = False
 heartbeat_thread.start()
 
+for executorNumber in range(SCHEDULER_OPERATION_EXECUTORS):     # every replica carries out the operations of all replicas
+    operation_thread = threading.Thread(target=operations.runExecutor, args=(subscriptionOperations.HANDLERS,))
+    operation_thread.daemon = True
+    operation_thread.start()
+
+if WORKER_DISPATCH_MODE == 'stream':    # every replica runs the dispatcher, only the one holding the lease adds the ticks to the stream
+    dispatch_thread = threading.Thread(target=streamDispatch.runDispatcher)
+    dispatch_thread.daemon = True
+    dispatch_thread.start()
+
 if __name__ == '__main__':          # Only executed when using the Dockerfile.dev
                                     # Otherwise, the app is started by the WSGI server
       app.run(host='0.0.0.0', port=5002, debug=True)
\ No newline at end of file
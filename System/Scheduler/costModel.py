@@ -0,0 +1,92 @@
+import fetchLatencies
+from commonRessources import WORKER_TARGET_UTILISATION, WORKER_COST_DEFAULT_LATENCY, WORKER_COST_BYTES_PER_SECOND, WORKER_COST_TICK_OVERHEAD
+from commonRessources.logger import setLoggerLevel
+from commonRessources.latencyHistograms import mergeHistograms
+
+# --------------------------- Initializations -----------------------------------------------------------------------------------------------------------------------------------------
+logger = setLoggerLevel("CostModel")
+
+# --------------------------- Cost Model Functions -----------------------------------------------------------------------------------------------------------------------------------------
+# The cost of a job is the number of fetch slots it keeps busy on average: the expected duration of one tick divided by its interval.
+# A tick takes the observed mean duration of the ticks of its API (all workers, see fetchLatencies.py), the time to decode and write its
+# mean payload and the overhead of a tick in the fetch mode. So a job fetching every second weighs 3600 times as much as the same job fetching hourly.
+# The capacity of a worker is the number of its fetch slots (WORKER_CAPACITY), the scheduler fills WORKER_TARGET_UTILISATION of it.
+
+def loadApiStatistics():
+    """
+    :return: Dictionary apiID -> {"latency": mean seconds of a tick, "payloadBytes": mean bytes of a payload}, of the APIs with observed ticks
+    """
+    byApi = {}
+    for histograms in fetchLatencies.loadWorkerHistograms().values():
+        for (stage, apiID), histogram in histograms.items():
+            if stage in ('total', 'download'):
+                byApi.setdefault(apiID, {}).setdefault(stage, []).append(histogram)
+
+    apiStatistics = {}
+    for apiID, stages in byApi.items():
+        total = mergeHistograms(stages.get('total', []))
+        download = mergeHistograms(stages.get('download', []))
+        ticks = sum(total['buckets'])
+        downloads = sum(download['buckets'])
+        apiStatistics[apiID] = {
+            'latency': total['sum'] / ticks if ticks else None,
+            'payloadBytes': download['bytes'] / downloads if downloads else None
+        }
+    return apiStatistics
+
+def jobCost(interval, apiID, apiStatistics):
+    """
+    :param interval: Interval of the job in seconds
+    :param apiID: ID of the API of the job
+    :param apiStatistics: As returned by loadApiStatistics
+    :return: The fetch slots the job keeps busy on average
+    """
+    statistics = apiStatistics.get(str(apiID), {})
+    latency = statistics.get('latency') or WORKER_COST_DEFAULT_LATENCY
+    payloadBytes = statistics.get('payloadBytes') or 0
+    return (latency + payloadBytes / WORKER_COST_BYTES_PER_SECOND + WORKER_COST_TICK_OVERHEAD) / max(1, int(interval))
+
+def workerBudget(capacity):
+    """
+    :return: The cost of the jobs a worker with this capacity takes at most
+    """
+    return capacity * WORKER_TARGET_UTILISATION
+
+def summarizeUtilisation(workerCapacities, workerCosts, workerJobCounts):
+    """
+    :param workerCapacities: Dictionary workerID -> capacity of the available workers (see scale.availableWorkers)
+    :param workerCosts: Dictionary workerID -> sum of the costs of its jobs
+    :param workerJobCounts: Dictionary workerID -> number of its jobs
+    :return: Dictionary workerID -> {"capacity", "cost", "utilisation", "jobs", "available"}, the utilisation is the share of the capacity the jobs keep busy.
+             Workers which have jobs but aren't available are included with capacity 0
+    """
+    utilisation = {}
+    for workerID in {*workerCapacities, *workerJobCounts}:
+        capacity = workerCapacities.get(workerID, 0)
+        cost = workerCosts.get(workerID, 0.0)
+        utilisation[workerID] = {
+            'capacity': capacity,
+            'cost': round(cost, 4),
+            'utilisation': round(cost / capacity, 4) if capacity else None,
+            'jobs': workerJobCounts.get(workerID, 0),
+            'available': workerID in workerCapacities
+        }
+    return utilisation
+
+def renderPrometheus(utilisation):
+    """
+    :param utilisation: As returned by summarizeUtilisation
+    :return: The utilisation of the workers in the Prometheus text exposition format
+    """
+    lines = [
+        "# HELP apiharvester_worker_utilisation Share of the fetch slots of the worker its jobs keep busy according to the cost model",
+        "# TYPE apiharvester_worker_utilisation gauge"
+    ]
+    for workerID, worker in sorted(utilisation.items()):
+        if worker['utilisation'] is not None:
+            lines.append(f'apiharvester_worker_utilisation{{worker="{workerID}"}} {worker["utilisation"]}')
+    lines.append("# HELP apiharvester_worker_jobs Number of jobs assigned to the worker")
+    lines.append("# TYPE apiharvester_worker_jobs gauge")
+    for workerID, worker in sorted(utilisation.items()):
+        lines.append(f'apiharvester_worker_jobs{{worker="{workerID}"}} {worker["jobs"]}')
+    return "\n".join(lines) + "\n"
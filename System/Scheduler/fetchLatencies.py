@@ -0,0 +1,62 @@
+import redis
+from commonRessources import REDIS_HOST, REDIS_PORT
+from commonRessources.logger import setLoggerLevel
+from commonRessources.latencyHistograms import LATENCY_BUCKETS, WORKER_LATENCY_KEY_PREFIX, FETCH_STAGES, parseHistograms, mergeHistograms, summarizeHistogram
+
+# --------------------------- Initializations -----------------------------------------------------------------------------------------------------------------------------------------
+logger = setLoggerLevel("FetchLatencies")
+redisClient = redis.StrictRedis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+
+# --------------------------- Fetch Latency Functions -----------------------------------------------------------------------------------------------------------------------------------------
+# Every worker adds the stage latencies of its fetches to a Redis hash (see commonRessources/latencyHistograms.py).
+# The scheduler reads the hashes of all workers and exports them as Prometheus histograms, or as percentiles per stage.
+
+def loadWorkerHistograms():
+    """
+    :return: Dictionary workerID -> {(stage, apiID): histogram}
+    """
+    workerHistograms = {}
+    for key in redisClient.scan_iter(match=f"{WORKER_LATENCY_KEY_PREFIX}*"):
+        workerHistograms[key[len(WORKER_LATENCY_KEY_PREFIX):]] = parseHistograms(redisClient.hgetall(key))
+    return workerHistograms
+
+def summarizeLatencies(workerHistograms):
+    """
+    Computes count, mean, p50, p95 and p99 of every stage per API (all workers) and per worker (all APIs).
+
+    :param workerHistograms: As returned by loadWorkerHistograms
+    :return: {"byApi": {apiID: {stage: summary}}, "byWorker": {workerID: {stage: summary}}}
+    """
+    byApi = {}
+    byWorker = {}
+    for workerID, histograms in workerHistograms.items():
+        for (stage, apiID), histogram in histograms.items():
+            byApi.setdefault(apiID, {}).setdefault(stage, []).append(histogram)
+            byWorker.setdefault(workerID, {}).setdefault(stage, []).append(histogram)
+    return {
+        'byApi': {apiID: {stage: summarizeHistogram(mergeHistograms(histograms)) for stage, histograms in stages.items()} for apiID, stages in byApi.items()},
+        'byWorker': {workerID: {stage: summarizeHistogram(mergeHistograms(histograms)) for stage, histograms in stages.items()} for workerID, stages in byWorker.items()}
+    }
+
+def renderPrometheus(workerHistograms):
+    """
+    Renders the histograms in the Prometheus text exposition format, one series per worker, API and stage:
+    apiharvester_fetch_stage_seconds_bucket{worker="...",api="2",stage="ttfb",le="0.1"} 42
+
+    :param workerHistograms: As returned by loadWorkerHistograms
+    :return: The exposition as text
+    """
+    lines = [
+        "# HELP apiharvester_fetch_stage_seconds Duration of the stages of the fetches (" + ", ".join(f"{stage}: {description}" for stage, description in FETCH_STAGES.items()) + ")",
+        "# TYPE apiharvester_fetch_stage_seconds histogram"
+    ]
+    for workerID, histograms in sorted(workerHistograms.items()):
+        for (stage, apiID), histogram in sorted(histograms.items()):
+            labels = f'worker="{workerID}",api="{apiID}",stage="{stage}"'
+            cumulative = 0
+            for bound, count in zip([*map(str, LATENCY_BUCKETS), '+Inf'], histogram['buckets']):
+                cumulative += count
+                lines.append(f'apiharvester_fetch_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'apiharvester_fetch_stage_seconds_sum{{{labels}}} {histogram["sum"]}')
+            lines.append(f'apiharvester_fetch_stage_seconds_count{{{labels}}} {cumulative}')
+    return "\n".join(lines) + "\n"
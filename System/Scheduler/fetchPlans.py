@@ -0,0 +1,211 @@
+import redis
+import requests
+import hashlib
+import json
+from os import getenv
+from commonRessources import REDIS_HOST, REDIS_PORT, COMPOSE_POSTGRES_DATA_CONNECTOR_URL, WORKER_FETCH_TIMEOUT, WORKER_FETCH_API_TIMEOUTS, WORKER_FETCH_MAX_BODY_SIZE, WORKER_UNCHANGED_PAYLOAD
+from commonRessources.logger import setLoggerLevel
+from commonRessources.rateLimits import getProvider
+from commonRessources.urlTemplates import templateParameters, renderUrlTemplate
+
+# -------------------------- Environment Variables ------------------------------------------------------------------------------------------------------------------------------------------
+FETCH_PLAN_FORMAT_VERSION = 2
+FETCH_PLANS_KEY = 'FETCH_PLANS'                     # Redis hash: subscriptionID -> compiled fetch plan (JSON)
+FETCH_PLANS_BY_API_KEY_PREFIX = 'FETCH_PLANS_BY_API:'   # Redis set per availableApiID containing the subscriptionIDs of its fetch plans
+FETCH_PLANS_VERSION_KEY = 'FETCH_PLANS_VERSION'     # Incremented every time fetch plans are invalidated, so the fetch daemons reload them
+REPORTED_STATUS_KEY = 'REPORTED_SUBSCRIPTION_STATUS'    # Written by the workers: subscriptionID -> status they last reported
+CONTENT_STATE_KEY = 'CONTENT_STATE'                 # Written by the workers in cli mode: subscriptionID -> ETag, Last-Modified and hash of the last payload
+
+apiKey = getenv('INTERNAL_API_KEY')
+headers = {
+    'x-api-key': apiKey
+}
+
+# --------------------------- Initializations -----------------------------------------------------------------------------------------------------------------------------------------
+logger = setLoggerLevel("FetchPlans")
+redisClient = redis.StrictRedis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+
+# --------------------------- Fetch Plan Functions -----------------------------------------------------------------------------------------------------------------------------------------
+def compileFetchPlan(apiData, parameters=None):
+    """
+    Compiles the fetch plan of a subscription of an availableApi. The fetch plan contains everything a worker needs to fetch the API,
+    so that the worker doesn't have to ask the PostgreSQL data connector on every tick:
+    {
+        "v": 2,                                 # format version of the fetch plan
+        "apiID": 2,
+        "apiVersion": "3f0c5e1a9b2d",           # hash of the availableApi row the plan was compiled from
+        "url": "https://finnhub.io/api/v1/quote?symbol=IBM",    # the URL template of the API filled with the parameters
+        "parameters": {"symbol": "IBM"},        # parameters of the subscription for the placeholders of the URL template
+        "auth": {"scheme": "query", "param": "token", "tokenRef": "FINNHUB_KEY"},   # None if no API token is required
+        "provider": "FINNHUB",                  # whose rate limit the fetches use (see rateLimits.json)
+        "timeout": 10,
+        "maxBodySize": 10485760,                # bytes, larger responses are aborted
+        "fields": ["c", "d", ...],              # relevantFields which are stored
+        "unchanged": "HEARTBEAT",               # what is written if the payload didn't change (see interfaces.UnchangedPayload)
+        "batch": {                              # None if the API has no batch form
+            "group": "3:5d41402abc4b",          # subscriptions of the same group may be fetched together in one request
+            "url": "https://api.open-meteo.com/v1/forecast?latitude={latitude}&longitude={longitude}&current=rain",
+            "parameters": ["latitude", "longitude"],    # placeholders which take the values of all subscriptions of the request
+            "separator": ",",
+            "maxSize": 50,                      # subscriptions per request
+            "split": "INDEX",                   # INDEX: the response is a list in the order of the values, KEY: a dictionary by the value of "key"
+            "key": null
+        }
+    }
+
+    :param apiData: The availableApi as returned by the PostgreSQL data connector
+    :param parameters: The parameters of the subscription for the placeholders of the URL template
+    :return: The fetch plan, None if the API requires a token but has no authParameter configured or a parameter is missing
+    """
+    apiID = apiData.get('availableApiID')
+    parameters = {name: str(value) for name, value in (parameters or {}).items()}
+    missingParameters = [name for name in templateParameters(apiData.get('url')) if name not in parameters]
+    if missingParameters:
+        logger.error(f"Parameters {missingParameters} of the URL template of availableApi {apiID} are missing")
+        return None
+    auth = None
+    if apiData.get('apiTokenRequired'):
+        if not apiData.get('authParameter'):
+            logger.error(f"availableApi {apiID} requires an API token but has no authParameter")
+            return None
+        auth = {
+            'scheme': 'query',
+            'param': apiData.get('authParameter'),
+            'tokenRef': f"{apiData.get('name').split(' ')[0].upper()}_KEY"     # the API token is stored in apikeys.txt under the name of the API until the first space
+        }
+
+    return {
+        'v': FETCH_PLAN_FORMAT_VERSION,
+        'apiID': apiID,
+        'apiVersion': hashlib.sha1(json.dumps(apiData, sort_keys=True).encode('utf-8')).hexdigest()[:12],
+        'url': renderUrlTemplate(apiData.get('url'), parameters),
+        'parameters': parameters,
+        'auth': auth,
+        'provider': getProvider(apiData.get('name'), apiData.get('url'), apiData.get('apiTokenRequired')),
+        'timeout': apiData.get('timeout') or WORKER_FETCH_API_TIMEOUTS.get(str(apiID), WORKER_FETCH_TIMEOUT),
+        'maxBodySize': apiData.get('maxBodySize') or WORKER_FETCH_MAX_BODY_SIZE,
+        'fields': apiData.get('relevantFields') or [],
+        'unchanged': apiData.get('unchangedPayload') or WORKER_UNCHANGED_PAYLOAD,
+        'batch': compileBatch(apiID, apiData.get('batch'), parameters)
+    }
+
+def compileBatch(apiID, batch, parameters):
+    """
+    Compiles the batch form of an availableApi for the fetch plan of one subscription.
+    The placeholders which aren't batched are filled already, subscriptions which share them form a group.
+
+    :param apiID: The ID of the availableApi
+    :param batch: The batch form of the availableApi, e.g. {"url": <template>, "parameters": ["symbol"], "separator": ",", "maxSize": 50, "split": "KEY", "key": "symbol"}
+    :param parameters: The parameters of the subscription
+    :return: The batch part of the fetch plan, None if the API has no (valid) batch form
+    """
+    if not batch or not batch.get('url') or not batch.get('parameters'):
+        return None
+    batchedParameters = list(batch['parameters'])
+    split = batch.get('split', 'INDEX')
+    if split not in ('INDEX', 'KEY') or (split == 'KEY' and batch.get('key') not in batchedParameters) \
+            or any(name not in parameters for name in templateParameters(batch['url'])):
+        logger.error(f"Invalid batch form of availableApi {apiID}, its subscriptions are fetched one by one")
+        return None
+    sharedParameters = {name: value for name, value in parameters.items() if name not in batchedParameters}
+    return {
+        'group': f"{apiID}:{hashlib.sha1(json.dumps(sharedParameters, sort_keys=True).encode('utf-8')).hexdigest()[:12]}",
+        'url': renderUrlTemplate(batch['url'], sharedParameters),
+        'parameters': batchedParameters,
+        'separator': batch.get('separator', ','),
+        'maxSize': int(batch.get('maxSize', 50)),
+        'split': split,
+        'key': batch.get('key')
+    }
+
+def storeFetchPlan(subscriptionID, plan):
+    """
+    Stores the fetch plan of a subscription in Redis, where the workers read it from.
+
+    :param subscriptionID: The ID of the subscription
+    :param plan: The compiled fetch plan
+    """
+    storeFetchPlans({subscriptionID: plan})
+
+def storeFetchPlans(plans):
+    """
+    Stores the fetch plans of several subscriptions in one transaction, the fetch daemons reload them once.
+
+    :param plans: Dictionary subscriptionID -> compiled fetch plan
+    """
+    if not plans:
+        return
+    pipeline = redisClient.pipeline(transaction=True)
+    pipeline.hset(FETCH_PLANS_KEY, mapping={subscriptionID: json.dumps(plan, separators=(',', ':')) for subscriptionID, plan in plans.items()})
+    for subscriptionID, plan in plans.items():
+        pipeline.sadd(f"{FETCH_PLANS_BY_API_KEY_PREFIX}{plan['apiID']}", subscriptionID)
+    pipeline.incr(FETCH_PLANS_VERSION_KEY)
+    pipeline.execute()
+
+def deleteFetchPlan(subscriptionID, apiID):
+    """
+    Deletes the fetch plan of a subscription from Redis.
+
+    :param subscriptionID: The ID of the subscription
+    :param apiID: The ID of the availableApi of the subscription
+    """
+    deleteFetchPlans({subscriptionID: apiID})
+
+def deleteFetchPlans(subscriptions):
+    """
+    Deletes the fetch plans of several subscriptions from Redis in one transaction.
+
+    :param subscriptions: Dictionary subscriptionID -> ID of the availableApi of the subscription
+    """
+    if not subscriptions:
+        return
+    try:
+        pipeline = redisClient.pipeline(transaction=True)
+        pipeline.hdel(FETCH_PLANS_KEY, *subscriptions)
+        for subscriptionID, apiID in subscriptions.items():
+            pipeline.srem(f"{FETCH_PLANS_BY_API_KEY_PREFIX}{apiID}", subscriptionID)
+        pipeline.hdel(REPORTED_STATUS_KEY, *subscriptions)
+        pipeline.hdel(CONTENT_STATE_KEY, *subscriptions)
+        pipeline.incr(FETCH_PLANS_VERSION_KEY)
+        pipeline.execute()
+    except redis.RedisError as e:
+        logger.error(f"Error deleting the fetch plans of subscriptions {sorted(map(str, subscriptions))}: {e}")
+
+def refreshFetchPlans(apiID):
+    """
+    Compiles the fetch plans of all subscriptions of an availableApi again, each with the parameters of its old plan.
+    This is done if the availableApi was changed.
+
+    :param apiID: The ID of the availableApi
+    :return: The number of refreshed fetch plans, None if the availableApi couldn't be loaded or compiled
+    """
+    try:
+        response = requests.get(f'{COMPOSE_POSTGRES_DATA_CONNECTOR_URL}/availableApi/{apiID}', headers=headers)
+        response.raise_for_status()
+    except requests.RequestException as e:
+        logger.error(f"Error fetching availableApi {apiID}: {e}")
+        return None
+
+    apiData = response.json()
+    if compileFetchPlan(apiData, {name: '' for name in templateParameters(apiData.get('url'))}) is None:
+        return None
+
+    try:
+        subscriptionIDs = list(redisClient.smembers(f"{FETCH_PLANS_BY_API_KEY_PREFIX}{apiID}"))
+        plans = {}
+        for subscriptionID, rawPlan in zip(subscriptionIDs, redisClient.hmget(FETCH_PLANS_KEY, subscriptionIDs) if subscriptionIDs else []):
+            plan = compileFetchPlan(apiData, json.loads(rawPlan).get('parameters') if rawPlan else None)
+            if plan is None:
+                logger.error(f"Fetch plan of subscription {subscriptionID} couldn't be compiled again, resubscribe it with the parameters of the new URL template")
+                continue
+            plans[subscriptionID] = json.dumps(plan, separators=(',', ':'))
+        if plans:
+            pipeline = redisClient.pipeline(transaction=True)
+            pipeline.hset(FETCH_PLANS_KEY, mapping=plans)
+            pipeline.incr(FETCH_PLANS_VERSION_KEY)
+            pipeline.execute()
+        logger.info(f"Refreshed {len(plans)} of {len(subscriptionIDs)} fetch plans of availableApi {apiID}")
+        return len(plans)
+    except redis.RedisError as e:
+        logger.error(f"Error refreshing the fetch plans of availableApi {apiID}: {e}")
+        return None
@@ -2,11 +2,10 @@ import redis
 import logging
 from os import getenv
 from commonRessources import REDIS_HOST, REDIS_PORT
-import configparser
 from commonRessources.logger import setLoggerLevel
+import jobStore
 
 # -------------------------- Environment Variables ------------------------------------------------------------------------------------------------------------------------------------------
-CONFIG_FILE = '/app/opheliaConfig/config.ini'
 activeJobCounterName = 'ACTIVE_JOB_COUNTER'         # The active job counter is the number of jobs that are currently being executed.
 historicalJobCounterName = 'HISTORICAL_JOB_COUNTER' # The historical job counter is the number of jobs that have been executed since the start of the system.
                                                     # This is needed in order to assign unique job IDs to each job.
@@ -17,12 +16,8 @@ logger = setLoggerLevel("RedisJobCounter")
 redisClient = redis.StrictRedis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
 
 def initializeActiveJobCounter():
-    config = configparser.ConfigParser()
-    config.read(CONFIG_FILE)
-
-    activeJobCounter = sum(1 for section in config.sections() if section.startswith('job-exec "'))
-
     try:
+        activeJobCounter = jobStore.countJobs()
         logger.info(f"Active Job Counter initialized to {activeJobCounter}")
         redisClient.set(activeJobCounterName, activeJobCounter)
         # AKTIVE WORKER Müssen auch in der Redis gespeichert werden und am Anfang initialisiert werden
@@ -31,50 +26,63 @@ def initializeActiveJobCounter():
 initializeActiveJobCounter()
 
 def initializeHistoricalJobCounter():
-    config = configparser.ConfigParser()
-    config.read(CONFIG_FILE)
-
-    # search the highest job number in the config file
-    maxJobNumber = 0
-
-    for section in config.sections():
-        if section.startswith('job-exec "job'):
-            jobNumber = int(section.split('"job')[1].split('"')[0])
-            if jobNumber > maxJobNumber:
-                maxJobNumber = jobNumber
-    maxJobNumber += 1
-
     try:
+        # search the highest job number in the job store
+        maxJobNumber = max([jobStore.jobSortKey(jobName)[0] for jobName in jobStore.jobNames()], default=0)
+        maxJobNumber = max(maxJobNumber, 0) + 1
+
+        with redisClient.pipeline(transaction=True) as pipeline:        # never lower it, another replica may have handed out numbers already
+            while True:
+                try:
+                    pipeline.watch(historicalJobCounterName)
+                    maxJobNumber = max(maxJobNumber, int(pipeline.get(historicalJobCounterName) or 0))
+                    pipeline.multi()
+                    pipeline.set(historicalJobCounterName, maxJobNumber)
+                    pipeline.execute()
+                    break
+                except redis.WatchError:
+                    continue
         logger.info(f"Historical Job Counter initialized to {maxJobNumber}")
-        redisClient.set(historicalJobCounterName, maxJobNumber)
     except redis.RedisError as e:
         logger.error(f"Error accessing Redis during initializing the {historicalJobCounterName}: {e}")
 initializeHistoricalJobCounter()
 
 # --------------------------- Job Counter Functions -----------------------------------------------------------------------------------------------------------------------------------------
-def updateActiveJobCounter(increment: bool):
+def updateActiveJobCounter(increment: bool, count=1):
     """
     Updates the active job counter in Redis.
     :param increment: True if the counter should be incremented, False if it should be decremented
+    :param count: Number of jobs which were added or deleted
     """
-    config = configparser.ConfigParser()
-    config.read(CONFIG_FILE)
-
     try:
         if increment:
-            redisClient.incr(activeJobCounterName)
+            redisClient.incrby(activeJobCounterName, count)
         else:
-            redisClient.decr(activeJobCounterName)
+            redisClient.decrby(activeJobCounterName, count)
         logger.info(f"Active Job Counter updated to {redisClient.get(activeJobCounterName)}")
     except redis.RedisError as e:
         logger.error(f"Error updating Redis counter: {e}")
 
-def updateHistoricalJobCounter():
+def allocateJobName():
+    """
+    Hands out the name of a new job. The historical job counter is incremented in the same command,
+    so concurrent subscriptions of the scheduler replicas never get the same name.
+
+    :return: The job name, e.g. "job12"
     """
-    Updates the historical job counter in Redis.
+    return f"job{redisClient.incr(historicalJobCounterName) - 1}"
+
+def allocateJobNames(count):
+    """
+    Hands out the names of several new jobs with one increment of the historical job counter (see allocateJobName).
+
+    :param count: Number of job names
+    :return: List of the job names, in ascending order
     """
-    redisClient.incr(historicalJobCounterName)
-    logger.info(f"Historical Job Counter updated to {redisClient.get(historicalJobCounterName)}")
+    if count <= 0:
+        return []
+    last = redisClient.incrby(historicalJobCounterName, count)
+    return [f"job{number}" for number in range(last - count, last)]
 
 def getActiveJobCounter():
     """
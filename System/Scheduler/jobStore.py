@@ -0,0 +1,257 @@
+import configparser
+import json
+import os
+import re
+import uuid
+import redis
+import lockConfigFile
+from commonRessources import REDIS_HOST, REDIS_PORT, SCHEDULER_JOBS_FILE
+from commonRessources.logger import setLoggerLevel
+
+# -------------------------- Environment Variables ------------------------------------------------------------------------------------------------------------------------------------------
+CONFIG_FILE = SCHEDULER_JOBS_FILE     # Rendered from the job store after every change, the jobs are imported from it if Redis lost them
+JOBS_KEY = 'JOBS'                                   # Hash jobName -> job (JSON), the source of truth of the jobs of all workers
+JOBS_BY_WORKER_KEY_PREFIX = 'JOBS_BY_WORKER:'       # Set per worker containing the names of its jobs
+JOBS_BY_API_KEY_PREFIX = 'JOBS_BY_API:'             # Set per availableApiID containing the names of the jobs of its subscriptions
+JOB_BY_SUBSCRIPTION_KEY = 'JOB_BY_SUBSCRIPTION'     # Hash subscriptionID -> jobName
+WORKER_JOB_COUNTS_KEY = 'WORKER_JOB_COUNTS'         # Hash workerID -> number of its jobs
+WORKER_JOB_COSTS_KEY = 'WORKER_JOB_COSTS'           # Hash workerID -> sum of the costs of its jobs (see costModel.py)
+JOBS_DIRTY_WORKERS_KEY = 'JOBS_DIRTY_WORKERS'       # Set of the workers whose jobs changed since they were published (see workerJobs.publishWorkerJobs)
+
+# --------------------------- Initializations -----------------------------------------------------------------------------------------------------------------------------------------
+logger = setLoggerLevel("JobStore")
+redisClient = redis.StrictRedis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+
+# --------------------------- Job Store Functions -----------------------------------------------------------------------------------------------------------------------------------------
+# Every job is stored once in JOBS together with its subscription, API and worker, the indexes are updated in the same transaction.
+# So placing a job only reads the job counts of the workers and moving or deleting a job only touches the job itself,
+# instead of parsing the whole jobs file on every operation. The jobs file is only written to keep a copy of the jobs outside of Redis.
+# The job store is changed while holding the locks of the workers whose jobs change (see lockConfigFile.py), the read-modify-write functions rely on it.
+# The writes are fenced by the leases of these locks, so they fail with a LockLostError if a lease was lost in the meantime.
+
+def buildJob(jobName, subscriptionID, apiID, interval, command, worker, cost=0.0):
+    """
+    :return: The job as stored, its cost is the number of fetch slots it keeps busy on average (see costModel.jobCost):
+    {
+        "jobName": "job12",
+        "subscriptionID": "42",
+        "apiID": "2",
+        "interval": 60,
+        "command": "python /app/fetchScripts/fetchApis.py --subscriptionID 42 --apiID 2 --interval 60",
+        "worker": "3f2a9c0d41b7",
+        "cost": 0.025
+    }
+    """
+    return {
+        'jobName': jobName,
+        'subscriptionID': str(subscriptionID) if subscriptionID is not None else None,
+        'apiID': str(apiID) if apiID is not None else None,
+        'interval': int(interval),
+        'command': command,
+        'worker': worker,
+        'cost': round(float(cost), 6)
+    }
+
+def jobSortKey(jobName):
+    """
+    :return: Sort key ordering the jobs by the time they were created (the number of the historical job counter in their name)
+    """
+    match = re.search(r'(\d+)$', jobName)
+    return (int(match.group(1)) if match else -1, jobName)
+
+def jobsFromConfig(config):
+    """
+    Parses the jobs of an INI file in the format of the jobs file (or of the Ofelia config.ini),
+    the only place where the subscription and the API are taken from the command.
+
+    :param config: The ConfigParser of the file
+    :return: List of the jobs
+    """
+    jobs = []
+    for section in config.sections():
+        if section.startswith('job-exec'):
+            jobName = re.search(r'job-exec\s*"(.*?)"', section).group(1)
+            command = config.get(section, 'command')
+            subscriptionID = re.search(r'--subscriptionID (\d+)', command)
+            apiID = re.search(r'--apiID (\d+)', command)
+            jobs.append(buildJob(jobName,
+                                 subscriptionID.group(1) if subscriptionID else None,
+                                 apiID.group(1) if apiID else None,
+                                 re.search(r'@every\s*(\d+)s', config.get(section, 'schedule')).group(1),
+                                 command,
+                                 config.get(section, 'container', fallback=None)))
+    return jobs
+
+def _addToIndexes(pipeline, job):
+    pipeline.sadd(f"{JOBS_BY_WORKER_KEY_PREFIX}{job['worker']}", job['jobName'])
+    pipeline.hincrby(WORKER_JOB_COUNTS_KEY, job['worker'], 1)
+    pipeline.hincrbyfloat(WORKER_JOB_COSTS_KEY, job['worker'], job.get('cost', 0.0))
+    pipeline.sadd(JOBS_DIRTY_WORKERS_KEY, job['worker'])
+    if job['apiID'] is not None:
+        pipeline.sadd(f"{JOBS_BY_API_KEY_PREFIX}{job['apiID']}", job['jobName'])
+    if job['subscriptionID'] is not None:
+        pipeline.hset(JOB_BY_SUBSCRIPTION_KEY, job['subscriptionID'], job['jobName'])
+
+def _removeFromIndexes(pipeline, job):
+    pipeline.srem(f"{JOBS_BY_WORKER_KEY_PREFIX}{job['worker']}", job['jobName'])
+    pipeline.hincrby(WORKER_JOB_COUNTS_KEY, job['worker'], -1)
+    pipeline.hincrbyfloat(WORKER_JOB_COSTS_KEY, job['worker'], -job.get('cost', 0.0))
+    pipeline.sadd(JOBS_DIRTY_WORKERS_KEY, job['worker'])
+    if job['apiID'] is not None:
+        pipeline.srem(f"{JOBS_BY_API_KEY_PREFIX}{job['apiID']}", job['jobName'])
+    if job['subscriptionID'] is not None:
+        pipeline.hdel(JOB_BY_SUBSCRIPTION_KEY, job['subscriptionID'])
+
+def applyChanges(jobs=(), deletedJobNames=(), leases=()):
+    """
+    Adds or replaces jobs and deletes jobs, together with their index entries, in one transaction.
+
+    :param jobs: List of jobs to add or replace (see buildJob)
+    :param deletedJobNames: Names of the jobs to delete
+    :param leases: Leases of the locks held for the change, the transaction only commits if they are still held (see lockConfigFile.executeFenced)
+    :return: The number of deleted jobs which existed
+    """
+    jobs = list(jobs)
+    deletedJobNames = list(deletedJobNames)
+    if not jobs and not deletedJobNames:
+        return 0
+    previousJobs = redisClient.hmget(JOBS_KEY, [job['jobName'] for job in jobs] + deletedJobNames)
+    deletedJobs = [json.loads(previousJob) for previousJob in previousJobs[len(jobs):] if previousJob]
+
+    def write(pipeline):
+        for job, previousJob in zip(jobs, previousJobs):
+            if previousJob:
+                _removeFromIndexes(pipeline, json.loads(previousJob))
+            pipeline.hset(JOBS_KEY, job['jobName'], json.dumps(job))
+            _addToIndexes(pipeline, job)
+        for job in deletedJobs:
+            _removeFromIndexes(pipeline, job)
+        if deletedJobs:
+            pipeline.hdel(JOBS_KEY, *[job['jobName'] for job in deletedJobs])
+
+    lockConfigFile.executeFenced(leases, write)
+    return len(deletedJobs)
+
+def saveJobs(jobs, leases=()):
+    """
+    Adds or replaces jobs and updates the indexes, in one transaction.
+
+    :param jobs: List of jobs (see buildJob)
+    :param leases: Leases the write is fenced by (see applyChanges)
+    """
+    applyChanges(jobs=jobs, leases=leases)
+
+def deleteJobs(jobNames, leases=()):
+    """
+    Deletes jobs and their index entries, in one transaction.
+
+    :param jobNames: Names of the jobs
+    :param leases: Leases the write is fenced by (see applyChanges)
+    :return: The number of jobs which existed and were deleted
+    """
+    return applyChanges(deletedJobNames=jobNames, leases=leases)
+
+def getJobs(jobNames):
+    """
+    :return: List of the jobs which exist, in the order of jobNames
+    """
+    jobNames = list(jobNames)
+    if not jobNames:
+        return []
+    return [json.loads(job) for job in redisClient.hmget(JOBS_KEY, jobNames) if job]
+
+def getJob(jobName):
+    """
+    :return: The job, None if it doesn't exist
+    """
+    job = redisClient.hget(JOBS_KEY, jobName)
+    return json.loads(job) if job else None
+
+def jobNameOfSubscription(subscriptionID):
+    """
+    :return: The name of the job of the subscription, None if it has none
+    """
+    return redisClient.hget(JOB_BY_SUBSCRIPTION_KEY, str(subscriptionID))
+
+def jobsOfWorker(workerID):
+    """
+    :return: List of the jobs of the worker, the oldest first
+    """
+    return sorted(getJobs(redisClient.smembers(f"{JOBS_BY_WORKER_KEY_PREFIX}{workerID}")), key=lambda job: jobSortKey(job['jobName']))
+
+def jobsOfApi(apiID):
+    """
+    :return: List of the jobs of the subscriptions of an availableApi, the oldest first
+    """
+    return sorted(getJobs(redisClient.smembers(f"{JOBS_BY_API_KEY_PREFIX}{apiID}")), key=lambda job: jobSortKey(job['jobName']))
+
+def jobCountsPerWorker():
+    """
+    :return: Dictionary workerID -> number of its jobs, of all workers with at least one job
+    """
+    return {workerID: int(count) for workerID, count in redisClient.hgetall(WORKER_JOB_COUNTS_KEY).items() if int(count) > 0}
+
+def jobCostsPerWorker():
+    """
+    :return: Dictionary workerID -> sum of the costs of its jobs, of all workers with at least one job
+    """
+    jobCounts = jobCountsPerWorker()
+    return {workerID: max(0.0, float(cost)) for workerID, cost in redisClient.hgetall(WORKER_JOB_COSTS_KEY).items() if workerID in jobCounts}
+
+def countJobs():
+    return redisClient.hlen(JOBS_KEY)
+
+def jobNames():
+    return redisClient.hkeys(JOBS_KEY)
+
+def loadJobs():
+    """
+    :return: List of all jobs, the oldest first
+    """
+    return sorted((json.loads(job) for job in redisClient.hvals(JOBS_KEY)), key=lambda job: jobSortKey(job['jobName']))
+
+def renderJobsFile():
+    """
+    Writes all jobs to the jobs file, which looks like this:
+    [job-exec "job1"]
+    schedule = @every 5s
+    command = python /app/fetchScripts/fetchApis.py --subscriptionID 319286224 --apiID 2 --interval 5
+    container = 3f2a9c0d41b7
+
+    The file is replaced atomically, so a replica importing it never reads half of it, and only by the holder of the jobs file lock,
+    so two replicas never replace it at the same time.
+    """
+    with lockConfigFile.holdLocks([lockConfigFile.JOBS_FILE_LOCK]) as leases:
+        config = configparser.ConfigParser()
+        for job in loadJobs():
+            sectionName = f'job-exec "{job["jobName"]}"'
+            config.add_section(sectionName)
+            config[sectionName]['schedule'] = f"@every {job['interval']}s"
+            config[sectionName]['command'] = job['command']
+            config[sectionName]['container'] = job['worker']
+
+        temporaryFile = f"{CONFIG_FILE}.{uuid.uuid4().hex}.tmp"      # the replicas share the file, their PIDs may be the same
+        with open(temporaryFile, 'w') as configfile:
+            config.write(configfile)
+        if not leases[0].isHeld():      # another replica may be rendering a newer state of the job store
+            os.remove(temporaryFile)
+            raise lockConfigFile.LockLostError(f"Lease of lock {lockConfigFile.JOBS_FILE_LOCK} was lost while rendering the jobs file")
+        os.replace(temporaryFile, CONFIG_FILE)
+
+def importJobsFile(leases=()):
+    """
+    Imports the jobs of the jobs file if the job store is empty, e.g. on the first start or after Redis lost its data.
+    Has to be called while holding the job store lock.
+
+    :param leases: Leases the write is fenced by (see applyChanges)
+    :return: The number of imported jobs
+    """
+    if redisClient.exists(JOBS_KEY):
+        return 0
+    config = configparser.ConfigParser()
+    config.read(CONFIG_FILE)
+    jobs = [job for job in jobsFromConfig(config) if job['worker']]
+    saveJobs(jobs, leases)
+    if jobs:
+        logger.info(f"Imported {len(jobs)} jobs from {CONFIG_FILE}")
+    return len(jobs)
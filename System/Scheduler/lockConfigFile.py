@@ -1,45 +1,286 @@
 from commonRessources.logger import setLoggerLevel
 from commonRessources import REDIS_HOST, REDIS_PORT
+from contextlib import contextmanager
 import redis
+import threading
 import time
+import uuid
 
 # -------------------------- Environment Variables ------------------------------------------------------------------------------------------------------------------------------------------
-LOCK_KEY = 'config_file_lock'
-LOCK_TIMEOUT = 10  # Timeout for the lock in seconds
+LOCK_KEY_PREFIX = 'SCHEDULER_LOCK:'                 # One key per lock, the value is "<owner>:<fencing token>" of the lease holding it
+LOCK_FENCE_KEY = 'SCHEDULER_LOCK_FENCE'             # Counter the fencing tokens are taken from, every acquired lease gets a higher token
+LOCK_RELEASED_CHANNEL_PREFIX = 'SCHEDULER_LOCK_RELEASED:'   # Pub/sub channel per lock, published to when the lock is released
+LOCK_LEASE = 10                 # Seconds a lease is valid without being renewed, the leases are renewed every third of it while they are held
+LOCK_WAIT_TIMEOUT = 60          # Seconds to wait for a lock before giving up
+JOB_STORE_LOCK = 'jobs'         # Whole job store operations: rebalancing, job costs, importing the jobs
+JOBS_FILE_LOCK = 'jobsFile'     # Rendering the jobs file
+
+ACQUIRE_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 1 then
+    return 0
+end
+local token = redis.call('incr', KEYS[2])
+redis.call('set', KEYS[1], ARGV[1] .. ':' .. token, 'PX', ARGV[2])
+return token
+"""
+RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    redis.call('del', KEYS[1])
+    redis.call('publish', ARGV[2], ARGV[1])
+    return 1
+end
+return 0
+"""
 
 # --------------------------- Initializations -----------------------------------------------------------------------------------------------------------------------------------------
 logger = setLoggerLevel("lockConfigFile")
 redisClient = redis.StrictRedis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+acquireScript = redisClient.register_script(ACQUIRE_SCRIPT)
+renewScript = redisClient.register_script(RENEW_SCRIPT)
+releaseScript = redisClient.register_script(RELEASE_SCRIPT)
+
+heldLeases = {}                         # value -> Lease, of the leases this process holds
+heldLeasesLock = threading.Lock()
+releases = {}                           # lock name -> number of releases this process was notified of
+releasesCondition = threading.Condition()
+listening = threading.Event()           # set while the release listener is subscribed
+backgroundThreadsLock = threading.Lock()
+backgroundThreads = []
 
 # --------------------------- Lock Functions -----------------------------------------------------------------------------------------------------------------------------------------
-def acquireLock():
+# The scheduler replicas don't serialise on one lock anymore, every lock protects a shard of the state:
+#   worker:<workerID>               placing jobs on the worker, deleting and moving its jobs
+#   subscription:<subscriptionID>   subscribing, resubscribing and unsubscribing the subscription
+#   provider:<provider>             checking and reserving the rate budget of the provider (see rateBudget.py)
+#   jobs                            operations on the whole job store, which also hold the locks of all workers
+#   jobsFile                        rendering the jobs file
+# A caller holding several locks acquires them in this global order, so two callers never wait for each other:
+#   subscription:* -> provider:* -> jobs -> worker:* -> jobsFile
+# Locks of the same kind are acquired sorted by name (see scale.lockJobStore and the bulk operations in subscriptionOperations.py).
+# Every caller may skip kinds, but never acquires a lock of an earlier kind while holding one of a later kind, e.g. subscribe holds
+# subscription:<id>, then provider:<provider> (released again) and then worker:<workerID>; the job store operations hold jobs and then all worker locks.
+# A lock is a lease: it expires after LOCK_LEASE seconds unless the holder renews it, which a background thread does every third of the lease.
+# Every lease gets a fencing token. Writes to the job store check in the same transaction that the leases of the writer are still held
+# (see fencedPipeline), so a replica which lost its lease (e.g. it was paused longer than the lease) can't overwrite the changes of the next holder.
+# Waiting callers don't poll: the release publishes to the channel of the lock and the waiters of the lock are woken up,
+# they only retry on their own when the lease of the holder would expire.
+
+class LockTimeoutError(Exception):
+    """
+    The lock couldn't be acquired within LOCK_WAIT_TIMEOUT seconds.
+    """
+
+class LockLostError(Exception):
+    """
+    A lease expired or was taken over by another holder before a write which is fenced by it.
+    """
+
+class Lease:
+    """
+    A held lock.
+
+    :param name: Name of the lock
+    :param owner: Random ID of the holder
+    :param token: Fencing token of the lease, higher than the tokens of all leases acquired before
+    """
+
+    def __init__(self, name, owner, token):
+        self.name = name
+        self.key = f"{LOCK_KEY_PREFIX}{name}"
+        self.token = token
+        self.value = f"{owner}:{token}"
+        self.lost = False
+
+    def isHeld(self):
+        """
+        :return: True if the lease is still held, checked in Redis
+        """
+        return not self.lost and redisClient.get(self.key) == self.value
+
+def workerLock(workerID):
+    return f"worker:{workerID}"
+
+def subscriptionLock(subscriptionID):
+    return f"subscription:{subscriptionID}"
+
+def providerLock(provider):
+    return f"provider:{provider}"
+
+def startBackgroundThreads():
+    """
+    Starts the threads renewing the leases and listening for released locks, once per process.
+    """
+    with backgroundThreadsLock:
+        if backgroundThreads:
+            return
+        for target in (renewLeases, listenForReleases):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            backgroundThreads.append(thread)
+    listening.wait(1)        # waiters would only miss a release published before the listener subscribed
+
+def renewLeases():
     """
-    Acquires a lock on the config file. This method is blocking the config file.
+    Renews all held leases every third of LOCK_LEASE. A lease which can't be renewed because it expired or has another holder is marked as lost.
+    """
+    while True:
+        time.sleep(LOCK_LEASE / 3)
+        with heldLeasesLock:
+            leases = list(heldLeases.values())
+        for lease in leases:
+            try:
+                if not renewScript(keys=[lease.key], args=[lease.value, int(LOCK_LEASE * 1000)]):
+                    lease.lost = True
+                    with heldLeasesLock:
+                        heldLeases.pop(lease.value, None)
+                    logger.error(f"Lost the lease of lock {lease.name} (fencing token {lease.token})")
+            except redis.RedisError as e:
+                logger.error(f"Error renewing the lease of lock {lease.name}: {e}")
+
+def listenForReleases():
+    """
+    Wakes up the waiters of a lock every time it's released by any scheduler replica.
+    """
+    while True:
+        pubsub = redisClient.pubsub()
+        try:
+            pubsub.psubscribe(f"{LOCK_RELEASED_CHANNEL_PREFIX}*")
+            for message in pubsub.listen():
+                if message['type'] == 'psubscribe':
+                    listening.set()
+                elif message['type'] == 'pmessage':
+                    name = message['channel'][len(LOCK_RELEASED_CHANNEL_PREFIX):]
+                    with releasesCondition:
+                        releases[name] = releases.get(name, 0) + 1
+                        releasesCondition.notify_all()
+        except redis.RedisError as e:
+            logger.error(f"Error listening for released locks: {e}")
+        finally:
+            listening.clear()
+            pubsub.close()
+        with releasesCondition:      # releases may have been missed, let all waiters retry
+            for name in releases:
+                releases[name] += 1
+            releasesCondition.notify_all()
+        time.sleep(1)
+
+def acquireLock(name, timeout=LOCK_WAIT_TIMEOUT):
+    """
+    Acquires a lock, waiting until it's released if another caller holds it.
 
-    :return: True if the lock was acquired, False if it couldn't aqcuire it
+    :param name: Name of the lock (see the lock names above)
+    :param timeout: Seconds to wait at most
+    :return: The Lease
+    :raises LockTimeoutError: If the lock couldn't be acquired in time
     """
+    startBackgroundThreads()
+    owner = uuid.uuid4().hex
+    key = f"{LOCK_KEY_PREFIX}{name}"
+    deadline = time.monotonic() + timeout
+    while True:
+        with releasesCondition:
+            seenReleases = releases.get(name, 0)
+        try:
+            token = acquireScript(keys=[key, LOCK_FENCE_KEY], args=[owner, int(LOCK_LEASE * 1000)])
+            if token:
+                lease = Lease(name, owner, int(token))
+                with heldLeasesLock:
+                    heldLeases[lease.value] = lease
+                logger.info(f"Lock {name} acquired (fencing token {lease.token}).")
+                return lease
+            remainingLease = redisClient.pttl(key) / 1000      # the lease of the holder expires if it dies without releasing it
+        except redis.RedisError as e:
+            logger.error(f"Error acquiring lock {name}: {e}")
+            remainingLease = 1
+        remainingWait = deadline - time.monotonic()
+        if remainingWait <= 0:
+            raise LockTimeoutError(f"Lock {name} couldn't be acquired within {timeout}s")
+        with releasesCondition:
+            if releases.get(name, 0) == seenReleases:
+                releasesCondition.wait(min(remainingWait, max(remainingLease, 0.01) if listening.is_set() else 1))
+
+def releaseLock(lease):
+    """
+    Releases a lock and wakes up its waiters. A lease which was lost isn't released, the lock has another holder or none.
+
+    :param lease: The Lease returned by acquireLock
+    :return: True if the lock was released, False if the lease was lost or it couldn't release it
+    """
+    with heldLeasesLock:
+        heldLeases.pop(lease.value, None)
     try:
-        result = redisClient.set(LOCK_KEY, 'locked', nx=True, ex=LOCK_TIMEOUT)
-        if result == True:
-            logger.info("Lock acquired.")
-            return True
+        released = bool(releaseScript(keys=[lease.key], args=[lease.value, f"{LOCK_RELEASED_CHANNEL_PREFIX}{lease.name}"]))
+        if released:
+            logger.info(f"Lock {lease.name} released.")
         else:
-            logger.warning("Lock not acquired. The config file is currently locked.")
-            return False
+            logger.warning(f"Lock {lease.name} wasn't held anymore when it was released (fencing token {lease.token})")
+        return released
     except redis.RedisError as e:
-        logger.error(f"Error acquiring lock: {e}")
+        logger.error(f"Error releasing lock {lease.name}: {e}")
         return False
 
-def releaseLock():
+@contextmanager
+def holdLocks(names, timeout=LOCK_WAIT_TIMEOUT):
     """
-    Releases the lock on the config file.
+    Holds several locks, acquired in the given order and released in the reverse order.
+
+    with lockConfigFile.holdLocks([lockConfigFile.workerLock(workerID)]) as leases:
+        jobStore.saveJobs(jobs, leases)
 
-    :return: True if the lock was released, False if it couldn't release it
+    :param names: Names of the locks, duplicates are only acquired once
+    :param timeout: Seconds to wait for each lock at most
+    :return: List of the Leases
     """
+    leases = []
     try:
-        redisClient.delete(LOCK_KEY)
-        logger.info("Lock released.")
-        return True
-    except redis.RedisError as e:
-        logger.error(f"Error releasing lock: {e}")
-        return False
+        for name in dict.fromkeys(names):
+            leases.append(acquireLock(name, timeout))
+        yield leases
+    finally:
+        for lease in reversed(leases):
+            releaseLock(lease)
+
+def fencedPipeline(leases):
+    """
+    Starts a transaction which only commits if all leases are still held: the lock keys are watched and checked,
+    so the transaction fails if a lease expires or is taken over before it's executed.
+    A renewal of a lease also touches its key, so a WatchError has to be retried (see executeFenced).
+
+    :param leases: List of the Leases the write is fenced by, without leases the transaction isn't fenced
+    :return: The pipeline in buffered mode
+    :raises LockLostError: If a lease isn't held anymore
+    """
+    pipeline = redisClient.pipeline(transaction=True)
+    if leases:
+        pipeline.watch(*[lease.key for lease in leases])
+        for lease in leases:
+            if lease.lost or pipeline.get(lease.key) != lease.value:
+                pipeline.reset()
+                raise LockLostError(f"Lease of lock {lease.name} (fencing token {lease.token}) was lost")
+    pipeline.multi()
+    return pipeline
+
+def executeFenced(leases, write):
+    """
+    Executes a write in a transaction fenced by the leases (see fencedPipeline), again if a renewal of a lease interfered.
+
+    :param leases: List of the Leases the write is fenced by
+    :param write: Function adding the commands to the pipeline
+    :return: The results of the transaction
+    :raises LockLostError: If a lease isn't held anymore
+    """
+    while True:
+        pipeline = fencedPipeline(leases)
+        try:
+            write(pipeline)
+            return pipeline.execute()
+        except redis.WatchError:
+            continue
+        finally:
+            pipeline.reset()
@@ -1,90 +1,96 @@
+import redis
 import jobCounter
-import scale
-import configparser
-import docker
-import time
+import jobStore
+import lockConfigFile
+import workerJobs
 from commonRessources.logger import setLoggerLevel
 
-# -------------------------- Environment Variables ------------------------------------------------------------------------------------------------------------------------------------------
-CONFIG_FILE = '/app/opheliaConfig/config.ini'
-
 # --------------------------- Initializations -----------------------------------------------------------------------------------------------------------------------------------------
 logger = setLoggerLevel("JobManager")
-dockerClient = docker.from_env()
 
 # --------------------------- Job Management Functions -----------------------------------------------------------------------------------------------------------------------------------------
 
 
 
-def addJob(jobName, interval, command, container):
+def addJob(jobName, interval, command, container, subscriptionID=None, apiID=None, cost=0.0, leases=()):
     """
-    Adds a new job to the Ofelia configuration file, which looks like this:
-    [job-exec "job1"]
-    schedule = @every 5s
-    command = python /app/fetchScripts/fetchApis.py --url https://finnhub.io/api/v1/quote?symbol=IBM --tokenRequired True --subscriptionID 319286224 --apiID 2
-    container = system-worker-1
+    Adds a new job to the job store (see jobStore.py). Has to be called while holding the lock of the worker (see scale.lockWorkerForJob),
+    the job is published to its worker by refreshWorkerJobs once the lock is released.
 
-    :param jobName: Name of the job
+    :param jobName: Name of the job (see jobCounter.allocateJobName)
     :param interval: Fetching interval in seconds
     :param command: Command to execute
-    :param container: Container to execute the command in
+    :param container: Worker to execute the command on
+    :param subscriptionID: ID of the subscription of the job
+    :param apiID: ID of the subscribed API
+    :param cost: Fetch slots the job keeps busy on average (see costModel.py)
+    :param leases: Leases of the lock of the worker, the job is only saved if they are still held
     """
-    config = configparser.ConfigParser()
-    config.read(CONFIG_FILE)
+    jobStore.saveJobs([jobStore.buildJob(jobName, subscriptionID, apiID, interval, command, container, cost)], leases)
 
-    sectionName = f'job-exec "{jobName}"'
-    if sectionName not in config:
-        config.add_section(sectionName)
+    jobCounter.updateActiveJobCounter(True)
 
-    config[sectionName]['schedule'] = f"@every {interval}s"
-    config[sectionName]['command'] = command
-    config[sectionName]['container'] = container
+def addJobs(jobs, leases=()):
+    """
+    Adds several new jobs to the job store in one transaction, e.g. the jobs of a bulk subscription.
+    Has to be called while holding the locks of their workers (see scale.lockJobStore).
 
-    with open(CONFIG_FILE, 'w') as configfile:
-        config.write(configfile)
+    :param jobs: List of the jobs (see jobStore.buildJob)
+    :param leases: Leases of the locks of the workers, the jobs are only saved if they are still held
+    """
+    jobs = list(jobs)
+    if not jobs:
+        return
+    jobStore.saveJobs(jobs, leases)
+    jobCounter.updateActiveJobCounter(True, len(jobs))
 
-    refreshOfelia()     # Restart Ofelia to apply the new job
+def deleteJobs(jobNames, leases=()):
+    """
+    Deletes several jobs from the job store in one transaction, e.g. the jobs of a bulk unsubscription.
+    Has to be called while holding the locks of all workers (see scale.lockJobStore), so no job is moved in the meantime.
 
-    jobCounter.updateHistoricalJobCounter()
-    jobCounter.updateActiveJobCounter(True)
+    :param jobNames: Names of the jobs to delete
+    :param leases: Leases of the locks of the workers, the jobs are only deleted if they are still held
+    :return: Set of the names of the jobs which existed and were deleted
+    """
+    existingJobNames = {job['jobName'] for job in jobStore.getJobs({jobName for jobName in jobNames if jobName})}
+    if existingJobNames:
+        jobStore.deleteJobs(existingJobNames, leases)
+        jobCounter.updateActiveJobCounter(False, len(existingJobNames))
+    return existingJobNames
 
 def deleteJob(jobName):
     """
-    Deletes a job from the Ofelia configuration file.
+    Deletes a job from the job store while holding the lock of its worker. The other jobs stay on their workers, so nothing is rebalanced.
+    The job is unpublished from its worker by refreshWorkerJobs.
 
     :param jobName: Name of the job to delete
     :return: True if the job was deleted, False if the job was not found
     """
-    config = configparser.ConfigParser()
-    config.read(CONFIG_FILE)
-
-    sectionName = f'job-exec "{jobName}"'
-    if sectionName in config:
-        config.remove_section(sectionName)
-        with open(CONFIG_FILE, 'w') as configfile:
-            config.write(configfile)
-        jobCounter.updateActiveJobCounter(False)
-        scale.balanceJobsAcrossWorkers()
-        refreshOfelia()
-        return True
-    else:
-        return False
-
-def refreshOfelia():
+    while jobName:
+        job = jobStore.getJob(jobName)
+        if not job:
+            return False
+        with lockConfigFile.holdLocks([lockConfigFile.workerLock(job['worker'])]) as leases:
+            currentJob = jobStore.getJob(jobName)
+            if currentJob and currentJob['worker'] != job['worker']:
+                continue        # the job was moved to another worker before the lock was acquired
+            if currentJob and jobStore.deleteJobs([jobName], leases):
+                jobCounter.updateActiveJobCounter(False)
+                return True
+            return False
+    return False
+
+def refreshWorkerJobs():
     """
-    Restarts the Ofelia container to apply the new configuration.
+    Publishes the changed jobs of the job store to the workers, only the changed jobs are rescheduled (see workerJobs.publishWorkerJobs),
+    and renders the jobs file from the job store.
 
-    :return: True if the container was restarted, False if the container was not found or an error occurred
+    :return: True if the jobs were published, False if an error occurred
     """
+    published = workerJobs.publishWorkerJobs()
     try:
-        container = dockerClient.containers.get('ofelia')
-        container.restart()
-        container.reload()
-        logger.info("Ofelia container has been restarted successfully.")
-        return True
-    except docker.errors.NotFound:
-        logger.error("Ofelia container not found.")
-        return False
-    except docker.errors.APIError as e:
-        logger.error(f"Error restarting Ofelia container: {str(e)}")
-        return False
+        jobStore.renderJobsFile()
+    except (OSError, redis.RedisError, lockConfigFile.LockTimeoutError, lockConfigFile.LockLostError) as e:
+        logger.error(f"Error rendering the jobs file: {e}")
+    return published
@@ -0,0 +1,247 @@
+import json
+import os
+import socket
+import time
+import uuid
+import redis
+import lockConfigFile
+from commonRessources import REDIS_HOST, REDIS_PORT, SCHEDULER_OPERATION_MAX_ATTEMPTS, SCHEDULER_OPERATION_CLAIM_IDLE, SCHEDULER_OPERATION_RETENTION
+from commonRessources.logger import setLoggerLevel
+
+# -------------------------- Environment Variables ------------------------------------------------------------------------------------------------------------------------------------------
+OPERATION_KEY_PREFIX = 'OPERATION:'                 # Hash per operation (see createOperation), expires SCHEDULER_OPERATION_RETENTION seconds after it finished
+OPERATIONS_STREAM_KEY = 'SCHEDULER_OPERATIONS'      # Stream of the operations to carry out, read by the executors of all scheduler replicas
+OPERATIONS_STREAM_GROUP = 'schedulers'              # Consumer group of the executors, the consumer name is the scheduler process
+OPERATIONS_STREAM_MAX_LENGTH = 100000
+OPERATIONS_READ_BLOCK = 5000        # milliseconds a read waits for new operations
+CONSUMER_NAME = f"{socket.gethostname()}-{os.getpid()}"
+
+# --------------------------- Initializations -----------------------------------------------------------------------------------------------------------------------------------------
+logger = setLoggerLevel("Operations")
+redisClient = redis.StrictRedis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+
+# --------------------------- Operation Functions -----------------------------------------------------------------------------------------------------------------------------------------
+# Subscribing, resubscribing and unsubscribing take several requests to the PostgreSQL data connector, the placement of the job and its publication.
+# The API routes only validate the request, store an operation and add it to the stream, and answer with 202 and the ID of the operation.
+# Every scheduler process carries the operations out in the background (see runExecutor) and records the progress in the operation,
+# which is returned by /operationStatus. Operations which fail with a transient error (see TransientOperationError) are tried again,
+# the steps which are done are remembered in the state of the operation, so they aren't done twice.
+# Operations of a scheduler process which died are claimed by another one after SCHEDULER_OPERATION_CLAIM_IDLE seconds.
+
+class OperationStatus:
+    PENDING = 'PENDING'         # waiting for an executor
+    RUNNING = 'RUNNING'
+    RETRYING = 'RETRYING'       # failed with a transient error, tried again
+    SUCCEEDED = 'SUCCEEDED'
+    FAILED = 'FAILED'
+
+FINISHED_STATUSES = (OperationStatus.SUCCEEDED, OperationStatus.FAILED)
+
+class OperationFailedError(Exception):
+    """
+    The operation can't succeed, e.g. the API doesn't exist or no worker can take the job. It isn't tried again.
+
+    :param message: The reason, returned as message of the operation
+    :param code: HTTP status code the synchronous API route answered with
+    """
+
+    def __init__(self, message, code=400):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+
+class TransientOperationError(Exception):
+    """
+    The operation failed, but may succeed if it's tried again, e.g. the PostgreSQL data connector couldn't be reached.
+    Errors of Redis and of the scheduler locks are transient as well.
+    """
+
+class Operation:
+    """
+    An operation while it's carried out by an executor.
+
+    :param operationID: ID of the operation
+    :param fields: The hash of the operation
+    :param entryID: ID of its entry in the stream
+    """
+
+    def __init__(self, operationID, fields, entryID):
+        self.operationID = operationID
+        self.type = fields['type']
+        self.request = json.loads(fields.get('request') or '{}')
+        self.state = json.loads(fields.get('state') or '{}')
+        self.attempts = int(fields.get('attempts') or 0)
+        self.entryID = entryID
+
+    def progress(self, step, **state):
+        """
+        Records the step the operation is at and the values the following steps (or a later attempt) need.
+        Also keeps the entry of the operation claimed, so that no other executor claims it while it's carried out.
+
+        :param step: Name of the step, returned as step of the operation
+        :param state: Values to remember, e.g. the ID of the created subscription
+        """
+        self.state.update(state)
+        pipeline = redisClient.pipeline(transaction=False)
+        pipeline.hset(f"{OPERATION_KEY_PREFIX}{self.operationID}", mapping={'step': step, 'state': json.dumps(self.state), 'updatedAt': time.time()})
+        pipeline.xclaim(OPERATIONS_STREAM_KEY, OPERATIONS_STREAM_GROUP, CONSUMER_NAME, 0, [self.entryID], justid=True)
+        pipeline.execute()
+
+def createOperation(operationType, operationRequest):
+    """
+    Stores an operation and adds it to the stream of the executors, in one transaction.
+
+    :param operationType: Type of the operation, the key of its handler (see runExecutor)
+    :param operationRequest: Dictionary with the validated request
+    :return: The ID of the operation
+    """
+    operationID = uuid.uuid4().hex
+    now = time.time()
+    pipeline = redisClient.pipeline(transaction=True)
+    pipeline.hset(f"{OPERATION_KEY_PREFIX}{operationID}", mapping={
+        'operationID': operationID,
+        'type': operationType,
+        'status': OperationStatus.PENDING,
+        'step': '',
+        'attempts': 0,
+        'request': json.dumps(operationRequest),
+        'state': '{}',
+        'createdAt': now,
+        'updatedAt': now
+    })
+    pipeline.xadd(OPERATIONS_STREAM_KEY, {'operationID': operationID}, maxlen=OPERATIONS_STREAM_MAX_LENGTH, approximate=True)
+    pipeline.execute()
+    logger.info(f"Operation {operationID} ({operationType}) created")
+    return operationID
+
+def loadOperation(operationID):
+    """
+    :return: The operation as returned by /operationStatus, None if it doesn't exist (anymore):
+    {
+        "operationID": "3f2a9c0d41b7...",
+        "type": "subscribe",
+        "status": "SUCCEEDED",
+        "step": "setSubscriptionStatus",
+        "attempts": 1,
+        "message": "Job job12 scheduled and subscription for API OpenMeteo; API_ID: 2 created",
+        "code": 200,
+        "result": {"subscriptionID": 42, "jobName": "job12", "container": "3f2a9c0d41b7"},
+        "createdAt": 1718000000.0,
+        "updatedAt": 1718000001.2
+    }
+    """
+    fields = redisClient.hgetall(f"{OPERATION_KEY_PREFIX}{operationID}")
+    if not fields:
+        return None
+    return {
+        'operationID': operationID,
+        'type': fields.get('type'),
+        'status': fields.get('status'),
+        'step': fields.get('step') or None,
+        'attempts': int(fields.get('attempts') or 0),
+        'message': fields.get('message'),
+        'code': int(fields['code']) if fields.get('code') else None,
+        'result': json.loads(fields['result']) if fields.get('result') else None,
+        'createdAt': float(fields['createdAt']),
+        'updatedAt': float(fields['updatedAt'])
+    }
+
+def finishOperation(operation, status, message, code, result=None):
+    """
+    Records the outcome of an operation, acknowledges its entry and lets the operation expire after SCHEDULER_OPERATION_RETENTION seconds.
+    """
+    key = f"{OPERATION_KEY_PREFIX}{operation.operationID}"
+    pipeline = redisClient.pipeline(transaction=True)
+    pipeline.hset(key, mapping={'status': status, 'message': message, 'code': code, 'result': json.dumps(result) if result is not None else '', 'updatedAt': time.time()})
+    pipeline.expire(key, SCHEDULER_OPERATION_RETENTION)
+    pipeline.xack(OPERATIONS_STREAM_KEY, OPERATIONS_STREAM_GROUP, operation.entryID)
+    pipeline.execute()
+    logger.info(f"Operation {operation.operationID} ({operation.type}) {status.lower()}: {message}")
+
+def ensureGroup():
+    """
+    Creates the stream and the consumer group of the executors if they don't exist yet.
+    """
+    try:
+        redisClient.xgroup_create(OPERATIONS_STREAM_KEY, OPERATIONS_STREAM_GROUP, id='0', mkstream=True)
+    except redis.ResponseError as e:
+        if 'BUSYGROUP' not in str(e):
+            raise
+
+def carryOut(entryID, operationID, handlers):
+    """
+    Carries out an operation with its handler, again after a transient error (waiting 1, 2, 4, ... seconds)
+    until SCHEDULER_OPERATION_MAX_ATTEMPTS attempts failed. The attempts are counted in the operation,
+    so the attempts of an executor which died count as well.
+
+    :param entryID: ID of the entry of the operation in the stream
+    :param operationID: ID of the operation
+    :param handlers: Dictionary operation type -> function(operation) returning (message, result)
+    """
+    key = f"{OPERATION_KEY_PREFIX}{operationID}"
+    fields = redisClient.hgetall(key)
+    if not fields or fields.get('status') in FINISHED_STATUSES:       # expired, or finished by an executor which died before acknowledging it
+        redisClient.xack(OPERATIONS_STREAM_KEY, OPERATIONS_STREAM_GROUP, entryID)
+        return
+    operation = Operation(operationID, fields, entryID)
+    handler = handlers.get(operation.type)
+    if handler is None:
+        finishOperation(operation, OperationStatus.FAILED, f"Unknown operation type {operation.type}", 500)
+        return
+
+    while True:
+        operation.attempts = redisClient.hincrby(key, 'attempts', 1)
+        redisClient.hset(key, mapping={'status': OperationStatus.RUNNING if operation.attempts == 1 else OperationStatus.RETRYING, 'updatedAt': time.time()})
+        try:
+            message, result = handler(operation)
+            finishOperation(operation, OperationStatus.SUCCEEDED, message, 200, result)
+            return
+        except OperationFailedError as e:
+            finishOperation(operation, OperationStatus.FAILED, e.message, e.code, operation.state or None)
+            return
+        except (TransientOperationError, redis.RedisError, lockConfigFile.LockTimeoutError, lockConfigFile.LockLostError) as e:
+            if operation.attempts >= SCHEDULER_OPERATION_MAX_ATTEMPTS:
+                finishOperation(operation, OperationStatus.FAILED, f"{e} (gave up after {operation.attempts} attempts)", 503, operation.state or None)
+                return
+            logger.warning(f"Attempt {operation.attempts} of operation {operationID} ({operation.type}) failed, trying again: {e}")
+            redisClient.hset(key, 'message', str(e))
+            time.sleep(min(2 ** (operation.attempts - 1), SCHEDULER_OPERATION_CLAIM_IDLE / 4))
+        except Exception as e:
+            logger.exception(f"Unexpected error in operation {operationID} ({operation.type})")
+            finishOperation(operation, OperationStatus.FAILED, f"Unexpected error: {e}", 500, operation.state or None)
+            return
+
+def runExecutor(handlers):
+    """
+    Carries out the operations of the stream one after the other, started SCHEDULER_OPERATION_EXECUTORS times per scheduler process.
+
+    1) Claims the operations which another executor read but didn't finish within SCHEDULER_OPERATION_CLAIM_IDLE seconds (it died),
+       otherwise reads the next new operation
+    2) Carries it out (see carryOut) and acknowledges it when it finished
+
+    :param handlers: Dictionary operation type -> function(operation) returning (message, result)
+    """
+    groupReady = False
+    while True:
+        try:
+            if not groupReady:
+                ensureGroup()
+                groupReady = True
+            claimed = redisClient.xautoclaim(OPERATIONS_STREAM_KEY, OPERATIONS_STREAM_GROUP, CONSUMER_NAME, SCHEDULER_OPERATION_CLAIM_IDLE * 1000, '0-0', 1)
+            entries = claimed[1]
+            if entries:
+                logger.info(f"Claimed operation {entries[0][0]} which wasn't finished within {SCHEDULER_OPERATION_CLAIM_IDLE}s")
+            else:
+                response = redisClient.xreadgroup(OPERATIONS_STREAM_GROUP, CONSUMER_NAME, {OPERATIONS_STREAM_KEY: '>'}, count=1, block=OPERATIONS_READ_BLOCK)
+                entries = response[0][1] if response else []
+            for entryID, fields in entries:
+                if fields and fields.get('operationID'):
+                    carryOut(entryID, fields['operationID'], handlers)
+                else:           # the entry was trimmed from the stream in the meantime
+                    redisClient.xack(OPERATIONS_STREAM_KEY, OPERATIONS_STREAM_GROUP, entryID)
+        except redis.RedisError as e:
+            logger.error(f"Error carrying out the operations: {e}")
+            time.sleep(1)
+        except Exception as e:
+            logger.error(f"Unexpected error carrying out the operations: {e}")
+            time.sleep(1)
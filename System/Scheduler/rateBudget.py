@@ -0,0 +1,92 @@
+import redis
+import time
+from commonRessources import REDIS_HOST, REDIS_PORT
+from commonRessources.logger import setLoggerLevel
+from commonRessources.rateLimits import RATE_LIMITS, RATE_LIMIT_QUOTA_KEY_PREFIX, RATE_LIMIT_DEMAND_KEY_PREFIX, getQuota
+
+# --------------------------- Initializations -----------------------------------------------------------------------------------------------------------------------------------------
+logger = setLoggerLevel("RateBudget")
+redisClient = redis.StrictRedis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+
+# --------------------------- Rate Budget Functions -----------------------------------------------------------------------------------------------------------------------------------------
+# Every active subscription of a rate limited provider uses 1/interval requests per second of its quota.
+# The scheduler only subscribes an API if the sum of its subscriptions stays within the quota of rateLimits.json.
+# Check and reservation must both be done while holding the lock of the provider (see lockConfigFile.providerLock), so that no other scheduler replica interleaves.
+
+def checkBudget(plan, interval, subscriptionID=None):
+    """
+    Checks if a subscription fits into the quota of the provider of its fetch plan.
+
+    :param plan: The compiled fetch plan of the subscription
+    :param interval: Interval in seconds the subscription is fetched with
+    :param subscriptionID: ID of the subscription if it already exists (resubscribe), its old reservation isn't counted
+    :return: None if the subscription fits, otherwise the reason why it doesn't
+    """
+    provider = plan.get('provider')
+    quota = getQuota(provider)
+    if not quota:
+        return None
+    try:
+        interval = int(interval)
+    except (TypeError, ValueError):
+        return f"Invalid interval {interval}"
+    if interval <= 0:
+        return f"Invalid interval {interval}"
+
+    try:
+        reportedQuota = redisClient.hgetall(f"{RATE_LIMIT_QUOTA_KEY_PREFIX}{provider}")
+        demand = redisClient.hgetall(f"{RATE_LIMIT_DEMAND_KEY_PREFIX}{provider}")
+    except redis.RedisError as e:
+        logger.error(f"Error reading the rate budget of {provider}: {e}")
+        return None
+
+    if reportedQuota.get('remaining') == '0' and int(reportedQuota.get('reset', 0)) > time.time():
+        return f"The quota of {provider} is exhausted until {time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(int(reportedQuota['reset'])))} UTC"
+
+    budget = quota['requests'] / quota['period']
+    used = sum(1 / int(otherInterval) for otherID, otherInterval in demand.items() if otherID != str(subscriptionID))
+    if used + 1 / interval > budget:
+        return (f"Subscription would exceed the quota of {provider} ({quota['requests']} requests per {quota['period']}s), "
+                f"{used * quota['period']:.1f} requests per {quota['period']}s are already used")
+    return None
+
+def reserveBudget(plan, subscriptionID, interval):
+    """
+    Reserves the requests of a subscription in the quota of its provider.
+
+    :param plan: The compiled fetch plan of the subscription
+    :param subscriptionID: ID of the subscription
+    :param interval: Interval in seconds the subscription is fetched with
+    """
+    provider = plan.get('provider')
+    if not getQuota(provider):
+        return
+    try:
+        redisClient.hset(f"{RATE_LIMIT_DEMAND_KEY_PREFIX}{provider}", subscriptionID, int(interval))
+    except redis.RedisError as e:
+        logger.error(f"Error reserving the rate budget of subscription {subscriptionID} at {provider}: {e}")
+
+def releaseBudget(subscriptionID):
+    """
+    Releases the requests a subscription reserved in the quota of its provider.
+
+    :param subscriptionID: ID of the subscription
+    """
+    releaseBudgets([subscriptionID])
+
+def releaseBudgets(subscriptionIDs):
+    """
+    Releases the requests several subscriptions reserved in the quotas of their providers, in one round trip.
+
+    :param subscriptionIDs: IDs of the subscriptions
+    """
+    subscriptionIDs = list(subscriptionIDs)
+    if not subscriptionIDs:
+        return
+    try:
+        pipeline = redisClient.pipeline(transaction=False)
+        for provider in RATE_LIMITS:
+            pipeline.hdel(f"{RATE_LIMIT_DEMAND_KEY_PREFIX}{provider}", *subscriptionIDs)
+        pipeline.execute()
+    except redis.RedisError as e:
+        logger.error(f"Error releasing the rate budget of subscriptions {subscriptionIDs}: {e}")
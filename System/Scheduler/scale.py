@@ -1,26 +1,31 @@
+import hashlib
+import math
+import time
 import redis
-import docker
-import configparser
+from contextlib import contextmanager
 from commonRessources.logger import setLoggerLevel
 from os import getenv
 import requests
-from commonRessources import MAX_NUMBER_JOBS_PER_WORKER, MAX_NUMBER_WORKERS, REDIS_HOST, REDIS_PORT, COMPOSE_POSTGRES_DATA_CONNECTOR_URL
+from commonRessources import WORKER_CAPACITY, WORKER_FETCH_MODE, WORKER_LOAD_LOW_WATERMARK, WORKER_LOAD_SHED_FRACTION, REDIS_HOST, REDIS_PORT, COMPOSE_POSTGRES_DATA_CONNECTOR_URL
 from commonRessources.interfaces import SubscriptionStatus
-import re
+from commonRessources.workerRegistry import loadRegisteredWorkers
+import costModel
+import jobStore
+import lockConfigFile
+import workerLoad
 
 logger = setLoggerLevel("Scalling")
 
 
 redisClient = redis.StrictRedis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
-dockerClient = docker.from_env()
 
 # -------------------------- Environment Variables ------------------------------------------------------------------------------------------------------------------------------------------
-CONFIG_FILE = '/app/opheliaConfig/config.ini'
-
 apiKey = getenv('INTERNAL_API_KEY')
 headers = {
     'x-api-key': apiKey
 }
+REBALANCE_STATS_KEY = 'REBALANCE_STATS'     # Hash with the duration and the moved jobs of the last rebalance and the totals of all rebalances
+PLACEMENT_ATTEMPTS = 3          # Workers picked for a new job before giving up, if the picked worker got other jobs before its lock was acquired
 
 # --------------------------- Initializations -----------------------------------------------------------------------------------------------------------------------------------------
 def initializeWorkerCounter():
@@ -28,19 +33,7 @@ def initializeWorkerCounter():
     Initialize the number of currently active worker containers.
     """
     try:
-        config = configparser.ConfigParser()
-        config.read(CONFIG_FILE)
-
-        unique_workers = set()
-
-        # Iterating through the sections and capturing the number unique worker containers
-        for section in config.sections():
-            if config.has_option(section, 'container'):
-                container_value = config.get(section, 'container')
-                if container_value.startswith('worker-'):
-                    unique_workers.add(container_value)
-
-        activeWorkerCounter = len(unique_workers)
+        activeWorkerCounter = len(jobStore.jobCountsPerWorker())      # the workers with at least one job
 
         logger.info(f"Worker counter initialized to {activeWorkerCounter}")
 
@@ -54,117 +47,395 @@ def initializeWorkerCounter():
 initializeWorkerCounter()
 
 # --------------------------- Scaling Functions -----------------------------------------------------------------------------------------------------------------------------------------
-def scaleWorkers():
+def availableWorkers():
+    """
+    The workers jobs can be placed on: registered (see commonRessources/workerRegistry.py), able to run jobs of
+    WORKER_FETCH_MODE and not in NOT_WORKING_CONTAINERS.
+    Overloaded workers (see workerLoad.py) come last, so they only get jobs if no other worker has free capacity.
+
+    :return: Dictionary workerID -> capacity (fetch slots), in the order the workers registered
+    """
+    notWorkingContainers = redisClient.smembers('NOT_WORKING_CONTAINERS')
+    loads = workerLoad.loadWorkerLoads()
+    workerCapacities = {workerID: int(registration.get('capacity') or WORKER_CAPACITY)
+                        for workerID, registration in loadRegisteredWorkers(redisClient).items()
+                        if WORKER_FETCH_MODE in registration.get('capabilities', []) and workerID not in notWorkingContainers}
+    return dict(sorted(workerCapacities.items(), key=lambda worker: loads.get(worker[0], {}).get('overloaded', False)))
+
+def hasUnregisteredAssignments():
+    """
+    Checks if jobs are assigned to workers which aren't registered (anymore), e.g. containers which were removed
+    or jobs assigned by container name before the workers registered themselves.
+
+    :return: True if at least one job has to be moved to a registered worker
+    """
+    registeredWorkers = loadRegisteredWorkers(redisClient)
+    return any(workerID not in registeredWorkers for workerID in jobStore.jobCountsPerWorker())
+
+def pickWorker(cost, workerCapacities, workerCosts, workerJobCounts, overloadedWorkers):
+    """
+    Picks the worker for a job (worst fit): the available worker with the lowest utilisation after taking the job,
+    among the workers whose jobs stay within their budget (see costModel.workerBudget). So the jobs are spread evenly
+    instead of filling one worker after the other. A worker without jobs always takes a job, even one costing more than its budget,
+    overloaded workers only get the job if no other worker can take it.
+
+    :param cost: The cost of the job
+    :param workerCapacities: As returned by availableWorkers
+    :param workerCosts: Dictionary workerID -> sum of the costs of its jobs
+    :param workerJobCounts: Dictionary workerID -> number of its jobs
+    :param overloadedWorkers: Set of the IDs of the overloaded workers
+    :return: The ID of the worker, None if no worker can take the job
+    """
+    candidates = [workerID for workerID, capacity in workerCapacities.items()
+                  if capacity > 0 and (workerCosts.get(workerID, 0.0) + cost <= costModel.workerBudget(capacity) or not workerJobCounts.get(workerID))]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda workerID: (workerID in overloadedWorkers, (workerCosts.get(workerID, 0.0) + cost) / workerCapacities[workerID]))
+
+def overloadedWorkers():
+    return {workerID for workerID, load in workerLoad.loadWorkerLoads().items() if load.get('overloaded')}
+
+def jobCost(interval, apiID):
+    """
+    :return: The cost of a new job of the API with this interval (see costModel.jobCost)
+    """
+    return costModel.jobCost(interval, apiID, costModel.loadApiStatistics())
+
+def scaleWorkers(cost=0.0):
     """
     Scales the jobs across the worker containers.
     This is done if a new job is added.
     
-    1) counts the number of jobs per worker in the ofelia config file and checks if there are any workers available.
-    2) fills the first available worker with the next job.
+    1) reads the costs and the number of the jobs per worker from the job store (see jobStore.py)
+    2) picks the available worker with the lowest utilisation which can take the cost of the job (see pickWorker).
 
-    :return: False if no worker is available, otherwise the name of the worker container
+    :param cost: The cost of the new job (see jobCost)
+    :return: False if no worker is available, otherwise the ID of the worker
     """
     try:
-        config = configparser.ConfigParser()
-        config.read(CONFIG_FILE)
+        workerCapacities = availableWorkers()
+        workerCosts = jobStore.jobCostsPerWorker()
+        workerID = pickWorker(cost, workerCapacities, workerCosts, jobStore.jobCountsPerWorker(), overloadedWorkers())
+        if not workerID:
+            logger.warning(f"No worker can take a job with cost {cost:.4f}")
+            return False        # No worker available
+        logger.info(f"Placing job with cost {cost:.4f} on worker {workerID}, utilisation {(workerCosts.get(workerID, 0.0) + cost) / workerCapacities[workerID]:.2%}")
+        return workerID
+    except redis.RedisError as e:
+        logger.error(f"Error accessing Redis: {e}")
+    except Exception as e:
+        logger.error(f"Unexpected error during scaling worker instances: {e}")
 
-        jobsPerContainer = {}
-        notWorkingContainers = redisClient.smembers('NOT_WORKING_CONTAINERS')
+def canTake(workerID, cost):
+    """
+    Checks again if a worker can take a job, after its lock was acquired: it's still available and the job fits into its budget (see pickWorker).
 
-        for i in range(1, MAX_NUMBER_WORKERS + 1):
-            jobsPerContainer[f"system-worker-{i}"] = 0
+    :param workerID: The ID of the worker
+    :param cost: The cost of the job
+    :return: True if the worker can take the job
+    """
+    workerCapacities = availableWorkers()
+    if not workerCapacities.get(workerID):
+        return False
+    return (jobStore.jobCostsPerWorker().get(workerID, 0.0) + cost <= costModel.workerBudget(workerCapacities[workerID])
+            or not jobStore.jobCountsPerWorker().get(workerID))
 
-        for section in config.sections():
-            if section.startswith('job-exec'):
-                containerName = config.get(section, 'container')
+def planJobs(costs):
+    """
+    Places several new jobs in one planning pass: every job is placed like by scaleWorkers (see pickWorker),
+    the costs of the jobs placed before are added to their workers. Has to be called while holding the locks of all workers (see lockJobStore).
 
-                if containerName in jobsPerContainer:
-                    jobsPerContainer[containerName] += 1
-                else:
-                    logger.error(f"Container {containerName} not found in jobsPerContainer dictionary.")
+    :param costs: List of the costs of the new jobs (see jobCost), the jobs are placed in this order
+    :return: List with the ID of the worker of every job, None if no worker can take the job
+    """
+    workerCapacities = availableWorkers()
+    workerCosts = jobStore.jobCostsPerWorker()
+    workerJobCounts = jobStore.jobCountsPerWorker()
+    overloaded = overloadedWorkers()
+    workers = []
+    for cost in costs:
+        workerID = pickWorker(cost, workerCapacities, workerCosts, workerJobCounts, overloaded)
+        if workerID:
+            workerCosts[workerID] = workerCosts.get(workerID, 0.0) + cost
+            workerJobCounts[workerID] = workerJobCounts.get(workerID, 0) + 1
+        workers.append(workerID)
+    placedJobs = sum(1 for workerID in workers if workerID)
+    logger.info(f"Planned {placedJobs} of {len(costs)} new jobs on {len({workerID for workerID in workers if workerID})} workers")
+    return workers
+
+@contextmanager
+def lockWorkerForJob(cost):
+    """
+    Picks the worker for a new job (see scaleWorkers) and holds its lock while the job is added.
+    Jobs are only placed on different workers in parallel, if the picked worker can't take the job anymore once its lock
+    is acquired (e.g. another replica placed a job on it in the meantime), another worker is picked.
 
-        for i in range(1, MAX_NUMBER_WORKERS + 1):
-            if jobsPerContainer[f"system-worker-{i}"] < MAX_NUMBER_JOBS_PER_WORKER and f"system-worker-{i}" not in notWorkingContainers:
-                return f'system-worker-{i}'
+    with scale.lockWorkerForJob(cost) as (workerID, leases):
+        manageJobs.addJob(jobName, interval, command, workerID, subscriptionID, apiID, cost, leases)
+
+    :param cost: The cost of the new job (see jobCost)
+    :return: (ID of the worker, Leases of its lock), (False, []) if no worker can take the job
+    """
+    for attempt in range(PLACEMENT_ATTEMPTS):
+        workerID = scaleWorkers(cost)
+        if not workerID:
+            break
+        with lockConfigFile.holdLocks([lockConfigFile.workerLock(workerID)]) as leases:
+            if canTake(workerID, cost):
+                yield workerID, leases
+                return
+        logger.info(f"Worker {workerID} can't take a job with cost {cost:.4f} anymore, picking another one")
+    yield False, []
 
-        return False        # No worker available
+@contextmanager
+def lockJobStore():
+    """
+    Holds the lock of the whole job store and the locks of all workers which are registered or have jobs,
+    for operations which move jobs between workers (rebalancing, shedding load, updating the job costs, importing jobs).
+
+    The workers are read once the job store lock is held. A worker which registers after that has no jobs which could be moved,
+    it can only get jobs from this holder and from lockWorkerForJob at the same time. Its job count and costs stay right
+    (the job store increments them atomically) and if its jobs exceed its budget, the next rebalance moves the newest ones away.
+
+    with scale.lockJobStore() as leases:
+        scale.balanceJobsAcrossWorkers(leases)
+
+    :return: The Leases (see lockConfigFile.holdLocks)
+    """
+    with lockConfigFile.holdLocks([lockConfigFile.JOB_STORE_LOCK]) as jobStoreLeases:
+        workers = {*loadRegisteredWorkers(redisClient), *jobStore.jobCountsPerWorker()}
+        with lockConfigFile.holdLocks([lockConfigFile.workerLock(workerID) for workerID in sorted(workers)]) as workerLeases:
+            yield jobStoreLeases + workerLeases
+
+def loadUtilisation():
+    """
+    :return: The utilisation of the workers (see costModel.summarizeUtilisation)
+    """
+    return costModel.summarizeUtilisation(availableWorkers(), jobStore.jobCostsPerWorker(), jobStore.jobCountsPerWorker())
+
+def updateJobCosts(leases=()):
+    """
+    Computes the costs of all jobs again with the current latencies and payload sizes of their APIs,
+    e.g. after the jobs were imported from the jobs file. The jobs stay on their workers.
+
+    :param leases: Leases of the job store lock (see lockJobStore)
+    :return: The number of jobs whose cost changed
+    """
+    apiStatistics = costModel.loadApiStatistics()
+    changedJobs = []
+    for job in jobStore.loadJobs():
+        cost = round(costModel.jobCost(job['interval'], job['apiID'], apiStatistics), 6)
+        if job.get('cost') != cost:
+            job['cost'] = cost
+            changedJobs.append(job)
+    jobStore.saveJobs(changedJobs, leases)
+    return len(changedJobs)
+
+def rendezvousScore(jobName, workerID, capacity):
+    """
+    Weighted rendezvous hashing: every worker gets a pseudo-random score per job, weighted by its capacity.
+    A job prefers the worker with the highest score, so it keeps its preference if other workers come or go.
+
+    :return: The score of the worker for the job
+    """
+    digest = hashlib.sha1(f"{jobName}|{workerID}".encode()).digest()
+    uniform = (int.from_bytes(digest[:8], 'big') + 1) / (2 ** 64 + 1)      # in (0, 1)
+    return -capacity / math.log(uniform)
+
+def pickRendezvousWorker(job, workerCapacities, workerCosts, workerJobCounts, overloadedWorkers):
+    """
+    Picks the worker for a job which has to move: the worker with the highest rendezvous score for the job (see rendezvousScore),
+    among the workers which can take its cost within their budget (same bounds as pickWorker). Overloaded workers only get the job
+    if no other worker can take it.
+
+    :param job: The job (see jobStore.buildJob)
+    :return: The ID of the worker, None if no worker can take the job
+    """
+    cost = job.get('cost', 0.0)
+    candidates = [workerID for workerID, capacity in workerCapacities.items()
+                  if capacity > 0 and (workerCosts.get(workerID, 0.0) + cost <= costModel.workerBudget(capacity) or not workerJobCounts.get(workerID))]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda workerID: (workerID not in overloadedWorkers, rendezvousScore(job['jobName'], workerID, workerCapacities[workerID])))
+
+def reportAssignments(movedJobs, droppedJobs):
+    """
+    Reports the new workers of moved jobs (ACTIVE) and the jobs which were dropped (INACTIVE) to the PostgreSQL data connector,
+    with one request to /setSubscriptionsStatuses.
+
+    :param movedJobs: List of the jobs with their new worker
+    :param droppedJobs: List of the jobs which were deleted because no worker could take them
+    """
+    subscriptions = [{
+        'subscriptionID': job['subscriptionID'],
+        'subscriptionStatus': SubscriptionStatus.ACTIVE.value,
+        'jobName': job['jobName'],
+        'container': job['worker']
+    } for job in movedJobs if job['subscriptionID'] is not None] + [{
+        'subscriptionID': job['subscriptionID'],
+        'subscriptionStatus': SubscriptionStatus.INACTIVE.value,
+        'jobName': None,
+        'container': None
+    } for job in droppedJobs if job['subscriptionID'] is not None]
+    if subscriptions:
+        subscriptionResponse = requests.post(f'{COMPOSE_POSTGRES_DATA_CONNECTOR_URL}/setSubscriptionsStatuses', json={'subscriptions': subscriptions}, headers=headers)
+        subscriptionResponse.raise_for_status()
+
+def recordRebalance(duration, movedJobs, droppedJobs):
+    """
+    Stores the duration and the number of moved and dropped jobs of a rebalance in REBALANCE_STATS.
+    """
+    try:
+        pipeline = redisClient.pipeline(transaction=True)
+        pipeline.hset(REBALANCE_STATS_KEY, mapping={'lastDuration': round(duration, 6), 'lastMovedJobs': movedJobs, 'lastDroppedJobs': droppedJobs, 'lastRunAt': time.time()})
+        pipeline.hincrby(REBALANCE_STATS_KEY, 'runs', 1)
+        pipeline.hincrby(REBALANCE_STATS_KEY, 'movedJobs', movedJobs)
+        pipeline.hincrby(REBALANCE_STATS_KEY, 'droppedJobs', droppedJobs)
+        pipeline.execute()
     except redis.RedisError as e:
-        logger.error(f"Error accessing Redis: {e}")
-    except Exception as e:
-        logger.error(f"Unexpected error during scaling worker instances: {e}")
+        logger.error(f"Error storing the rebalance statistics: {e}")
 
-def extractSubscriptionID(command):
-    match = re.search(r'--subscriptionID (\d+)', command)
-    if match:
-        return match.group(1)
-    return None
+def loadRebalanceStats():
+    """
+    :return: {"lastDuration", "lastMovedJobs", "lastDroppedJobs", "lastRunAt", "runs", "movedJobs", "droppedJobs"}, empty if no rebalance ran yet
+    """
+    return {field: float(value) if field in ('lastDuration', 'lastRunAt') else int(value) for field, value in redisClient.hgetall(REBALANCE_STATS_KEY).items()}
 
-def balanceJobsAcrossWorkers():
+def renderRebalancePrometheus(stats):
     """
-    Balances the jobs across the worker containers.
-    This is done if a Subscribtion is unsubscribed or a worker container is not working (detected by not sending a heartbeat anymore).
-    
-    1) Counts the number of jobs per worker in the ofelia config file
-    2) Delete all the entries in the config file
-    3) Fill container for container with jobs if the container is available
+    :param stats: As returned by loadRebalanceStats
+    :return: The rebalance statistics in the Prometheus text exposition format
+    """
+    if not stats:
+        return ""
+    return "\n".join([
+        "# HELP apiharvester_rebalance_duration_seconds Duration of the last rebalance of the jobs",
+        "# TYPE apiharvester_rebalance_duration_seconds gauge",
+        f"apiharvester_rebalance_duration_seconds {stats.get('lastDuration', 0)}",
+        "# HELP apiharvester_rebalance_last_moved_jobs Number of jobs moved by the last rebalance",
+        "# TYPE apiharvester_rebalance_last_moved_jobs gauge",
+        f"apiharvester_rebalance_last_moved_jobs {stats.get('lastMovedJobs', 0)}",
+        "# HELP apiharvester_rebalance_runs_total Number of rebalances of the jobs",
+        "# TYPE apiharvester_rebalance_runs_total counter",
+        f"apiharvester_rebalance_runs_total {stats.get('runs', 0)}",
+        "# HELP apiharvester_rebalance_moved_jobs_total Number of jobs moved to another worker by rebalances",
+        "# TYPE apiharvester_rebalance_moved_jobs_total counter",
+        f"apiharvester_rebalance_moved_jobs_total {stats.get('movedJobs', 0)}",
+        "# HELP apiharvester_rebalance_dropped_jobs_total Number of jobs deleted by rebalances because no worker could take them",
+        "# TYPE apiharvester_rebalance_dropped_jobs_total counter",
+        f"apiharvester_rebalance_dropped_jobs_total {stats.get('droppedJobs', 0)}"
+    ]) + "\n"
+
+def balanceJobsAcrossWorkers(leases=()):
+    """
+    Balances the jobs across the worker containers, moving only the jobs which have to move.
+    This is done if a worker container is not working (detected by not sending a heartbeat anymore), a worker registered while jobs
+    are assigned to unregistered workers, and after the costs of the jobs were updated.
+
+    1) Collects the jobs of the workers which aren't available anymore (see availableWorkers)
+    2) Collects the newest jobs of the workers whose jobs exceed their budget (see costModel.workerBudget), until they are within it again
+    3) Places the collected jobs from the most to the least expensive one on the worker with the highest rendezvous score
+       which can take them (see pickRendezvousWorker), all other jobs stay on their worker
+    4) Saves the moved jobs and deletes the jobs which didn't find a worker in one transaction of the job store
+       and reports them with one request to the PostgreSQL data connector (see reportAssignments)
+
+    :param leases: Leases of the job store lock (see lockJobStore)
+    :return: {"duration": <seconds>, "movedJobs": <int>, "droppedJobs": <int>}, None if an unexpected error occurred
+    :raises redis.RedisError: If the job store couldn't be read or written, nothing was moved
+    :raises LockLostError: If a lease was lost before the jobs were saved, nothing was moved
     """
     try:
-        config = configparser.ConfigParser()
-        config.read(CONFIG_FILE)
-
-        notWorkingContainers = redisClient.smembers('NOT_WORKING_CONTAINERS')
-
-        # Initialize dictionary to track jobs for each container
-        jobsPerContainer = {f"system-worker-{i}": 0 for i in range(1, MAX_NUMBER_WORKERS + 1)}
-        jobSections = []
-
-        # Collect all job sections in variable jobSections
-        for section in config.sections():
-            if section.startswith('job-exec'):
-                jobSections.append(section)
-
-        # Delete all container assignments in the config
-        for section in jobSections:
-            if config.has_option(section, 'container'):
-                config.remove_option(section, 'container')
-
-        # Distribute jobs across containers
-        for section in jobSections:             # Iterate through all jobSections stored locally
-            if section.startswith('job-exec'):
-                containerToUse = ""
-                for container in jobsPerContainer:
-                    if jobsPerContainer[container] < MAX_NUMBER_JOBS_PER_WORKER and container not in notWorkingContainers:
-                        containerToUse = container
-                        jobsPerContainer[container] += 1
-                        break
-
-                jobName = re.search(r'job-exec\s*"(.*?)"', section).group(1)    # section contains the first line of a job entry in the config.ini file
-                subscriptionID = extractSubscriptionID(config.get(section, 'command'))
-                if containerToUse:          # If a container with free space was found add the job to the container
-                                            # -> write to config file and set subscription status to active
-                    config.set(section, 'container', containerToUse)
-                    subscriptionResponse = requests.post(f'{COMPOSE_POSTGRES_DATA_CONNECTOR_URL}/setSubscriptionsStatus', json={
-                        'subscriptionID': subscriptionID,
-                        'subscriptionStatus': SubscriptionStatus.ACTIVE.value,
-                        'jobName': jobName,
-                        'container': containerToUse
-                    }, headers=headers)
-                    subscriptionResponse.raise_for_status()
-                else:               # If no container with free space was found delete the job from the config file
-                                    # -> delete the section and set subscription status to inactive
-                    logger.error(f"No suitable container found for job section: {section}")
-                    config.remove_section(section)
-                    subscriptionResponse = requests.post(f'{COMPOSE_POSTGRES_DATA_CONNECTOR_URL}/setSubscriptionsStatus', json={
-                        'subscriptionID': subscriptionID,
-                        'subscriptionStatus': SubscriptionStatus.INACTIVE.value,
-                        'jobName': None,
-                        'container': None
-                    }, headers=headers)
-                    subscriptionResponse.raise_for_status()
-
-        # Save the updated configuration
-        with open(CONFIG_FILE, 'w') as configfile:
-            config.write(configfile)        # Write the updated config file
+        startedAt = time.perf_counter()
+        workerCapacities = availableWorkers()
+        overloaded = overloadedWorkers()
+        workerCosts = jobStore.jobCostsPerWorker()
+        workerJobCounts = jobStore.jobCountsPerWorker()
+
+        pendingJobs = []
+        for workerID in list(workerJobCounts):
+            if workerID not in workerCapacities:        # all jobs of workers which are gone have to move
+                pendingJobs.extend(jobStore.jobsOfWorker(workerID))
+                workerCosts.pop(workerID, None)
+                workerJobCounts.pop(workerID)
+        for workerID, capacity in workerCapacities.items():
+            budget = costModel.workerBudget(capacity)
+            if workerCosts.get(workerID, 0.0) <= budget or workerJobCounts.get(workerID, 0) <= 1:
+                continue
+            for job in reversed(jobStore.jobsOfWorker(workerID)):      # the newest jobs of the worker first
+                if workerCosts[workerID] <= budget or workerJobCounts[workerID] <= 1:
+                    break
+                pendingJobs.append(job)
+                workerCosts[workerID] -= job.get('cost', 0.0)
+                workerJobCounts[workerID] -= 1
+
+        movedJobs = []
+        droppedJobs = []
+        for job in sorted(pendingJobs, key=lambda job: -job.get('cost', 0.0)):     # sorted is stable, so equal jobs stay oldest first
+            containerToUse = pickRendezvousWorker(job, workerCapacities, workerCosts, workerJobCounts, overloaded)
+            if containerToUse:
+                workerCosts[containerToUse] = workerCosts.get(containerToUse, 0.0) + job.get('cost', 0.0)
+                workerJobCounts[containerToUse] = workerJobCounts.get(containerToUse, 0) + 1
+                job['worker'] = containerToUse
+                movedJobs.append(job)
+            else:
+                logger.error(f"No suitable container found for job {job['jobName']}")
+                droppedJobs.append(job)
 
+        jobStore.applyChanges(jobs=movedJobs, deletedJobNames=[job['jobName'] for job in droppedJobs], leases=leases)
+        reportAssignments(movedJobs, droppedJobs)
+
+        duration = time.perf_counter() - startedAt
+        recordRebalance(duration, len(movedJobs), len(droppedJobs))
+        logger.info(f"Rebalanced in {duration * 1000:.1f}ms: {len(movedJobs)} jobs moved, {len(droppedJobs)} jobs dropped, utilisation "
+                    + ", ".join(f"{workerID}: {workerCosts.get(workerID, 0.0) / capacity:.2%}" for workerID, capacity in workerCapacities.items() if capacity))
+        return {'duration': duration, 'movedJobs': len(movedJobs), 'droppedJobs': len(droppedJobs)}
+
+    except (redis.RedisError, lockConfigFile.LockTimeoutError, lockConfigFile.LockLostError):
+        raise       # the caller tries again, e.g. checkHeartbeats at its next check
     except Exception as e:
         logger.error(f"Unexpected error during job rebalancing across workers: {e}")
+        return None
+
+def shedLoad(workerID, leases=()):
+    """
+    Moves WORKER_LOAD_SHED_FRACTION of the jobs of an overloaded worker (at least one) to the least loaded workers.
+    Only workers whose load score is below WORKER_LOAD_LOW_WATERMARK and whose budget can take the cost of the job take jobs,
+    if there is none the jobs stay where they are.
+
+    :param workerID: The ID of the overloaded worker
+    :param leases: Leases of the job store lock (see lockJobStore)
+    :return: The number of moved jobs
+    :raises redis.RedisError: If the job store couldn't be read or written, nothing was moved
+    :raises LockLostError: If a lease was lost before the jobs were saved, nothing was moved
+    """
+    try:
+        workerCapacities = availableWorkers()
+        loads = workerLoad.loadWorkerLoads()
+        workerCosts = jobStore.jobCostsPerWorker()
+        workerJobs = jobStore.jobsOfWorker(workerID)
+
+        targets = [container for container in workerCapacities
+                   if container != workerID and loads.get(container, {}).get('score', 0) < WORKER_LOAD_LOW_WATERMARK]
+        movedJobs = []
+        for job in workerJobs[-max(1, int(len(workerJobs) * WORKER_LOAD_SHED_FRACTION)):]:   # the newest jobs of the worker
+            cost = job.get('cost', 0.0)
+            freeTargets = [container for container in targets if workerCosts.get(container, 0.0) + cost <= costModel.workerBudget(workerCapacities[container])]
+            if not freeTargets:
+                break
+            containerToUse = min(freeTargets, key=lambda container: (loads.get(container, {}).get('score', 0), (workerCosts.get(container, 0.0) + cost) / workerCapacities[container]))
+            job['worker'] = containerToUse
+            workerCosts[containerToUse] = workerCosts.get(containerToUse, 0.0) + cost
+            movedJobs.append(job)
+
+        if movedJobs:
+            jobStore.saveJobs(movedJobs, leases)
+            reportAssignments(movedJobs, [])
+            logger.info(f"Moved {len(movedJobs)} jobs away from overloaded worker {workerID}")
+        else:
+            logger.warning(f"Worker {workerID} is overloaded, but no other worker can take its jobs")
+        return len(movedJobs)
+    except (redis.RedisError, lockConfigFile.LockTimeoutError, lockConfigFile.LockLostError):
+        raise
+    except Exception as e:
+        logger.error(f"Unexpected error while moving jobs away from worker {workerID}: {e}")
+        return 0
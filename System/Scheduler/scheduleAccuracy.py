@@ -0,0 +1,86 @@
+import redis
+from commonRessources import REDIS_HOST, REDIS_PORT
+from commonRessources.logger import setLoggerLevel
+from commonRessources.latencyHistograms import LATENCY_BUCKETS, SCHEDULE_LATENESS_KEY, SCHEDULE_MISSED_TICKS_KEY, SCHEDULE_LAST_START_KEY, parseHistograms, mergeHistograms, summarizeHistogram
+
+# --------------------------- Initializations -----------------------------------------------------------------------------------------------------------------------------------------
+logger = setLoggerLevel("ScheduleAccuracy")
+redisClient = redis.StrictRedis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+
+# --------------------------- Schedule Accuracy Functions -----------------------------------------------------------------------------------------------------------------------------------------
+# Every executed tick records how late it started compared to when it was scheduled, every tick which couldn't be executed
+# (previous tick still running, worker or daemon too late, schedule reloaded) counts as missed.
+# The daemon knows the scheduled time of every tick, the cli mode compares the start with the start of the previous tick plus the interval.
+
+def loadScheduleAccuracy():
+    """
+    :return: (Dictionary subscriptionID -> lateness histogram, Dictionary subscriptionID -> missed ticks)
+    """
+    histograms = {subscriptionID: histogram for (_, subscriptionID), histogram in parseHistograms(redisClient.hgetall(SCHEDULE_LATENESS_KEY)).items()}
+    missedTicks = {subscriptionID: int(count) for subscriptionID, count in redisClient.hgetall(SCHEDULE_MISSED_TICKS_KEY).items()}
+    return histograms, missedTicks
+
+def summarizeScheduleAccuracy(histograms, missedTicks):
+    """
+    Computes the lateness percentiles and missed ticks of the fleet and of every subscription.
+
+    :param histograms: Dictionary subscriptionID -> lateness histogram
+    :param missedTicks: Dictionary subscriptionID -> missed ticks
+    :return: {"fleet": summary, "bySubscription": {subscriptionID: summary}}, a summary has count, mean, p50, p95, p99 (seconds), missedTicks and missedRatio
+    """
+    def summarize(histogram, missed):
+        summary = summarizeHistogram(histogram)
+        scheduledTicks = summary['count'] + missed
+        return {**summary, 'missedTicks': missed, 'missedRatio': round(missed / scheduledTicks, 6) if scheduledTicks else None}
+
+    emptyHistogram = mergeHistograms([])
+    return {
+        'fleet': summarize(mergeHistograms(histograms.values()), sum(missedTicks.values())),
+        'bySubscription': {subscriptionID: summarize(histograms.get(subscriptionID, emptyHistogram), missedTicks.get(subscriptionID, 0))
+                           for subscriptionID in sorted(set(histograms) | set(missedTicks))}
+    }
+
+def renderPrometheus(histograms, missedTicks):
+    """
+    Renders the fleet wide lateness histogram and missed ticks in the Prometheus text exposition format.
+    The values per subscription are left out to keep the number of series small, see /scheduleAccuracy.
+
+    :return: The exposition as text
+    """
+    histogram = mergeHistograms(histograms.values())
+    lines = [
+        "# HELP apiharvester_tick_lateness_seconds How late the ticks of all subscriptions started compared to their schedule",
+        "# TYPE apiharvester_tick_lateness_seconds histogram"
+    ]
+    cumulative = 0
+    for bound, count in zip([*map(str, LATENCY_BUCKETS), '+Inf'], histogram['buckets']):
+        cumulative += count
+        lines.append(f'apiharvester_tick_lateness_seconds_bucket{{le="{bound}"}} {cumulative}')
+    lines.append(f'apiharvester_tick_lateness_seconds_sum {histogram["sum"]}')
+    lines.append(f'apiharvester_tick_lateness_seconds_count {cumulative}')
+    lines.append("# HELP apiharvester_missed_ticks_total Scheduled ticks which weren't executed")
+    lines.append("# TYPE apiharvester_missed_ticks_total counter")
+    lines.append(f"apiharvester_missed_ticks_total {sum(missedTicks.values())}")
+    return "\n".join(lines) + "\n"
+
+def forgetLastStart(subscriptionID):
+    """
+    Deletes the start of the last tick of a subscription (cli mode), so that the time it was unsubscribed doesn't count as missed ticks.
+
+    :param subscriptionID: ID of the subscription
+    """
+    forgetLastStarts([subscriptionID])
+
+def forgetLastStarts(subscriptionIDs):
+    """
+    Deletes the starts of the last ticks of several subscriptions (see forgetLastStart).
+
+    :param subscriptionIDs: IDs of the subscriptions
+    """
+    subscriptionIDs = list(subscriptionIDs)
+    if not subscriptionIDs:
+        return
+    try:
+        redisClient.hdel(SCHEDULE_LAST_START_KEY, *subscriptionIDs)
+    except redis.RedisError as e:
+        logger.error(f"Error deleting the last tick starts of subscriptions {subscriptionIDs}: {e}")
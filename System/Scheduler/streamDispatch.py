@@ -0,0 +1,123 @@
+import time
+import uuid
+import zlib
+import redis
+import jobStore
+import workerJobs
+from commonRessources import REDIS_HOST, REDIS_PORT, FETCH_STREAM_MAX_LENGTH, FETCH_STREAM_DISPATCHER_LEASE, WORKER_DAEMON_JOB_SYNC_INTERVAL
+from commonRessources.logger import setLoggerLevel
+from commonRessources.fetchStream import FETCH_STREAM_KEY, FETCH_STREAM_GROUP, FETCH_STREAM_DISPATCHER_KEY, encodeTick
+from commonRessources.jobSchedule import JobSchedule, syncSchedule
+from commonRessources.latencyHistograms import missedTicks
+
+# -------------------------- Environment Variables ------------------------------------------------------------------------------------------------------------------------------------------
+DISPATCHER_ID = uuid.uuid4().hex        # identifies this scheduler replica in the lease
+RENEW_LEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# --------------------------- Initializations -----------------------------------------------------------------------------------------------------------------------------------------
+logger = setLoggerLevel("StreamDispatch")
+redisClient = redis.StrictRedis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+renewLease = redisClient.register_script(RENEW_LEASE_SCRIPT)
+
+# --------------------------- Stream Dispatch Functions -----------------------------------------------------------------------------------------------------------------------------------------
+# Only used in the stream dispatch mode (see commonRessources/fetchStream.py). Every scheduler replica runs the dispatcher,
+# but only the replica holding the lease adds ticks to the stream. If it dies, another replica takes the lease over
+# after FETCH_STREAM_DISPATCHER_LEASE seconds and continues with the same schedule, because the ticks of every job
+# are on a fixed grid (offset by a hash of its name, so that the jobs with the same interval don't all start at once).
+
+def ensureGroup():
+    """
+    Creates the stream and the consumer group of the workers if they don't exist yet.
+    """
+    try:
+        redisClient.xgroup_create(FETCH_STREAM_KEY, FETCH_STREAM_GROUP, id='0', mkstream=True)
+    except redis.ResponseError as e:
+        if 'BUSYGROUP' not in str(e):
+            raise
+
+def holdLease():
+    """
+    Acquires or renews the lease of the dispatcher.
+
+    :return: True if this replica dispatches the ticks
+    """
+    leaseMilliseconds = int(FETCH_STREAM_DISPATCHER_LEASE * 1000)
+    if redisClient.set(FETCH_STREAM_DISPATCHER_KEY, DISPATCHER_ID, nx=True, px=leaseMilliseconds):
+        return True
+    return bool(renewLease(keys=[FETCH_STREAM_DISPATCHER_KEY], args=[DISPATCHER_ID, leaseMilliseconds]))
+
+def firstRun(job, wall):
+    """
+    :param job: The job as loaded by loadStreamJobs
+    :param wall: The current UNIX time
+    :return: The next UNIX time on the grid of the job: every interval, offset by a hash of the job name
+    """
+    interval = job['interval']
+    offset = zlib.crc32(job['name'].encode()) % interval
+    return wall + interval - (wall - offset) % interval
+
+def loadStreamJobs():
+    """
+    :return: Dictionary jobName -> {"name": <str>, "interval": <int>, "command": <str>, "definition": <str>} of all jobs in the job store
+    """
+    return {job['jobName']: {'name': job['jobName'], 'interval': job['interval'], 'command': job['command'], 'definition': workerJobs.publishedJob(job)}
+            for job in jobStore.loadJobs()}
+
+def runDispatcher():
+    """
+    Adds the due ticks of all jobs to the stream while this replica holds the lease.
+
+    1) Renews the lease, a replica which lost it forgets its schedule
+    2) Reloads the jobs every time the scheduler published a new version of them, only new and changed jobs are (re)scheduled
+    3) Adds all due ticks to the stream with one pipeline and schedules their next run
+    """
+    schedule = JobSchedule()
+    jobs = {}
+    jobsVersion = None
+    dispatching = False
+    nextSync = 0
+    while True:
+        try:
+            if not holdLease():
+                if dispatching:
+                    logger.warning("Lost the dispatcher lease, another scheduler replica dispatches the ticks")
+                dispatching, schedule, jobs, jobsVersion = False, JobSchedule(), {}, None
+                time.sleep(FETCH_STREAM_DISPATCHER_LEASE / 3)
+                continue
+            if not dispatching:
+                ensureGroup()
+                logger.info("Acquired the dispatcher lease, dispatching the ticks")
+                dispatching = True
+
+            now = time.time()
+            if now >= nextSync:
+                version = redisClient.get(workerJobs.WORKER_JOBS_VERSION_KEY)
+                if version != jobsVersion:
+                    loadedJobs = loadStreamJobs()
+                    added, changed, removed = syncSchedule(schedule, jobs, loadedJobs, lambda job: firstRun(job, now))
+                    jobs = loadedJobs
+                    jobsVersion = version
+                    logger.info(f"Loaded {len(jobs)} jobs (version {version}): {added} added, {changed} changed, {removed} removed")
+                nextSync = now + WORKER_DAEMON_JOB_SYNC_INTERVAL
+
+            dueTicks = schedule.popDue(now)
+            if dueTicks:
+                pipeline = redisClient.pipeline(transaction=False)
+                for dueAt, jobName in dueTicks:
+                    job = jobs[jobName]
+                    pipeline.xadd(FETCH_STREAM_KEY, encodeTick(jobName, {'interval': job['interval'], 'command': job['command']}, dueAt),
+                                  maxlen=FETCH_STREAM_MAX_LENGTH, approximate=True)
+                    schedule.schedule(jobName, dueAt + (missedTicks(now - dueAt, job['interval']) + 1) * job['interval'])
+                pipeline.execute()
+
+            nextRun = schedule.nextRunAt()
+            nextWakeup = min(nextSync, now + FETCH_STREAM_DISPATCHER_LEASE / 3, nextRun if nextRun is not None else nextSync)
+            time.sleep(max(0, nextWakeup - time.time()))
+        except redis.RedisError as e:
+            logger.error(f"Error dispatching the ticks: {e}")
+            time.sleep(1)
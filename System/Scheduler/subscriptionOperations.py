@@ -0,0 +1,612 @@
+import redis
+import requests
+from os import getenv
+from datetime import datetime, timezone
+from commonRessources import COMPOSE_POSTGRES_DATA_CONNECTOR_URL, SCHEDULER_WORKER_HEARTBEAT_INTERVAL, REDIS_HOST, REDIS_PORT
+from commonRessources.interfaces import SubscriptionStatus
+from commonRessources.logger import setLoggerLevel
+from commonRessources.urlTemplates import templateParameters
+from operations import OperationFailedError, TransientOperationError
+import jobCounter, scale, manageJobs, lockConfigFile, jobStore, fetchPlans, rateBudget, scheduleAccuracy, costModel
+
+# -------------------------- Environment Variables ------------------------------------------------------------------------------------------------------------------------------------------
+apiKey = getenv('INTERNAL_API_KEY')
+headers = {
+    'x-api-key': apiKey
+}
+
+# --------------------------- Initializations -----------------------------------------------------------------------------------------------------------------------------------------
+logger = setLoggerLevel("SubscriptionOperations")
+redisClient = redis.StrictRedis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+
+# --------------------------- Functions -----------------------------------------------------------------------------------------------------------------------------------------
+def callConnector(method, path, json=None):
+    """
+    Sends a request to the PostgreSQL data connector.
+
+    :param method: 'get' or 'post'
+    :param path: Path of the route, e.g. '/subscription/42'
+    :param json: Body of a POST request
+    :return: The JSON response
+    :raises TransientOperationError: If the connector couldn't be reached or answered with a server error
+    :raises OperationFailedError: If the connector refused the request
+    """
+    try:
+        if method == 'get':
+            response = requests.get(f'{COMPOSE_POSTGRES_DATA_CONNECTOR_URL}{path}', headers=headers)
+        else:
+            response = requests.post(f'{COMPOSE_POSTGRES_DATA_CONNECTOR_URL}{path}', json=json, headers=headers)
+    except requests.RequestException as e:
+        raise TransientOperationError(f"PostgreSQL data connector couldn't be reached: {e}")
+    if response.status_code >= 500:
+        raise TransientOperationError(f"{path} of the PostgreSQL data connector failed with {response.status_code}")
+    if response.status_code >= 400:
+        raise OperationFailedError(f"{path} of the PostgreSQL data connector refused the request: {response.text}", response.status_code)
+    return response.json()
+
+def buildJobCommand(subscriptionID, apiID, subscription):
+    """
+    Builds the fetchApis.py command of the job of a subscription.
+
+    :param subscriptionID: ID of the subscription
+    :param apiID: ID of the subscribed API
+    :param subscription: Dictionary with the options of the subscription (interval, adaptive, aggregationWindow, aggregationRawSample)
+    :return: The command
+    """
+    command = f"python /app/fetchScripts/fetchApis.py --subscriptionID {subscriptionID} --apiID {apiID}"
+    if str(subscription.get('interval', '')).isdigit():
+        command += f" --interval {subscription['interval']}"      # the cli mode measures how late its ticks start
+    if subscription.get('adaptive'):
+        command += " --adaptive"
+    if subscription.get('aggregationWindow'):
+        command += f" --aggregationWindow {int(subscription['aggregationWindow'])}"
+        if subscription.get('aggregationRawSample'):
+            command += " --rawSample"
+    return command
+
+def checkContainersAlive():
+    """
+    Check which of the containers are still alive.
+    In comparison to the checkHeartbeats function, this function is only called when a new job is scheduled and
+    isn't executed periodically.
+    And it doesn't checks if last heartbeat was sent in SCHEDULER_WORKER_HEARTBEAT_INTERVAL*2
+    this one checks if the last heartbeat was sent in SCHEDULER_WORKER_HEARTBEAT_INTERVAL because the chance to schedule
+    a job on a dead container gets smaller if no heartbeat could be missed like it's checked in this function
+    """
+    now = datetime.now(timezone.utc)
+    heartbeats = redisClient.hgetall('heartbeats')
+
+    # Iterate over all workers and check if they sent a heartbeat within the expected time
+    for workerID, lastHeartbeat in heartbeats.items():
+        lastHeartbeat = datetime.fromisoformat(lastHeartbeat)
+        # Last heartbeat has to be send within 2*SCHEDULER_WORKER_HEARTBEAT_INTERVAL so one heartbeat can be missed
+        if (now - lastHeartbeat).total_seconds() > (SCHEDULER_WORKER_HEARTBEAT_INTERVAL):
+            logger.error(f"Worker {workerID} missed heartbeat! Last seen at {lastHeartbeat}")
+            redisClient.sadd("NOT_WORKING_CONTAINERS", workerID)
+
+def placeSubscriptionJob(jobName, subscriptionID, apiID, interval, command, cost, fetchPlan):
+    """
+    Reserves the rate budget of a subscription while holding the lock of its provider and adds its job to a worker
+    while holding the lock of the worker (see scale.lockWorkerForJob). No HTTP request is made while a lock is held.
+
+    :return: (ID of the worker, None), (False, reason) if the budget of the provider or no worker can take the job
+    """
+    provider = fetchPlan.get('provider')
+    with lockConfigFile.holdLocks([lockConfigFile.providerLock(provider)] if provider else []):
+        budgetError = rateBudget.checkBudget(fetchPlan, interval, subscriptionID)      # checked again, another replica may have reserved the budget in the meantime
+        if budgetError:
+            return False, budgetError
+        rateBudget.reserveBudget(fetchPlan, subscriptionID, interval)
+    try:
+        with scale.lockWorkerForJob(cost) as (containerName, leases):
+            if containerName:
+                manageJobs.addJob(jobName, interval, command, containerName, subscriptionID, apiID, cost, leases)     # add the job to the job store
+    except lockConfigFile.LockLostError:
+        rateBudget.releaseBudget(subscriptionID)
+        raise
+    if not containerName:
+        rateBudget.releaseBudget(subscriptionID)
+    return containerName, None
+
+def placeJobOnce(operation, subscriptionID, apiID, interval, command, cost, fetchPlan):
+    """
+    Places the job of a subscription while holding the lock of the subscription, unless an earlier attempt of the operation placed it already.
+
+    :param operation: The operation (see operations.Operation), its state remembers the name of the job
+    :return: (name of the job, ID of the worker, None), (name of the job, False, reason) if it couldn't be placed
+    """
+    with lockConfigFile.holdLocks([lockConfigFile.subscriptionLock(subscriptionID)]):
+        jobName = jobStore.jobNameOfSubscription(subscriptionID)
+        if jobName:
+            if jobName != operation.state.get('jobName'):
+                raise OperationFailedError("Api is already active")
+            return jobName, jobStore.getJob(jobName)['worker'], None
+        fetchPlans.storeFetchPlan(subscriptionID, fetchPlan)
+        jobName = operation.state.get('jobName') or jobCounter.allocateJobName()
+        operation.progress('placeJob', jobName=jobName)
+        containerName, budgetError = placeSubscriptionJob(jobName, subscriptionID, apiID, interval, command, cost, fetchPlan)
+        return jobName, containerName, budgetError
+
+def loadFetchPlan(apiID, parameters):
+    """
+    :return: (availableApi, compiled fetch plan) of the API with the parameters of the subscription
+    :raises OperationFailedError: If the API has no name or URL or no fetch plan could be compiled
+    """
+    apiData = callConnector('get', f'/availableApi/{apiID}')
+    return apiData, compileSubscriptionPlan(apiID, apiData, parameters)
+
+def compileSubscriptionPlan(apiID, apiData, parameters):
+    """
+    :return: The compiled fetch plan of the availableApi with the parameters of the subscription
+    :raises OperationFailedError: If the API has no name or URL or no fetch plan could be compiled
+    """
+    if not apiData.get("name") or not apiData.get("url"):
+        raise OperationFailedError("API name or URL not found in response")
+    fetchPlan = fetchPlans.compileFetchPlan(apiData, parameters)     # resolve everything the worker needs once, instead of on every tick
+    if not fetchPlan:
+        raise OperationFailedError(f"No fetch plan could be compiled for API {apiData.get('name')}, parameters {templateParameters(apiData.get('url'))} are required")
+    return fetchPlan
+
+# --------------------------- Operation Handlers -----------------------------------------------------------------------------------------------------------------------------------------
+# Every handler carries out an operation (see operations.py) and can be run again after a transient error:
+# the steps which were done are remembered with operation.progress and skipped by the next attempt.
+
+def subscribe(operation):
+    """
+    Creates a subscription and schedules the job fetching its API.
+
+    1) Loads the availableApi and compiles the fetch plan, checks the rate budget and if a worker can take the job
+    2) Creates the subscription as INACTIVE, so that it can be resubscribed if the operation fails later on.
+       The ID of the operation is its idempotency key, so an attempt after one which created it but failed before it was remembered gets the same subscription
+    3) Places the job on a worker (see placeJobOnce) and publishes it
+    4) Sets the job, command and container of the subscription and activates it
+
+    :param operation: The operation, its request is the JSON of /subscribeApi
+    :return: (message, {"subscriptionID", "jobName", "container"})
+    """
+    request = operation.request
+    apiID, interval = request['apiID'], request['interval']
+    options = {'interval': interval, 'adaptive': request.get('adaptive'), 'aggregationWindow': request.get('aggregationWindow'), 'aggregationRawSample': request.get('aggregationRawSample')}
+
+    operation.progress('loadApi')
+    apiData, fetchPlan = loadFetchPlan(apiID, request.get('parameters'))
+    cost = scale.jobCost(interval, apiID)       # fetch slots the job will keep busy, see costModel.py
+
+    subscriptionID = operation.state.get('subscriptionID')
+    if subscriptionID is None:
+        checkContainersAlive()
+        budgetError = rateBudget.checkBudget(fetchPlan, interval)     # refuse subscriptions which would push the provider into 429s
+        if budgetError:
+            raise OperationFailedError(budgetError)
+        if not scale.scaleWorkers(cost):        # checked again while holding the lock of the picked worker
+            raise OperationFailedError("No worker container available")
+
+        operation.progress('createSubscription')
+        subscriptionID = callConnector('post', '/createSubscription', {
+            'userID': request['userID'],
+            'availableApiID': apiID,
+            'interval': interval,
+            'status': SubscriptionStatus.INACTIVE.value,
+            'adaptive': options['adaptive'],
+            'aggregationWindow': options['aggregationWindow'],
+            'aggregationRawSample': options['aggregationRawSample'],
+            'parameters': request.get('parameters'),
+            'idempotencyKey': operation.operationID
+        }).get('subscriptionID')
+        operation.progress('createSubscription', subscriptionID=subscriptionID)
+
+    command = buildJobCommand(subscriptionID, apiID, options)
+    jobName, containerName, budgetError = placeJobOnce(operation, subscriptionID, apiID, interval, command, cost, fetchPlan)
+    if not containerName:       # another subscription took the budget or the workers in the meantime, the subscription stays inactive
+        fetchPlans.deleteFetchPlan(subscriptionID, apiID)
+        raise OperationFailedError(budgetError or "No worker container available")
+
+    operation.progress('publishJob')
+    manageJobs.refreshWorkerJobs()      # publish the new job to its worker
+
+    operation.progress('setSubscriptionStatus')
+    callConnector('post', '/setSubscriptionsStatus', {
+        'subscriptionID': subscriptionID,
+        'subscriptionStatus': SubscriptionStatus.ACTIVE.value,
+        'jobName': jobName,
+        'command': command,
+        'container': containerName
+    })
+    return (f"Job {jobName} scheduled and subscription for API {apiData.get('name')}; API_ID: {apiID} created",
+            {'subscriptionID': subscriptionID, 'jobName': jobName, 'container': containerName})
+
+def resubscribe(operation):
+    """
+    Schedules the job of an inactive subscription again.
+
+    :param operation: The operation, its request is {"subscriptionID": <int>}
+    :return: (message, {"subscriptionID", "jobName", "container"})
+    """
+    subscriptionID = operation.request['subscriptionID']
+
+    operation.progress('loadSubscription')
+    data = callConnector('get', f'/subscription/{subscriptionID}')
+    if data.get('status') != SubscriptionStatus.INACTIVE.value and not operation.state.get('jobName'):
+        raise OperationFailedError("Api is already active")
+    apiID = data.get('availableApiID')
+
+    operation.progress('loadApi')
+    apiData, fetchPlan = loadFetchPlan(apiID, data.get('parameters'))     # the availableApi may have changed since the subscription was inactivated
+    command = buildJobCommand(subscriptionID, apiID, data)
+    cost = scale.jobCost(data.get('interval'), apiID)
+
+    checkContainersAlive()
+    jobName, containerName, budgetError = placeJobOnce(operation, subscriptionID, apiID, data.get('interval'), command, cost, fetchPlan)
+    if not containerName:
+        raise OperationFailedError(budgetError or "No worker container available")
+
+    operation.progress('publishJob')
+    manageJobs.refreshWorkerJobs()
+
+    operation.progress('setSubscriptionStatus')
+    callConnector('post', '/setSubscriptionsStatus', {
+        'subscriptionID': subscriptionID,
+        'subscriptionStatus': SubscriptionStatus.ACTIVE.value,
+        'jobName': jobName,
+        'command': command,
+        'container': containerName
+    })
+    return (f"Job {jobName} scheduled and subscription for API_ID {apiID} reactivated",
+            {'subscriptionID': subscriptionID, 'jobName': jobName, 'container': containerName})
+
+def unsubscribe(operation):
+    """
+    Deletes the job of a subscription and sets the subscription to INACTIVE.
+    If the job couldn't be deleted, the subscription is set to ERROR.
+
+    :param operation: The operation, its request is {"subscriptionID": <int>}
+    :return: (message, {"subscriptionID", "jobName"})
+    """
+    subscriptionID = operation.request['subscriptionID']
+
+    operation.progress('loadSubscription')
+    data = callConnector('get', f'/subscription/{subscriptionID}')
+
+    jobName = operation.state.get('jobName')
+    if not operation.state.get('deleted'):
+        operation.progress('deleteJob')
+        with lockConfigFile.holdLocks([lockConfigFile.subscriptionLock(subscriptionID)]):
+            jobName = jobStore.jobNameOfSubscription(subscriptionID) or data.get('jobName')       # jobName is needed to delete the job from the job store
+            deleted = manageJobs.deleteJob(jobName)
+            if deleted:
+                fetchPlans.deleteFetchPlan(subscriptionID, data.get('availableApiID'))
+                rateBudget.releaseBudget(subscriptionID)
+                scheduleAccuracy.forgetLastStart(subscriptionID)
+                operation.progress('deleteJob', jobName=jobName, deleted=True)
+        if not deleted:     # if the job couldn't be deleted from the job store set the subscription status the DB to ERROR
+            callConnector('post', '/setSubscriptionsStatus', {
+                'subscriptionID': subscriptionID,
+                'subscriptionStatus': SubscriptionStatus.ERROR.value,
+                'jobName': None,
+                'container': None
+            })
+            raise OperationFailedError(f"Api isn't unsubscribed and job {jobName} couldn't be deleted")
+
+    operation.progress('publishJob')
+    manageJobs.refreshWorkerJobs()      # unpublish the job from its worker
+
+    operation.progress('setSubscriptionStatus')
+    callConnector('post', '/setSubscriptionsStatus', {
+        'subscriptionID': subscriptionID,
+        'subscriptionStatus': SubscriptionStatus.INACTIVE.value,
+        'jobName': None,
+        'container': None
+    })
+    return f"Api unsubsribed and job {jobName} deleted", {'subscriptionID': subscriptionID, 'jobName': jobName}
+
+# --------------------------- Bulk Operation Handlers -----------------------------------------------------------------------------------------------------------------------------------------
+# The bulk handlers carry out the subscriptions of a batch together instead of one operation per subscription:
+# every availableApi is loaded once, the subscriptions are created and updated with one request each, all jobs are placed
+# in one planning pass and saved in one transaction (see placeJobsInBatch), and the changed jobs are published once.
+# A subscription of the batch which can't be carried out doesn't fail the others, the result of the operation contains one result per subscription:
+# {"results": [{"subscriptionID": 42, "jobName": "job12", "container": "3f2a9c0d41b7", "code": 200, "message": "..."}, ...]}
+
+def itemResult(code, message, subscriptionID=None, jobName=None, container=None):
+    return {'subscriptionID': subscriptionID, 'jobName': jobName, 'container': container, 'code': code, 'message': message}
+
+def loadApis(apiIDs):
+    """
+    Loads every availableApi once.
+
+    :param apiIDs: IDs of the availableApis, duplicates are only loaded once
+    :return: Dictionary apiID -> availableApi, or the OperationFailedError if the data connector refused to load it
+    """
+    apis = {}
+    for apiID in dict.fromkeys(apiIDs):
+        try:
+            apis[apiID] = callConnector('get', f'/availableApi/{apiID}')
+        except OperationFailedError as e:
+            apis[apiID] = e
+    return apis
+
+def compileItemPlan(apis, apiID, parameters):
+    """
+    :return: (compiled fetch plan, None), (None, OperationFailedError) if the availableApi couldn't be loaded or compiled
+    """
+    apiData = apis.get(apiID)
+    if isinstance(apiData, OperationFailedError):
+        return None, apiData
+    try:
+        return compileSubscriptionPlan(apiID, apiData, parameters), None
+    except OperationFailedError as e:
+        return None, e
+
+def placeJobsInBatch(operation, placements):
+    """
+    Places the jobs of several subscriptions in one planning pass:
+    1) skips the subscriptions whose job was placed by an earlier attempt of the operation and refuses the ones which have another job
+    2) stores all fetch plans in one transaction
+    3) checks and reserves the rate budget of every subscription while holding the locks of all their providers
+    4) hands out the job names, remembered in the operation
+    5) plans the workers of all jobs (see scale.planJobs) and saves the jobs in one transaction while holding the job store lock
+
+    :param operation: The operation, its state remembers the job names
+    :param placements: List of dictionaries with index (in the batch), subscriptionID, apiID, interval, command, cost and fetchPlan
+    :return: Dictionary index -> (name of the job, ID of the worker, None), (None, None, reason) if the job couldn't be placed
+    """
+    jobNames = operation.state.get('jobNames', {})
+    outcomes = {}
+    remaining = []
+    for placement in placements:
+        jobName = jobStore.jobNameOfSubscription(placement['subscriptionID'])
+        if not jobName:
+            remaining.append(placement)
+        elif jobName == jobNames.get(str(placement['index'])):
+            outcomes[placement['index']] = (jobName, jobStore.getJob(jobName)['worker'], None)
+        else:
+            outcomes[placement['index']] = (None, None, "Api is already active")
+
+    fetchPlans.storeFetchPlans({placement['subscriptionID']: placement['fetchPlan'] for placement in remaining})
+    providers = sorted({placement['fetchPlan'].get('provider') for placement in remaining} - {None})
+    budgeted = []
+    with lockConfigFile.holdLocks([lockConfigFile.providerLock(provider) for provider in providers]):
+        for placement in remaining:         # the reservations of the subscriptions before count for the ones after
+            budgetError = rateBudget.checkBudget(placement['fetchPlan'], placement['interval'], placement['subscriptionID'])
+            if budgetError:
+                outcomes[placement['index']] = (None, None, budgetError)
+                continue
+            rateBudget.reserveBudget(placement['fetchPlan'], placement['subscriptionID'], placement['interval'])
+            budgeted.append(placement)
+
+    unnamed = [placement for placement in budgeted if str(placement['index']) not in jobNames]
+    for placement, jobName in zip(unnamed, jobCounter.allocateJobNames(len(unnamed))):
+        jobNames[str(placement['index'])] = jobName
+    operation.progress('placeJobs', jobNames=jobNames)
+
+    try:
+        with scale.lockJobStore() as leases:
+            workers = scale.planJobs([placement['cost'] for placement in budgeted])
+            manageJobs.addJobs([jobStore.buildJob(jobNames[str(placement['index'])], placement['subscriptionID'], placement['apiID'], placement['interval'],
+                                                  placement['command'], workerID, placement['cost'])
+                                for placement, workerID in zip(budgeted, workers) if workerID], leases)
+    except (lockConfigFile.LockTimeoutError, lockConfigFile.LockLostError):
+        rateBudget.releaseBudgets([placement['subscriptionID'] for placement in budgeted])
+        raise
+    for placement, workerID in zip(budgeted, workers):
+        outcomes[placement['index']] = (jobNames[str(placement['index'])], workerID, None) if workerID else (None, None, "No worker container available")
+    rateBudget.releaseBudgets([placement['subscriptionID'] for placement, workerID in zip(budgeted, workers) if not workerID])
+    return outcomes
+
+def activateSubscriptions(placements, outcomes):
+    """
+    Sets the job, command and container of the subscriptions whose job was placed and activates them, in one request.
+    """
+    updates = [{
+        'subscriptionID': placement['subscriptionID'],
+        'subscriptionStatus': SubscriptionStatus.ACTIVE.value,
+        'jobName': outcomes[placement['index']][0],
+        'command': placement['command'],
+        'container': outcomes[placement['index']][1]
+    } for placement in placements if outcomes[placement['index']][1]]
+    if updates:
+        callConnector('post', '/setSubscriptionsStatuses', {'subscriptions': updates})
+
+def bulkSubscribe(operation):
+    """
+    Creates several subscriptions and schedules their jobs (see subscribe):
+    1) loads every availableApi once, compiles the fetch plans and checks the rate budgets
+    2) creates the subscriptions as INACTIVE with one request
+    3) places all jobs (see placeJobsInBatch) and publishes them once
+    4) activates the subscriptions whose job was placed with one request
+
+    :param operation: The operation, its request is {"subscriptions": [<JSON of /subscribeApi>, ...]}
+    :return: (message, {"results": [...]})
+    """
+    subscriptions = operation.request['subscriptions']
+    results = [None] * len(subscriptions)
+
+    operation.progress('loadApis')
+    apis = loadApis(subscription['apiID'] for subscription in subscriptions)
+    apiStatistics = costModel.loadApiStatistics()
+    candidates = []
+    for index, subscription in enumerate(subscriptions):
+        fetchPlan, error = compileItemPlan(apis, subscription['apiID'], subscription.get('parameters'))
+        if error:
+            results[index] = itemResult(error.code, error.message)
+            continue
+        candidates.append({'index': index, 'apiID': subscription['apiID'], 'interval': subscription['interval'], 'fetchPlan': fetchPlan,
+                           'cost': costModel.jobCost(subscription['interval'], subscription['apiID'], apiStatistics)})
+
+    subscriptionIDs = operation.state.get('subscriptionIDs')
+    rejected = operation.state.get('rejected', {})
+    if subscriptionIDs is None:
+        checkContainersAlive()
+        if candidates and not scale.availableWorkers():
+            raise OperationFailedError("No worker container available")
+        for candidate in candidates:
+            budgetError = rateBudget.checkBudget(candidate['fetchPlan'], candidate['interval'])
+            if budgetError:
+                rejected[str(candidate['index'])] = budgetError
+        created = [candidate for candidate in candidates if str(candidate['index']) not in rejected]
+        subscriptionIDs = {}
+        if created:
+            operation.progress('createSubscriptions')
+            createdIDs = callConnector('post', '/createSubscriptions', {'subscriptions': [{
+                'userID': subscriptions[candidate['index']]['userID'],
+                'availableApiID': candidate['apiID'],
+                'interval': candidate['interval'],
+                'status': SubscriptionStatus.INACTIVE.value,
+                'adaptive': subscriptions[candidate['index']].get('adaptive'),
+                'aggregationWindow': subscriptions[candidate['index']].get('aggregationWindow'),
+                'aggregationRawSample': subscriptions[candidate['index']].get('aggregationRawSample'),
+                'parameters': subscriptions[candidate['index']].get('parameters'),
+                'idempotencyKey': f"{operation.operationID}:{candidate['index']}"      # see subscribe
+            } for candidate in created]}).get('subscriptionIDs')
+            subscriptionIDs = {str(candidate['index']): subscriptionID for candidate, subscriptionID in zip(created, createdIDs)}
+        operation.progress('createSubscriptions', subscriptionIDs=subscriptionIDs, rejected=rejected)
+
+    placements = []
+    for candidate in candidates:
+        if str(candidate['index']) in rejected:
+            results[candidate['index']] = itemResult(400, rejected[str(candidate['index'])])
+            continue
+        candidate['subscriptionID'] = subscriptionIDs[str(candidate['index'])]
+        candidate['command'] = buildJobCommand(candidate['subscriptionID'], candidate['apiID'], subscriptions[candidate['index']])
+        placements.append(candidate)
+
+    outcomes = placeJobsInBatch(operation, placements)
+    fetchPlans.deleteFetchPlans({placement['subscriptionID']: placement['apiID'] for placement in placements if not outcomes[placement['index']][1]})
+
+    operation.progress('publishJobs')
+    manageJobs.refreshWorkerJobs()      # publish all new jobs at once
+
+    operation.progress('setSubscriptionStatuses')
+    activateSubscriptions(placements, outcomes)
+    for placement in placements:
+        jobName, containerName, reason = outcomes[placement['index']]
+        if containerName:       # the subscriptions which couldn't be placed stay inactive
+            results[placement['index']] = itemResult(200, f"Job {jobName} scheduled and subscription for API_ID {placement['apiID']} created", placement['subscriptionID'], jobName, containerName)
+        else:
+            results[placement['index']] = itemResult(400, reason, placement['subscriptionID'])
+    scheduled = sum(1 for result in results if result['code'] == 200)
+    return f"{scheduled} of {len(results)} subscriptions created and scheduled", {'results': results}
+
+def loadSubscriptions(subscriptionIDs):
+    """
+    :return: Dictionary subscriptionID -> subscription of the subscriptions which exist, loaded with one request
+    """
+    return {subscription['subscriptionID']: subscription for subscription in callConnector('post', '/subscriptionsByIDs', {'subscriptionIDs': subscriptionIDs})}
+
+def bulkResubscribe(operation):
+    """
+    Schedules the jobs of several inactive subscriptions again (see resubscribe), placed in one planning pass
+    while holding the locks of all subscriptions.
+
+    :param operation: The operation, its request is {"subscriptionIDs": [<int>, ...]}
+    :return: (message, {"results": [...]})
+    """
+    subscriptionIDs = operation.request['subscriptionIDs']
+    results = [None] * len(subscriptionIDs)
+    jobNames = operation.state.get('jobNames', {})
+
+    operation.progress('loadSubscriptions')
+    subscriptions = loadSubscriptions(subscriptionIDs)
+    candidates = []
+    for index, subscriptionID in enumerate(subscriptionIDs):
+        data = subscriptions.get(subscriptionID)
+        if data is None:
+            results[index] = itemResult(404, f"No subscription with ID {subscriptionID} found", subscriptionID)
+        elif data.get('status') != SubscriptionStatus.INACTIVE.value and str(index) not in jobNames:
+            results[index] = itemResult(400, "Api is already active", subscriptionID)
+        else:
+            candidates.append((index, subscriptionID, data))
+
+    operation.progress('loadApis')
+    apis = loadApis(data.get('availableApiID') for index, subscriptionID, data in candidates)
+    apiStatistics = costModel.loadApiStatistics()
+    placements = []
+    for index, subscriptionID, data in candidates:
+        apiID = data.get('availableApiID')
+        fetchPlan, error = compileItemPlan(apis, apiID, data.get('parameters'))     # the availableApi may have changed since the subscription was inactivated
+        if error:
+            results[index] = itemResult(error.code, error.message, subscriptionID)
+            continue
+        placements.append({'index': index, 'subscriptionID': subscriptionID, 'apiID': apiID, 'interval': data.get('interval'), 'fetchPlan': fetchPlan,
+                           'command': buildJobCommand(subscriptionID, apiID, data), 'cost': costModel.jobCost(data.get('interval'), apiID, apiStatistics)})
+
+    checkContainersAlive()
+    with lockConfigFile.holdLocks(sorted((lockConfigFile.subscriptionLock(placement['subscriptionID']) for placement in placements))):
+        outcomes = placeJobsInBatch(operation, placements)
+
+    operation.progress('publishJobs')
+    manageJobs.refreshWorkerJobs()
+
+    operation.progress('setSubscriptionStatuses')
+    activateSubscriptions(placements, outcomes)
+    for placement in placements:
+        jobName, containerName, reason = outcomes[placement['index']]
+        if containerName:
+            results[placement['index']] = itemResult(200, f"Job {jobName} scheduled and subscription for API_ID {placement['apiID']} reactivated", placement['subscriptionID'], jobName, containerName)
+        else:
+            results[placement['index']] = itemResult(400, reason, placement['subscriptionID'])
+    scheduled = sum(1 for result in results if result['code'] == 200)
+    return f"{scheduled} of {len(results)} subscriptions reactivated", {'results': results}
+
+def bulkUnsubscribe(operation):
+    """
+    Deletes the jobs of several subscriptions in one transaction while holding the locks of all subscriptions and of the job store,
+    and sets the subscriptions to INACTIVE (or ERROR if their job couldn't be deleted, see unsubscribe) with one request.
+
+    :param operation: The operation, its request is {"subscriptionIDs": [<int>, ...]}
+    :return: (message, {"results": [...]})
+    """
+    subscriptionIDs = operation.request['subscriptionIDs']
+    results = [None] * len(subscriptionIDs)
+
+    operation.progress('loadSubscriptions')
+    subscriptions = loadSubscriptions(subscriptionIDs)
+    candidates = []
+    for index, subscriptionID in enumerate(subscriptionIDs):
+        if subscriptionID in subscriptions:
+            candidates.append((index, subscriptionID, subscriptions[subscriptionID]))
+        else:
+            results[index] = itemResult(404, f"No subscription with ID {subscriptionID} found", subscriptionID)
+
+    deleted = dict(operation.state.get('deleted', {}))      # index -> name of the deleted job, None if it couldn't be deleted
+    pending = [(index, subscriptionID, data) for index, subscriptionID, data in candidates if str(index) not in deleted]    # not deleted by an earlier attempt yet
+    if pending:
+        operation.progress('deleteJobs')
+        with lockConfigFile.holdLocks(sorted((lockConfigFile.subscriptionLock(subscriptionID) for index, subscriptionID, data in pending))):
+            jobNames = {index: jobStore.jobNameOfSubscription(subscriptionID) or data.get('jobName') for index, subscriptionID, data in pending}
+            with scale.lockJobStore() as leases:
+                deletedJobNames = manageJobs.deleteJobs(jobNames.values(), leases)
+            deleted.update({str(index): jobName if jobName in deletedJobNames else None for index, jobName in jobNames.items()})
+            deletedSubscriptions = [(subscriptionID, data) for index, subscriptionID, data in pending if deleted[str(index)]]
+            fetchPlans.deleteFetchPlans({subscriptionID: data.get('availableApiID') for subscriptionID, data in deletedSubscriptions})
+            rateBudget.releaseBudgets([subscriptionID for subscriptionID, data in deletedSubscriptions])
+            scheduleAccuracy.forgetLastStarts([subscriptionID for subscriptionID, data in deletedSubscriptions])
+            operation.progress('deleteJobs', deleted=deleted, jobNames={**operation.state.get('jobNames', {}), **{str(index): jobName for index, jobName in jobNames.items()}})
+
+    operation.progress('publishJobs')
+    manageJobs.refreshWorkerJobs()      # unpublish all deleted jobs at once
+
+    operation.progress('setSubscriptionStatuses')
+    if candidates:
+        callConnector('post', '/setSubscriptionsStatuses', {'subscriptions': [{
+            'subscriptionID': subscriptionID,
+            'subscriptionStatus': SubscriptionStatus.INACTIVE.value if deleted.get(str(index)) else SubscriptionStatus.ERROR.value,
+            'jobName': None,
+            'container': None
+        } for index, subscriptionID, data in candidates]})
+    jobNames = operation.state.get('jobNames', {})
+    for index, subscriptionID, data in candidates:
+        if deleted.get(str(index)):
+            results[index] = itemResult(200, f"Api unsubsribed and job {deleted[str(index)]} deleted", subscriptionID, deleted[str(index)])
+        else:       # the subscription is set to ERROR like by unsubscribe
+            results[index] = itemResult(400, f"Api isn't unsubscribed and job {jobNames.get(str(index))} couldn't be deleted", subscriptionID)
+    unsubscribed = sum(1 for result in results if result['code'] == 200)
+    return f"{unsubscribed} of {len(results)} subscriptions unsubscribed", {'results': results}
+
+HANDLERS = {
+    'subscribe': subscribe,
+    'resubscribe': resubscribe,
+    'unsubscribe': unsubscribe,
+    'bulkSubscribe': bulkSubscribe,
+    'bulkResubscribe': bulkResubscribe,
+    'bulkUnsubscribe': bulkUnsubscribe
+}
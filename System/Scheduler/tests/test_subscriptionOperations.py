@@ -0,0 +1,78 @@
+import os
+import sys
+import unittest
+from contextlib import nullcontext
+from unittest import mock
+
+sys.path[:0] = [os.path.dirname(os.path.dirname(os.path.abspath(__file__))), os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))]
+
+import subscriptionOperations
+from commonRessources.interfaces import SubscriptionStatus
+
+
+class FakeOperation:
+    """
+    Stands in for operations.Operation, the state is only kept in memory.
+    """
+
+    def __init__(self, request, state=None):
+        self.operationID = 'operation'
+        self.request = request
+        self.state = dict(state or {})
+
+    def progress(self, step, **state):
+        self.state.update(state)
+
+
+class BulkUnsubscribeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.subscriptions = {
+            11: {'subscriptionID': 11, 'availableApiID': 1, 'jobName': 'job11'},
+            12: {'subscriptionID': 12, 'availableApiID': 2, 'jobName': 'job12'}
+        }
+        self.connectorCalls = []
+        self.deleteJobs = mock.Mock(side_effect=lambda jobNames, leases: set(jobNames))
+        patches = [
+            mock.patch.object(subscriptionOperations, 'loadSubscriptions', lambda subscriptionIDs: {subscriptionID: self.subscriptions[subscriptionID] for subscriptionID in subscriptionIDs if subscriptionID in self.subscriptions}),
+            mock.patch.object(subscriptionOperations, 'callConnector', lambda method, path, json=None: self.connectorCalls.append((path, json))),
+            mock.patch.object(subscriptionOperations.lockConfigFile, 'holdLocks', lambda names: nullcontext([])),
+            mock.patch.object(subscriptionOperations.scale, 'lockJobStore', lambda: nullcontext([])),
+            mock.patch.object(subscriptionOperations.jobStore, 'jobNameOfSubscription', lambda subscriptionID: None),
+            mock.patch.object(subscriptionOperations.manageJobs, 'deleteJobs', self.deleteJobs),
+            mock.patch.object(subscriptionOperations.manageJobs, 'refreshWorkerJobs', lambda: True),
+            mock.patch.object(subscriptionOperations.fetchPlans, 'deleteFetchPlans', lambda subscriptions: None),
+            mock.patch.object(subscriptionOperations.rateBudget, 'releaseBudgets', lambda subscriptionIDs: None),
+            mock.patch.object(subscriptionOperations.scheduleAccuracy, 'forgetLastStarts', lambda subscriptionIDs: None)
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_resumed_with_partly_recorded_state(self):
+        operation = FakeOperation({'subscriptionIDs': [11, 12, 13]}, {'deleted': {'0': 'job11'}, 'jobNames': {'0': 'job11'}})
+
+        message, result = subscriptionOperations.bulkUnsubscribe(operation)
+
+        self.deleteJobs.assert_called_once()
+        self.assertEqual(list(self.deleteJobs.call_args[0][0]), ['job12'])      # only the job without a recorded deletion
+        self.assertEqual(operation.state['deleted'], {'0': 'job11', '1': 'job12'})
+        self.assertEqual([itemResult['code'] for itemResult in result['results']], [200, 200, 404])
+        self.assertEqual(message, "2 of 3 subscriptions unsubscribed")
+        path, body = self.connectorCalls[-1]
+        self.assertEqual(path, '/setSubscriptionsStatuses')
+        self.assertEqual([update['subscriptionStatus'] for update in body['subscriptions']], [SubscriptionStatus.INACTIVE.value] * 2)
+
+    def test_resumed_after_all_jobs_were_deleted(self):
+        operation = FakeOperation({'subscriptionIDs': [11, 12]}, {'deleted': {'0': 'job11', '1': None}, 'jobNames': {'0': 'job11', '1': 'job12'}})
+
+        message, result = subscriptionOperations.bulkUnsubscribe(operation)
+
+        self.deleteJobs.assert_not_called()
+        self.assertEqual([itemResult['code'] for itemResult in result['results']], [200, 400])
+        path, body = self.connectorCalls[-1]
+        self.assertEqual([update['subscriptionStatus'] for update in body['subscriptions']], [SubscriptionStatus.INACTIVE.value, SubscriptionStatus.ERROR.value])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import redis
+import configparser
+import json
+import lockConfigFile
+import jobStore
+from commonRessources import REDIS_HOST, REDIS_PORT, SCHEDULER_OFELIA_CONFIG_FILE
+from commonRessources.logger import setLoggerLevel
+
+# -------------------------- Environment Variables ------------------------------------------------------------------------------------------------------------------------------------------
+WORKER_JOBS_KEY_PREFIX = 'WORKER_JOBS:'         # One Redis hash per worker: jobName -> {"interval": <int>, "command": <str>}
+WORKER_JOBS_VERSION_KEY_PREFIX = 'WORKER_JOBS_VERSION:'     # Incremented every time the jobs of the worker change, so that it reloads them
+WORKER_JOBS_VERSION_KEY = 'WORKER_JOBS_VERSION' # Incremented after every publish which changed jobs, guards concurrent publishes of the scheduler replicas
+
+# --------------------------- Initializations -----------------------------------------------------------------------------------------------------------------------------------------
+logger = setLoggerLevel("WorkerJobs")
+redisClient = redis.StrictRedis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+
+# --------------------------- Worker Job Functions -----------------------------------------------------------------------------------------------------------------------------------------
+def publishedJob(job):
+    """
+    :param job: The job as stored in the job store
+    :return: The job as published to its worker (JSON)
+    """
+    return json.dumps({
+        'interval': job['interval'],
+        'command': job['command']
+    })
+
+def readWorkerJobs(workers):
+    """
+    :param workers: IDs of the workers
+    :return: Dictionary workerID -> {jobName: job as published (JSON)} of the jobs of the workers in the job store
+    """
+    return {workerID: {job['jobName']: publishedJob(job) for job in jobStore.jobsOfWorker(workerID)} for workerID in workers}
+
+def publishWorkerJobs(allWorkers=False):
+    """
+    Publishes the jobs of the job store to the workers, which run them on their own schedule (job runner in cli mode, fetch daemon in daemon mode).
+    Only the workers whose jobs changed since the last publish are compared (see jobStore.JOBS_DIRTY_WORKERS_KEY),
+    and only the difference to their published jobs is written: new and changed jobs are set, removed jobs are deleted
+    and the version of every worker whose jobs changed is incremented, all in one transaction.
+    The workers only reschedule the jobs which changed, so the other jobs keep running without a gap.
+    If another scheduler replica publishes or the jobs change at the same time, the difference is computed again.
+
+    :param allWorkers: Compare the jobs of all workers, e.g. after a restart of Redis
+    :return: True if the jobs were published, False if an error occurred
+    """
+    try:
+        with redisClient.pipeline(transaction=True) as pipeline:
+            while True:
+                try:
+                    pipeline.watch(WORKER_JOBS_VERSION_KEY, jobStore.JOBS_DIRTY_WORKERS_KEY)
+                    dirtyWorkers = pipeline.smembers(jobStore.JOBS_DIRTY_WORKERS_KEY)
+                    workers = set(dirtyWorkers)
+                    if allWorkers:
+                        workers |= set(jobStore.jobCountsPerWorker())
+                        workers |= {key[len(WORKER_JOBS_KEY_PREFIX):] for key in pipeline.scan_iter(f"{WORKER_JOBS_KEY_PREFIX}*")}
+                    jobsPerContainer = readWorkerJobs(workers)
+                    publishedJobs = {container: pipeline.hgetall(f"{WORKER_JOBS_KEY_PREFIX}{container}") for container in workers}
+
+                    pipeline.multi()
+                    changedWorkers = 0
+                    for container in workers:
+                        published = publishedJobs[container]
+                        jobs = jobsPerContainer[container]
+                        removedJobs = [jobName for jobName in published if jobName not in jobs]
+                        changedJobs = {jobName: job for jobName, job in jobs.items() if published.get(jobName) != job}
+                        if removedJobs:
+                            pipeline.hdel(f"{WORKER_JOBS_KEY_PREFIX}{container}", *removedJobs)
+                        if changedJobs:
+                            pipeline.hset(f"{WORKER_JOBS_KEY_PREFIX}{container}", mapping=changedJobs)
+                        if removedJobs or changedJobs:
+                            pipeline.incr(f"{WORKER_JOBS_VERSION_KEY_PREFIX}{container}")
+                            changedWorkers += 1
+                    if dirtyWorkers:
+                        pipeline.srem(jobStore.JOBS_DIRTY_WORKERS_KEY, *dirtyWorkers)
+                    if changedWorkers:
+                        pipeline.incr(WORKER_JOBS_VERSION_KEY)
+                    pipeline.execute()
+                    break
+                except redis.WatchError:        # another replica published or the jobs changed in the meantime
+                    continue
+        logger.info(f"Published the jobs of {len(workers)} workers, the jobs of {changedWorkers} workers changed")
+        return True
+    except redis.RedisError as e:
+        logger.error(f"Error publishing the worker jobs to Redis: {e}")
+        return False
+
+def migrateOfeliaJobs():
+    """
+    Moves the jobs of the Ofelia config.ini, which ran the jobs of the cli mode before the workers ran them themselves, to the job store.
+
+    :return: True if jobs were moved
+    """
+    ofeliaConfig = configparser.ConfigParser()
+    ofeliaConfig.read(SCHEDULER_OFELIA_CONFIG_FILE)
+    if not any(section.startswith('job-exec') for section in ofeliaConfig.sections()):
+        return False
+
+    with lockConfigFile.holdLocks([lockConfigFile.JOB_STORE_LOCK]) as leases:
+        ofeliaConfig = configparser.ConfigParser()
+        ofeliaConfig.read(SCHEDULER_OFELIA_CONFIG_FILE)     # read again, another replica may have moved them in the meantime
+        jobs = [job for job in jobStore.jobsFromConfig(ofeliaConfig) if job['worker'] and not jobStore.getJob(job['jobName'])]
+        jobStore.saveJobs(jobs, leases)
+        for section in [section for section in ofeliaConfig.sections() if section.startswith('job-exec')]:
+            ofeliaConfig.remove_section(section)
+        with open(SCHEDULER_OFELIA_CONFIG_FILE, 'w') as configfile:
+            ofeliaConfig.write(configfile)
+        if jobs:
+            jobStore.renderJobsFile()
+        logger.info(f"Moved {len(jobs)} jobs of the Ofelia config to the job store")
+    return bool(jobs)
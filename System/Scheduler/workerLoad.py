@@ -0,0 +1,91 @@
+import json
+import redis
+from datetime import datetime, timezone
+from commonRessources import REDIS_HOST, REDIS_PORT, WORKER_LOAD_SMOOTHING, WORKER_LOAD_HIGH_WATERMARK, WORKER_LOAD_LOW_WATERMARK, WORKER_LOAD_LATENCY_THRESHOLD, WORKER_LOAD_SHED_COOLDOWN
+from commonRessources.logger import setLoggerLevel
+
+# -------------------------- Environment Variables ------------------------------------------------------------------------------------------------------------------------------------------
+WORKER_LOAD_KEY = 'WORKER_LOAD'                     # Hash workerID -> smoothed load of the worker (JSON), shared by all scheduler replicas
+WORKER_LOAD_SHED_KEY_PREFIX = 'WORKER_LOAD_SHED:'   # Set while an overloaded worker is in its cooldown after handing over jobs
+
+# --------------------------- Initializations -----------------------------------------------------------------------------------------------------------------------------------------
+logger = setLoggerLevel("WorkerLoad")
+redisClient = redis.StrictRedis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+
+# --------------------------- Worker Load Functions -----------------------------------------------------------------------------------------------------------------------------------------
+# Every heartbeat carries a load report of the worker (see Worker/heartbeat/loadReport.py). Its load score is the highest of
+# CPU usage, saturation of the fetch slots and mean tick duration relative to WORKER_LOAD_LATENCY_THRESHOLD, so 1 means one of them is at its limit.
+# The error rate is reported but not scored, errors are mostly caused by the upstreams and don't go away on another worker.
+# The score is smoothed over the heartbeats and a worker is overloaded between the two watermarks depending on where it comes from,
+# so a worker hovering around one threshold doesn't flip between overloaded and not.
+
+def loadScore(report):
+    """
+    :param report: The load report of a heartbeat
+    :return: The load score of the report
+    """
+    latency = report.get('latency')
+    signals = [report.get('cpu'), report.get('saturation'), latency / WORKER_LOAD_LATENCY_THRESHOLD if latency is not None else None]
+    return max([signal for signal in signals if signal is not None], default=0.0)
+
+def smoothLoad(previous, report):
+    """
+    :param previous: The smoothed load of the worker before the report, None for the first report
+    :param report: The load report of a heartbeat
+    :return: The smoothed load {"score", "overloaded", "report", "updatedAt"}
+    """
+    score = loadScore(report)
+    if previous:
+        score = WORKER_LOAD_SMOOTHING * score + (1 - WORKER_LOAD_SMOOTHING) * previous['score']
+    overloaded = score > (WORKER_LOAD_LOW_WATERMARK if previous and previous['overloaded'] else WORKER_LOAD_HIGH_WATERMARK)
+    return {'score': round(score, 4), 'overloaded': overloaded, 'report': report, 'updatedAt': datetime.now(timezone.utc).isoformat()}
+
+def updateWorkerLoad(workerID, report):
+    """
+    Adds the load report of a heartbeat to the smoothed load of the worker.
+
+    :param workerID: The ID of the worker
+    :param report: The load report of the heartbeat
+    :return: The smoothed load of the worker
+    """
+    previous = redisClient.hget(WORKER_LOAD_KEY, workerID)
+    load = smoothLoad(json.loads(previous) if previous else None, report)
+    redisClient.hset(WORKER_LOAD_KEY, workerID, json.dumps(load))
+    if load['overloaded'] and not (previous and json.loads(previous)['overloaded']):
+        logger.warning(f"Worker {workerID} is overloaded, load score {load['score']} ({report})")
+    return load
+
+def loadWorkerLoads():
+    """
+    :return: Dictionary workerID -> smoothed load
+    """
+    return {workerID: json.loads(load) for workerID, load in redisClient.hgetall(WORKER_LOAD_KEY).items()}
+
+def claimShed(workerID):
+    """
+    Starts the cooldown of an overloaded worker, so that only one scheduler replica moves its jobs and not on every heartbeat.
+
+    :param workerID: The ID of the worker
+    :return: True if the jobs of the worker may be moved now
+    """
+    return bool(redisClient.set(f"{WORKER_LOAD_SHED_KEY_PREFIX}{workerID}", 1, nx=True, ex=WORKER_LOAD_SHED_COOLDOWN))
+
+def forgetWorkerLoad(workerID):
+    redisClient.hdel(WORKER_LOAD_KEY, workerID)
+
+def renderPrometheus(loads):
+    """
+    :param loads: As returned by loadWorkerLoads
+    :return: The smoothed load scores of the workers in the Prometheus text exposition format
+    """
+    lines = [
+        "# HELP apiharvester_worker_load_score Smoothed load score of the worker, 1 means CPU, fetch slots or tick duration are at their limit",
+        "# TYPE apiharvester_worker_load_score gauge"
+    ]
+    for workerID, load in sorted(loads.items()):
+        lines.append(f'apiharvester_worker_load_score{{worker="{workerID}"}} {load["score"]}')
+    lines.append("# HELP apiharvester_worker_overloaded If jobs are moved away from the worker")
+    lines.append("# TYPE apiharvester_worker_overloaded gauge")
+    for workerID, load in sorted(loads.items()):
+        lines.append(f'apiharvester_worker_overloaded{{worker="{workerID}"}} {int(load["overloaded"])}')
+    return "\n".join(lines) + "\n"
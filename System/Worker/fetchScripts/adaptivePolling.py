@@ -0,0 +1,30 @@
+from commonRessources import WORKER_ADAPTIVE_BACKOFF, WORKER_ADAPTIVE_MAX_FACTOR, WORKER_ADAPTIVE_MAX_INTERVAL
+
+# --------------------------- Adaptive Interval -----------------------------------------------------------------------------------------------------------------------------------------
+class AdaptiveInterval:
+    """
+    Effective interval of an adaptive subscription of the fetch daemon.
+
+    Every tick whose payload didn't change stretches the interval by WORKER_ADAPTIVE_BACKOFF, up to
+    WORKER_ADAPTIVE_MAX_FACTOR times the interval of the user (but not above WORKER_ADAPTIVE_MAX_INTERVAL seconds).
+    As soon as the payload changes again the interval snaps back to the one of the user.
+    """
+
+    def __init__(self, interval, backoff=WORKER_ADAPTIVE_BACKOFF, maxFactor=WORKER_ADAPTIVE_MAX_FACTOR, maxInterval=WORKER_ADAPTIVE_MAX_INTERVAL):
+        self.interval = interval
+        self.backoff = backoff
+        self.ceiling = max(interval, min(interval * maxFactor, maxInterval))
+        self.effectiveInterval = interval
+
+    def update(self, changed):
+        """
+        Adapts the effective interval to the outcome of the last tick.
+
+        :param changed: True if the payload changed, False if it didn't, None if the tick failed or was skipped
+        :return: The effective interval in seconds
+        """
+        if changed:
+            self.effectiveInterval = self.interval
+        elif changed is False:
+            self.effectiveInterval = min(self.effectiveInterval * self.backoff, self.ceiling)
+        return self.effectiveInterval
@@ -0,0 +1,55 @@
+from commonRessources.urlTemplates import renderUrlTemplate
+
+# --------------------------- Batch Request Functions -----------------------------------------------------------------------------------------------------------------------------------------
+# Subscriptions of an API with a batch form (see Scheduler/fetchPlans.compileBatch) which are due in the same tick
+# and share the same batch group are fetched in one upstream request, whose response is split per subscription.
+
+def groupDueJobs(dueJobs):
+    """
+    Groups the due jobs of a tick into upstream requests. Jobs whose fetch plans have the same batch group
+    are fetched together, at most maxSize per request. All other jobs are fetched alone.
+
+    :param dueJobs: List of (jobName, job) as loaded by fetchDaemon.loadJobs
+    :return: List of requests, each a list of (jobName, job)
+    """
+    requests = []
+    groups = {}     # batch group -> jobs of the request which is filled
+    for jobName, job in dueJobs:
+        batch = job['plan'].get('batch')
+        if not batch:
+            requests.append([(jobName, job)])
+            continue
+        group = groups.setdefault(batch['group'], [])
+        group.append((jobName, job))
+        if len(group) >= batch['maxSize']:
+            requests.append(groups.pop(batch['group']))
+    requests.extend(groups.values())
+    return requests
+
+def buildBatchUrl(batch, plans):
+    """
+    Renders the URL of a batch request, the batched parameters take the values of all subscriptions joined by the separator.
+
+    :param batch: The batch part of the fetch plans
+    :param plans: The fetch plans of the subscriptions of the request
+    :return: The URL
+    """
+    values = {name: [plan['parameters'][name] for plan in plans] for name in batch['parameters']}
+    return renderUrlTemplate(batch['url'], values, batch['separator'])
+
+def splitBatchPayload(batch, data, plans):
+    """
+    Splits the decoded response of a batch request into the payloads of its subscriptions.
+
+    :param batch: The batch part of the fetch plans
+    :param data: The decoded response
+    :param plans: The fetch plans of the subscriptions of the request, in the order of the request
+    :return: List with the payload of every subscription, None if the response contains none for it
+    """
+    if batch['split'] == 'KEY':
+        if not isinstance(data, dict):
+            return [None] * len(plans)
+        return [data.get(plan['parameters'][batch['key']]) for plan in plans]
+    if not isinstance(data, list) or len(data) != len(plans):
+        return [None] * len(plans)
+    return data
@@ -0,0 +1,115 @@
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import subprocess
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Benchmark of the two fetch modes of the worker, run it inside a worker container (no other services needed):
+#   docker compose exec worker python /app/fetchScripts/benchmarkFetchModes.py --ticks 200
+# A local stub server plays both the upstream API and the Influx data connector, so only the cost of the
+# worker itself is measured. "ticks/s per core" is the number of ticks per consumed CPU second.
+
+# --------------------------- Stub Server -----------------------------------------------------------------------------------------------------------------------------------------
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'       # keep-alive, like the real upstream APIs and the gunicorn connectors
+    wbufsize = -1                       # send headers and body in one segment, otherwise Nagle's algorithm delays every response
+
+    def do_GET(self):
+        self.sendJson({"c": 183.31, "d": -5.81, "dp": -3.0721, "h": 185.255, "l": 181.81, "o": 184.55, "pc": 189.12, "t": 1722888002})
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.sendJson({"response": "SUCCESS: "})
+
+    def sendJson(self, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def runStubServer(port):
+    ThreadingHTTPServer(('127.0.0.1', port), StubHandler).serve_forever()
+
+# --------------------------- Benchmark Functions -----------------------------------------------------------------------------------------------------------------------------------------
+CLI_TICK = """
+import logging, sys
+logging.disable(logging.CRITICAL)
+import fetchApis
+fetchApis.COMPOSE_INFLUX_DATA_CONNECTOR_URL = sys.argv[2]
+fetchApis.fetchWithPlan({'apiID': 1, 'url': sys.argv[1], 'auth': None, 'timeout': 10, 'fields': []}, '1')
+"""
+
+def benchmarkCli(ticks, upstreamUrl, connectorUrl):
+    """
+    Every tick starts a new interpreter, like the job runner does in cli mode.
+
+    :return: (wall seconds, CPU seconds)
+    """
+    cpuBefore = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.perf_counter()
+    for _ in range(ticks):
+        subprocess.run([sys.executable, "-c", CLI_TICK, upstreamUrl, connectorUrl], cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+    wall = time.perf_counter() - start
+    cpuAfter = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return wall, (cpuAfter.ru_utime - cpuBefore.ru_utime) + (cpuAfter.ru_stime - cpuBefore.ru_stime)
+
+def benchmarkDaemon(ticks, upstreamUrl, connectorUrl):
+    """
+    Every tick runs in the fetch engine of this process with warm modules and connection pools, like the fetch daemon does.
+
+    :return: (wall seconds, CPU seconds)
+    """
+    import fetchEngine
+    import writeBuffer
+    writeBuffer.COMPOSE_INFLUX_DATA_CONNECTOR_URL = connectorUrl
+    plan = {'apiID': 1, 'url': upstreamUrl, 'auth': None, 'timeout': 10, 'fields': []}
+
+    async def runTicks():
+        engine = fetchEngine.FetchEngine()
+        await engine.runJob('warmup', '1', plan)      # warm up the connection pool
+        cpuBefore = resource.getrusage(resource.RUSAGE_SELF)
+        start = time.perf_counter()
+        for tick in range(ticks):
+            engine.submit(f"job{tick}", '1', plan)
+        await asyncio.gather(*engine.running.values())
+        wall = time.perf_counter() - start
+        cpuAfter = resource.getrusage(resource.RUSAGE_SELF)
+        await engine.close()
+        return wall, (cpuAfter.ru_utime - cpuBefore.ru_utime) + (cpuAfter.ru_stime - cpuBefore.ru_stime)
+
+    return asyncio.run(runTicks())
+
+def printResult(mode, ticks, wall, cpu):
+    print(f"{mode:<8} {ticks:>6} ticks  {wall:8.2f}s wall  {ticks / wall:9.1f} ticks/s  {cpu:8.2f}s CPU  {ticks / cpu if cpu else float('inf'):9.1f} ticks/s per core")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare the ticks per second per core of the cli and the daemon fetch mode.')
+    parser.add_argument('--ticks', type=int, default=200, help='number of ticks per mode')
+    parser.add_argument('--port', type=int, default=8765, help='port of the local stub server')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    stubServer = multiprocessing.Process(target=runStubServer, args=(args.port,), daemon=True)
+    stubServer.start()
+    time.sleep(0.5)
+    upstreamUrl = f"http://127.0.0.1:{args.port}/api/v1/quote?symbol=IBM"
+    connectorUrl = f"http://127.0.0.1:{args.port}"
+
+    try:
+        printResult('cli', args.ticks, *benchmarkCli(args.ticks, upstreamUrl, connectorUrl))
+        printResult('daemon', args.ticks, *benchmarkDaemon(args.ticks, upstreamUrl, connectorUrl))
+    finally:
+        stubServer.terminate()
+        stubServer.join()
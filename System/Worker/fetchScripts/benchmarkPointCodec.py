@@ -0,0 +1,67 @@
+import argparse
+import hashlib
+import json
+import logging
+import time
+from commonRessources import jsonCodec
+from payloadDecoding import projectFields, decodePayload
+
+# Microbenchmark of the CPU time per point from the upstream body to the value handed to the InfluxDB Point, run it inside a worker container:
+#   docker compose exec worker python /app/fetchScripts/benchmarkPointCodec.py --points 20000
+# "before" repeats the passes of the old path: response.json(), json.dumps() of the value, json.dumps() with sorted keys for the
+# change hash, json.dumps() of the envelope and json.loads() of the envelope in the Influx data connector.
+# "after" is the current path: the body is passed through or decoded once (decodePayload) and the envelope is encoded
+# and decoded with jsonCodec (orjson if installed). Compression and network are the same in both paths and left out.
+
+# --------------------------- Payloads -----------------------------------------------------------------------------------------------------------------------------------------
+PAYLOADS = {
+    'quote': {"c": 183.31, "d": -5.81, "dp": -3.0721, "h": 185.255, "l": 181.81, "o": 184.55, "pc": 189.12, "t": 1722888002},
+    'weather': {
+        "latitude": 52.52, "longitude": 13.419998, "generationtime_ms": 0.0209808349609375, "utc_offset_seconds": 0, "timezone": "GMT",
+        "timezone_abbreviation": "GMT", "elevation": 38.0,
+        "current_units": {"time": "iso8601", "interval": "seconds", "temperature_2m": "°C", "relative_humidity_2m": "%", "apparent_temperature": "°C",
+                          "is_day": "", "precipitation": "mm", "rain": "mm", "showers": "mm", "snowfall": "cm", "weather_code": "wmo code",
+                          "cloud_cover": "%", "pressure_msl": "hPa", "surface_pressure": "hPa", "wind_speed_10m": "km/h", "wind_direction_10m": "°", "wind_gusts_10m": "km/h"},
+        "current": {"time": "2024-08-05T20:00", "interval": 900, "temperature_2m": 20.5, "relative_humidity_2m": 66, "apparent_temperature": 19.9,
+                    "is_day": 0, "precipitation": 0.0, "rain": 0.0, "showers": 0.0, "snowfall": 0.0, "weather_code": 3, "cloud_cover": 100,
+                    "pressure_msl": 1011.8, "surface_pressure": 1007.2, "wind_speed_10m": 11.2, "wind_direction_10m": 254, "wind_gusts_10m": 23.4}
+    }
+}
+FIELDS = ["temperature_2m", "rain", "wind_speed_10m", "c", "dp"]
+
+# --------------------------- Benchmark Functions -----------------------------------------------------------------------------------------------------------------------------------------
+def before(body, fields):
+    data = projectFields(json.loads(body), fields)
+    value = json.dumps(data)
+    hashlib.sha1(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+    envelope = json.dumps({"points": [{"apiID": 1, "subscriptionID": "1", "value": value, "fetchTimestamp": "2024-08-05T20:00:00"}]}).encode('utf-8')
+    return json.loads(envelope)["points"][0]["value"]
+
+def after(body, fields):
+    _, value, _ = decodePayload({'fields': fields}, body, 'application/json')
+    envelope = jsonCodec.dumpsBytes({"points": [{"apiID": 1, "subscriptionID": "1", "value": value, "fetchTimestamp": "2024-08-05T20:00:00"}]})
+    return jsonCodec.loads(envelope)["points"][0]["value"]
+
+def cpuPerPoint(path, body, fields, points):
+    """
+    :return: CPU microseconds per point
+    """
+    start = time.process_time()
+    for _ in range(points):
+        path(body, fields)
+    return (time.process_time() - start) / points * 1e6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare the CPU time per point of the old and the current payload path.')
+    parser.add_argument('--points', type=int, default=20000, help='number of points per case')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    print(f"codec: {'orjson' if jsonCodec.orjson else 'json'}")
+    for payloadName, payload in PAYLOADS.items():
+        body = json.dumps(payload).encode('utf-8')
+        for fieldsName, fields in (('all fields', []), ('projected', FIELDS)):
+            cpuBefore = cpuPerPoint(before, body, fields, args.points)
+            cpuAfter = cpuPerPoint(after, body, fields, args.points)
+            print(f"{payloadName:<8} {fieldsName:<10}  before {cpuBefore:7.2f}µs  after {cpuAfter:7.2f}µs  per point  ({cpuBefore / cpuAfter:4.1f}x)")
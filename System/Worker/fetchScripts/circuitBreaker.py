@@ -0,0 +1,92 @@
+import time
+from urllib.parse import urlsplit
+from commonRessources import CIRCUIT_BREAKER_FAILURE_THRESHOLD, CIRCUIT_BREAKER_OPEN_DURATION, CIRCUIT_BREAKER_MAX_OPEN_DURATION, CIRCUIT_BREAKER_HALF_OPEN_PROBES
+from commonRessources.logger import setLoggerLevel
+
+# -------------------------- Environment Variables ------------------------------------------------------------------------------------------------------------------------------------------
+CLOSED = 'CLOSED'          # requests are sent
+OPEN = 'OPEN'              # the upstream is down, requests are not sent until the open duration is over
+HALF_OPEN = 'HALF_OPEN'    # a few probe requests are sent, the first result decides if the circuit closes or opens again
+
+# --------------------------- Initializations -----------------------------------------------------------------------------------------------------------------------------------------
+logger = setLoggerLevel("WorkerCircuitBreaker")
+
+# --------------------------- Circuit Breaker -----------------------------------------------------------------------------------------------------------------------------------------
+class CircuitBreaker:
+    """
+    Circuit breaker per upstream host of the fetch daemon.
+
+    After CIRCUIT_BREAKER_FAILURE_THRESHOLD consecutive failures (connection errors, timeouts, 5xx) the circuit of
+    the host opens and its ticks are skipped without a request. After the open duration up to
+    CIRCUIT_BREAKER_HALF_OPEN_PROBES probe requests are let through: a success closes the circuit, a failure opens it
+    again for twice as long (at most CIRCUIT_BREAKER_MAX_OPEN_DURATION seconds).
+    """
+
+    def __init__(self, failureThreshold=CIRCUIT_BREAKER_FAILURE_THRESHOLD, openDuration=CIRCUIT_BREAKER_OPEN_DURATION,
+                 maxOpenDuration=CIRCUIT_BREAKER_MAX_OPEN_DURATION, halfOpenProbes=CIRCUIT_BREAKER_HALF_OPEN_PROBES):
+        self.failureThreshold = failureThreshold
+        self.openDuration = openDuration
+        self.maxOpenDuration = maxOpenDuration
+        self.halfOpenProbes = halfOpenProbes
+        self.circuits = {}      # upstream -> {"state", "failures", "openUntil", "openDuration", "probes"}
+
+    @staticmethod
+    def upstream(plan):
+        """
+        :return: The upstream host of a fetch plan, the circuits are kept per host
+        """
+        return urlsplit(plan['url']).netloc
+
+    def getCircuit(self, upstream):
+        return self.circuits.setdefault(upstream, {'state': CLOSED, 'failures': 0, 'openUntil': 0, 'openDuration': self.openDuration, 'probes': 0})
+
+    def state(self, upstream):
+        return self.circuits[upstream]['state'] if upstream in self.circuits else CLOSED
+
+    def allowRequest(self, upstream):
+        """
+        Decides if a request to an upstream may be sent. Every allowed request must be followed by recordSuccess() or recordFailure().
+
+        :param upstream: The upstream host
+        :return: True if the request may be sent
+        """
+        circuit = self.getCircuit(upstream)
+        if circuit['state'] == OPEN:
+            if time.monotonic() < circuit['openUntil']:
+                return False
+            circuit['state'] = HALF_OPEN
+            circuit['probes'] = 0
+            logger.info(f"Circuit of {upstream} is half-open, sending probe requests")
+        if circuit['state'] == HALF_OPEN:
+            if circuit['probes'] >= self.halfOpenProbes:
+                return False
+            circuit['probes'] += 1
+        return True
+
+    def recordSuccess(self, upstream):
+        """
+        Records that the upstream answered. Answers which are errors of a single subscription (4xx) count as success too.
+        """
+        circuit = self.getCircuit(upstream)
+        if circuit['state'] != CLOSED:
+            logger.info(f"Circuit of {upstream} closed, the upstream answers again")
+        circuit.update(state=CLOSED, failures=0, openDuration=self.openDuration, probes=0)
+
+    def recordFailure(self, upstream):
+        """
+        Records that the upstream failed (connection error, timeout, 5xx).
+        """
+        circuit = self.getCircuit(upstream)
+        circuit['failures'] += 1
+        if circuit['state'] == HALF_OPEN:
+            circuit['openDuration'] = min(circuit['openDuration'] * 2, self.maxOpenDuration)
+        elif circuit['state'] == OPEN or circuit['failures'] < self.failureThreshold:
+            return
+        circuit.update(state=OPEN, openUntil=time.monotonic() + circuit['openDuration'], probes=0)
+        logger.warning(f"Circuit of {upstream} opened after {circuit['failures']} failures, next probe in {circuit['openDuration']}s")
+
+    def openCircuits(self):
+        """
+        :return: The upstreams whose circuit isn't closed
+        """
+        return [upstream for upstream, circuit in self.circuits.items() if circuit['state'] != CLOSED]
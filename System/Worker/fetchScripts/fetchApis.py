@@ -1,21 +1,36 @@
 import requests
+import redis
 import logging
 from os import getenv
 import argparse
+import time
 from datetime import datetime, timezone
 import json
-from commonRessources import COMPOSE_INFLUX_DATA_CONNECTOR_URL, COMPOSE_POSTGRES_DATA_CONNECTOR_URL
-from commonRessources.interfaces import SubscriptionStatus
+from commonRessources import COMPOSE_INFLUX_DATA_CONNECTOR_URL, COMPOSE_POSTGRES_DATA_CONNECTOR_URL, WORKER_FETCH_TIMEOUT, WORKER_FETCH_API_TIMEOUTS, WORKER_LATENCY_RETENTION, REDIS_HOST, REDIS_PORT
+from commonRessources.interfaces import SubscriptionStatus, UnchangedPayload
+from commonRessources.rateLimits import GCRA_SCRIPT, RATE_LIMIT_QUOTA_KEY_PREFIX, RATE_LIMIT_BLOCKED_KEY_PREFIX, getQuota, gcraKeys, gcraArguments, keyID, parseQuotaHeaders, parseRetryAfter
 from commonRessources.logger import setLoggerLevel
+from commonRessources import jsonCodec
+from commonRessources.latencyHistograms import LatencyHistograms, queueIncrements, missedTicks, WORKER_LATENCY_KEY_PREFIX, SCHEDULE_LATENESS_KEY, SCHEDULE_MISSED_TICKS_KEY, SCHEDULE_LAST_START_KEY
+from commonRessources.workerRegistry import getWorkerID
+from payloadDecoding import PayloadReader, PAYLOAD_CHUNK_SIZE
 
 # -------------------------- Environment Variables ------------------------------------------------------------------------------------------------------------------------------------------
 apiKey = getenv('INTERNAL_API_KEY')
 headers = {
     'x-api-key': apiKey
     }
+FETCH_PLANS_KEY = 'FETCH_PLANS'     # Written by the scheduler (fetchPlans.storeFetchPlan): subscriptionID -> compiled fetch plan
+REPORTED_STATUS_KEY = 'REPORTED_SUBSCRIPTION_STATUS'    # Hash subscriptionID -> status the workers last reported, so that every change is only reported once
+CONTENT_STATE_KEY = 'CONTENT_STATE'     # Hash subscriptionID -> ETag, Last-Modified and hash of the last payload (cli mode, the daemon keeps it in memory)
 
 # --------------------------- Initializations -----------------------------------------------------------------------------------------------------------------------------------------
 logger = setLoggerLevel("WorkerFetchApis")
+session = requests.Session()
+redisClient = redis.StrictRedis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+gcraScript = redisClient.register_script(GCRA_SCRIPT)
+latencies = LatencyHistograms()     # stages of the tick, reported once at its end (see publishLatencies)
+lateness = LatencyHistograms()      # how late the tick started, reported with the latencies
 
 def loadApiTokens(file_path):
     api_tokens = {}
@@ -32,25 +47,183 @@ def loadApiTokens(file_path):
 apiTokens = loadApiTokens('/run/secrets/apikeys')
 
 # --------------------------- Functions -----------------------------------------------------------------------------------------------------------------------------------------
-def logErrorToPostgres(apiID, subscriptionID, error_message):
+def getFetchTimeout(apiID):
     """
-    If an error occurs during fetching data from an API, the error message is logged to the PostgreSQL database.
+    Returns the timeout budget of one fetch of an API in seconds.
 
     :param apiID: The ID of the API
+    :return: The timeout in seconds
+    """
+    return WORKER_FETCH_API_TIMEOUTS.get(str(apiID), WORKER_FETCH_TIMEOUT)
+
+def buildTokenUrl(url, availableApiName):
+    """
+    Adds the API token to the URL of an API.
+    Different APIs require different query parameters in order to pass the API token.
+
+    :param url: The URL to fetch
+    :param availableApiName: The name of the API until the first space in upper case, e.g. FINNHUB
+    :return: The URL including the API token, None if the API isn't supported
+    """
+    apiToken = apiTokens.get(availableApiName + '_KEY')
+    if availableApiName == 'FINNHUB':
+        return f"{url}&token={apiToken}"
+    elif availableApiName == 'ALPHAVANTAGE':
+        return f"{url}&apikey={apiToken}"
+    return None
+
+def loadFetchPlan(subscriptionID):
+    """
+    Loads the fetch plan the scheduler compiled for a subscription.
+
     :param subscriptionID: The ID of the subscription
-    :param error_message: The error message
+    :return: The fetch plan, None if there is none
+    """
+    try:
+        rawPlan = redisClient.hget(FETCH_PLANS_KEY, subscriptionID)
+        return json.loads(rawPlan) if rawPlan else None
+    except redis.RedisError as e:
+        logger.error(f"Error loading the fetch plan of subscription {subscriptionID}: {e}")
+        return None
+
+def buildPlanRequest(plan):
+    """
+    Builds the upstream request of a fetch plan.
+
+    :param plan: The fetch plan
+    :return: (url, query parameters), the query parameters contain the API token if one is required
+    """
+    auth = plan.get('auth')
+    params = {auth['param']: apiTokens.get(auth['tokenRef'])} if auth else {}
+    return plan['url'], params
+
+def getPlanToken(plan):
+    """
+    :return: The API token of a fetch plan, None if no token is required
+    """
+    auth = plan.get('auth')
+    return apiTokens.get(auth['tokenRef']) if auth else None
+
+def acquireRateLimit(plan):
+    """
+    Takes one request from the shared rate limit of the provider and API key of a fetch plan.
+    If Redis isn't reachable the fetch is allowed, the provider enforces its quota anyway.
+
+    :param plan: The fetch plan
+    :return: 0 if the request may be sent, otherwise the seconds until it would be allowed
+    """
+    quota = getQuota(plan.get('provider'))
+    if not quota:
+        return 0
+    try:
+        return gcraScript(keys=gcraKeys(plan['provider'], getPlanToken(plan)), args=gcraArguments(quota)) / 1000
+    except redis.RedisError as e:
+        logger.error(f"Error checking the rate limit of {plan['provider']}: {e}")
+        return 0
+
+def recordQuota(plan, response):
+    """
+    Stores the remaining quota the provider reported in its response headers, so that the scheduler can take it into account.
+    If the provider answered 429 its API key is blocked for all workers until it may be used again.
+
+    :param plan: The fetch plan
+    :param response: The response of the provider
+    """
+    provider = plan.get('provider')
+    quota = parseQuotaHeaders(response.headers)
+    if not provider or (not quota and response.status_code != 429):
+        return
+    try:
+        pipeline = redisClient.pipeline(transaction=False)
+        if quota:
+            pipeline.hset(f"{RATE_LIMIT_QUOTA_KEY_PREFIX}{provider}", mapping={**quota, 'updatedAt': int(datetime.now(timezone.utc).timestamp())})
+        if response.status_code == 429:
+            pipeline.set(f"{RATE_LIMIT_BLOCKED_KEY_PREFIX}{provider}:{keyID(getPlanToken(plan))}", 1, ex=parseRetryAfter(response.headers))
+        pipeline.execute()
+    except redis.RedisError as e:
+        logger.error(f"Error recording the quota of {provider}: {e}")
+
+def conditionalHeaders(plan, state):
+    """
+    Builds the headers of a conditional GET from the ETag and Last-Modified of the last response of a subscription.
+    If unchanged payloads are stored anyway, the payload is always downloaded.
+
+    :param plan: The fetch plan
+    :param state: The content state of the last response, see detectChange()
+    :return: The request headers
+    """
+    if not state or state.get('apiVersion') != plan.get('apiVersion') or plan.get('unchanged', UnchangedPayload.STORE.value) == UnchangedPayload.STORE.value:
+        return {}
+    requestHeaders = {}
+    if state.get('etag'):
+        requestHeaders['If-None-Match'] = state['etag']
+    if state.get('lastModified'):
+        requestHeaders['If-Modified-Since'] = state['lastModified']
+    return requestHeaders
+
+def detectChange(plan, state, response, contentHash):
+    """
+    Detects if the payload of a subscription changed since the last tick.
+    The hash of the stored value is compared, so changes of fields which aren't stored don't count.
+
+    :param plan: The fetch plan
+    :param state: The content state of the last response, None if there was none
+    :param response: The response of the API, a 304 means unchanged
+    :param contentHash: The hash of the stored value of the response (see decodePayload), None for a 304
+    :return: (True if the payload changed, content state of this response)
+    """
+    if response.status_code == 304:
+        return False, state
+    newState = {
+        'apiVersion': plan.get('apiVersion'),
+        'etag': response.headers.get('etag'),
+        'lastModified': response.headers.get('last-modified'),
+        'hash': contentHash
+    }
+    changed = not state or state.get('apiVersion') != plan.get('apiVersion') or state.get('hash') != contentHash
+    return changed, newState
+
+def reportStatus(subscriptionID, status, message):
+    """
+    Reports the status of a subscription to the PostgreSQL database, but only if it changed since the last report of any worker.
+    So a subscription is set to ERROR once when its API goes down and to ACTIVE once when it answers again, not on every tick.
+
+    :param subscriptionID: The ID of the subscription
+    :param status: The SubscriptionStatus observed by this tick
+    :param message: Why the status changed
     """
     try:
-        response = requests.post(f"{COMPOSE_POSTGRES_DATA_CONNECTOR_URL}/setSubscriptionsStatus",
-            json={
+        if (redisClient.hget(REPORTED_STATUS_KEY, subscriptionID) or SubscriptionStatus.ACTIVE.value) == status.value:
+            return
+    except redis.RedisError as e:
+        logger.error(f"Error reading the reported status of subscription ID {subscriptionID}: {e}")
+    try:
+        response = session.post(f"{COMPOSE_POSTGRES_DATA_CONNECTOR_URL}/setSubscriptionsStatuses",
+            json={"subscriptions": [{
                 "subscriptionID": subscriptionID,
-                "subscriptionStatus": SubscriptionStatus.ERROR.value,
-            },
-            headers=headers)
+                "subscriptionStatus": status.value,
+                "expectedStatuses": [SubscriptionStatus.ACTIVE.value, SubscriptionStatus.ERROR.value]     # never reactivate an unsubscribed subscription
+            }]},
+            headers=headers,
+            timeout=WORKER_FETCH_TIMEOUT)
         response.raise_for_status()
-        logger.info(f"Logged error to PostgreSQL for subscription ID {subscriptionID}: {error_message}")
+        redisClient.hset(REPORTED_STATUS_KEY, subscriptionID, status.value)
+        logger.info(f"Reported status {status.value} to PostgreSQL for subscription ID {subscriptionID}: {message}")
     except requests.exceptions.RequestException as e:
-        logger.error(f"Failed to log error to PostgreSQL for subscription ID {subscriptionID}: {e}")
+        logger.error(f"Failed to report status {status.value} to PostgreSQL for subscription ID {subscriptionID}: {e}")
+    except redis.RedisError as e:
+        logger.error(f"Error storing the reported status of subscription ID {subscriptionID}: {e}")
+
+def logErrorToPostgres(apiID, subscriptionID, error_message):
+    """
+    If an error occurs during fetching data from an API, the error is reported to the PostgreSQL database.
+
+    :param apiID: The ID of the API
+    :param subscriptionID: The ID of the subscription
+    :param error_message: The error message
+    """
+    logger.error(f"Error for API ID {apiID} and subscription ID {subscriptionID}: {error_message}")
+    reportStatus(subscriptionID, SubscriptionStatus.ERROR, error_message)
 
 
 def writeToInfluxdb(apiID, subscriptionID, value, fetchTimestamp):
@@ -59,7 +232,7 @@ def writeToInfluxdb(apiID, subscriptionID, value, fetchTimestamp):
 
     :param apiID: The ID of the API
     :param subscriptionID: The ID of the subscription
-    :param value: The fetched data
+    :param value: The fetched data, None writes a heartbeat point for an unchanged payload
     :param fetchTimestamp: The timestamp of the fetch
     """
     try:
@@ -67,10 +240,17 @@ def writeToInfluxdb(apiID, subscriptionID, value, fetchTimestamp):
         now = datetime.now(timezone.utc)
         data = {
             "subscriptionID": subscriptionID,
-            "value": value,
             "fetchTimestamp": fetchTimestamp
         }
-        response = requests.post(influx_url, json=data, headers=headers)
+        if value is None:
+            data["unchanged"] = True
+        else:
+            data["value"] = value
+        startedAt = time.perf_counter()
+        try:
+            response = session.post(influx_url, data=jsonCodec.dumpsBytes(data), headers={**headers, 'Content-Type': 'application/json'}, timeout=WORKER_FETCH_TIMEOUT)
+        finally:
+            latencies.observe('write', apiID, time.perf_counter() - startedAt)
         response.raise_for_status()
         logger.info(f"Successfully sent data to InfluxDB for API ID {apiID}: {data}")
     except requests.exceptions.RequestException as e:
@@ -86,21 +266,20 @@ def fetchApi(url, subscriptionID, apiID, tokenRequired):
     :param apiID: The ID of the API
     :param tokenRequired: If an API token is required to fetch the data
     """
+    timeout = getFetchTimeout(apiID)
     try:
         if tokenRequired == "True":
-            availableApiResponse = requests.get(f"{COMPOSE_POSTGRES_DATA_CONNECTOR_URL}/availableApi/{apiID}", headers=headers)
+            availableApiResponse = session.get(f"{COMPOSE_POSTGRES_DATA_CONNECTOR_URL}/availableApi/{apiID}", headers=headers, timeout=timeout)
             availableApiResponse.raise_for_status()
             availableApiName = availableApiResponse.json().get('name').split(' ')[0].upper()    # Get the name of the API in order to get the correct API token
-            apiToken = apiTokens.get(availableApiName + '_KEY')
-            if availableApiName == 'FINNHUB':                       # Different APIs require different query parameters in order to pass the API token
-                response = requests.get(f"{url}&token={apiToken}")
-            elif availableApiName == 'ALPHAVANTAGE':
-                response = requests.get(f"{url}&apikey={apiToken}")
-            else:
+            tokenUrl = buildTokenUrl(url, availableApiName)
+            if tokenUrl is None:
                 logger.error(f"API {availableApiName} not supported")
                 logErrorToPostgres(apiID, subscriptionID, f"API {availableApiName} not supported")
-        elif tokenRequired == "False":
-            response = requests.get(url)
+                return
+            response = session.get(tokenUrl, timeout=timeout)
+        else:
+            response = session.get(url, timeout=timeout)
         response.raise_for_status()
         data = response.json()
         fetchTimestamp = datetime.now().isoformat()
@@ -111,16 +290,157 @@ def fetchApi(url, subscriptionID, apiID, tokenRequired):
         logErrorToPostgres(apiID, subscriptionID, str(e))
 
 
-if __name__ == "__main__":
+def loadContentState(subscriptionID):
+    """
+    :return: The content state of the last response of a subscription, None if there is none
+    """
+    try:
+        rawState = redisClient.hget(CONTENT_STATE_KEY, subscriptionID)
+        return json.loads(rawState) if rawState else None
+    except redis.RedisError as e:
+        logger.error(f"Error loading the content state of subscription {subscriptionID}: {e}")
+        return None
+
+def storeContentState(subscriptionID, state):
+    try:
+        redisClient.hset(CONTENT_STATE_KEY, subscriptionID, json.dumps(state))
+    except redis.RedisError as e:
+        logger.error(f"Error storing the content state of subscription {subscriptionID}: {e}")
+
+
+def fetchWithPlan(plan, subscriptionID, planLookupTime=0.0):
+    """
+    Fetches the subscribed data from an API by the compiled fetch plan of the subscription and loads it to InfluxDB.
+    If the payload didn't change since the last tick, depending on the fetch plan it's stored anyway, a heartbeat point is written or nothing.
+
+    :param plan: The fetch plan of the subscription
+    :param subscriptionID: The ID of the subscription
+    :param planLookupTime: Seconds it took to load the fetch plan, observed as one planLookup sample together with the content state
+    """
+    startedAt = time.perf_counter()
+    state = loadContentState(subscriptionID)
+    latencies.observe('planLookup', plan['apiID'], planLookupTime + time.perf_counter() - startedAt)
+    startedAt = time.perf_counter()
+    retryAfter = acquireRateLimit(plan)
+    latencies.observe('rateLimit', plan['apiID'], time.perf_counter() - startedAt)
+    if retryAfter:      # skipping a tick doesn't put the subscription into ERROR, it is just fetched again on the next one
+        logger.warning(f"Rate limit of {plan['provider']} reached, skipping the fetch of subscription ID {subscriptionID} (allowed again in {retryAfter:.1f}s)")
+        return
+    url, params = buildPlanRequest(plan)
+    response = None
+    try:
+        startedAt = time.perf_counter()     # requests opens a new connection on every tick, so ttfb includes the connect stage
+        response = session.get(url, params=params, headers=conditionalHeaders(plan, state), timeout=plan['timeout'], stream=True)
+        latencies.observe('ttfb', plan['apiID'], time.perf_counter() - startedAt)
+        recordQuota(plan, response)
+        if response.status_code == 429:
+            logger.warning(f"{plan['provider']} answered 429 for subscription ID {subscriptionID}, its API key is paused")
+            return
+        response.raise_for_status()
+        value = contentHash = None
+        if response.status_code != 304:
+            startedAt = time.perf_counter()
+            reader = PayloadReader(plan, response.headers)
+            for chunk in response.iter_content(chunk_size=PAYLOAD_CHUNK_SIZE):
+                reader.feed(chunk)
+            _, value, contentHash = reader.finish()
+            latencies.observe('download', plan['apiID'], time.perf_counter() - startedAt)
+            latencies.observeBytes(plan['apiID'], reader.size)
+        changed, newState = detectChange(plan, state, response, contentHash)
+        fetchTimestamp = datetime.now().isoformat()
+        logger.debug(f"Received data for {url}: {value}")
+        if changed or plan.get('unchanged', UnchangedPayload.STORE.value) == UnchangedPayload.STORE.value:
+            writeToInfluxdb(plan['apiID'], subscriptionID, value, fetchTimestamp)
+        elif plan['unchanged'] == UnchangedPayload.HEARTBEAT.value:
+            writeToInfluxdb(plan['apiID'], subscriptionID, None, fetchTimestamp)
+        if newState is not state:
+            storeContentState(subscriptionID, newState)
+        reportStatus(subscriptionID, SubscriptionStatus.ACTIVE, "Fetched successfully again")
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logger.error(f"Error fetching data for {url}: {e}")
+        logErrorToPostgres(plan['apiID'], subscriptionID, str(e))
+    finally:
+        if response is not None:
+            response.close()
+
+
+def recordTickStart(subscriptionID, interval):
+    """
+    Records how late the tick started. The job runner doesn't tell the cli when the tick was scheduled,
+    so it is expected one interval after the start of the previous tick of the subscription, every further interval counts as a missed tick.
+
+    :param subscriptionID: The ID of the subscription
+    :param interval: The interval of the job in seconds
+    :return: The number of missed ticks since the previous tick
+    """
+    now = time.time()
+    try:
+        pipeline = redisClient.pipeline(transaction=True)
+        pipeline.hget(SCHEDULE_LAST_START_KEY, subscriptionID)
+        pipeline.hset(SCHEDULE_LAST_START_KEY, subscriptionID, now)
+        lastStart, _ = pipeline.execute()
+    except redis.RedisError as e:
+        logger.error(f"Error recording the start of the tick of subscription {subscriptionID}: {e}")
+        return 0
+    if lastStart is None:       # first tick since it was subscribed
+        return 0
+    lateBy = now - float(lastStart) - interval
+    missed = missedTicks(lateBy, interval)
+    lateness.observe('lateness', subscriptionID, max(0, lateBy - missed * interval))
+    return missed
+
+def publishLatencies(subscriptionID, missed=0):
+    """
+    Adds the latency histograms of the tick to the ones of the worker in Redis and its lateness and missed ticks to the ones of the subscription.
+    The cli runs inside the worker container, so the worker is identified the same way as by its heartbeat.
+
+    :param subscriptionID: The ID of the subscription
+    :param missed: The number of missed ticks since the previous tick
+    """
+    try:
+        pipeline = redisClient.pipeline(transaction=False)
+        queueIncrements(pipeline, f"{WORKER_LATENCY_KEY_PREFIX}{getWorkerID()}", latencies.drain(), WORKER_LATENCY_RETENTION)
+        queueIncrements(pipeline, SCHEDULE_LATENESS_KEY, lateness.drain(), WORKER_LATENCY_RETENTION)
+        if missed:
+            pipeline.hincrby(SCHEDULE_MISSED_TICKS_KEY, subscriptionID, missed)
+        pipeline.execute()
+    except redis.RedisError as e:
+        logger.error(f"Error publishing the fetch latencies: {e}")
+
+def buildArgumentParser():
+    """
+    Builds the argument parser for the fetch command.
+    It is shared with the fetch daemon, which parses the commands of its jobs the same way.
+
+    :return: The argument parser
+    """
     parser = argparse.ArgumentParser(description='Run specific functions from the script.')
     parser.add_argument('--url', help='the Url to fetch')
     parser.add_argument('--tokenRequired',help='is an API token required to fetch the API')
     parser.add_argument('--subscriptionID', help='the Id of the subscription')
     parser.add_argument('--apiID', help='the Id of the API to fetch')
+    parser.add_argument('--adaptive', action='store_true', help='stretch the interval while the payload does not change (only used by the fetch daemon)')
+    parser.add_argument('--aggregationWindow', type=int, help='write one min/max/mean/last/count summary per window of this many seconds (only used by the fetch daemon)')
+    parser.add_argument('--rawSample', action='store_true', help='write the last raw payload of every aggregation window as well')
+    parser.add_argument('--interval', type=int, help='the interval of the job in seconds, to measure how late the tick started (only used by the cli mode)')
+    return parser
+
 
-    args = parser.parse_args()
+if __name__ == "__main__":      # cli mode: the job runner of the worker (jobRunner.py) executes this script on every tick of a job
+    args = buildArgumentParser().parse_args()
 
-    if args.url and args.tokenRequired and args.subscriptionID and args.apiID:
+    if args.url and args.tokenRequired and args.subscriptionID and args.apiID:      # jobs which were scheduled before fetch plans existed
         fetchApi(args.url, args.subscriptionID, args.apiID, args.tokenRequired)
+    elif args.subscriptionID and args.apiID:
+        missed = recordTickStart(args.subscriptionID, args.interval) if args.interval else 0
+        startedAt = time.perf_counter()
+        plan = loadFetchPlan(args.subscriptionID)
+        if plan:
+            fetchWithPlan(plan, args.subscriptionID, time.perf_counter() - startedAt)
+            latencies.observe('total', args.apiID, time.perf_counter() - startedAt)
+            publishLatencies(args.subscriptionID, missed)
+        else:
+            logger.error(f"No fetch plan found for subscription ID {args.subscriptionID}")
+            logErrorToPostgres(args.apiID, args.subscriptionID, "No fetch plan found")
     else:
-        logger.error("--url & --tokenRequired & --subscriptionID & --apiID argument is required.")
\ No newline at end of file
+        logger.error("--subscriptionID & --apiID argument is required.")
\ No newline at end of file
@@ -0,0 +1,210 @@
+import argparse
+import asyncio
+import json
+import os
+import shlex
+import signal
+import time
+import redis
+import redis.asyncio
+from commonRessources import REDIS_HOST, REDIS_PORT, WORKER_DAEMON_JOB_SYNC_INTERVAL, WORKER_SPOOL_DIRECTORY, WORKER_METRICS_INTERVAL, WORKER_LATENCY_RETENTION
+from commonRessources.logger import setLoggerLevel
+from commonRessources.latencyHistograms import queueIncrements, missedTicks, WORKER_LATENCY_KEY_PREFIX, SCHEDULE_LATENESS_KEY, SCHEDULE_MISSED_TICKS_KEY
+from fetchApis import buildArgumentParser
+from fetchEngine import FetchEngine
+from adaptivePolling import AdaptiveInterval
+from batchRequests import groupDueJobs
+from commonRessources.jobSchedule import JobSchedule, syncSchedule, loadWorkerJobs, WORKER_JOBS_VERSION_KEY_PREFIX
+
+# -------------------------- Environment Variables ------------------------------------------------------------------------------------------------------------------------------------------
+FETCH_PLANS_KEY = 'FETCH_PLANS'                 # Written by the scheduler (fetchPlans.storeFetchPlan): subscriptionID -> compiled fetch plan
+FETCH_PLANS_VERSION_KEY = 'FETCH_PLANS_VERSION' # Incremented by the scheduler every time fetch plans change
+WORKER_METRICS_KEY_PREFIX = 'WORKER_METRICS:'   # Hash per worker with the current metrics of its fetch daemon
+BATCH_COALESCE_WINDOW = 0.05                    # Jobs due within this many seconds are handed over in the same tick, so that batchable jobs meet
+
+# --------------------------- Initializations -----------------------------------------------------------------------------------------------------------------------------------------
+logger = setLoggerLevel("WorkerFetchDaemon")
+redisClient = redis.asyncio.StrictRedis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+
+# --------------------------- Functions -----------------------------------------------------------------------------------------------------------------------------------------
+def parseJobCommand(command):
+    """
+    Parses the fetchApis.py command of a job into its arguments.
+    The daemon runs the same command the cli mode would run, but inside its own process.
+
+    :param command: The command of the job, e.g. python /app/fetchScripts/fetchApis.py --url ... --apiID 2
+    :return: The parsed arguments
+    """
+    return buildArgumentParser().parse_args(shlex.split(command)[2:])
+
+async def loadJobs(workerID):
+    """
+    Loads the jobs the scheduler assigned to this worker and their fetch plans from Redis.
+    Jobs without a fetch plan (scheduled before fetch plans existed) can't be run by the daemon and are skipped.
+
+    :param workerID: The ID of the worker (see workerRegistry.getWorkerID)
+    :return: Dictionary jobName -> {"interval": <int>, "definition": <str>, "subscriptionID": <str>, "adaptive": <bool>, "aggregation": <(window, rawSample) or None>, "plan": <fetch plan>}
+    """
+    jobs = {}
+    for jobName, job in (await loadWorkerJobs(redisClient, workerID)).items():
+        arguments = parseJobCommand(job['command'])
+        jobs[jobName] = {
+            'interval': job['interval'],
+            'definition': job['definition'],
+            'subscriptionID': arguments.subscriptionID,
+            'adaptive': arguments.adaptive,
+            'aggregation': (arguments.aggregationWindow, arguments.rawSample) if arguments.aggregationWindow else None
+        }
+    if not jobs:
+        return jobs
+
+    jobNames = list(jobs)
+    rawPlans = await redisClient.hmget(FETCH_PLANS_KEY, [jobs[jobName]['subscriptionID'] for jobName in jobNames])
+    for jobName, rawPlan in zip(jobNames, rawPlans):
+        if rawPlan:
+            jobs[jobName]['plan'] = json.loads(rawPlan)
+        else:
+            logger.error(f"No fetch plan found for job {jobName}, resubscribe its subscription")
+            del jobs[jobName]
+    return jobs
+
+def firstRun(job, now, wall):
+    """
+    Batchable jobs start on the wall clock grid of their interval, so that the jobs of a batch group with the same interval
+    are due in the same tick on every worker and can be fetched with one request. All other jobs start one interval after loading.
+
+    :param job: The job as loaded by loadJobs
+    :param now: The current time of the event loop
+    :param wall: The current wall clock time
+    :return: The time of the event loop the job runs first
+    """
+    interval = job['interval']
+    if job['plan'].get('batch'):
+        return now + interval - wall % interval
+    return now + interval
+
+async def publishMetrics(workerID, engine):
+    """
+    Publishes the metrics of the fetch engine (e.g. spool depth and drain rate), its latency histograms
+    and the lateness and missed ticks of its subscriptions to Redis.
+    The metrics hash expires if the daemon stops reporting, the histograms are kept WORKER_LATENCY_RETENTION seconds.
+
+    :param workerID: The ID of the worker (see workerRegistry.getWorkerID)
+    :param engine: The fetch engine of the daemon
+    """
+    metrics = engine.metrics()
+    pipeline = redisClient.pipeline(transaction=True)
+    pipeline.hset(f"{WORKER_METRICS_KEY_PREFIX}{workerID}", mapping=metrics)
+    pipeline.expire(f"{WORKER_METRICS_KEY_PREFIX}{workerID}", WORKER_METRICS_INTERVAL * 3)
+    latencyIncrements = engine.latencies.drain()
+    latenessIncrements = engine.lateness.drain()
+    missed = engine.drainMissedTicks()
+    queueIncrements(pipeline, f"{WORKER_LATENCY_KEY_PREFIX}{workerID}", latencyIncrements, WORKER_LATENCY_RETENTION)
+    queueIncrements(pipeline, SCHEDULE_LATENESS_KEY, latenessIncrements, WORKER_LATENCY_RETENTION)
+    for subscriptionID, count in missed.items():
+        pipeline.hincrby(SCHEDULE_MISSED_TICKS_KEY, subscriptionID, count)
+    try:
+        await pipeline.execute()
+    except redis.RedisError:
+        engine.latencies.restore(latencyIncrements)     # reported with the next metrics instead
+        engine.lateness.restore(latenessIncrements)
+        for subscriptionID, count in missed.items():
+            engine.recordMissedTicks(subscriptionID, count)
+        raise
+    if metrics['spoolDepth']:
+        logger.info(f"Spool depth {metrics['spoolDepth']} points ({metrics['spoolBytes']} bytes), draining {metrics['spoolDrainRate']} points/s")
+
+async def runDaemon(workerID):
+    """
+    Runs the scheduled jobs of the worker in-process.
+    The modules, the API tokens and the HTTP connection pools stay loaded for the whole lifetime of the daemon.
+
+    1) Reloads the jobs from Redis every time the scheduler published a new version of them or of the fetch plans.
+       Only new and changed jobs are (re)scheduled, all other jobs keep their next run
+    2) Hands all due jobs over to the fetch engine and schedules their next run,
+       adaptive jobs with an interval adapted to how often their payload changes.
+       Due jobs of the same batch group are fetched with one request.
+       Ticks which are already overdue by a whole interval are skipped and counted as missed
+    3) Publishes the metrics, latency histograms and schedule accuracy of the fetch engine every WORKER_METRICS_INTERVAL seconds
+    4) On SIGTERM/SIGINT the running ticks are cancelled and the connections are closed
+
+    :param workerID: The ID of the worker (see workerRegistry.getWorkerID)
+    """
+    logger.info(f"Starting fetch daemon for worker {workerID}")
+    loop = asyncio.get_running_loop()
+    stopEvent = asyncio.Event()
+    for stopSignal in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(stopSignal, stopEvent.set)
+
+    engine = FetchEngine(spoolDirectory=os.path.join(WORKER_SPOOL_DIRECTORY, workerID))
+    jobs = {}
+    schedule = JobSchedule()
+    adaptiveIntervals = {}  # jobName -> AdaptiveInterval of the adaptive jobs
+    jobsVersion = None
+    nextSync = 0
+    nextMetrics = loop.time() + WORKER_METRICS_INTERVAL
+
+    while not stopEvent.is_set():
+        now = loop.time()
+        if now >= nextSync:
+            try:
+                version = tuple(await redisClient.mget(f"{WORKER_JOBS_VERSION_KEY_PREFIX}{workerID}", FETCH_PLANS_VERSION_KEY))
+                if version != jobsVersion:
+                    loadedJobs = await loadJobs(workerID)
+                    wall = time.time()
+                    added, changed, removed = syncSchedule(schedule, jobs, loadedJobs, lambda job: firstRun(job, now, wall))
+                    jobs = loadedJobs
+                    for jobName in [jobName for jobName in adaptiveIntervals if not jobs.get(jobName, {}).get('adaptive')]:
+                        del adaptiveIntervals[jobName]      # removed, moved or no longer adaptive, every subscription gets a new job name
+                    jobsVersion = version
+                    logger.info(f"Loaded {len(jobs)} jobs (version {version}): {added} added, {changed} changed, {removed} removed")
+            except redis.RedisError as e:
+                logger.error(f"Error loading the jobs from Redis: {e}")
+            nextSync = now + WORKER_DAEMON_JOB_SYNC_INTERVAL
+
+        if now >= nextMetrics:
+            try:
+                await publishMetrics(workerID, engine)
+            except redis.RedisError as e:
+                logger.error(f"Error publishing the metrics to Redis: {e}")
+            nextMetrics = now + WORKER_METRICS_INTERVAL
+
+        dueJobs = []
+        scheduledAts = {}       # jobName -> time the due tick was scheduled at
+        for dueAt, jobName in schedule.popDue(now + BATCH_COALESCE_WINDOW):
+            job = jobs[jobName]
+            interval = job['interval']
+            if job['adaptive']:
+                if jobName not in adaptiveIntervals or adaptiveIntervals[jobName].interval != interval:
+                    adaptiveIntervals[jobName] = AdaptiveInterval(interval)
+                interval = adaptiveIntervals[jobName].update(engine.tickOutcomes.pop(job['subscriptionID'], None))
+                engine.statusReporter.reportEffectiveInterval(job['subscriptionID'], round(interval))
+            missed = missedTicks(now - dueAt, interval)
+            if missed:
+                engine.recordMissedTicks(job['subscriptionID'], missed)
+            dueJobs.append((jobName, job))
+            scheduledAts[jobName] = dueAt
+            schedule.schedule(jobName, dueAt + (missed + 1) * interval)
+        for request in groupDueJobs(dueJobs):
+            engine.submitBatch([(jobName, job['subscriptionID'], job['plan'], job['aggregation'], scheduledAts[jobName]) for jobName, job in request])
+
+        nextWakeup = min(nextRun for nextRun in (schedule.nextRunAt(), nextSync, nextMetrics) if nextRun is not None)
+        try:
+            await asyncio.wait_for(stopEvent.wait(), timeout=max(0, nextWakeup - loop.time()))
+        except asyncio.TimeoutError:
+            pass
+
+    logger.info(f"Stopping fetch daemon for worker {workerID}")
+    await engine.close()
+    await redisClient.aclose()
+
+
+if __name__ == "__main__":      # daemon mode: started once per worker container by heartbeats.py
+    parser = argparse.ArgumentParser(description='Run the fetch jobs of a worker in a long-lived process.')
+    parser.add_argument('--workerID', help='the ID of the worker (see workerRegistry.getWorkerID)')
+    args = parser.parse_args()
+
+    if args.workerID:
+        asyncio.run(runDaemon(args.workerID))
+    else:
+        logger.error("--workerID argument is required.")
@@ -0,0 +1,498 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+import httpx
+import redis
+import redis.asyncio
+from commonRessources import WORKER_MAX_INFLIGHT_FETCHES, WORKER_FETCH_TIMEOUT, WORKER_FETCH_MAX_BODY_SIZE, REDIS_HOST, REDIS_PORT
+from commonRessources.interfaces import SubscriptionStatus, UnchangedPayload
+from commonRessources.logger import setLoggerLevel
+from commonRessources.latencyHistograms import LatencyHistograms
+from commonRessources.rateLimits import GCRA_SCRIPT, RATE_LIMIT_QUOTA_KEY_PREFIX, RATE_LIMIT_BLOCKED_KEY_PREFIX, getQuota, gcraKeys, gcraArguments, keyID, parseQuotaHeaders, parseRetryAfter
+from fetchApis import buildPlanRequest, getPlanToken, conditionalHeaders, detectChange
+from payloadDecoding import PayloadReader, encodePayload, PAYLOAD_CHUNK_SIZE
+from batchRequests import buildBatchUrl, splitBatchPayload
+from writeBuffer import WriteBuffer
+from statusReporter import StatusReporter
+from circuitBreaker import CircuitBreaker
+from spool import Spool
+from preAggregation import PreAggregator
+
+# --------------------------- Initializations -----------------------------------------------------------------------------------------------------------------------------------------
+logger = setLoggerLevel("WorkerFetchEngine")
+
+# --------------------------- Connect Timer -----------------------------------------------------------------------------------------------------------------------------------------
+class ConnectTimer:
+    """
+    Times DNS, TCP and TLS of a request through the trace extension of httpx (httpcore),
+    which only emits these events if the request opens a new connection.
+    """
+
+    def __init__(self):
+        self.startedAt = {}
+        self.duration = 0
+        self.connected = False
+
+    async def trace(self, event, info):
+        name, _, phase = event.rpartition('.')
+        if name not in ('connection.connect_tcp', 'connection.start_tls'):      # connect_tcp includes the DNS lookup
+            return
+        if phase == 'started':
+            self.startedAt[name] = time.perf_counter()
+        elif phase in ('complete', 'failed') and name in self.startedAt:
+            self.duration += time.perf_counter() - self.startedAt.pop(name)
+            self.connected = True
+
+# --------------------------- Fetch Engine -----------------------------------------------------------------------------------------------------------------------------------------
+class FetchEngine:
+    """
+    Asynchronous fetch engine of the fetch daemon.
+
+    All fetches share one HTTP client which keeps a pool of keep-alive connections per upstream host
+    and uses HTTP/2 if the server supports it. The number of fetches in flight is capped, every fetch
+    has a hard deadline (the timeout budget of its fetch plan) and a job never runs twice at the same time.
+    Every fetch takes a request from the rate limit of its provider, which is shared by all workers through Redis.
+    Upstreams which are down are skipped by a circuit breaker and status changes of the subscriptions are reported coalesced.
+    Bodies are read chunk by chunk up to the maximum body size of the fetch plan and projected while they are received.
+    The fetched points are buffered and shipped to the Influx data connector in batches,
+    points which couldn't be written are spooled to spoolDirectory (if given) and replayed later.
+    Subscriptions with an aggregation window only write one summary point per window.
+    Due subscriptions of the same batch group are fetched in one request (see batchRequests.py).
+    Every tick is timed by stage (see latencyHistograms.FETCH_STAGES) and how late it started is recorded per subscription,
+    the histograms are reported with the metrics.
+    """
+
+    def __init__(self, maxInflight=WORKER_MAX_INFLIGHT_FETCHES, spoolDirectory=None):
+        self.client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_connections=maxInflight * 2, max_keepalive_connections=maxInflight, keepalive_expiry=60),
+            timeout=WORKER_FETCH_TIMEOUT
+        )
+        self.semaphore = asyncio.Semaphore(maxInflight)
+        self.redisClient = redis.asyncio.StrictRedis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+        self.gcraScript = self.redisClient.register_script(GCRA_SCRIPT)
+        self.running = {}       # jobName -> task of the tick that is currently running
+        self.latencies = LatencyHistograms()
+        self.lateness = LatencyHistograms()     # stage "lateness", label subscriptionID
+        self.missedTicks = {}       # subscriptionID -> ticks which weren't executed since the last report
+        self.writeBuffer = WriteBuffer(self.client, spool=Spool(spoolDirectory) if spoolDirectory else None, latencies=self.latencies)
+        self.writeBuffer.start()
+        self.statusReporter = StatusReporter(self.client)
+        self.statusReporter.start()
+        self.preAggregator = PreAggregator(self.writeBuffer)
+        self.preAggregator.start()
+        self.circuitBreaker = CircuitBreaker()
+        self.contentStates = {}     # subscriptionID -> ETag, Last-Modified and hash of the last payload (see fetchApis.detectChange)
+        self.tickOutcomes = {}      # subscriptionID -> if the payload of its last tick changed, None if the tick failed (used by adaptive polling)
+        self.bytesFetched = 0
+        self.payloadsChanged = 0
+        self.payloadsUnchanged = 0
+        self.batchRequests = 0
+        self.batchedFetches = 0
+        self.inflightFetches = 0    # ticks holding a fetch slot
+        self.completedTicks = 0
+        self.failedTicks = 0
+
+    def submit(self, jobName, subscriptionID, plan, aggregation=None, scheduledAt=None):
+        """
+        Starts one tick of a job in the background.
+        If the previous tick of the job is still running, the new tick is skipped so that slow upstreams can't pile up ticks.
+
+        :param jobName: Name of the job
+        :param subscriptionID: The ID of the subscription
+        :param plan: The fetch plan of the subscription
+        :param aggregation: (window in seconds, rawSample) if the subscription is pre-aggregated, otherwise None
+        :param scheduledAt: Time of the event loop the tick was scheduled at, to record how late it started
+        """
+        if jobName in self.running:
+            logger.warning(f"Previous tick of job {jobName} is still running, skipping this tick")
+            self.recordMissedTicks(subscriptionID)
+            return
+        task = asyncio.create_task(self.runJob(jobName, subscriptionID, plan, aggregation, scheduledAt))
+        self.running[jobName] = task
+        task.add_done_callback(lambda _: self.running.pop(jobName, None))
+
+    def submitBatch(self, members):
+        """
+        Starts one tick of several jobs of the same batch group in the background, fetched with one upstream request.
+        Jobs whose previous tick is still running are left out.
+
+        :param members: List of (jobName, subscriptionID, plan, aggregation, scheduledAt) of the jobs
+        """
+        for jobName, subscriptionID, _, _, _ in members:
+            if jobName in self.running:
+                logger.warning(f"Previous tick of job {jobName} is still running, skipping this tick")
+                self.recordMissedTicks(subscriptionID)
+        members = [member for member in members if member[0] not in self.running]
+        if len(members) <= 1:
+            for member in members:
+                self.submit(*member)
+            return
+        task = asyncio.create_task(self.runBatch(members))
+        for jobName, _, _, _, _ in members:
+            self.running[jobName] = task
+            task.add_done_callback(lambda _, jobName=jobName: self.running.pop(jobName, None))
+
+    async def runBatch(self, members):
+        """
+        Executes one tick of several jobs of the same batch group within the timeout budget of their API.
+
+        :param members: List of (jobName, subscriptionID, plan, aggregation, scheduledAt) of the jobs
+        """
+        queuedAt = time.perf_counter()
+        async with self.semaphore:
+            startedAt = time.perf_counter()
+            apiID = members[0][2]['apiID']
+            self.latencies.observe('queue', apiID, startedAt - queuedAt)
+            for _, subscriptionID, _, _, scheduledAt in members:
+                self.recordLateness(subscriptionID, scheduledAt)
+            timeout = members[0][2]['timeout']
+            for _, subscriptionID, _, _, _ in members:
+                self.tickOutcomes[subscriptionID] = None
+            self.inflightFetches += 1
+            try:
+                try:
+                    self.tickOutcomes.update(await asyncio.wait_for(self.fetchBatch([(subscriptionID, plan, aggregation) for _, subscriptionID, plan, aggregation, _ in members]), timeout))
+                except asyncio.TimeoutError:
+                    logger.error(f"Batch request of {len(members)} jobs exceeded its timeout budget of {timeout}s")
+                    for _, subscriptionID, _, _, _ in members:
+                        self.reportError(subscriptionID, f"Timeout budget of {timeout}s exceeded")
+            except Exception as e:      # an exception must never stop the fetch daemon
+                logger.error(f"Unexpected error while running a batch request of {len(members)} jobs: {e}")
+            finally:
+                self.inflightFetches -= 1
+            self.latencies.observe('total', apiID, time.perf_counter() - startedAt)
+            self.countOutcomes([subscriptionID for _, subscriptionID, _, _, _ in members])
+
+    async def runJob(self, jobName, subscriptionID, plan, aggregation=None, scheduledAt=None):
+        """
+        Executes one tick of a job within the timeout budget of its API.
+
+        :param jobName: Name of the job
+        :param subscriptionID: The ID of the subscription
+        :param plan: The fetch plan of the subscription
+        :param aggregation: (window in seconds, rawSample) if the subscription is pre-aggregated, otherwise None
+        :param scheduledAt: Time of the event loop the tick was scheduled at
+        """
+        queuedAt = time.perf_counter()
+        async with self.semaphore:
+            startedAt = time.perf_counter()
+            self.latencies.observe('queue', plan['apiID'], startedAt - queuedAt)
+            self.recordLateness(subscriptionID, scheduledAt)
+            timeout = plan['timeout']
+            self.tickOutcomes[subscriptionID] = None
+            self.inflightFetches += 1
+            try:
+                try:
+                    self.tickOutcomes[subscriptionID] = await asyncio.wait_for(self.fetchApi(plan, subscriptionID, aggregation), timeout)
+                except asyncio.TimeoutError:
+                    logger.error(f"Job {jobName} exceeded its timeout budget of {timeout}s")
+                    self.reportError(subscriptionID, f"Timeout budget of {timeout}s exceeded")
+            except Exception as e:      # an exception must never stop the fetch daemon
+                logger.error(f"Unexpected error while running job {jobName}: {e}")
+            finally:
+                self.inflightFetches -= 1
+            self.latencies.observe('total', plan['apiID'], time.perf_counter() - startedAt)
+            self.countOutcomes([subscriptionID])
+
+    def countOutcomes(self, subscriptionIDs):
+        """
+        Counts the finished ticks and the failed ones among them for the load report of the worker (see heartbeat/loadReport.py).
+
+        :param subscriptionIDs: The subscriptions whose tick finished
+        """
+        self.completedTicks += len(subscriptionIDs)
+        self.failedTicks += sum(1 for subscriptionID in subscriptionIDs if self.tickOutcomes.get(subscriptionID) is None)
+
+    def recordLateness(self, subscriptionID, scheduledAt):
+        """
+        Records how late a tick started compared to its schedule, including the wait for a free fetch slot.
+
+        :param subscriptionID: The ID of the subscription
+        :param scheduledAt: Time of the event loop the tick was scheduled at, None if unknown
+        """
+        if scheduledAt is not None:     # jobs which are handed over early to meet their batch group count as on time
+            self.lateness.observe('lateness', subscriptionID, max(0, asyncio.get_running_loop().time() - scheduledAt))
+
+    def recordMissedTicks(self, subscriptionID, count=1):
+        self.missedTicks[subscriptionID] = self.missedTicks.get(subscriptionID, 0) + count
+
+    def drainMissedTicks(self):
+        """
+        :return: Dictionary subscriptionID -> ticks missed since the last drain
+        """
+        missedTicks, self.missedTicks = self.missedTicks, {}
+        return missedTicks
+
+    def reportError(self, subscriptionID, error_message):
+        """
+        If an error occurs during fetching data from an API, the subscription is set to ERROR.
+        The status reporter only sends it to the PostgreSQL database if the subscription wasn't in ERROR already.
+
+        :param subscriptionID: The ID of the subscription
+        :param error_message: The error message
+        """
+        logger.debug(f"Error for subscription ID {subscriptionID}: {error_message}")
+        self.statusReporter.report(subscriptionID, SubscriptionStatus.ERROR, error_message)
+
+    async def acquireRateLimit(self, plan):
+        """
+        Takes one request from the shared rate limit of the provider and API key of a fetch plan.
+        If Redis isn't reachable the fetch is allowed, the provider enforces its quota anyway.
+
+        :param plan: The fetch plan
+        :return: 0 if the request may be sent, otherwise the seconds until it would be allowed
+        """
+        quota = getQuota(plan.get('provider'))
+        if not quota:
+            return 0
+        try:
+            return await self.gcraScript(keys=gcraKeys(plan['provider'], getPlanToken(plan)), args=gcraArguments(quota)) / 1000
+        except redis.RedisError as e:
+            logger.error(f"Error checking the rate limit of {plan['provider']}: {e}")
+            return 0
+
+    async def recordQuota(self, plan, response):
+        """
+        Stores the remaining quota the provider reported in its response headers, so that the scheduler can take it into account.
+        If the provider answered 429 its API key is blocked for all workers until it may be used again.
+
+        :param plan: The fetch plan
+        :param response: The response of the provider
+        """
+        provider = plan.get('provider')
+        quota = parseQuotaHeaders(response.headers)
+        if not provider or (not quota and response.status_code != 429):
+            return
+        try:
+            pipeline = self.redisClient.pipeline(transaction=False)
+            if quota:
+                pipeline.hset(f"{RATE_LIMIT_QUOTA_KEY_PREFIX}{provider}", mapping={**quota, 'updatedAt': int(datetime.now(timezone.utc).timestamp())})
+            if response.status_code == 429:
+                pipeline.set(f"{RATE_LIMIT_BLOCKED_KEY_PREFIX}{provider}:{keyID(getPlanToken(plan))}", 1, ex=parseRetryAfter(response.headers))
+            await pipeline.execute()
+        except redis.RedisError as e:
+            logger.error(f"Error recording the quota of {provider}: {e}")
+
+    def writeToInfluxdb(self, apiID, subscriptionID, value, fetchTimestamp):
+        """
+        Writes the fetched data to InfluxDB by adding it to the write buffer.
+
+        :param apiID: The ID of the API
+        :param subscriptionID: The ID of the subscription
+        :param value: The fetched data, None writes a heartbeat point for an unchanged payload
+        :param fetchTimestamp: The timestamp of the fetch
+        """
+        self.writeBuffer.add(apiID, subscriptionID, value, fetchTimestamp)
+        logger.debug(f"Buffered data for InfluxDB for API ID {apiID} and subscription ID {subscriptionID}")
+
+    async def fetchApi(self, plan, subscriptionID, aggregation=None):
+        """
+        Fetches the subscribed data from an API by its fetch plan and loads it to InfluxDB.
+        If the payload didn't change since the last tick, depending on the fetch plan it's stored anyway, a heartbeat point is written or nothing.
+        Pre-aggregated subscriptions add every tick to their window instead, an unchanged payload counts as another sample of the last one.
+
+        :param plan: The fetch plan of the subscription
+        :param subscriptionID: The ID of the subscription
+        :param aggregation: (window in seconds, rawSample) if the subscription is pre-aggregated, otherwise None
+        :return: True if the payload changed, False if it didn't, None if the tick failed or was skipped
+        """
+        url, params = buildPlanRequest(plan)
+        state = self.contentStates.get(subscriptionID)
+        response = await self.sendRequest(plan, url, params, conditionalHeaders(plan, state), [subscriptionID])
+        if response is None:
+            return
+        data = value = contentHash = None
+        try:
+            if response.status_code != 304:     # httpx treats the 304 of a conditional GET as error
+                response.raise_for_status()
+                data, value, contentHash = await self.readPayload(response, plan, needData=bool(aggregation))
+        except (httpx.HTTPError, ValueError) as e:
+            logger.error(f"Error fetching data for {url}: {e}")
+            self.reportError(subscriptionID, str(e))
+            return
+        finally:
+            await self.closeResponse(response)
+        changed, self.contentStates[subscriptionID] = detectChange(plan, state, response, contentHash)
+        logger.debug(f"Received data for {url}: {value}")
+        self.storePayload(plan, subscriptionID, aggregation, data, value, changed)
+        return changed
+
+    async def fetchBatch(self, members):
+        """
+        Fetches the data of several subscriptions of the same batch group in one upstream request and splits the response.
+        The request takes one request from the rate limit. Conditional GETs aren't used, the response of a batch changes
+        as soon as the payload of one of its subscriptions does.
+
+        :param members: List of (subscriptionID, fetch plan, aggregation) of the subscriptions of the request
+        :return: Dictionary subscriptionID -> True if its payload changed, False if it didn't (missing if it failed)
+        """
+        plans = [plan for _, plan, _ in members]
+        subscriptionIDs = [subscriptionID for subscriptionID, _, _ in members]
+        batch = plans[0]['batch']
+        url, params = buildPlanRequest(dict(plans[0], url=buildBatchUrl(batch, plans)))
+        response = await self.sendRequest(plans[0], url, params, {}, subscriptionIDs)
+        if response is None:
+            return {}
+        batchPlan = dict(plans[0], fields=[], maxBodySize=(plans[0].get('maxBodySize') or WORKER_FETCH_MAX_BODY_SIZE) * len(members))
+        try:
+            response.raise_for_status()
+            batchData, _, _ = await self.readPayload(response, batchPlan, needData=True)
+        except (httpx.HTTPError, ValueError) as e:
+            logger.error(f"Error fetching the batch of {len(members)} subscriptions from {url}: {e}")
+            for subscriptionID in subscriptionIDs:
+                self.reportError(subscriptionID, str(e))
+            return {}
+        finally:
+            await self.closeResponse(response)
+        self.batchRequests += 1
+        self.batchedFetches += len(members)
+
+        outcomes = {}
+        for (subscriptionID, plan, aggregation), payload in zip(members, splitBatchPayload(batch, batchData, plans)):
+            if payload is None:
+                self.reportError(subscriptionID, "No data for the subscription in the response of the batch request")
+                continue
+            data, value, contentHash = encodePayload(plan, payload)
+            changed, state = detectChange(plan, self.contentStates.get(subscriptionID), response, contentHash)
+            self.contentStates[subscriptionID] = dict(state, etag=None, lastModified=None)     # the validators belong to the batch, not to the subscription
+            self.storePayload(plan, subscriptionID, aggregation, data, value, changed)
+            outcomes[subscriptionID] = changed
+        return outcomes
+
+    async def sendRequest(self, plan, url, params, requestHeaders, subscriptionIDs):
+        """
+        Sends an upstream request of a fetch plan if the rate limit of its provider and the circuit breaker of its host allow it.
+        Connection errors, timeouts and 5xx answers count as failures of the upstream for the circuit breaker,
+        other error answers only concern the subscriptions.
+
+        :param plan: The fetch plan
+        :param url: The URL of the request
+        :param params: The query parameters of the request
+        :param requestHeaders: The headers of the request
+        :param subscriptionIDs: The IDs of the subscriptions the request fetches, errors are reported for all of them
+        :return: The response whose body isn't read yet (close it with closeResponse), None if the request was skipped or failed
+        """
+        startedAt = time.perf_counter()
+        retryAfter = await self.acquireRateLimit(plan)
+        self.latencies.observe('rateLimit', plan['apiID'], time.perf_counter() - startedAt)
+        if retryAfter:      # skipping a tick doesn't put the subscriptions into ERROR, they are just fetched again on the next one
+            logger.warning(f"Rate limit of {plan['provider']} reached, skipping the fetch of subscription IDs {subscriptionIDs} (allowed again in {retryAfter:.1f}s)")
+            return None
+        upstream = self.circuitBreaker.upstream(plan)
+        if not self.circuitBreaker.allowRequest(upstream):
+            for subscriptionID in subscriptionIDs:
+                self.reportError(subscriptionID, f"Circuit of {upstream} is open")
+            return None
+        try:
+            request = self.client.build_request('GET', url, params=params, headers=requestHeaders, timeout=plan['timeout'])
+            connectTimer = ConnectTimer()
+            request.extensions['trace'] = connectTimer.trace
+            sentAt = time.perf_counter()
+            response = await self.client.send(request, stream=True)     # the body is read chunk by chunk, see payloadDecoding.PayloadReader
+            if connectTimer.connected:      # reused connections have no connect stage
+                self.latencies.observe('connect', plan['apiID'], connectTimer.duration)
+            self.latencies.observe('ttfb', plan['apiID'], time.perf_counter() - sentAt - connectTimer.duration)
+        except httpx.HTTPError as e:
+            logger.error(f"Error fetching data for {url}: {e}")
+            self.circuitBreaker.recordFailure(upstream)
+            for subscriptionID in subscriptionIDs:
+                self.reportError(subscriptionID, str(e))
+            return None
+        except asyncio.CancelledError:      # the timeout budget of the tick is exceeded
+            self.circuitBreaker.recordFailure(upstream)
+            raise
+        try:
+            if response.status_code >= 500:
+                self.circuitBreaker.recordFailure(upstream)
+            else:
+                self.circuitBreaker.recordSuccess(upstream)
+            await self.recordQuota(plan, response)
+        except BaseException:
+            await self.closeResponse(response)
+            raise
+        if response.status_code == 429:
+            logger.warning(f"{plan['provider']} answered 429 for subscription IDs {subscriptionIDs}, its API key is paused")
+            await self.closeResponse(response)
+            return None
+        return response
+
+    async def readPayload(self, response, plan, needData=False):
+        """
+        Reads the body of a response up to the maximum body size of the fetch plan.
+
+        :return: (the projected data or None if it was passed through, the value to store, the hash of the value)
+        :raises ValueError: If the body is too large or isn't valid JSON
+        """
+        startedAt = time.perf_counter()
+        reader = PayloadReader(plan, response.headers, needData)
+        async for chunk in response.aiter_bytes(PAYLOAD_CHUNK_SIZE):
+            reader.feed(chunk)
+        payload = reader.finish()
+        self.latencies.observe('download', plan['apiID'], time.perf_counter() - startedAt)
+        self.latencies.observeBytes(plan['apiID'], reader.size)
+        return payload
+
+    async def closeResponse(self, response):
+        self.bytesFetched += response.num_bytes_downloaded
+        await response.aclose()
+
+    def storePayload(self, plan, subscriptionID, aggregation, data, value, changed):
+        """
+        Writes the payload of a tick depending on the fetch plan and the aggregation of the subscription and reports the subscription as ACTIVE.
+
+        :param plan: The fetch plan of the subscription
+        :param subscriptionID: The ID of the subscription
+        :param aggregation: (window in seconds, rawSample) if the subscription is pre-aggregated, otherwise None
+        :param data: The projected data, None if it was passed through or the upstream answered 304
+        :param value: The value to store, None if the upstream answered 304
+        :param changed: If the payload changed since the last tick
+        """
+        fetchTimestamp = datetime.now().isoformat()
+        if aggregation:
+            self.payloadsChanged += bool(changed)
+            self.payloadsUnchanged += not changed
+            self.preAggregator.add(plan['apiID'], subscriptionID, data, *aggregation)
+        elif changed or plan.get('unchanged', UnchangedPayload.STORE.value) == UnchangedPayload.STORE.value:
+            self.payloadsChanged += 1
+            self.writeToInfluxdb(plan['apiID'], subscriptionID, value, fetchTimestamp)
+        else:
+            self.payloadsUnchanged += 1
+            if plan['unchanged'] == UnchangedPayload.HEARTBEAT.value:
+                self.writeToInfluxdb(plan['apiID'], subscriptionID, None, fetchTimestamp)
+        self.statusReporter.report(subscriptionID, SubscriptionStatus.ACTIVE, "Fetched successfully again")
+
+    def metrics(self):
+        """
+        :return: Dictionary with the current metrics of the fetch engine
+        """
+        return {
+            "runningTicks": len(self.running),
+            "inflightFetches": self.inflightFetches,
+            "completedTicks": self.completedTicks,
+            "failedTicks": self.failedTicks,
+            "openCircuits": len(self.circuitBreaker.openCircuits()),
+            "pendingStatusReports": len(self.statusReporter.pending),
+            "aggregationWindows": len(self.preAggregator.windows),
+            "bytesFetched": self.bytesFetched,
+            "payloadsChanged": self.payloadsChanged,
+            "payloadsUnchanged": self.payloadsUnchanged,
+            "batchRequests": self.batchRequests,
+            "batchedFetches": self.batchedFetches,
+            **self.writeBuffer.metrics()
+        }
+
+    async def close(self):
+        """
+        Cancels all running ticks, flushes the write buffer and closes the connection pools.
+        """
+        tasks = list(set(self.running.values()))       # the jobs of a batch request share their task
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.preAggregator.close()
+        await self.writeBuffer.close()
+        await self.statusReporter.close()
+        await self.client.aclose()
+        await self.redisClient.aclose()
+        logger.info(f"Fetch engine closed, {len(tasks)} running ticks cancelled")
@@ -0,0 +1,110 @@
+import argparse
+import asyncio
+import shlex
+import signal
+import redis
+import redis.asyncio
+from commonRessources import REDIS_HOST, REDIS_PORT, WORKER_DAEMON_JOB_SYNC_INTERVAL
+from commonRessources.logger import setLoggerLevel
+from commonRessources.latencyHistograms import missedTicks
+from commonRessources.jobSchedule import JobSchedule, syncSchedule, loadWorkerJobs, WORKER_JOBS_VERSION_KEY_PREFIX
+
+# --------------------------- Initializations -----------------------------------------------------------------------------------------------------------------------------------------
+logger = setLoggerLevel("WorkerJobRunner")
+redisClient = redis.asyncio.StrictRedis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+
+# --------------------------- Functions -----------------------------------------------------------------------------------------------------------------------------------------
+async def runCommand(jobName, command):
+    """
+    Runs the fetchApis.py command of one tick of a job in a new process.
+
+    :param jobName: Name of the job
+    :param command: The command of the job, e.g. python /app/fetchScripts/fetchApis.py --subscriptionID 1 --apiID 2 --interval 60
+    """
+    try:
+        process = await asyncio.create_subprocess_exec(*shlex.split(command))
+    except OSError as e:
+        logger.error(f"Couldn't start job {jobName}: {e}")
+        return
+    try:
+        returnCode = await process.wait()
+    except asyncio.CancelledError:
+        process.terminate()
+        await process.wait()
+        raise
+    if returnCode:
+        logger.error(f"Job {jobName} exited with code {returnCode}")
+
+async def runJobRunner(workerID):
+    """
+    Runs the scheduled jobs of the worker in cli mode, every tick in a new fetchApis.py process.
+
+    1) Reloads the jobs from Redis every time the scheduler published a new version of them.
+       Only new and changed jobs are (re)scheduled, all other jobs keep their next run
+    2) Starts all due jobs and schedules their next run. A tick whose previous tick is still running is skipped,
+       fetchApis.py counts it as missed on the next tick of the subscription
+    3) On SIGTERM/SIGINT the running ticks are terminated
+
+    :param workerID: The ID of the worker (see workerRegistry.getWorkerID)
+    """
+    logger.info(f"Starting job runner for worker {workerID}")
+    loop = asyncio.get_running_loop()
+    stopEvent = asyncio.Event()
+    for stopSignal in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(stopSignal, stopEvent.set)
+
+    jobs = {}
+    schedule = JobSchedule()
+    running = {}            # jobName -> task of the tick that is currently running
+    jobsVersion = None
+    nextSync = 0
+
+    while not stopEvent.is_set():
+        now = loop.time()
+        if now >= nextSync:
+            try:
+                version = await redisClient.get(f"{WORKER_JOBS_VERSION_KEY_PREFIX}{workerID}")
+                if version != jobsVersion:
+                    loadedJobs = await loadWorkerJobs(redisClient, workerID)
+                    added, changed, removed = syncSchedule(schedule, jobs, loadedJobs, lambda job: now + job['interval'])
+                    jobs = loadedJobs
+                    jobsVersion = version
+                    logger.info(f"Loaded {len(jobs)} jobs (version {version}): {added} added, {changed} changed, {removed} removed")
+            except redis.RedisError as e:
+                logger.error(f"Error loading the jobs from Redis: {e}")
+            nextSync = now + WORKER_DAEMON_JOB_SYNC_INTERVAL
+
+        for dueAt, jobName in schedule.popDue(now):
+            job = jobs[jobName]
+            if jobName in running:
+                logger.warning(f"Previous tick of job {jobName} is still running, skipping this tick")
+            else:
+                task = asyncio.create_task(runCommand(jobName, job['command']))
+                running[jobName] = task
+                task.add_done_callback(lambda _, jobName=jobName: running.pop(jobName, None))
+            schedule.schedule(jobName, dueAt + (missedTicks(now - dueAt, job['interval']) + 1) * job['interval'])
+
+        nextRun = schedule.nextRunAt()
+        nextWakeup = nextSync if nextRun is None else min(nextRun, nextSync)
+        try:
+            await asyncio.wait_for(stopEvent.wait(), timeout=max(0, nextWakeup - loop.time()))
+        except asyncio.TimeoutError:
+            pass
+
+    logger.info(f"Stopping job runner for worker {workerID}")
+    tasks = list(running.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await redisClient.aclose()
+
+
+if __name__ == "__main__":      # cli mode: started once per worker container by heartbeats.py
+    parser = argparse.ArgumentParser(description='Start the fetch jobs of a worker on their schedule.')
+    parser.add_argument('--workerID', help='the ID of the worker (see workerRegistry.getWorkerID)')
+    args = parser.parse_args()
+
+    if args.workerID:
+        asyncio.run(runJobRunner(args.workerID))
+    else:
+        logger.error("--workerID argument is required.")
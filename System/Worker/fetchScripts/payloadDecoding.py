@@ -0,0 +1,204 @@
+import hashlib
+from commonRessources import WORKER_FETCH_MAX_BODY_SIZE, jsonCodec
+
+# -------------------------- Environment Variables ------------------------------------------------------------------------------------------------------------------------------------------
+PAYLOAD_CHUNK_SIZE = 65536      # bytes of the body which are read at once
+
+try:
+    import ijson        # incremental JSON parser, without it bodies are buffered and decoded at once
+except ImportError:
+    ijson = None
+
+# --------------------------- Functions -----------------------------------------------------------------------------------------------------------------------------------------
+def projectFields(data, fields):
+    """
+    Reduces the fetched data to the relevant fields of the API.
+    The nesting of the data is kept, so that e.g. {"current": {"rain": 0}} stays nested.
+
+    :param data: The decoded response of the API
+    :param fields: The relevant fields, all data is kept if it's empty
+    :return: The projected data
+    """
+    if not fields:
+        return data
+    if isinstance(data, dict):
+        projected = {}
+        for key, value in data.items():
+            if key in fields:
+                projected[key] = value
+            elif isinstance(value, (dict, list)):
+                nested = projectFields(value, fields)
+                if nested:
+                    projected[key] = nested
+        return projected
+    if isinstance(data, list):
+        return [nested for nested in (projectFields(item, fields) for item in data) if nested]
+    return None
+
+def decodePayload(plan, content, contentType, needData=False):
+    """
+    Turns the body of a response into the value which is stored in InfluxDB, decoding it at most once.
+    If the fetch plan keeps all fields, the body of a JSON response is passed through untouched.
+    Otherwise it's decoded, projected to the relevant fields and encoded once with sorted keys,
+    so that the same string is stored and hashed.
+
+    :param plan: The fetch plan
+    :param content: The body of the response as bytes
+    :param contentType: The Content-Type header of the response
+    :param needData: If the decoded data is needed anyway (e.g. for pre-aggregation)
+    :return: (the projected data or None if it was passed through, the value to store, the hash of the value)
+    :raises ValueError: If the body isn't valid JSON
+    """
+    if not plan['fields'] and not needData and 'json' in (contentType or ''):
+        return None, content.decode('utf-8'), hashlib.sha1(content).hexdigest()
+    return encodePayload(plan, jsonCodec.loads(content))
+
+def encodePayload(plan, data):
+    """
+    Projects decoded data to the relevant fields of the fetch plan and encodes it once with sorted keys,
+    e.g. the payload of one subscription of a batch request.
+
+    :param plan: The fetch plan
+    :param data: The decoded data
+    :return: (the projected data, the value to store, the hash of the value)
+    """
+    data = projectFields(data, plan['fields'])
+    value = jsonCodec.dumpsBytes(data, sortKeys=True)
+    return data, value.decode('utf-8'), hashlib.sha1(value).hexdigest()
+
+# --------------------------- Exceptions -----------------------------------------------------------------------------------------------------------------------------------------
+class PayloadTooLargeError(ValueError):
+    """
+    The body of a response exceeds the maximum body size of its fetch plan.
+    """
+
+# --------------------------- Streaming Projection -----------------------------------------------------------------------------------------------------------------------------------------
+class StreamingProjection:
+    """
+    Projects a JSON document to the relevant fields of an API while it is received, like projectFields() does
+    with a decoded document. Only the values of the relevant fields are built, everything else is dropped by the parser,
+    so the memory of a fetch doesn't grow with the size of the body.
+    """
+
+    def __init__(self, fields):
+        self.fields = set(fields)
+        self.events = ijson.sendable_list()
+        self.parser = ijson.basic_parse_coro(self.events, use_float=True)
+        self.stack = []             # [projected dict or list, current key] of the enclosing containers
+        self.capture = None         # [ObjectBuilder, depth, key] while the value of a relevant field is built
+        self.captureKey = None      # relevant field whose value starts with the next event
+        self.result = None
+
+    def feed(self, chunk):
+        """
+        Parses the next chunk of the body.
+
+        :param chunk: The chunk as bytes
+        :raises ValueError: If the body isn't valid JSON
+        """
+        try:
+            self.parser.send(chunk)
+        except ijson.JSONError as e:
+            raise ValueError(f"Invalid JSON: {e}") from e
+        for event, value in self.events:
+            self.handleEvent(event, value)
+        del self.events[:]
+
+    def finish(self):
+        """
+        :return: The projected data
+        :raises ValueError: If the body is incomplete
+        """
+        try:
+            self.parser.close()
+        except ijson.IncompleteJSONError as e:
+            raise ValueError(f"Incomplete JSON: {e}") from e
+        for event, value in self.events:
+            self.handleEvent(event, value)
+        del self.events[:]
+        return self.result
+
+    def handleEvent(self, event, value):
+        if self.captureKey is not None:
+            self.capture = [ijson.ObjectBuilder(), 0, self.captureKey]
+            self.captureKey = None
+        if self.capture:
+            builder, depth, key = self.capture
+            builder.event(event, value)
+            depth += 1 if event in ('start_map', 'start_array') else -1 if event in ('end_map', 'end_array') else 0
+            if depth:
+                self.capture[1] = depth
+            else:
+                self.capture = None
+                self.stack[-1][0][key] = builder.value      # relevant fields are kept even if they are empty
+            return
+
+        if event == 'map_key':
+            if value in self.fields:
+                self.captureKey = value
+            else:
+                self.stack[-1][1] = value
+        elif event in ('start_map', 'start_array'):
+            self.stack.append([{} if event == 'start_map' else [], None])
+        elif event in ('end_map', 'end_array'):
+            projected = self.stack.pop()[0]
+            if not self.stack:
+                self.result = projected
+            elif projected:             # containers without relevant fields are dropped
+                parent, key = self.stack[-1]
+                if isinstance(parent, list):
+                    parent.append(projected)
+                else:
+                    parent[key] = projected
+        # scalars outside of relevant fields are dropped
+
+# --------------------------- Payload Reader -----------------------------------------------------------------------------------------------------------------------------------------
+class PayloadReader:
+    """
+    Reads the body of a response chunk by chunk and turns it into the value which is stored, like decodePayload().
+    Reading is stopped as soon as the body exceeds the maximum body size of the fetch plan, responses which announce a
+    larger Content-Length aren't read at all. If the fetch plan projects the body to relevant fields and ijson is
+    installed, only the projection is kept in memory instead of the whole body.
+    """
+
+    def __init__(self, plan, responseHeaders, needData=False):
+        self.plan = plan
+        self.maxBodySize = plan.get('maxBodySize') or WORKER_FETCH_MAX_BODY_SIZE
+        self.contentType = responseHeaders.get('content-type') or ''
+        self.needData = needData
+        self.size = 0
+        self.chunks = []
+        self.projection = StreamingProjection(plan['fields']) if ijson and plan['fields'] else None
+        try:
+            contentLength = int(responseHeaders.get('content-length') or 0)
+        except ValueError:
+            contentLength = 0
+        if contentLength > self.maxBodySize and not responseHeaders.get('content-encoding'):     # the decompressed size is checked while reading
+            raise PayloadTooLargeError(f"Body of {contentLength} bytes exceeds the maximum body size of {self.maxBodySize} bytes")
+
+    def feed(self, chunk):
+        """
+        Adds the next chunk of the body.
+
+        :param chunk: The (decompressed) chunk as bytes
+        :raises PayloadTooLargeError: If the body exceeds the maximum body size
+        :raises ValueError: If the body isn't valid JSON
+        """
+        self.size += len(chunk)
+        if self.size > self.maxBodySize:
+            raise PayloadTooLargeError(f"Body exceeds the maximum body size of {self.maxBodySize} bytes")
+        if self.projection:
+            self.projection.feed(chunk)
+        else:
+            self.chunks.append(chunk)
+
+    def finish(self):
+        """
+        :return: (the projected data or None if it was passed through, the value to store, the hash of the value)
+        :raises ValueError: If the body isn't valid JSON
+        """
+        if self.projection:
+            data = self.projection.finish()
+            value = jsonCodec.dumpsBytes(data, sortKeys=True)
+            return data, value.decode('utf-8'), hashlib.sha1(value).hexdigest()
+        return decodePayload(self.plan, b''.join(self.chunks), self.contentType, self.needData)
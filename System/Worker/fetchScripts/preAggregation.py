@@ -0,0 +1,138 @@
+import asyncio
+import time
+from datetime import datetime
+from commonRessources.logger import setLoggerLevel
+from commonRessources import jsonCodec
+
+# --------------------------- Initializations -----------------------------------------------------------------------------------------------------------------------------------------
+logger = setLoggerLevel("WorkerPreAggregation")
+
+# --------------------------- Functions -----------------------------------------------------------------------------------------------------------------------------------------
+def numericFields(data, path=''):
+    """
+    Yields the numeric values of the projected data of a payload with their path, e.g. ("current/rain", 0.0).
+    Numbers sent as strings (like the quotes of AlphaVantage) count as numeric too.
+    The keys are joined with "/" because keys like "05. price" contain dots.
+
+    :param data: The projected data
+    :param path: Path of data in the payload
+    """
+    if isinstance(data, dict):
+        for key, value in data.items():
+            yield from numericFields(value, f"{path}/{key}" if path else key)
+    elif isinstance(data, list):
+        for index, value in enumerate(data):
+            yield from numericFields(value, f"{path}/{index}" if path else str(index))
+    elif isinstance(data, bool):
+        return
+    elif isinstance(data, (int, float)):
+        yield path, data
+    elif isinstance(data, str):
+        try:
+            yield path, float(data)
+        except ValueError:
+            return
+
+# --------------------------- Pre-Aggregator -----------------------------------------------------------------------------------------------------------------------------------------
+class PreAggregator:
+    """
+    Pre-aggregates the samples of high frequency subscriptions in the fetch daemon.
+
+    Instead of one point per tick, one point per window of aggregationWindow seconds is written. It contains the
+    min/max/mean/last/count of every numeric field of the window as JSON in the field "aggregate" and, if the
+    subscription wants a raw sample, the last payload of the window as "value".
+    """
+
+    def __init__(self, writeBuffer):
+        self.writeBuffer = writeBuffer
+        self.windows = {}       # subscriptionID -> current window
+        self.emitTask = None
+
+    def start(self):
+        """
+        Starts the background task which writes the windows which are over.
+        """
+        self.emitTask = asyncio.create_task(self.emitPeriodically())
+
+    def add(self, apiID, subscriptionID, data, windowLength, rawSample):
+        """
+        Adds a sample to the current window of a subscription.
+
+        :param apiID: The ID of the API
+        :param subscriptionID: The ID of the subscription
+        :param data: The projected data, None if the payload didn't change (the last sample is counted again)
+        :param windowLength: Length of the windows in seconds
+        :param rawSample: If the last payload of the window is written as well
+        """
+        window = self.windows.get(subscriptionID)
+        if window and time.monotonic() >= window['end']:
+            self.emit(subscriptionID)
+            lastData, window = window['lastData'], None
+        else:
+            lastData = window['lastData'] if window else None
+        if data is None:
+            data = lastData
+        if data is None:
+            return
+        if window is None:
+            window = self.windows[subscriptionID] = {
+                'apiID': apiID,
+                'end': time.monotonic() + windowLength,
+                'length': windowLength,
+                'rawSample': rawSample,
+                'fields': {},
+                'lastData': None
+            }
+        for path, number in numericFields(data):
+            stats = window['fields'].get(path)
+            if stats is None:
+                window['fields'][path] = {'min': number, 'max': number, 'sum': number, 'last': number, 'count': 1}
+                continue
+            stats['min'] = min(stats['min'], number)
+            stats['max'] = max(stats['max'], number)
+            stats['sum'] += number
+            stats['last'] = number
+            stats['count'] += 1
+        window['lastData'] = data
+
+    def emit(self, subscriptionID):
+        """
+        Writes the summary point of the current window of a subscription and closes the window.
+        """
+        window = self.windows.pop(subscriptionID)
+        aggregate = {path: {
+            'min': stats['min'],
+            'max': stats['max'],
+            'mean': stats['sum'] / stats['count'],
+            'last': stats['last'],
+            'count': stats['count']
+        } for path, stats in window['fields'].items()}
+        self.writeBuffer.add(window['apiID'], subscriptionID,
+                             jsonCodec.dumps(window['lastData'], sortKeys=True) if window['rawSample'] else None,
+                             datetime.now().isoformat(),
+                             aggregate=jsonCodec.dumps(aggregate),
+                             window=window['length'])
+        logger.debug(f"Wrote the aggregate of {len(aggregate)} fields of a {window['length']}s window for subscription ID {subscriptionID}")
+
+    def emitDue(self):
+        """
+        Writes all windows which are over.
+        """
+        now = time.monotonic()
+        for subscriptionID in [subscriptionID for subscriptionID, window in self.windows.items() if now >= window['end']]:
+            self.emit(subscriptionID)
+
+    async def emitPeriodically(self):
+        while True:
+            await asyncio.sleep(1)
+            self.emitDue()
+
+    async def close(self):
+        """
+        Stops the background task and writes the windows which aren't over yet.
+        """
+        if self.emitTask:
+            self.emitTask.cancel()
+            await asyncio.gather(self.emitTask, return_exceptions=True)
+        for subscriptionID in list(self.windows):
+            self.emit(subscriptionID)
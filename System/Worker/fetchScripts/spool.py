@@ -0,0 +1,206 @@
+import fcntl
+import os
+from commonRessources import WORKER_SPOOL_SEGMENT_SIZE, WORKER_SPOOL_MAX_SIZE, WORKER_SPOOL_FSYNC
+from commonRessources.logger import setLoggerLevel
+from commonRessources import jsonCodec
+
+# -------------------------- Environment Variables ------------------------------------------------------------------------------------------------------------------------------------------
+SEGMENT_PREFIX = 'segment-'
+SEGMENT_SUFFIX = '.jsonl'
+FSYNC_POLICIES = ('always', 'rotate', 'never')  # fsync after every append, only when a segment is closed, or leave it to the OS
+LOCK_FILE_NAME = '.lock'        # locked by the spool of the directory as long as it's open, and by a spool adopting its segments
+
+# --------------------------- Initializations -----------------------------------------------------------------------------------------------------------------------------------------
+logger = setLoggerLevel("WorkerSpool")
+
+# --------------------------- Functions -----------------------------------------------------------------------------------------------------------------------------------------
+def isSegment(fileName):
+    return fileName.startswith(SEGMENT_PREFIX) and fileName.endswith(SEGMENT_SUFFIX)
+
+def segmentSequence(fileName):
+    return int(fileName[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+
+# --------------------------- Spool -----------------------------------------------------------------------------------------------------------------------------------------
+class Spool:
+    """
+    Append-only on-disk spool of the points the fetch daemon couldn't write to InfluxDB.
+
+    The points are appended as JSON lines to segment files (segment-<sequence>.jsonl). A segment is closed as soon
+    as it reaches WORKER_SPOOL_SEGMENT_SIZE bytes and the points are read back segment by segment, oldest first.
+    If the spool grows beyond WORKER_SPOOL_MAX_SIZE bytes the oldest segments are dropped.
+    The read position is only kept in memory, so after a crash the partly replayed segment is replayed again.
+    The segments of spools in the same parent directory which no running worker holds (e.g. of a worker which was scaled down)
+    are moved into this spool when it's opened, so their points are replayed as well.
+    """
+
+    def __init__(self, directory, segmentSize=WORKER_SPOOL_SEGMENT_SIZE, maxSize=WORKER_SPOOL_MAX_SIZE, fsyncPolicy=WORKER_SPOOL_FSYNC):
+        if fsyncPolicy not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy {fsyncPolicy}, use one of {FSYNC_POLICIES}")
+        self.directory = directory
+        self.segmentSize = segmentSize
+        self.maxSize = maxSize
+        self.fsyncPolicy = fsyncPolicy
+        os.makedirs(directory, exist_ok=True)
+        self.lockFile = open(os.path.join(directory, LOCK_FILE_NAME), 'a')
+        fcntl.flock(self.lockFile, fcntl.LOCK_EX)      # only waits while another spool moves the segments of this one
+        self.adoptOrphanedSpools()
+
+        self.segments = {}          # sequence -> [size in bytes, number of points], in the order they were written
+        for fileName in sorted(os.listdir(directory)):
+            if isSegment(fileName):
+                sequence = segmentSequence(fileName)
+                with open(self.segmentPath(sequence), 'rb') as segment:
+                    self.segments[sequence] = [os.path.getsize(self.segmentPath(sequence)), sum(1 for _ in segment)]
+        self.segments = dict(sorted(self.segments.items()))
+        self.readOffset = 0         # byte offset in the oldest segment up to which its points were replayed
+        self.readPoints = 0         # number of points of the oldest segment which were replayed
+        self.droppedPoints = 0
+        self.writeSequence = None   # a segment left over by the last run is never appended to, it could end with a partial line
+        self.writeFile = None
+        if self.segments:
+            logger.info(f"Found {self.depth()} spooled points in {len(self.segments)} segments in {directory}")
+
+    def segmentPath(self, sequence):
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{sequence:012d}{SEGMENT_SUFFIX}")
+
+    def adoptOrphanedSpools(self):
+        """
+        Moves the segments of the other spools in the parent directory whose lock is free into this spool,
+        after the segments of this spool. A spool whose worker is running keeps its segments.
+        """
+        parent = os.path.dirname(os.path.normpath(self.directory))
+        nextSequence = max((segmentSequence(fileName) for fileName in os.listdir(self.directory) if isSegment(fileName)), default=0) + 1
+        for name in sorted(os.listdir(parent)):
+            orphan = os.path.join(parent, name)
+            if os.path.normpath(orphan) == os.path.normpath(self.directory) or not os.path.isdir(orphan):
+                continue
+            if not any(isSegment(fileName) for fileName in os.listdir(orphan)):
+                continue
+            with open(os.path.join(orphan, LOCK_FILE_NAME), 'a') as orphanLock:
+                try:
+                    fcntl.flock(orphanLock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:         # its worker is running and replays it itself
+                    continue
+                fileNames = sorted(fileName for fileName in os.listdir(orphan) if isSegment(fileName))     # read again, it may have been adopted in the meantime
+                for fileName in fileNames:
+                    os.rename(os.path.join(orphan, fileName), self.segmentPath(nextSequence))
+                    nextSequence += 1
+                if fileNames:
+                    logger.info(f"Adopted {len(fileNames)} segments of the orphaned spool {orphan}")
+
+    def depth(self):
+        """
+        :return: The number of points in the spool which weren't replayed yet
+        """
+        return sum(points for _, points in self.segments.values()) - self.readPoints
+
+    def size(self):
+        """
+        :return: The number of bytes in the spool which weren't replayed yet
+        """
+        return sum(size for size, _ in self.segments.values()) - self.readOffset
+
+    def append(self, points):
+        """
+        Appends points to the current segment.
+
+        :param points: List of points as sent to the Influx data connector
+        """
+        if not points:
+            return
+        if self.writeFile is None:
+            self.writeSequence = max(self.segments, default=0) + 1
+            self.writeFile = open(self.segmentPath(self.writeSequence), 'ab')
+            self.segments[self.writeSequence] = [0, 0]
+        data = b''.join(jsonCodec.dumpsBytes(point) + b'\n' for point in points)
+        self.writeFile.write(data)
+        self.writeFile.flush()
+        if self.fsyncPolicy == 'always':
+            os.fsync(self.writeFile.fileno())
+        self.segments[self.writeSequence][0] += len(data)
+        self.segments[self.writeSequence][1] += len(points)
+
+        if self.segments[self.writeSequence][0] >= self.segmentSize:
+            self.closeSegment()
+        self.enforceMaxSize()
+
+    def closeSegment(self):
+        """
+        Closes the current segment, the next append starts a new one.
+        """
+        if self.writeFile is None:
+            return
+        if self.fsyncPolicy != 'never':
+            os.fsync(self.writeFile.fileno())
+        self.writeFile.close()
+        self.writeFile = None
+        self.writeSequence = None
+
+    def enforceMaxSize(self):
+        """
+        Drops the oldest segments as long as the spool is bigger than WORKER_SPOOL_MAX_SIZE.
+        The segment which is currently written is never dropped.
+        """
+        while self.size() > self.maxSize and len(self.segments) > 1:
+            sequence = next(iter(self.segments))
+            if sequence == self.writeSequence:
+                break
+            _, points = self.segments.pop(sequence)
+            self.droppedPoints += points - self.readPoints
+            logger.warning(f"Spool exceeds {self.maxSize} bytes, dropped {points - self.readPoints} points of segment {sequence}")
+            self.readOffset = 0
+            self.readPoints = 0
+            os.remove(self.segmentPath(sequence))
+
+    def read(self, maxPoints):
+        """
+        Reads the next points to replay from the oldest segment without removing them.
+        Call commit() once they are written to InfluxDB.
+
+        :param maxPoints: Maximum number of points to read
+        :return: (list of points, read position to pass to commit())
+        """
+        if not self.segments:
+            return [], None
+        sequence = next(iter(self.segments))
+        if sequence == self.writeSequence:
+            self.closeSegment()     # the oldest segment is the current one, new points go to the next segment from now on
+
+        points = []
+        with open(self.segmentPath(sequence), 'rb') as segment:
+            segment.seek(self.readOffset)
+            offset = self.readOffset
+            lines = 0
+            while len(points) < maxPoints:
+                line = segment.readline()
+                if not line.endswith(b'\n'):
+                    break           # end of the segment or partial line written by a crash
+                offset += len(line)
+                lines += 1
+                try:
+                    points.append(jsonCodec.loads(line))
+                except ValueError:
+                    logger.error(f"Skipping corrupt line in segment {sequence}")
+        return points, (sequence, offset, lines)
+
+    def commit(self, position):
+        """
+        Marks the points returned by read() as replayed. Fully replayed segments are deleted.
+
+        :param position: The read position returned by read()
+        """
+        sequence, offset, lines = position
+        if sequence not in self.segments:
+            return                  # the segment was dropped in the meantime
+        self.readOffset = offset
+        self.readPoints += lines
+        size, points = self.segments[sequence]
+        if offset >= size or lines == 0:     # lines == 0: only a partial line is left, it will never be completed
+            self.segments.pop(sequence)
+            self.readOffset = 0
+            self.readPoints = 0
+            os.remove(self.segmentPath(sequence))
+
+    def close(self):
+        self.closeSegment()
+        self.lockFile.close()       # releases the lock
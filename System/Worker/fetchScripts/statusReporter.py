@@ -0,0 +1,101 @@
+import asyncio
+import httpx
+from commonRessources import COMPOSE_POSTGRES_DATA_CONNECTOR_URL, WORKER_STATUS_REPORT_INTERVAL
+from commonRessources.interfaces import SubscriptionStatus
+from commonRessources.logger import setLoggerLevel
+from fetchApis import headers
+
+# --------------------------- Initializations -----------------------------------------------------------------------------------------------------------------------------------------
+logger = setLoggerLevel("WorkerStatusReporter")
+
+# --------------------------- Status Reporter -----------------------------------------------------------------------------------------------------------------------------------------
+class StatusReporter:
+    """
+    Reports the status of the subscriptions of the fetch daemon to the PostgreSQL data connector.
+
+    A status is only reported if it changed (e.g. ACTIVE -> ERROR when the upstream goes down and ERROR -> ACTIVE
+    when it answers again), not on every failed tick. The same goes for the effective interval of adaptive subscriptions.
+    The changes are coalesced and sent every WORKER_STATUS_REPORT_INTERVAL seconds in one request to /setSubscriptionsStatuses.
+    """
+
+    def __init__(self, client, interval=WORKER_STATUS_REPORT_INTERVAL):
+        self.client = client
+        self.interval = interval
+        self.reported = {}      # (subscriptionID, field) -> last value the data connector accepted
+        self.pending = {}       # (subscriptionID, field) -> (value, reason) which still has to be reported
+        self.reportTask = None
+
+    def start(self):
+        """
+        Starts the background task which sends the status changes.
+        """
+        self.reportTask = asyncio.create_task(self.reportPeriodically())
+
+    def report(self, subscriptionID, status, reason=None):
+        """
+        Notes the current status of a subscription. Nothing is sent if the status didn't change.
+        Subscriptions the daemon didn't report yet are assumed to be ACTIVE, as they were scheduled.
+
+        :param subscriptionID: The ID of the subscription
+        :param status: The SubscriptionStatus observed by the last tick
+        :param reason: Why the status changed, only logged
+        """
+        self.noteChange(subscriptionID, 'subscriptionStatus', status, SubscriptionStatus.ACTIVE, reason)
+
+    def reportEffectiveInterval(self, subscriptionID, effectiveInterval):
+        """
+        Notes the interval an adaptive subscription is currently fetched with. Nothing is sent if it didn't change.
+
+        :param subscriptionID: The ID of the subscription
+        :param effectiveInterval: The effective interval in seconds
+        """
+        self.noteChange(subscriptionID, 'effectiveInterval', effectiveInterval, None, "Adaptive polling")
+
+    def noteChange(self, subscriptionID, field, value, default, reason):
+        key = (subscriptionID, field)
+        if self.pending.get(key, (self.reported.get(key, default), None))[0] == value:
+            return
+        if self.reported.get(key, default) == value:
+            self.pending.pop(key, None)     # changed back before it was reported
+            return
+        self.pending[key] = (value, reason)
+
+    async def reportPeriodically(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def flush(self):
+        """
+        Sends all pending status changes in one request. If it fails they are sent again with the next one.
+        """
+        if not self.pending:
+            return
+        pending = dict(self.pending)
+        updates = {}
+        for (subscriptionID, field), (value, _) in pending.items():
+            update = updates.setdefault(subscriptionID, {
+                "subscriptionID": subscriptionID,
+                "expectedStatuses": [SubscriptionStatus.ACTIVE.value, SubscriptionStatus.ERROR.value]     # never reactivate an unsubscribed subscription
+            })
+            update[field] = value.value if isinstance(value, SubscriptionStatus) else value
+        try:
+            response = await self.client.post(f"{COMPOSE_POSTGRES_DATA_CONNECTOR_URL}/setSubscriptionsStatuses", json={"subscriptions": list(updates.values())}, headers=headers)
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            logger.error(f"Failed to report {len(updates)} subscription changes to PostgreSQL: {e}")
+            return
+        for key, (value, reason) in pending.items():
+            self.reported[key] = value
+            if self.pending.get(key, (None, None))[0] == value:
+                del self.pending[key]
+            logger.info(f"Reported {key[1]} {value} for subscription ID {key[0]}: {reason}")
+
+    async def close(self):
+        """
+        Stops the background task and sends the pending status changes.
+        """
+        if self.reportTask:
+            self.reportTask.cancel()
+            await asyncio.gather(self.reportTask, return_exceptions=True)
+        await self.flush()
@@ -0,0 +1,222 @@
+import argparse
+import asyncio
+import json
+import os
+import signal
+import time
+import redis
+import redis.asyncio
+from commonRessources import REDIS_HOST, REDIS_PORT, WORKER_FETCH_MODE, WORKER_CAPACITY, WORKER_MAX_INFLIGHT_FETCHES, WORKER_SPOOL_DIRECTORY, WORKER_METRICS_INTERVAL, FETCH_STREAM_CLAIM_IDLE
+from commonRessources.logger import setLoggerLevel
+from commonRessources.fetchStream import FETCH_STREAM_KEY, FETCH_STREAM_GROUP, decodeTick
+from commonRessources.latencyHistograms import SCHEDULE_MISSED_TICKS_KEY
+from fetchDaemon import parseJobCommand, publishMetrics, FETCH_PLANS_KEY, FETCH_PLANS_VERSION_KEY
+from fetchEngine import FetchEngine
+from batchRequests import groupDueJobs
+from jobRunner import runCommand
+
+# -------------------------- Environment Variables ------------------------------------------------------------------------------------------------------------------------------------------
+STREAM_READ_BLOCK = 1000        # milliseconds a read waits for new ticks
+
+# --------------------------- Initializations -----------------------------------------------------------------------------------------------------------------------------------------
+logger = setLoggerLevel("WorkerStreamConsumer")
+redisClient = redis.asyncio.StrictRedis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+
+# --------------------------- Functions -----------------------------------------------------------------------------------------------------------------------------------------
+async def ensureGroup():
+    """
+    Creates the stream and the consumer group of the workers if they don't exist yet (the dispatcher of the scheduler does the same).
+    """
+    try:
+        await redisClient.xgroup_create(FETCH_STREAM_KEY, FETCH_STREAM_GROUP, id='0', mkstream=True)
+    except redis.ResponseError as e:
+        if 'BUSYGROUP' not in str(e):
+            raise
+
+class StreamConsumer:
+    """
+    Reads the due ticks from the fetch stream as long as the worker has free slots and runs them:
+    in the fetch engine in daemon mode, as a fetchApis.py process in cli mode.
+    Every tick is acknowledged when it finished, ticks which are already older than their interval are skipped and counted as missed.
+    """
+
+    def __init__(self, workerID):
+        self.workerID = workerID
+        self.slots = WORKER_MAX_INFLIGHT_FETCHES if WORKER_FETCH_MODE == 'daemon' else WORKER_CAPACITY
+        self.engine = FetchEngine(spoolDirectory=os.path.join(WORKER_SPOOL_DIRECTORY, workerID)) if WORKER_FETCH_MODE == 'daemon' else None
+        self.running = {}           # entryID -> task of the tick, the ticks of a batch request share their task
+        self.finished = []          # entryIDs to acknowledge
+        self.plans = {}             # subscriptionID -> fetch plan (daemon mode)
+        self.plansVersion = None
+        self.claimCursor = '0-0'
+        self.nextClaim = 0
+
+    def freeSlots(self):
+        return self.slots - len(set(self.running.values()))
+
+    def track(self, entryID, task):
+        """
+        Acknowledges the tick when its task is done, or right away if it wasn't started.
+        Ticks which were cancelled (the worker stops) aren't acknowledged, so that another worker claims them.
+        """
+        if task is None:
+            self.finished.append(entryID)
+            return
+
+        def done(task):
+            self.running.pop(entryID, None)
+            if not task.cancelled():
+                self.finished.append(entryID)
+
+        self.running[entryID] = task
+        task.add_done_callback(done)
+
+    async def loadPlan(self, subscriptionID):
+        """
+        :return: The fetch plan of the subscription, cached until the scheduler publishes a new version of the fetch plans
+        """
+        version = await redisClient.get(FETCH_PLANS_VERSION_KEY)
+        if version != self.plansVersion:
+            self.plans, self.plansVersion = {}, version
+        if subscriptionID not in self.plans:
+            rawPlan = await redisClient.hget(FETCH_PLANS_KEY, subscriptionID)
+            self.plans[subscriptionID] = json.loads(rawPlan) if rawPlan else None
+        return self.plans[subscriptionID]
+
+    async def recordMissedTick(self, subscriptionID):
+        if self.engine:
+            self.engine.recordMissedTicks(subscriptionID)
+        else:
+            await redisClient.hincrby(SCHEDULE_MISSED_TICKS_KEY, subscriptionID, 1)
+
+    async def handle(self, entries):
+        """
+        Runs the ticks of a read. In daemon mode the ticks of the same batch group are fetched with one request.
+
+        :param entries: List of (entryID, fields) of the stream
+        """
+        loop = asyncio.get_running_loop()
+        dueJobs = []
+        for entryID, fields in entries:
+            if fields is None:          # the entry was trimmed from the stream in the meantime
+                self.finished.append(entryID)
+                continue
+            jobName, job, scheduledAt = decodeTick(fields)
+            arguments = parseJobCommand(job['command'])
+            if time.time() - scheduledAt > job['interval']:     # the next tick of the job is already dispatched
+                logger.warning(f"Tick of job {jobName} is older than its interval, skipping it")
+                await self.recordMissedTick(arguments.subscriptionID)
+                self.finished.append(entryID)
+            elif self.engine is None:
+                if jobName in {task.get_name() for task in self.running.values()}:
+                    logger.warning(f"Previous tick of job {jobName} is still running, skipping this tick")
+                    self.finished.append(entryID)
+                else:
+                    self.track(entryID, asyncio.create_task(runCommand(jobName, job['command']), name=jobName))
+            else:
+                plan = await self.loadPlan(arguments.subscriptionID)
+                if plan is None:
+                    logger.error(f"No fetch plan found for job {jobName}, resubscribe its subscription")
+                    self.finished.append(entryID)
+                    continue
+                dueJobs.append((jobName, {'entryID': entryID, 'subscriptionID': arguments.subscriptionID, 'plan': plan,
+                                          'scheduledAt': loop.time() - (time.time() - scheduledAt)}))
+        for request in groupDueJobs(dueJobs):
+            # pre-aggregation needs all ticks of a window on the same worker, so every tick is written on its own
+            self.engine.submitBatch([(jobName, job['subscriptionID'], job['plan'], None, job['scheduledAt']) for jobName, job in request])
+            for jobName, job in request:
+                self.track(job['entryID'], self.engine.running.get(jobName))
+
+    async def read(self):
+        """
+        Claims the ticks of dead workers (every quarter of FETCH_STREAM_CLAIM_IDLE, until none are left) or reads new ticks,
+        at most as many as the worker has free slots.
+
+        :return: List of (entryID, fields)
+        """
+        count = self.freeSlots()
+        if time.monotonic() >= self.nextClaim:
+            claimed = await redisClient.xautoclaim(FETCH_STREAM_KEY, FETCH_STREAM_GROUP, self.workerID, FETCH_STREAM_CLAIM_IDLE * 1000, self.claimCursor, count)
+            self.claimCursor = claimed[0]
+            if len(claimed) > 2:        # Redis >= 7 returns the entries which were deleted from the stream separately
+                self.finished.extend(claimed[2])
+            if claimed[1]:
+                logger.info(f"Claimed {len(claimed[1])} ticks of workers which didn't acknowledge them within {FETCH_STREAM_CLAIM_IDLE}s")
+                return claimed[1]
+            self.nextClaim = time.monotonic() + FETCH_STREAM_CLAIM_IDLE / 4
+        response = await redisClient.xreadgroup(FETCH_STREAM_GROUP, self.workerID, {FETCH_STREAM_KEY: '>'}, count=count, block=STREAM_READ_BLOCK)
+        return response[0][1] if response else []
+
+    async def acknowledge(self):
+        finished, self.finished = self.finished, []
+        if finished:
+            try:
+                await redisClient.xack(FETCH_STREAM_KEY, FETCH_STREAM_GROUP, *finished)
+            except redis.RedisError:
+                self.finished.extend(finished)
+                raise
+
+    async def close(self):
+        tasks = list(set(self.running.values()))
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self.engine:
+            await self.engine.close()
+
+async def runConsumer(workerID):
+    """
+    Runs the ticks the dispatcher of the scheduler adds to the fetch stream (stream dispatch mode).
+
+    1) Claims ticks which other workers read but didn't acknowledge within FETCH_STREAM_CLAIM_IDLE seconds, otherwise reads new ticks,
+       at most as many as the worker has free slots. Without free slots it waits for a running tick to finish
+    2) Runs the ticks and acknowledges every tick when it finished
+    3) Publishes the metrics of the fetch engine every WORKER_METRICS_INTERVAL seconds (daemon mode)
+    4) On SIGTERM/SIGINT the running ticks are cancelled, the ticks which weren't acknowledged are claimed by the other workers
+
+    :param workerID: The ID of the worker (see workerRegistry.getWorkerID), the name of its consumer
+    """
+    logger.info(f"Starting stream consumer for worker {workerID}")
+    loop = asyncio.get_running_loop()
+    stopEvent = asyncio.Event()
+    for stopSignal in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(stopSignal, stopEvent.set)
+
+    consumer = StreamConsumer(workerID)
+    nextMetrics = loop.time() + WORKER_METRICS_INTERVAL
+    groupReady = False
+    while not stopEvent.is_set():
+        try:
+            if not groupReady:
+                await ensureGroup()
+                groupReady = True
+            await consumer.acknowledge()
+            if consumer.engine and loop.time() >= nextMetrics:
+                await publishMetrics(workerID, consumer.engine)
+                nextMetrics = loop.time() + WORKER_METRICS_INTERVAL
+            if consumer.freeSlots() > 0:
+                await consumer.handle(await consumer.read())
+            else:
+                await asyncio.wait(set(consumer.running.values()), timeout=STREAM_READ_BLOCK / 1000, return_when=asyncio.FIRST_COMPLETED)
+        except redis.RedisError as e:
+            logger.error(f"Error consuming the fetch stream: {e}")
+            await asyncio.sleep(1)
+
+    logger.info(f"Stopping stream consumer for worker {workerID}")
+    await consumer.close()
+    try:
+        await consumer.acknowledge()
+    except redis.RedisError as e:
+        logger.error(f"Error acknowledging the last ticks: {e}")
+    await redisClient.aclose()
+
+
+if __name__ == "__main__":      # stream dispatch mode: started once per worker container by heartbeats.py
+    parser = argparse.ArgumentParser(description='Run the ticks dispatched to the workers via the fetch stream.')
+    parser.add_argument('--workerID', help='the ID of the worker (see workerRegistry.getWorkerID)')
+    args = parser.parse_args()
+
+    if args.workerID:
+        asyncio.run(runConsumer(args.workerID))
+    else:
+        logger.error("--workerID argument is required.")
@@ -0,0 +1,197 @@
+import asyncio
+import gzip
+import time
+from datetime import datetime, timezone
+import httpx
+from commonRessources import COMPOSE_INFLUX_DATA_CONNECTOR_URL, WORKER_WRITE_BATCH_SIZE, WORKER_WRITE_BATCH_MAX_AGE, WORKER_SPOOL_REPLAY_BATCH_SIZE, WORKER_SPOOL_REPLAY_RATE
+from commonRessources.logger import setLoggerLevel
+from commonRessources import jsonCodec
+from commonRessources.latencyHistograms import ALL_LABEL
+from fetchApis import headers
+
+# --------------------------- Initializations -----------------------------------------------------------------------------------------------------------------------------------------
+logger = setLoggerLevel("WorkerWriteBuffer")
+
+# --------------------------- Write Buffer -----------------------------------------------------------------------------------------------------------------------------------------
+class WriteBuffer:
+    """
+    Buffers the fetched points of the fetch daemon in memory and ships them to the Influx data connector
+    as one gzip compressed batch, as soon as WORKER_WRITE_BATCH_SIZE points are buffered or the oldest
+    point is WORKER_WRITE_BATCH_MAX_AGE seconds old.
+
+    If a spool is given, points which couldn't be written are appended to it and a background replayer
+    drains it again with at most WORKER_SPOOL_REPLAY_RATE points per second once the connector is healthy.
+    If latency histograms are given, every batch is timed as the write stage.
+    """
+
+    def __init__(self, client, maxSize=WORKER_WRITE_BATCH_SIZE, maxAge=WORKER_WRITE_BATCH_MAX_AGE, spool=None, latencies=None):
+        self.client = client
+        self.spool = spool
+        self.latencies = latencies
+        self.maxSize = maxSize
+        self.maxAge = maxAge
+        self.points = []
+        self.oldestPointAt = None
+        self.flushTask = None
+        self.pendingFlushes = set()     # flushes triggered by size which are still running
+        self.replayTask = None
+        self.replayedPoints = 0
+        self.pointsWritten = 0
+        self.metricsAt = (time.monotonic(), 0)  # (time, replayedPoints) of the last metrics() call, to compute the drain rate
+
+    def start(self):
+        """
+        Starts the background tasks which flush the buffer by age and replay the spool.
+        """
+        self.flushTask = asyncio.create_task(self.flushByAge())
+        if self.spool:
+            self.replayTask = asyncio.create_task(self.replaySpool())
+
+    def add(self, apiID, subscriptionID, value, fetchTimestamp, aggregate=None, window=None):
+        """
+        Adds a fetched point to the buffer and flushes it if it is full.
+
+        :param apiID: The ID of the API
+        :param subscriptionID: The ID of the subscription
+        :param value: The fetched data, None for a heartbeat point of an unchanged payload
+        :param fetchTimestamp: The timestamp of the fetch
+        :param aggregate: JSON of the pre-aggregated fields of a window (see preAggregation.py), value is then an optional raw sample
+        :param window: Length of the pre-aggregation window in seconds
+        """
+        if not self.points:
+            self.oldestPointAt = time.monotonic()
+        point = {
+            "apiID": apiID,
+            "subscriptionID": subscriptionID,
+            "fetchTimestamp": fetchTimestamp,
+            "time": datetime.now(timezone.utc).isoformat()     # replayed points keep the time they were fetched at
+        }
+        if aggregate is not None:
+            point["aggregate"] = aggregate
+            point["window"] = window
+        if value is not None:
+            point["value"] = value
+        elif aggregate is None:
+            point["unchanged"] = True
+        self.points.append(point)
+        if len(self.points) >= self.maxSize:
+            flushTask = asyncio.create_task(self.flush())
+            self.pendingFlushes.add(flushTask)
+            flushTask.add_done_callback(self.pendingFlushes.discard)
+
+    async def flushByAge(self):
+        """
+        Flushes the buffer as soon as its oldest point reached the maximum age.
+        """
+        while True:
+            await asyncio.sleep(self.maxAge / 4)
+            if self.points and time.monotonic() - self.oldestPointAt >= self.maxAge:
+                await self.flush()
+
+    async def send(self, points):
+        """
+        Sends points to the Influx data connector in one gzip compressed batch.
+        The connector reports a result per point, so points it rejected are logged one by one.
+
+        :param points: List of points
+        :return: The points which couldn't be written but may be written later (e.g. because InfluxDB is down)
+        :raises httpx.HTTPError: If the connector couldn't be reached or failed as a whole
+        """
+        body = gzip.compress(jsonCodec.dumpsBytes({"points": points}))
+        startedAt = time.perf_counter()
+        try:
+            response = await self.client.post(f"{COMPOSE_INFLUX_DATA_CONNECTOR_URL}/influxWriteBatch",
+                                              content=body,
+                                              headers={**headers, 'Content-Type': 'application/json', 'Content-Encoding': 'gzip'})
+        finally:
+            if self.latencies:      # a batch mixes the points of all APIs
+                self.latencies.observe('write', ALL_LABEL, time.perf_counter() - startedAt)
+        response.raise_for_status()
+        retryPoints = []
+        for point, result in zip(points, response.json().get("results", [])):
+            if result.get("status") == "SUCCESS":
+                continue
+            if result.get("retry"):
+                retryPoints.append(point)
+            else:
+                logger.error(f"Influx data connector rejected point of subscription ID {point['subscriptionID']}: {result.get('message')}")
+        return retryPoints
+
+    async def flush(self):
+        """
+        Ships all buffered points to the Influx data connector in one batch.
+        Points which couldn't be written are spooled, if there is a spool.
+        """
+        if not self.points:
+            return
+        points, self.points = self.points, []
+        try:
+            retryPoints = await self.send(points)
+            self.pointsWritten += len(points) - len(retryPoints)
+            logger.info(f"Sent batch of {len(points)} points to InfluxDB")
+        except httpx.HTTPError as e:
+            logger.error(f"Error sending batch of {len(points)} points to InfluxDB: {e}")
+            retryPoints = points
+        if retryPoints and self.spool:
+            try:
+                self.spool.append(retryPoints)
+                logger.warning(f"Spooled {len(retryPoints)} points, {self.spool.depth()} points in the spool")
+            except OSError as e:
+                logger.error(f"Error spooling {len(retryPoints)} points, they are lost: {e}")
+        elif retryPoints:
+            logger.error(f"{len(retryPoints)} points couldn't be written to InfluxDB and are lost")
+
+    async def replaySpool(self):
+        """
+        Drains the spool in batches of WORKER_SPOOL_REPLAY_BATCH_SIZE points with at most WORKER_SPOOL_REPLAY_RATE points per second.
+        As long as the connector fails the replayer backs off exponentially, up to one minute.
+        """
+        backoff = 1
+        while True:
+            points, position = self.spool.read(WORKER_SPOOL_REPLAY_BATCH_SIZE)
+            if position is None:
+                await asyncio.sleep(1)
+                continue
+            startedAt = time.monotonic()
+            try:
+                retryPoints = await self.send(points) if points else []
+            except httpx.HTTPError as e:
+                logger.warning(f"Replaying the spool failed, next try in {backoff}s: {e}")
+                retryPoints = points
+            if retryPoints:     # the connector isn't healthy yet, keep the points in the spool
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+                continue
+            backoff = 1
+            self.spool.commit(position)
+            self.replayedPoints += len(points)
+            logger.info(f"Replayed {len(points)} spooled points, {self.spool.depth()} points left")
+            await asyncio.sleep(max(0, len(points) / WORKER_SPOOL_REPLAY_RATE - (time.monotonic() - startedAt)))
+
+    def metrics(self):
+        """
+        :return: Dictionary with the spool depth (points and bytes), the dropped points and the drain rate (points per second since the last call)
+        """
+        now = time.monotonic()
+        lastAt, lastReplayedPoints = self.metricsAt
+        self.metricsAt = (now, self.replayedPoints)
+        return {
+            "pointsWritten": self.pointsWritten,
+            "spoolDepth": self.spool.depth() if self.spool else 0,
+            "spoolBytes": self.spool.size() if self.spool else 0,
+            "spoolDroppedPoints": self.spool.droppedPoints if self.spool else 0,
+            "spoolDrainRate": round((self.replayedPoints - lastReplayedPoints) / (now - lastAt), 2) if now > lastAt else 0
+        }
+
+    async def close(self):
+        """
+        Stops flushing by age and replaying, flushes the remaining points and closes the spool.
+        """
+        for task in (self.flushTask, self.replayTask):
+            if task:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        await asyncio.gather(*self.pendingFlushes, return_exceptions=True)
+        await self.flush()
+        if self.spool:
+            self.spool.close()
@@ -1,13 +1,15 @@
 import requests
-import socket
+import redis
+import os
 from os import getenv
 from datetime import datetime, timezone
 import time
 from commonRessources.logger import setLoggerLevel
-from commonRessources import COMPOSE_SCHEDULER_API_URL, SCHEDULER_WORKER_HEARTBEAT_INTERVAL
+from commonRessources import COMPOSE_SCHEDULER_API_URL, SCHEDULER_WORKER_HEARTBEAT_INTERVAL, WORKER_FETCH_MODE, WORKER_DISPATCH_MODE, WORKER_CAPACITY, WORKER_CAPABILITIES, WORKER_ID_DIRECTORY, REDIS_HOST, REDIS_PORT
+from commonRessources.workerRegistry import claimWorkerID, buildRegistration, registerWorker
+from loadReport import LoadReporter
 import threading
 import subprocess
-import docker
 
 # -------------------------- Environment Variables ------------------------------------------------------------------------------------------------------------------------------------------
 apiKey = getenv('INTERNAL_API_KEY')
@@ -17,19 +19,22 @@ headers = {
 
 # --------------------------- Initializations -----------------------------------------------------------------------------------------------------------------------------------------
 logger = setLoggerLevel("WorkerHeartbeats")
-client = docker.from_env()
+redisClient = redis.StrictRedis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
 
 
-def sendHeartbeat(workerID):
+def sendHeartbeat(workerID, loadReporter):
     """
     Send a heartbeat to the scheduler to signal that the worker is alive.
+    It carries the load of the worker since the last heartbeat, the scheduler moves jobs away from overloaded workers.
 
-    :param workerID: The ID of the worker"""
+    :param workerID: The ID of the worker
+    :param loadReporter: The LoadReporter of the worker"""
     try:
         heartbeat_url = f"{COMPOSE_SCHEDULER_API_URL}/heartbeatWorkers"
         data = {
             "workerID": workerID,
-            "timestamp": datetime.now(timezone.utc).isoformat()
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "load": loadReporter.report()
         }
         response = requests.post(heartbeat_url, json=data, headers=headers)
         response.raise_for_status()
@@ -37,6 +42,23 @@ def sendHeartbeat(workerID):
     except requests.exceptions.RequestException as e:
         logger.error(f"Failed to send heartbeat for worker {workerID}: {e}")
 
+def register(workerID):
+    """
+    Registers the worker in Redis with its capacity and capabilities, so that the scheduler places jobs on it.
+    Retried until Redis is reachable, the worker doesn't get any jobs without its registration.
+
+    :param workerID: The ID of the worker
+    """
+    registration = buildRegistration(workerID, WORKER_CAPACITY, [WORKER_FETCH_MODE, *WORKER_CAPABILITIES])
+    while True:
+        try:
+            registerWorker(redisClient, registration)
+            logger.info(f"Registered worker {workerID} with capacity {registration['capacity']} and capabilities {registration['capabilities']}")
+            return
+        except redis.RedisError as e:
+            logger.error(f"Failed to register worker {workerID}: {e}")
+            time.sleep(SCHEDULER_WORKER_HEARTBEAT_INTERVAL)
+
 def startHeartbeat(workerID):
     """
     Start sending heartbeats at regular intervals.
@@ -45,40 +67,44 @@ def startHeartbeat(workerID):
     :param workerID: The ID of the worker
     """
     logger.info(f"Starting heartbeat for worker: {workerID}")
+    register(workerID)
     # call the heartbeatWorkerStartup endpoint to signal the scheduler that the worker is starting up 
     # so that it can delete the worker from the list of dead workers
     response = requests.post(f"{COMPOSE_SCHEDULER_API_URL}/heartbeatWorkerStartup", 
                              json={"workerID": workerID},
                              headers=headers)
     response.raise_for_status()
+    loadReporter = LoadReporter(workerID, redisClient)
     while True:
-        sendHeartbeat(workerID)
+        sendHeartbeat(workerID, loadReporter)
         time.sleep(SCHEDULER_WORKER_HEARTBEAT_INTERVAL)
 
-def get_container_name():
+def startJobProcess(workerID):
     """
-    Get the name of the container.
-    It returns the name of the container in which the script is running instead of returning the GUID of it.
-    The container name is needed because if the container crashes it's entries can be removed from the scheduler which works with the container name.
+    Start the long-lived process which runs the jobs of the worker on their schedule:
+    the fetch daemon in daemon mode, the job runner which starts fetchApis.py on every tick in cli mode.
+    In stream dispatch mode the stream consumer runs the ticks the scheduler dispatches instead (in both fetch modes).
+    If the process exits it is started again.
 
-    :return: The name of the container
+    :param workerID: The ID of the worker
     """
-    hostname = socket.gethostname()
-    try:        # Get the container name out of the hostname which represents the containers GUID
-        result = subprocess.run(
-            ["docker", "ps", "--filter", f"id={hostname}", "--format", "{{.Names}}"],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        container_name = result.stdout.strip()
-        return container_name
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Failed to get container name: {e}")
-        return None
+    if WORKER_DISPATCH_MODE == 'stream':
+        script = "/app/fetchScripts/streamConsumer.py"
+    else:
+        script = "/app/fetchScripts/fetchDaemon.py" if WORKER_FETCH_MODE == 'daemon' else "/app/fetchScripts/jobRunner.py"
+    while True:
+        logger.info(f"Starting {script} for worker: {workerID}")
+        jobProcess = subprocess.Popen(["python", script, "--workerID", workerID])
+        returnCode = jobProcess.wait()
+        logger.error(f"{script} of worker {workerID} exited with code {returnCode}, restarting it")
+        time.sleep(1)
 
 if __name__ == "__main__":
-    containerName = get_container_name()
-    heartbeat_thread = threading.Thread(target=startHeartbeat, args=(containerName,))
+    workerID = claimWorkerID(WORKER_ID_DIRECTORY)
+    os.environ['WORKER_ID'] = workerID      # the job processes and fetchApis.py read it with getWorkerID
+    heartbeat_thread = threading.Thread(target=startHeartbeat, args=(workerID,))
     heartbeat_thread.daemon = False
-    heartbeat_thread.start()
\ No newline at end of file
+    heartbeat_thread.start()
+    job_thread = threading.Thread(target=startJobProcess, args=(workerID,))
+    job_thread.daemon = False
+    job_thread.start()
\ No newline at end of file
@@ -0,0 +1,124 @@
+import os
+import time
+import redis
+from commonRessources import WORKER_FETCH_MODE, WORKER_CAPACITY, WORKER_MAX_INFLIGHT_FETCHES
+from commonRessources.latencyHistograms import WORKER_LATENCY_KEY_PREFIX
+from commonRessources.logger import setLoggerLevel
+
+# -------------------------- Environment Variables ------------------------------------------------------------------------------------------------------------------------------------------
+WORKER_METRICS_KEY_PREFIX = 'WORKER_METRICS:'   # Written by the fetch daemon (fetchDaemon.publishMetrics), one hash per worker
+CGROUP_CPU_STAT = '/sys/fs/cgroup/cpu.stat'     # cgroup v2, usage_usec is the CPU time of the container
+CGROUP_CPU_MAX = '/sys/fs/cgroup/cpu.max'       # cgroup v2, "<quota> <period>" or "max <period>"
+
+# --------------------------- Initializations -----------------------------------------------------------------------------------------------------------------------------------------
+logger = setLoggerLevel("WorkerLoadReport")
+
+# --------------------------- Load Report Functions -----------------------------------------------------------------------------------------------------------------------------------------
+# Every heartbeat carries a compact report of the load of the worker since the previous heartbeat:
+# {"cpu": <share of the CPUs available to the container>, "inflight": <running fetches>, "saturation": <running fetches / fetch slots>,
+#  "errorRate": <share of failed ticks>, "latency": <mean duration of a tick in seconds>, "ticks": <finished ticks>}
+# Values which can't be measured in the fetch mode of the worker are None. The scheduler smooths them into a load score (see Scheduler/workerLoad.py).
+
+def availableCpus():
+    """
+    :return: The number of CPUs the container may use, its cgroup quota if it has one
+    """
+    try:
+        with open(CGROUP_CPU_MAX) as cpuMax:
+            quota, period = cpuMax.read().split()
+        if quota != 'max':
+            return int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    return os.cpu_count() or 1
+
+def cpuSeconds():
+    """
+    :return: The CPU time of the container in seconds, None if there is no cgroup v2
+    """
+    try:
+        with open(CGROUP_CPU_STAT) as cpuStat:
+            for line in cpuStat:
+                name, value = line.split()
+                if name == 'usage_usec':
+                    return int(value) / 1_000_000
+    except (OSError, ValueError):
+        pass
+    return None
+
+def runningFetchProcesses():
+    """
+    :return: The number of fetchApis.py processes the job runner started in the container (cli mode)
+    """
+    count = 0
+    for pid in filter(str.isdigit, os.listdir('/proc')):
+        try:
+            with open(f'/proc/{pid}/cmdline', 'rb') as cmdline:
+                if b'fetchApis.py' in cmdline.read():
+                    count += 1
+        except OSError:         # the process exited in the meantime
+            continue
+    return count
+
+class LoadReporter:
+    """
+    Builds the load reports of a worker, the counters are compared with the ones of the previous report.
+    """
+
+    def __init__(self, workerID, redisClient):
+        self.workerID = workerID
+        self.redisClient = redisClient
+        self.previousCpu = (time.monotonic(), cpuSeconds())
+        self.previousCounters = {}      # counter -> value at the previous report
+
+    def delta(self, counter, value):
+        """
+        :return: The increase of a cumulative counter since the previous report, the whole value if it was reset (restarted daemon)
+        """
+        previous = self.previousCounters.get(counter, 0)
+        self.previousCounters[counter] = value
+        return value - previous if value >= previous else value
+
+    def cpu(self):
+        now, usage = time.monotonic(), cpuSeconds()
+        (previousTime, previousUsage), self.previousCpu = self.previousCpu, (now, usage)
+        if usage is None or previousUsage is None or now <= previousTime:
+            return min(os.getloadavg()[0] / availableCpus(), 1.0)      # without cgroup the load of the host is the best estimate
+        return max(usage - previousUsage, 0) / (now - previousTime) / availableCpus()
+
+    def latency(self):
+        """
+        :return: (finished ticks, mean duration of a tick) since the previous report, from the latency histograms of the worker
+        """
+        ticks, seconds = 0, 0.0
+        for field, value in self.redisClient.hgetall(f"{WORKER_LATENCY_KEY_PREFIX}{self.workerID}").items():
+            if field.startswith('total|'):
+                if field.endswith('|sum'):
+                    seconds += float(value)
+                else:
+                    ticks += int(value)
+        ticks = self.delta('ticks', ticks)
+        seconds = self.delta('seconds', seconds)
+        return ticks, round(seconds / ticks, 4) if ticks else None
+
+    def report(self):
+        """
+        :return: The load report of the worker since the previous report
+        """
+        report = {'cpu': round(self.cpu(), 4), 'inflight': None, 'saturation': None, 'errorRate': None, 'latency': None, 'ticks': None}
+        try:
+            report['ticks'], report['latency'] = self.latency()
+            if WORKER_FETCH_MODE == 'daemon':
+                metrics = self.redisClient.hgetall(f"{WORKER_METRICS_KEY_PREFIX}{self.workerID}")
+                if metrics:
+                    report['inflight'] = int(metrics['inflightFetches'])
+                    report['saturation'] = round(report['inflight'] / WORKER_MAX_INFLIGHT_FETCHES, 4)
+                    completed = self.delta('completedTicks', int(metrics['completedTicks']))
+                    failed = self.delta('failedTicks', int(metrics['failedTicks']))
+                    report['errorRate'] = round(min(failed / completed, 1.0), 4) if completed else None
+        except (redis.RedisError, KeyError, ValueError) as e:
+            logger.error(f"Error reading the metrics of worker {self.workerID}: {e}")
+        if WORKER_FETCH_MODE == 'cli':
+            report['inflight'] = runningFetchProcesses()
+            report['saturation'] = round(report['inflight'] / WORKER_CAPACITY, 4)
+        return report
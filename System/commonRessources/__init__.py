@@ -22,7 +22,74 @@ COMPOSE_SCHEDULER_API_URL = constants['COMPOSE_SCHEDULER_API_URL']
 REDIS_HOST = constants['REDIS_HOST']
 REDIS_PORT = constants['REDIS_PORT']
 
-MAX_NUMBER_JOBS_PER_WORKER = constants['MAX_NUMBER_JOBS_PER_WORKER']
 MAX_NUMBER_WORKERS = int(getenv('MAX_NUMBER_WORKERS', '1'))
 
-SCHEDULER_WORKER_HEARTBEAT_INTERVAL = constants['SCHEDULER_WORKER_HEARTBEAT_INTERVAL']
\ No newline at end of file
+SCHEDULER_WORKER_HEARTBEAT_INTERVAL = constants['SCHEDULER_WORKER_HEARTBEAT_INTERVAL']
+
+# Constants for the worker fetch runtime
+WORKER_FETCH_MODE = getenv('WORKER_FETCH_MODE', constants['WORKER_FETCH_MODE'])    # 'cli': the job runner of the worker starts fetchApis.py on every tick, 'daemon': a long-lived fetchDaemon.py per worker runs the jobs
+WORKER_DAEMON_JOB_SYNC_INTERVAL = constants['WORKER_DAEMON_JOB_SYNC_INTERVAL']
+WORKER_MAX_INFLIGHT_FETCHES = constants['WORKER_MAX_INFLIGHT_FETCHES']     # cap of concurrent fetches of one fetch daemon
+WORKER_FETCH_TIMEOUT = constants['WORKER_FETCH_TIMEOUT']                   # default timeout budget of one fetch in seconds
+WORKER_FETCH_API_TIMEOUTS = constants['WORKER_FETCH_API_TIMEOUTS']         # timeout budgets per availableApiID which differ from the default
+WORKER_FETCH_MAX_BODY_SIZE = constants['WORKER_FETCH_MAX_BODY_SIZE']       # default maximum size of the (decompressed) body of one fetch in bytes
+WORKER_UNCHANGED_PAYLOAD = constants['WORKER_UNCHANGED_PAYLOAD']           # default of what is written if an API returns the same payload again (see interfaces.UnchangedPayload)
+WORKER_ADAPTIVE_BACKOFF = constants['WORKER_ADAPTIVE_BACKOFF']             # adaptive subscriptions stretch their interval by this factor per unchanged payload
+WORKER_ADAPTIVE_MAX_FACTOR = constants['WORKER_ADAPTIVE_MAX_FACTOR']       # ... up to this multiple of the interval of the user
+WORKER_ADAPTIVE_MAX_INTERVAL = constants['WORKER_ADAPTIVE_MAX_INTERVAL']   # ... but never above this many seconds
+WORKER_WRITE_BATCH_SIZE = constants['WORKER_WRITE_BATCH_SIZE']             # a fetch daemon ships its points as soon as this many are buffered
+WORKER_WRITE_BATCH_MAX_AGE = constants['WORKER_WRITE_BATCH_MAX_AGE']       # ... or as soon as the oldest buffered point is this many seconds old
+WORKER_SPOOL_DIRECTORY = constants['WORKER_SPOOL_DIRECTORY']               # points which couldn't be written are spooled to <directory>/<workerID>
+WORKER_SPOOL_SEGMENT_SIZE = constants['WORKER_SPOOL_SEGMENT_SIZE']         # bytes per spool segment file
+WORKER_SPOOL_MAX_SIZE = constants['WORKER_SPOOL_MAX_SIZE']                 # bytes, above the oldest segments are dropped
+WORKER_SPOOL_FSYNC = getenv('WORKER_SPOOL_FSYNC', constants['WORKER_SPOOL_FSYNC'])    # 'always', 'rotate' (when a segment is closed) or 'never'
+WORKER_SPOOL_REPLAY_BATCH_SIZE = constants['WORKER_SPOOL_REPLAY_BATCH_SIZE']
+WORKER_SPOOL_REPLAY_RATE = constants['WORKER_SPOOL_REPLAY_RATE']           # maximum points per second replayed from the spool
+WORKER_METRICS_INTERVAL = constants['WORKER_METRICS_INTERVAL']             # seconds between two metrics reports of a fetch daemon to Redis
+WORKER_LATENCY_RETENTION = constants['WORKER_LATENCY_RETENTION']           # seconds the latency histograms of a worker are kept after its last report
+WORKER_STATUS_REPORT_INTERVAL = constants['WORKER_STATUS_REPORT_INTERVAL'] # seconds a fetch daemon coalesces subscription status changes before reporting them
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = constants['CIRCUIT_BREAKER_FAILURE_THRESHOLD']     # consecutive failures after which the circuit of an upstream opens
+CIRCUIT_BREAKER_OPEN_DURATION = constants['CIRCUIT_BREAKER_OPEN_DURATION']             # seconds until the first probe of an open circuit
+CIRCUIT_BREAKER_MAX_OPEN_DURATION = constants['CIRCUIT_BREAKER_MAX_OPEN_DURATION']     # the open duration doubles with every failed probe up to this
+CIRCUIT_BREAKER_HALF_OPEN_PROBES = constants['CIRCUIT_BREAKER_HALF_OPEN_PROBES']       # concurrent probe requests of a half-open circuit
+
+# A fetch daemon multiplexes its jobs over pooled connections, so it can run a lot more fetches at once than the cli mode
+WORKER_SLOTS = WORKER_MAX_INFLIGHT_FETCHES if WORKER_FETCH_MODE == 'daemon' else constants['WORKER_CLI_SLOTS']
+
+# Workers register themselves with their capacity and capabilities (see workerRegistry.py)
+WORKER_CAPACITY = int(getenv('WORKER_CAPACITY') or WORKER_SLOTS)          # fetches the worker runs at once, WORKER_SLOTS if not set
+WORKER_CAPABILITIES = [capability.strip() for capability in getenv('WORKER_CAPABILITIES', '').split(',') if capability.strip()]    # capabilities besides its fetch mode
+WORKER_REGISTRATION_TIMEOUT = constants['WORKER_REGISTRATION_TIMEOUT']      # seconds without heartbeat after which a worker is removed from the registry
+WORKER_ID_DIRECTORY = constants['WORKER_ID_DIRECTORY']                      # the workers claim their ID by locking a slot file in this directory (see workerRegistry.claimWorkerID)
+
+# The heartbeats carry the load of the workers, the scheduler moves jobs away from overloaded workers (see Scheduler/workerLoad.py)
+WORKER_LOAD_SMOOTHING = constants['WORKER_LOAD_SMOOTHING']                  # weight of the newest load report in the smoothed load score
+WORKER_LOAD_HIGH_WATERMARK = constants['WORKER_LOAD_HIGH_WATERMARK']        # a worker becomes overloaded above this load score
+WORKER_LOAD_LOW_WATERMARK = constants['WORKER_LOAD_LOW_WATERMARK']          # ... and stays overloaded until its score drops below this one
+WORKER_LOAD_LATENCY_THRESHOLD = constants['WORKER_LOAD_LATENCY_THRESHOLD']  # mean tick duration in seconds which counts as a load score of 1
+WORKER_LOAD_SHED_FRACTION = constants['WORKER_LOAD_SHED_FRACTION']          # share of its jobs an overloaded worker hands over at once
+WORKER_LOAD_SHED_COOLDOWN = constants['WORKER_LOAD_SHED_COOLDOWN']          # seconds between two hand overs of the same worker
+
+# Jobs are placed by their cost: the fetch slots they keep busy on average, (duration of a tick + overhead) / interval (see Scheduler/costModel.py)
+WORKER_TARGET_UTILISATION = constants['WORKER_TARGET_UTILISATION']          # share of the capacity of a worker the scheduler fills with jobs
+WORKER_COST_DEFAULT_LATENCY = constants['WORKER_COST_DEFAULT_LATENCY']      # seconds a tick of an API without observed latencies is assumed to take
+WORKER_COST_BYTES_PER_SECOND = constants['WORKER_COST_BYTES_PER_SECOND']    # bytes of payload a worker decodes and writes per second and fetch slot
+WORKER_COST_TICK_OVERHEAD = constants['WORKER_COST_DAEMON_TICK_OVERHEAD'] if WORKER_FETCH_MODE == 'daemon' else constants['WORKER_COST_TICK_OVERHEAD']    # seconds every tick costs besides the fetch, e.g. starting fetchApis.py
+WORKER_COST_UPDATE_INTERVAL = constants['WORKER_COST_UPDATE_INTERVAL']      # seconds between two updates of the job costs, workers above their budget hand over jobs afterwards
+
+# 'pinned': every worker runs the jobs assigned to it, 'stream': the due ticks are dispatched to the workers via a Redis stream (see fetchStream.py)
+WORKER_DISPATCH_MODE = getenv('WORKER_DISPATCH_MODE', constants['WORKER_DISPATCH_MODE'])
+FETCH_STREAM_MAX_LENGTH = constants['FETCH_STREAM_MAX_LENGTH']              # the stream is trimmed to about this many ticks
+FETCH_STREAM_CLAIM_IDLE = constants['FETCH_STREAM_CLAIM_IDLE']              # seconds after which ticks read but not acknowledged by a worker are claimed by another one
+FETCH_STREAM_DISPATCHER_LEASE = constants['FETCH_STREAM_DISPATCHER_LEASE']  # seconds the lease of the dispatching scheduler replica lasts without renewal
+
+# Subscribing, resubscribing and unsubscribing are carried out in the background by every scheduler replica (see Scheduler/operations.py)
+SCHEDULER_OPERATION_EXECUTORS = constants['SCHEDULER_OPERATION_EXECUTORS']          # operations every scheduler process carries out at the same time
+SCHEDULER_OPERATION_MAX_ATTEMPTS = constants['SCHEDULER_OPERATION_MAX_ATTEMPTS']    # attempts of an operation which failed with a transient error before it fails
+SCHEDULER_OPERATION_CLAIM_IDLE = constants['SCHEDULER_OPERATION_CLAIM_IDLE']        # seconds after which an operation of a scheduler process which died is carried out by another one
+SCHEDULER_OPERATION_RETENTION = constants['SCHEDULER_OPERATION_RETENTION']          # seconds a finished operation can be queried
+SCHEDULER_BULK_MAX_SIZE = constants['SCHEDULER_BULK_MAX_SIZE']                      # subscriptions one bulk subscribe, resubscribe or unsubscribe request can contain
+
+# The workers run their jobs themselves in both modes, the jobs of the Ofelia config.ini used before are moved to the jobs file on startup
+SCHEDULER_JOBS_FILE = constants['SCHEDULER_DAEMON_JOBS_FILE']
+SCHEDULER_OFELIA_CONFIG_FILE = constants['SCHEDULER_OFELIA_CONFIG_FILE']
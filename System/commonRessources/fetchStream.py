@@ -0,0 +1,26 @@
+import json
+
+# In the stream dispatch mode the jobs aren't pinned to workers: the dispatcher of the scheduler (Scheduler/streamDispatch.py) adds
+# every due tick to a Redis stream and the workers read the ticks through a consumer group (Worker/fetchScripts/streamConsumer.py).
+# A worker reads as many ticks as it has free slots and acknowledges each tick when it finished, so the ticks balance by pull rate.
+# Ticks which were read by a worker that died are claimed by the other workers after FETCH_STREAM_CLAIM_IDLE seconds.
+FETCH_STREAM_KEY = 'FETCH_STREAM'                   # Stream of the due ticks
+FETCH_STREAM_GROUP = 'workers'                      # Consumer group of the workers, the consumer name is the workerID
+FETCH_STREAM_DISPATCHER_KEY = 'FETCH_STREAM_DISPATCHER'     # Lease of the scheduler replica which dispatches the ticks
+
+# --------------------------- Fetch Stream Functions -----------------------------------------------------------------------------------------------------------------------------------------
+def encodeTick(jobName, job, scheduledAt):
+    """
+    :param jobName: Name of the job
+    :param job: The job as published by the scheduler, {"interval": <int>, "command": <str>}
+    :param scheduledAt: UNIX time the tick was due
+    :return: The fields of the stream entry
+    """
+    return {'jobName': jobName, 'job': json.dumps(job), 'scheduledAt': scheduledAt}
+
+def decodeTick(fields):
+    """
+    :param fields: The fields of a stream entry
+    :return: (jobName, job, scheduledAt)
+    """
+    return fields['jobName'], json.loads(fields['job']), float(fields['scheduledAt'])
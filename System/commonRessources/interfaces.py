@@ -33,12 +33,21 @@ class SubscriptionStatus(Enum):     # possible Statuses a Subscription can have
     def __str__(self):
         return self.name
 
+class UnchangedPayload(Enum):      # what a worker writes if an API returns the same payload as on the last tick
+    STORE = "STORE"                 # store it again like a changed payload
+    HEARTBEAT = "HEARTBEAT"         # write a cheap point without the value, the last value is repeated when the data is read
+    SKIP = "SKIP"                   # write nothing
+
+    def __str__(self):
+        return self.name
+
 class Permissions(Enum):
     # InfluxDB permissions
     INFLUX_GET_DATA = "influxGetData"
 
     # PostgreSQL permissions
     AVAILABLE_APIS = "availableApis"
+    UPDATE_AVAILABLE_API = "updateAvailableApi"
     SUBSCRIPTIONS = "subscriptions"
     SUBSCRIPTIONS_BY_USER_ID = "subscriptionsByUserID"
 
@@ -46,6 +55,10 @@ class Permissions(Enum):
     SUBSCRIBE_API = "subscribeApi"
     RESUBSCRIBE_API = "resubscribeApi"
     UNSUBSCRIBE_API = "unsubscribeApi"
+    SUBSCRIBE_APIS = "subscribeApis"
+    RESUBSCRIBE_APIS = "resubscribeApis"
+    UNSUBSCRIBE_APIS = "unsubscribeApis"
+    OPERATION_STATUS = "operationStatus"
 
 
     def __str__(self):
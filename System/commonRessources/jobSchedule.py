@@ -0,0 +1,99 @@
+import heapq
+import json
+
+# -------------------------- Environment Variables ------------------------------------------------------------------------------------------------------------------------------------------
+WORKER_JOBS_KEY_PREFIX = 'WORKER_JOBS:'                 # Written by the scheduler (workerJobs.publishWorkerJobs), one hash per registered worker
+WORKER_JOBS_VERSION_KEY_PREFIX = 'WORKER_JOBS_VERSION:' # Incremented by the scheduler every time the jobs of the worker change
+
+# --------------------------- Job Schedule -----------------------------------------------------------------------------------------------------------------------------------------
+class JobSchedule:
+    """
+    The next runs of jobs, used by the fetch daemon, the job runner of the cli mode and the dispatcher of the stream dispatch mode.
+    It's a heap of (nextRun, jobName) with lazy deletion: rescheduling or removing a job only replaces its entry in nextRuns
+    and its old heap entries are dropped when they come up. Every change costs O(log n) and leaves the other jobs untouched.
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.nextRuns = {}      # jobName -> next run, the only valid heap entry of a job
+
+    def __len__(self):
+        return len(self.nextRuns)
+
+    def __contains__(self, jobName):
+        return jobName in self.nextRuns
+
+    def schedule(self, jobName, nextRun):
+        self.nextRuns[jobName] = nextRun
+        heapq.heappush(self.heap, (nextRun, jobName))
+        if len(self.heap) > 2 * len(self.nextRuns) + 64:    # too many stale entries, rebuild the heap
+            self.heap = [(run, name) for name, run in self.nextRuns.items()]
+            heapq.heapify(self.heap)
+
+    def remove(self, jobName):
+        self.nextRuns.pop(jobName, None)
+
+    def dropStale(self):
+        while self.heap and self.nextRuns.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+
+    def nextRunAt(self):
+        """
+        :return: The time of the next run of any job, None if there are no jobs
+        """
+        self.dropStale()
+        return self.heap[0][0] if self.heap else None
+
+    def popDue(self, until):
+        """
+        Takes the jobs which are due until the given time out of the schedule, they have to be scheduled again by the caller.
+
+        :param until: The time up to which jobs are due
+        :return: List of (dueAt, jobName) in the order they are due
+        """
+        dueJobs = []
+        self.dropStale()
+        while self.heap and self.heap[0][0] <= until:
+            dueAt, jobName = heapq.heappop(self.heap)
+            del self.nextRuns[jobName]
+            dueJobs.append((dueAt, jobName))
+            self.dropStale()
+        return dueJobs
+
+def syncSchedule(schedule, currentJobs, loadedJobs, firstRun):
+    """
+    Applies the jobs loaded from Redis to the schedule without touching the jobs which didn't change:
+    removed jobs are unscheduled, new jobs and jobs whose interval or command changed start with firstRun,
+    all other jobs keep their next run.
+
+    :param schedule: The JobSchedule
+    :param currentJobs: The jobs before the reload, jobName -> job with its "definition" as published by the scheduler
+    :param loadedJobs: The jobs after the reload
+    :param firstRun: Function job -> time of its first run
+    :return: (added, changed, removed) number of jobs
+    """
+    removed = [jobName for jobName in currentJobs if jobName not in loadedJobs]
+    for jobName in removed:
+        schedule.remove(jobName)
+    added = changed = 0
+    for jobName, job in loadedJobs.items():
+        if jobName not in currentJobs or jobName not in schedule:
+            added += 1
+        elif currentJobs[jobName]['definition'] != job['definition']:
+            changed += 1
+        else:
+            continue
+        schedule.schedule(jobName, firstRun(job))
+    return added, changed, len(removed)
+
+async def loadWorkerJobs(redisClient, workerID):
+    """
+    :param redisClient: A redis.asyncio client
+    :param workerID: The ID of the worker
+    :return: Dictionary jobName -> {"interval": <int>, "command": <str>, "definition": <the job as published>}
+    """
+    jobs = {}
+    for jobName, rawJob in (await redisClient.hgetall(f"{WORKER_JOBS_KEY_PREFIX}{workerID}")).items():
+        job = json.loads(rawJob)
+        jobs[jobName] = {'interval': int(job['interval']), 'command': job['command'], 'definition': rawJob}
+    return jobs
@@ -0,0 +1,43 @@
+import json
+
+try:
+    import orjson       # several times faster than json, installed in the worker and the Influx data connector
+except ImportError:
+    orjson = None
+
+# --------------------------- JSON Codec Functions -----------------------------------------------------------------------------------------------------------------------------------------
+# The fetched payloads are decoded and encoded on the hot path of every tick (worker) and every written point (Influx data connector).
+# orjson is used if it's installed, otherwise the json module. Both produce compact JSON, so the results only differ in float formatting.
+
+def loads(data):
+    """
+    Decodes JSON.
+
+    :param data: JSON as bytes or str
+    :return: The decoded data
+    """
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def dumpsBytes(data, sortKeys=False):
+    """
+    Encodes data to compact UTF-8 JSON.
+
+    :param data: The data to encode
+    :param sortKeys: If the keys of dictionaries are sorted, e.g. to hash the result
+    :return: JSON as bytes
+    """
+    if orjson:
+        return orjson.dumps(data, option=orjson.OPT_SORT_KEYS if sortKeys else 0)
+    return json.dumps(data, sort_keys=sortKeys, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+def dumps(data, sortKeys=False):
+    """
+    Encodes data to compact JSON.
+
+    :param data: The data to encode
+    :param sortKeys: If the keys of dictionaries are sorted, e.g. to hash the result
+    :return: JSON as str
+    """
+    return dumpsBytes(data, sortKeys).decode('utf-8')
@@ -0,0 +1,156 @@
+from bisect import bisect_left
+
+# Latency histograms of the fetches, recorded by every worker and aggregated by the scheduler (see Scheduler/fetchLatencies.py).
+# The histograms are cumulative like Prometheus histograms: the workers add the observations of their last report to a
+# Redis hash per worker, field "<stage>|<label>|<bucket index>" -> count and "<stage>|<label>|sum" -> seconds.
+# The label is the availableApiID of the fetch, "all" for stages which aren't attributable to one API (e.g. a write batch).
+# The download stage also counts the bytes of the payloads, field "download|<label>|bytes", which the scheduler uses to estimate the cost of a job.
+# The same histograms record how late the ticks started (Redis hash SCHEDULE_LATENESS, stage "lateness", label subscriptionID, see Scheduler/scheduleAccuracy.py).
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)  # upper bounds in seconds, the last bucket is +Inf
+WORKER_LATENCY_KEY_PREFIX = 'WORKER_LATENCY:'   # Hash per worker with its latency histograms
+SCHEDULE_LATENESS_KEY = 'SCHEDULE_LATENESS'     # Hash with the histograms of how late the ticks started, stage "lateness", label subscriptionID
+SCHEDULE_MISSED_TICKS_KEY = 'SCHEDULE_MISSED_TICKS'     # Hash subscriptionID -> number of ticks which weren't executed
+SCHEDULE_LAST_START_KEY = 'SCHEDULE_LAST_START'         # Hash subscriptionID -> UNIX time the last tick started (cli mode)
+FETCH_STAGES = {
+    'queue': "waiting for a free fetch slot of the daemon",
+    'rateLimit': "taking a request from the shared rate limit in Redis",
+    'planLookup': "loading the fetch plan and content state (cli mode)",
+    'connect': "DNS, TCP and TLS of a new upstream connection",
+    'ttfb': "sending the request until the response headers arrived",
+    'download': "reading and parsing the body",
+    'write': "posting points to the Influx data connector",
+    'total': "the whole tick"
+}
+ALL_LABEL = 'all'
+
+# --------------------------- Recording -----------------------------------------------------------------------------------------------------------------------------------------
+class LatencyHistograms:
+    """
+    Collects the observations of a worker between two reports to Redis.
+    """
+
+    def __init__(self):
+        self.pending = {}       # field of the Redis hash -> increment
+
+    def observe(self, stage, label, seconds):
+        """
+        :param stage: The stage, one of FETCH_STAGES
+        :param label: The availableApiID of the fetch or ALL_LABEL
+        :param seconds: The duration of the stage
+        """
+        prefix = f"{stage}|{label}"
+        bucketField = f"{prefix}|{bisect_left(LATENCY_BUCKETS, seconds)}"
+        self.pending[bucketField] = self.pending.get(bucketField, 0) + 1
+        self.pending[f"{prefix}|sum"] = self.pending.get(f"{prefix}|sum", 0) + seconds
+
+    def observeBytes(self, label, size):
+        """
+        :param label: The availableApiID of the fetch
+        :param size: The size of the (decompressed) payload in bytes
+        """
+        field = f"download|{label}|bytes"
+        self.pending[field] = self.pending.get(field, 0) + size
+
+    def drain(self):
+        """
+        :return: The increments collected since the last drain
+        """
+        increments, self.pending = self.pending, {}
+        return increments
+
+    def restore(self, increments):
+        """
+        Adds increments which couldn't be reported back, so that they are reported with the next drain.
+        """
+        for field, increment in increments.items():
+            self.pending[field] = self.pending.get(field, 0) + increment
+
+def queueIncrements(pipeline, key, increments, retention):
+    """
+    Queues the increments of a drain on a Redis pipeline (redis or redis.asyncio).
+
+    :param pipeline: The Redis pipeline
+    :param key: The Redis hash, e.g. WORKER_LATENCY_KEY_PREFIX + workerID
+    :param increments: The increments as returned by LatencyHistograms.drain
+    :param retention: Seconds the histograms are kept after the last report
+    """
+    for field, increment in increments.items():
+        if field.endswith('|sum'):
+            pipeline.hincrbyfloat(key, field, increment)
+        else:
+            pipeline.hincrby(key, field, increment)
+    if increments:
+        pipeline.expire(key, retention)
+
+def missedTicks(lateBy, interval):
+    """
+    :param lateBy: Seconds since the tick was scheduled
+    :param interval: Interval of the job in seconds
+    :return: The number of later ticks which were scheduled in the meantime and can't be executed anymore
+    """
+    return int(lateBy // interval) if interval > 0 and lateBy > 0 else 0
+
+# --------------------------- Evaluation -----------------------------------------------------------------------------------------------------------------------------------------
+def parseHistograms(rawHash):
+    """
+    :param rawHash: The Redis hash of a worker
+    :return: Dictionary (stage, label) -> {"buckets": [count per bucket], "sum": seconds, "bytes": bytes of the payloads (download stage)}
+    """
+    histograms = {}
+    for field, value in rawHash.items():
+        stage, label, bucket = field.rsplit('|', 2)
+        histogram = histograms.setdefault((stage, label), {'buckets': [0] * (len(LATENCY_BUCKETS) + 1), 'sum': 0.0, 'bytes': 0})
+        if bucket == 'sum':
+            histogram['sum'] = float(value)
+        elif bucket == 'bytes':
+            histogram['bytes'] = int(value)
+        else:
+            histogram['buckets'][int(bucket)] = int(value)
+    return histograms
+
+def mergeHistograms(histograms):
+    """
+    :param histograms: Iterable of histograms as in the values of parseHistograms
+    :return: The histogram with the observations of all of them
+    """
+    merged = {'buckets': [0] * (len(LATENCY_BUCKETS) + 1), 'sum': 0.0, 'bytes': 0}
+    for histogram in histograms:
+        merged['buckets'] = [total + count for total, count in zip(merged['buckets'], histogram['buckets'])]
+        merged['sum'] += histogram['sum']
+        merged['bytes'] += histogram.get('bytes', 0)
+    return merged
+
+def histogramQuantile(histogram, quantile):
+    """
+    Estimates a quantile like Prometheus' histogram_quantile: linear interpolation within the bucket the quantile falls into.
+    Quantiles in the +Inf bucket are reported as the largest finite bound.
+
+    :param histogram: The histogram
+    :param quantile: The quantile, e.g. 0.95
+    :return: The estimated seconds, None if the histogram is empty
+    """
+    count = sum(histogram['buckets'])
+    if not count:
+        return None
+    rank = quantile * count
+    cumulative = 0
+    for index, bucketCount in enumerate(histogram['buckets']):
+        if cumulative + bucketCount >= rank and bucketCount:
+            if index == len(LATENCY_BUCKETS):
+                return LATENCY_BUCKETS[-1]
+            lower = LATENCY_BUCKETS[index - 1] if index else 0
+            return lower + (LATENCY_BUCKETS[index] - lower) * (rank - cumulative) / bucketCount
+        cumulative += bucketCount
+    return LATENCY_BUCKETS[-1]
+
+def summarizeHistogram(histogram):
+    """
+    :return: {"count", "mean", "p50", "p95", "p99"} of a histogram, the times in seconds
+    """
+    count = sum(histogram['buckets'])
+    return {
+        'count': count,
+        'mean': round(histogram['sum'] / count, 6) if count else None,
+        **{name: None if value is None else round(value, 6)
+           for name, value in (('p50', histogramQuantile(histogram, 0.5)), ('p95', histogramQuantile(histogram, 0.95)), ('p99', histogramQuantile(histogram, 0.99)))}
+    }
@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+import time
+from email.utils import parsedate_to_datetime
+
+# Rate limits of the upstream providers, shared by all workers through Redis.
+# The quotas are configured per provider in rateLimits.json: "requests" per "period" seconds, up to "burst" requests at once.
+# A provider is the name of the API until the first space in upper case (like the key in apikeys.txt), or the host of the URL for APIs without a key.
+rateLimits_path = os.path.join(os.path.dirname(__file__), 'rateLimits.json')
+
+def load_rateLimits(file_path=rateLimits_path):
+    with open(file_path, 'r') as file:
+        return json.load(file)
+
+RATE_LIMITS = load_rateLimits()
+
+RATE_LIMIT_KEY_PREFIX = 'RATE_LIMIT:'                   # GCRA state (theoretical arrival time in ms) per provider and API key
+RATE_LIMIT_BLOCKED_KEY_PREFIX = 'RATE_LIMIT_BLOCKED:'   # Set with an expiry when the provider answered 429, per provider and API key
+RATE_LIMIT_QUOTA_KEY_PREFIX = 'RATE_LIMIT_QUOTA:'       # Hash per provider with the quota the provider reported in its response headers
+RATE_LIMIT_DEMAND_KEY_PREFIX = 'RATE_LIMIT_DEMAND:'     # Hash per provider: subscriptionID -> interval of the subscriptions using its quota
+RATE_LIMIT_DEFAULT_BLOCK = 60                           # seconds a provider is blocked after a 429 without Retry-After header
+
+# GCRA: the request is allowed if it isn't earlier than the theoretical arrival time minus the burst tolerance.
+# KEYS[1]: GCRA state, KEYS[2]: blocked key, ARGV[1]: emission interval in ms, ARGV[2]: burst tolerance in ms
+# Returns 0 if the request is allowed, otherwise the milliseconds until it would be allowed.
+GCRA_SCRIPT = """
+local blocked = redis.call('PTTL', KEYS[2])
+if blocked > 0 then
+    return blocked
+end
+local emission = tonumber(ARGV[1])
+local tolerance = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local tat = tonumber(redis.call('GET', KEYS[1])) or now
+if tat < now then
+    tat = now
+end
+local allowAt = tat - tolerance
+if allowAt > now then
+    return allowAt - now
+end
+redis.call('SET', KEYS[1], tat + emission, 'PX', tat + emission - now)
+return 0
+"""
+
+
+def getProvider(apiName, url, tokenRequired):
+    """
+    :return: The provider whose quota an API uses
+    """
+    if tokenRequired:
+        return apiName.split(' ')[0].upper()
+    return url.split('://', 1)[-1].split('/', 1)[0].split('?', 1)[0]
+
+def getQuota(provider):
+    """
+    :return: The configured quota of a provider, None if it isn't rate limited
+    """
+    return RATE_LIMITS.get(provider) if provider else None
+
+def keyID(apiToken):
+    """
+    Identifies an API key without storing it in Redis.
+
+    :return: Short hash of the API key, "public" for APIs without a key
+    """
+    return hashlib.sha1(apiToken.encode('utf-8')).hexdigest()[:12] if apiToken else 'public'
+
+def gcraKeys(provider, apiToken):
+    """
+    :return: The Redis keys for GCRA_SCRIPT
+    """
+    return [f"{RATE_LIMIT_KEY_PREFIX}{provider}:{keyID(apiToken)}", f"{RATE_LIMIT_BLOCKED_KEY_PREFIX}{provider}:{keyID(apiToken)}"]
+
+def gcraArguments(quota):
+    """
+    :return: The arguments for GCRA_SCRIPT (emission interval and burst tolerance in ms)
+    """
+    emission = int(quota['period'] * 1000 / quota['requests'])
+    return [emission, emission * (quota.get('burst', 1) - 1)]
+
+def parseQuotaHeaders(responseHeaders):
+    """
+    Reads the remaining quota from the rate limit headers of an upstream response
+    (X-Ratelimit-* as sent by e.g. Finnhub, or the RateLimit-* headers of the IETF draft).
+
+    :param responseHeaders: Case insensitive headers of the response
+    :return: Dictionary with "remaining", "limit" and "reset" (epoch seconds) as far as they were sent, None if none was sent
+    """
+    quota = {}
+    for field in ('remaining', 'limit', 'reset'):
+        value = responseHeaders.get(f"x-ratelimit-{field}") or responseHeaders.get(f"ratelimit-{field}")
+        if value is None:
+            continue
+        try:
+            quota[field] = int(float(value))
+        except ValueError:
+            continue
+    if 'reset' in quota and quota['reset'] < 10 ** 9:      # some providers send the seconds until the reset instead of the time
+        quota['reset'] += int(time.time())
+    return quota or None
+
+def parseRetryAfter(responseHeaders):
+    """
+    :return: Seconds to wait after a 429 response, from the Retry-After or reset header or RATE_LIMIT_DEFAULT_BLOCK
+    """
+    retryAfter = responseHeaders.get('retry-after')
+    if retryAfter:
+        try:
+            return max(1, int(float(retryAfter)))
+        except ValueError:
+            try:
+                return max(1, int(parsedate_to_datetime(retryAfter).timestamp() - time.time()))
+            except (TypeError, ValueError):
+                pass
+    quota = parseQuotaHeaders(responseHeaders)
+    if quota and quota.get('reset'):
+        return max(1, quota['reset'] - int(time.time()))
+    return RATE_LIMIT_DEFAULT_BLOCK
@@ -7,12 +7,17 @@ def getPermissionsForRole(role):        # set the permissions for the different
             Permissions.INFLUX_GET_DATA.value,
 
             Permissions.AVAILABLE_APIS.value,
+            Permissions.UPDATE_AVAILABLE_API.value,
             Permissions.SUBSCRIPTIONS.value,
             Permissions.SUBSCRIPTIONS_BY_USER_ID.value,
 
             Permissions.SUBSCRIBE_API.value,
             Permissions.RESUBSCRIBE_API.value,
-            Permissions.UNSUBSCRIBE_API.value
+            Permissions.UNSUBSCRIBE_API.value,
+            Permissions.SUBSCRIBE_APIS.value,
+            Permissions.RESUBSCRIBE_APIS.value,
+            Permissions.UNSUBSCRIBE_APIS.value,
+            Permissions.OPERATION_STATUS.value
         ]
     elif role == UserRole.USER.value:
         permissions = [
@@ -23,7 +28,11 @@ def getPermissionsForRole(role):        # set the permissions for the different
 
             Permissions.SUBSCRIBE_API.value,
             Permissions.RESUBSCRIBE_API.value,
-            Permissions.UNSUBSCRIBE_API.value
+            Permissions.UNSUBSCRIBE_API.value,
+            Permissions.SUBSCRIBE_APIS.value,
+            Permissions.RESUBSCRIBE_APIS.value,
+            Permissions.UNSUBSCRIBE_APIS.value,
+            Permissions.OPERATION_STATUS.value
         ]
     elif role == UserRole.PREMIUM_USER.value:
         permissions = [
@@ -34,6 +43,10 @@ def getPermissionsForRole(role):        # set the permissions for the different
 
             Permissions.SUBSCRIBE_API.value,
             Permissions.RESUBSCRIBE_API.value,
-            Permissions.UNSUBSCRIBE_API.value
+            Permissions.UNSUBSCRIBE_API.value,
+            Permissions.SUBSCRIBE_APIS.value,
+            Permissions.RESUBSCRIBE_APIS.value,
+            Permissions.UNSUBSCRIBE_APIS.value,
+            Permissions.OPERATION_STATUS.value
         ]
     return permissions
@@ -0,0 +1,32 @@
+import re
+from urllib.parse import quote
+
+# -------------------------- Environment Variables ------------------------------------------------------------------------------------------------------------------------------------------
+PLACEHOLDER_PATTERN = re.compile(r'\{(\w+)\}')     # e.g. https://finnhub.io/api/v1/quote?symbol={symbol}
+
+# --------------------------- URL Template Functions -----------------------------------------------------------------------------------------------------------------------------------------
+def templateParameters(template):
+    """
+    :param template: URL template of an availableApi
+    :return: The names of the placeholders of the template in order, e.g. ['latitude', 'longitude']
+    """
+    return PLACEHOLDER_PATTERN.findall(template or '')
+
+def renderUrlTemplate(template, parameters, separator=','):
+    """
+    Fills the placeholders of a URL template. The values are URL encoded.
+    Placeholders without a value are left in the URL, so that a batch template can be rendered in two steps.
+
+    :param template: The URL template
+    :param parameters: Dictionary placeholder -> value, a list of values is joined with separator (batch requests)
+    :param separator: Separator of the values of a batch request
+    :return: The rendered URL
+    """
+    def replacePlaceholder(match):
+        value = parameters.get(match.group(1))
+        if value is None:
+            return match.group(0)
+        if isinstance(value, (list, tuple)):
+            return separator.join(quote(str(item), safe='') for item in value)
+        return quote(str(value), safe='')
+    return PLACEHOLDER_PATTERN.sub(replacePlaceholder, template)
@@ -0,0 +1,81 @@
+import fcntl
+import json
+import os
+import socket
+from datetime import datetime, timezone
+from os import getenv
+
+# Workers register themselves in Redis when they start, so the scheduler doesn't need to know their container names
+# or run on the same Docker host. The scheduler only places jobs on registered workers (see Scheduler/scale.py).
+WORKER_REGISTRY_KEY = 'WORKER_REGISTRY'     # Hash workerID -> registration of the worker (JSON)
+
+claimedSlots = []       # open files of the claimed worker slots, the lock of a slot is held as long as its file is open
+
+# --------------------------- Worker Registry Functions -----------------------------------------------------------------------------------------------------------------------------------------
+def getWorkerID():
+    """
+    The ID of the worker is WORKER_ID if it's set (see claimWorkerID), otherwise the hostname.
+
+    :return: The ID of the worker
+    """
+    return getenv('WORKER_ID') or socket.gethostname()
+
+def claimWorkerID(directory):
+    """
+    Claims a stable ID for the worker: WORKER_ID if it's set, otherwise the lowest free slot worker-<n> (prefixed with WORKER_NODE if it's set).
+    A slot is claimed by locking its file in the directory the workers share, the lock is held until the process exits.
+    So a recreated worker container gets the slot of the one it replaces and with it its jobs, metrics and spool,
+    while the hostname is a new container ID every time.
+
+    :param directory: Directory of the slot files, on a volume all workers of the node share
+    :return: The ID of the worker
+    """
+    if getenv('WORKER_ID'):
+        return getenv('WORKER_ID')
+    os.makedirs(directory, exist_ok=True)
+    prefix = f"{getenv('WORKER_NODE')}-" if getenv('WORKER_NODE') else ""
+    slot = 1
+    while True:
+        workerID = f"{prefix}worker-{slot}"
+        slotFile = open(os.path.join(directory, f"{workerID}.lock"), 'a')
+        try:
+            fcntl.flock(slotFile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:         # another worker holds the slot
+            slotFile.close()
+            slot += 1
+            continue
+        claimedSlots.append(slotFile)
+        return workerID
+
+def buildRegistration(workerID, capacity, capabilities):
+    """
+    :param workerID: The ID of the worker
+    :param capacity: The number of jobs the worker takes at most
+    :param capabilities: What the worker can run, e.g. ['daemon'], the scheduler only places jobs on workers of its fetch mode
+    :return: The registration of the worker
+    """
+    return {
+        'workerID': workerID,
+        'node': getenv('WORKER_NODE'),      # optional name of the machine the worker runs on
+        'capacity': capacity,
+        'capabilities': sorted(set(capabilities)),
+        'registeredAt': datetime.now(timezone.utc).isoformat()
+    }
+
+def registerWorker(redisClient, registration):
+    """
+    :param redisClient: A Redis client
+    :param registration: The registration as built by buildRegistration
+    """
+    redisClient.hset(WORKER_REGISTRY_KEY, registration['workerID'], json.dumps(registration))
+
+def deregisterWorker(redisClient, workerID):
+    redisClient.hdel(WORKER_REGISTRY_KEY, workerID)
+
+def loadRegisteredWorkers(redisClient):
+    """
+    :param redisClient: A Redis client
+    :return: Dictionary workerID -> registration, in the order the workers registered
+    """
+    registrations = [json.loads(rawRegistration) for rawRegistration in redisClient.hgetall(WORKER_REGISTRY_KEY).values()]
+    return {registration['workerID']: registration for registration in sorted(registrations, key=lambda registration: (registration['registeredAt'], registration['workerID']))}